@@ -2,7 +2,7 @@ import { NextRequest, NextResponse } from 'next/server'
 
 export async function POST(request: NextRequest) {
   try {
-    const { imageData, confidence = 0.25 } = await request.json()
+    const { imageData, confidence = 0.25, transform, crs, origin } = await request.json()
     
     // Call Python inference service
     const response = await fetch('http://localhost:8000/detect', {
@@ -12,7 +12,11 @@ export async function POST(request: NextRequest) {
       },
       body: JSON.stringify({ 
         image: imageData, 
-        confidence: confidence 
+        confidence: confidence,
+        // Tile georeference from the fetch catalog; detections then come back with WGS84 geometry
+        transform,
+        crs,
+        origin
       }),
     })
     
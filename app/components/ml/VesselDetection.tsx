@@ -94,7 +94,7 @@ export default function VesselDetection() {
           id: Date.now() + idx,
           type: det.is_dark_vessel ? 'dark_vessel' : 'vessel',
           confidence: det.confidence,
-          coordinates: {
+          coordinates: det.geo ? { lat: det.geo.lat, lng: det.geo.lon } : {
             lat: 40.7128 + (Math.random() - 0.5) * 0.1, // Demo coordinates
             lng: -74.0060 + (Math.random() - 0.5) * 0.1
           },
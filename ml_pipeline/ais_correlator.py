@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIS correlator
+Matches SAR detections to AIS tracks at the acquisition time and reports the unmatched ones as dark-vessel events
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import aivdm
+import ais_tracks
+from ais_store import COLUMNS, AISStore, ais_columns, epoch_seconds, read_table
+from ais_tracks import EARTH_RADIUS_M
+
+# A detection without an AIS position within this distance / time is dark
+GATE_NM = float(os.environ.get("IODARKWATCH_CORRELATOR_GATE_NM", "2.0"))
+WINDOW_MIN = float(os.environ.get("IODARKWATCH_CORRELATOR_WINDOW_MIN", "30"))
+
+# Position uncertainty of an interpolated AIS track: SAR geolocation + AIS error,
+# growing with the time to the nearest report (unknown manoeuvres)
+POSITION_SIGMA_M = 250.0
+DRIFT_SIGMA_MPS = 0.5
+# A match this many sigmas away is as likely as no match at all
+CLUTTER_SIGMAS = 3.0
+
+NM = 1852.0
+# Fastest vessel assumed when reading AIS around detections from a store
+MAX_SPEED_KN = 40.0
+
+# Detections as parallel arrays; confidence and length_m may be NaN
+Detections = namedtuple("Detections", "lon lat time confidence length_m")
+
+EVENT_COLUMNS = ("detection", "time", "lon", "lat", "confidence", "length_m", "dark", "dark_confidence",
+                 "mmsi", "distance_m", "ais_gap_s", "match_confidence")
+
+
+def load_ais(path, bbox=None, start=None, end=None):
+    """ais_tracks.Tracks of an AIS position CSV, Parquet or NMEA file, or of an ais_store directory.
+
+    A store is queried for ``bbox`` between ``start`` and ``end`` (epoch
+    seconds), so only the partitions and row groups around the detections
+    are read; files are read whole.
+    """
+    if os.path.isdir(path):
+        columns = AISStore(path).query(bbox, start, end)
+    elif aivdm.is_nmea(path):
+        columns = aivdm.read_positions(path)
+    else:
+        columns = ais_columns(read_table(path), path)
+    return ais_tracks.build_tracks(*(columns[name] for name in COLUMNS))
+
+
+def search_area(detections, gate_nm=GATE_NM, window_min=WINDOW_MIN):
+    """(bbox, start, end) of the AIS that can match ``detections``: gate plus the furthest a vessel runs unreported"""
+    if not len(detections.lon):
+        return None, None, None
+    margin_m = gate_nm * NM + MAX_SPEED_KN * NM / 60 * window_min
+    margin_lat = np.degrees(margin_m / EARTH_RADIUS_M)
+    lat_min = max(float(detections.lat.min()) - margin_lat, -90.0)
+    lat_max = min(float(detections.lat.max()) + margin_lat, 90.0)
+    widest = np.cos(np.radians(max(abs(lat_min), abs(lat_max))))
+    margin_lon = min(np.degrees(margin_m / (EARTH_RADIUS_M * max(widest, 1e-6))), 180.0)
+    window_s = int(window_min * 60)
+    bbox = (max(float(detections.lon.min()) - margin_lon, -180.0), lat_min,
+            min(float(detections.lon.max()) + margin_lon, 180.0), lat_max)
+    return bbox, int(detections.time.min()) - window_s, int(detections.time.max()) + window_s
+
+
+def detections_from_response(response, acquired):
+    """Detections of an inference_server response (objects or columnar, georeferenced) taken at ``acquired``"""
+    payload = response["detections"]
+    if isinstance(payload, dict):
+        lon, lat = payload.get("lon"), payload.get("lat")
+        confidence = payload.get("confidence", payload.get("score"))
+        length = payload.get("length_m")
+    else:
+        geo = [detection.get("geo") or {} for detection in payload]
+        lon, lat = [g.get("lon") for g in geo], [g.get("lat") for g in geo]
+        confidence = [detection.get("confidence", detection.get("score")) for detection in payload]
+        length = [g.get("length_m") for g in geo]
+    if lon is None or any(v is None for v in lon):
+        raise ValueError("detections carry no lon/lat; send the image with its georeference")
+
+    count = len(lon)
+    as_array = lambda values: np.full(count, np.nan) if values is None else np.asarray(values, dtype=np.float64)
+    times = np.full(count, epoch_seconds([acquired])[0], dtype=np.int64)
+    return Detections(as_array(lon), as_array(lat), times, as_array(confidence), as_array(length))
+
+
+def load_detections(path, acquired=None):
+    """Detections of a saved server response (JSON, needs ``acquired``) or a CSV/Parquet table.
+
+    Tables need ``lon`` and ``lat`` columns and a ``time`` column unless
+    ``acquired`` is given; ``confidence`` and ``length_m`` are optional.
+    """
+    if str(path).endswith(".json"):
+        if acquired is None:
+            raise ValueError("server responses carry no acquisition time; pass it with --time")
+        with open(path) as f:
+            return detections_from_response(json.load(f), acquired)
+
+    frame = read_table(path)
+    count = len(frame)
+    if acquired is not None:
+        times = np.full(count, epoch_seconds([acquired])[0], dtype=np.int64)
+    elif "time" in frame.columns:
+        times = epoch_seconds(frame["time"])
+    else:
+        raise ValueError(f"{path} has no time column; pass the acquisition time with --time")
+    optional = lambda name: frame[name].to_numpy(np.float64) if name in frame.columns else np.full(count, np.nan)
+    return Detections(frame["lon"].to_numpy(np.float64), frame["lat"].to_numpy(np.float64), times,
+                      optional("confidence"), optional("length_m"))
+
+
+def unit_vectors(lon, lat):
+    """(N, 3) ECEF unit vectors; chord distances between them are great-circle distances for short ranges"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_metres(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def metres_to_chord(metres):
+    return 2 * np.sin(metres / (2 * EARTH_RADIUS_M))
+
+
+class AISIndex:
+    """AIS reports indexed by time, for position look-ups at any instant.
+
+    The reports' row numbers are kept in time order, so the reports near an
+    acquisition are one ``searchsorted`` window of that column. Only that
+    window is turned into tracks and placed at the acquisition time with
+    ``ais_tracks.positions_at``: great-circle interpolation between the
+    reports around it, or SOG/COG dead-reckoning where the window holds
+    reports on one side only.
+    """
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.order = np.argsort(tracks.time, kind="stable")
+        self.times = tracks.time[self.order]
+
+    def __len__(self):
+        return len(self.tracks.time)
+
+    def window(self, start, end):
+        """ais_tracks.Tracks of the reports between ``start`` and ``end`` (inclusive)"""
+        lo = np.searchsorted(self.times, start, side="left")
+        hi = np.searchsorted(self.times, end, side="right")
+        # Row numbers back in (mmsi, time) order without a sort, so build_tracks skips its own
+        selected = np.zeros(len(self.order), dtype=bool)
+        selected[self.order[lo:hi]] = True
+        rows = np.flatnonzero(selected)
+        t = self.tracks
+        return ais_tracks.build_tracks(t.mmsi[rows], t.time[rows], t.lat[rows], t.lon[rows], t.sog[rows],
+                                       t.cog[rows])
+
+    def positions_at(self, when, window_s):
+        """(mmsi, lon, lat, gap_s) of every vessel with a report within ``window_s`` of ``when``.
+
+        ``gap_s`` is the time from the nearest report, a measure of how far
+        the estimate may have drifted.
+        """
+        tracks = self.window(when - window_s, when + window_s)
+        positions = ais_tracks.positions_at(tracks, [when], max_gap_s=window_s)
+        keep = np.isfinite(positions.gap_s[:, 0])
+        return (positions.mmsi[keep, 0], positions.lon[keep, 0], positions.lat[keep, 0],
+                positions.gap_s[keep, 0])
+
+
+def _assign(pairs_i, pairs_j, cost, n_rows, n_cols):
+    """One-to-one assignment minimising total cost over sparse (row, col, cost) pairs.
+
+    The bipartite graph is split into connected components: single-edge
+    components (most of them) are matched directly, the rest are solved
+    with ``linear_sum_assignment`` on their own small dense matrix.
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if not len(cost):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    graph = coo_matrix((np.ones(len(cost)), (pairs_i, n_rows + pairs_j)), shape=(n_rows + n_cols,) * 2)
+    _, labels = connected_components(graph, directed=False)
+    component = labels[pairs_i]
+    edges = np.bincount(component)
+
+    simple = edges[component] == 1
+    rows, cols = [pairs_i[simple]], [pairs_j[simple]]
+    for label in np.flatnonzero(edges > 1):
+        members = np.flatnonzero(component == label)
+        r, r_index = np.unique(pairs_i[members], return_inverse=True)
+        c, c_index = np.unique(pairs_j[members], return_inverse=True)
+        dense = np.full((len(r), len(c)), np.inf)
+        dense[r_index, c_index] = cost[members]
+        # Pairs outside the gate cost more than any set of gated pairs
+        finite = np.isfinite(dense)
+        dense[~finite] = cost[members].sum() * 2 + 1
+        row_index, col_index = linear_sum_assignment(dense)
+        keep = finite[row_index, col_index]
+        rows.append(r[row_index[keep]])
+        cols.append(c[col_index[keep]])
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def correlate(detections, index, gate_nm=GATE_NM, window_min=WINDOW_MIN):
+    """One event per detection: its AIS match, or a dark-vessel flag.
+
+    Detections are grouped by acquisition time. For each group the AIS
+    tracks are placed at that instant (``AISIndex.positions_at``), pairs
+    within ``gate_nm`` are found with a KD-tree on ECEF unit vectors and
+    detections are matched one-to-one to vessels, minimising the summed
+    squared normalised distance. The Gaussian likelihood of a pair uses a
+    sigma that grows with the AIS report gap; ``match_confidence`` is the
+    matched pair's share of the detection's likelihood against all gated
+    vessels plus a clutter term, ``dark_confidence`` the clutter term's
+    share for unmatched detections. Returns a dict of ``EVENT_COLUMNS`` arrays.
+    """
+    from scipy.spatial import cKDTree
+
+    count = len(detections.lon)
+    mmsi = np.full(count, -1, dtype=np.int64)
+    distance = np.full(count, np.nan)
+    gap = np.full(count, np.nan)
+    match_confidence = np.zeros(count)
+    dark_confidence = np.zeros(count)
+
+    gate = gate_nm * NM
+    clutter = np.exp(-0.5 * CLUTTER_SIGMAS ** 2)
+    times, group = np.unique(detections.time, return_inverse=True)
+    for g, when in enumerate(times):
+        members = np.flatnonzero(group == g)
+        vessels, lon, lat, vessel_gap = index.positions_at(int(when), window_min * 60)
+        if not len(vessels):
+            dark_confidence[members] = 1.0
+            continue
+
+        tree = cKDTree(unit_vectors(lon, lat))
+        pairs = cKDTree(unit_vectors(detections.lon[members], detections.lat[members])).sparse_distance_matrix(
+            tree, metres_to_chord(gate), output_type="ndarray")
+        i, j = pairs["i"].astype(np.int64), pairs["j"].astype(np.int64)
+        metres = chord_to_metres(pairs["v"])
+        sigma = POSITION_SIGMA_M + DRIFT_SIGMA_MPS * vessel_gap[j]
+        cost = (metres / sigma) ** 2
+        likelihood = np.exp(-0.5 * cost)
+        row_total = np.bincount(i, weights=likelihood, minlength=len(members)) + clutter
+
+        rows, cols = _assign(i, j, cost, len(members), len(vessels))
+        pair_of = {(r, c): k for k, (r, c) in enumerate(zip(i.tolist(), j.tolist()))}
+        chosen = np.array([pair_of[(r, c)] for r, c in zip(rows.tolist(), cols.tolist())], dtype=np.int64)
+
+        dark_confidence[members] = clutter / row_total
+        if len(chosen):
+            target = members[rows]
+            mmsi[target] = vessels[cols]
+            distance[target] = metres[chosen]
+            gap[target] = vessel_gap[cols]
+            match_confidence[target] = likelihood[chosen] / row_total[rows]
+            dark_confidence[target] = 0.0
+
+    dark = mmsi < 0
+    return {
+        "detection": np.arange(count),
+        "time": detections.time,
+        "lon": detections.lon,
+        "lat": detections.lat,
+        "confidence": detections.confidence,
+        "length_m": detections.length_m,
+        "dark": dark,
+        "dark_confidence": dark_confidence,
+        "mmsi": mmsi,
+        "distance_m": distance,
+        "ais_gap_s": gap,
+        "match_confidence": match_confidence,
+    }
+
+
+def dark_events(events):
+    """Only the unmatched detections, most certain first"""
+    order = np.argsort(-events["dark_confidence"], kind="stable")
+    order = order[events["dark"][order]]
+    return {name: values[order] for name, values in events.items()}
+
+
+def write_events(events, path):
+    """Write events as CSV, Parquet or JSON records (by extension)"""
+    import pandas as pd
+
+    frame = pd.DataFrame(events)
+    frame["time"] = pd.to_datetime(frame["time"], unit="s", utc=True)
+    if str(path).endswith((".parquet", ".pq")):
+        frame.to_parquet(path, index=False)
+    elif str(path).endswith(".json"):
+        frame.to_json(path, orient="records", date_format="iso")
+    else:
+        frame.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("ais", help="AIS positions (CSV or Parquet: mmsi, timestamp, lat, lon[, sog, cog]), "
+                                    "a tag-blocked NMEA file or an ais_store directory")
+    parser.add_argument("detections", help="Server response (.json) or table with lon, lat[, time]")
+    parser.add_argument("--time", help="SAR acquisition time (ISO 8601, UTC) for all detections")
+    parser.add_argument("--gate-nm", type=float, default=GATE_NM)
+    parser.add_argument("--window-min", type=float, default=WINDOW_MIN)
+    parser.add_argument("--out", default="dark_events.csv", help="Dark-vessel events (.csv, .parquet or .json)")
+    parser.add_argument("--all", action="store_true", help="Write matched detections too")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    detections = load_detections(args.detections, args.time)
+    index = AISIndex(load_ais(args.ais, *search_area(detections, args.gate_nm, args.window_min)))
+    loaded = time.perf_counter()
+    events = correlate(detections, index, args.gate_nm, args.window_min)
+    correlated = time.perf_counter()
+
+    dark = int(events["dark"].sum())
+    print(f"📡 {len(index)} AIS reports, {len(detections.lon)} detections "
+          f"(loaded in {loaded - start:.2f}s, correlated in {correlated - loaded:.2f}s)")
+    print(f"✅ {len(detections.lon) - dark} matched to AIS within {args.gate_nm:g} NM / {args.window_min:g} min")
+    print(f"🚨 {dark} dark-vessel events")
+
+    write_events(events if args.all else dark_events(events), args.out)
+    print(f"💾 Events written to {args.out}")
+    return True
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
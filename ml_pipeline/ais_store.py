@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIS store
+Parquet AIS archive partitioned by UTC date and geohash cell; bbox/time queries prune partitions and row groups
+"""
+
+import argparse
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+# Geohash length of the spatial partitions: 2 = ~1250 x 625 km cells, 3 = ~156 km
+GEOHASH_PRECISION = int(os.environ.get("IODARKWATCH_AIS_GEOHASH_PRECISION", "2"))
+# Rows per Parquet row group, the unit of min/max pruning inside a partition
+ROW_GROUP_ROWS = int(os.environ.get("IODARKWATCH_AIS_ROW_GROUP_ROWS", "65536"))
+# Rows read from a CSV dump at a time while ingesting
+INGEST_CHUNK_ROWS = 2_000_000
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Stored columns, in file order; times are epoch seconds
+COLUMNS = ("mmsi", "time", "lat", "lon", "sog", "cog")
+
+# Accepted spellings of the AIS columns (MarineCadastre, AISHub, Spire exports)
+AIS_COLUMNS = {
+    "mmsi": ("mmsi", "MMSI"),
+    "time": ("timestamp", "time", "BaseDateTime", "basedatetime", "datetime"),
+    "lat": ("lat", "LAT", "latitude", "Latitude"),
+    "lon": ("lon", "LON", "longitude", "Longitude"),
+    "sog": ("sog", "SOG", "speed"),
+    "cog": ("cog", "COG", "course"),
+}
+
+
+def epoch_seconds(values):
+    """int64 epoch seconds of datetime strings or values"""
+    import pandas as pd
+
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).as_unit("s").asi8
+
+
+def read_table(path):
+    """DataFrame of a CSV or Parquet file"""
+    import pandas as pd
+
+    if str(path).endswith((".parquet", ".pq")):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def _column(frame, names):
+    for name in names:
+        if name in frame.columns:
+            return frame[name]
+    return None
+
+
+def ais_columns(frame, source="input"):
+    """Dict of ``COLUMNS`` arrays of a DataFrame with any accepted column spelling; SOG/COG may be missing"""
+    import pandas as pd
+
+    columns = {key: _column(frame, names) for key, names in AIS_COLUMNS.items()}
+    missing = [key for key in ("mmsi", "time", "lat", "lon") if columns[key] is None]
+    if missing:
+        raise ValueError(f"{source} has no {', '.join(missing)} column (accepted: "
+                         + "; ".join(f"{key}: {'/'.join(AIS_COLUMNS[key])}" for key in missing) + ")")
+    count = len(frame)
+    # Integer times are taken as epoch seconds already
+    integer_time = pd.api.types.is_integer_dtype(columns["time"].dtype)
+    return {
+        "mmsi": columns["mmsi"].to_numpy(np.int64),
+        "time": columns["time"].to_numpy(np.int64) if integer_time else epoch_seconds(columns["time"]),
+        "lat": columns["lat"].to_numpy(np.float64),
+        "lon": columns["lon"].to_numpy(np.float64),
+        "sog": np.full(count, np.nan) if columns["sog"] is None else columns["sog"].to_numpy(np.float64),
+        "cog": np.full(count, np.nan) if columns["cog"] is None else columns["cog"].to_numpy(np.float64),
+    }
+
+
+def geohash_codes(lat, lon, precision=GEOHASH_PRECISION):
+    """Integer geohash codes (``5 * precision`` bits) of coordinate arrays, bit-plane by bit-plane for all points"""
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lon_cell = np.clip(((np.asarray(lon) + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat_cell = np.clip(((np.asarray(lat) + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+
+    # Interleave, longitude first, most significant bit first
+    code = np.zeros(lon_cell.shape, dtype=np.int64)
+    for bit in range(bits):
+        if bit % 2 == 0:
+            code = (code << 1) | ((lon_cell >> (lon_bits - 1 - bit // 2)) & 1)
+        else:
+            code = (code << 1) | ((lat_cell >> (lat_bits - 1 - bit // 2)) & 1)
+    return code
+
+
+def geohash_string(code, precision=GEOHASH_PRECISION):
+    return "".join(GEOHASH_ALPHABET[(int(code) >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash strings of coordinate arrays"""
+    codes = geohash_codes(lat, lon, precision)
+    return np.array([geohash_string(code, precision) for code in codes.ravel()]).reshape(codes.shape)
+
+
+def geohash_bounds(cell):
+    """(lon_min, lat_min, lon_max, lat_max) of a geohash cell"""
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    lon_turn = True
+    for char in cell:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if lon_turn else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            lon_turn = not lon_turn
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def _overlaps(bounds, bbox):
+    """Whether ``bounds`` intersects ``bbox``; ``bbox`` may cross the antimeridian (lon_min > lon_max)"""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if bounds[3] < lat_min or bounds[1] > lat_max:
+        return False
+    if lon_min <= lon_max:
+        return bounds[2] >= lon_min and bounds[0] <= lon_max
+    return bounds[2] >= lon_min or bounds[0] <= lon_max
+
+
+def _in_bbox(lon, lat, bbox):
+    lon_min, lat_min, lon_max, lat_max = bbox
+    inside_lat = (lat >= lat_min) & (lat <= lat_max)
+    if lon_min <= lon_max:
+        return inside_lat & (lon >= lon_min) & (lon <= lon_max)
+    return inside_lat & ((lon >= lon_min) | (lon <= lon_max))
+
+
+def _date(seconds):
+    return str(np.datetime64(int(seconds) // 86400, "D"))
+
+
+class AISStore:
+    """AIS positions under ``root/date=YYYY-MM-DD/cell=<geohash>/part-*.parquet``.
+
+    Every ingest call writes one new file per partition it touches, rows
+    sorted by time, in row groups of ``ROW_GROUP_ROWS`` with Parquet's
+    min/max statistics. ``compact`` merges a partition's files back into
+    one time-sorted file; ``ingest_file`` does so for every partition it
+    wrote to, so a dump leaves one file per partition however many chunks
+    it was read in. ``query`` opens only partitions whose date and cell
+    intersect the request, memory-maps their files and reads only the row
+    groups whose time, lat and lon ranges do.
+    """
+
+    def __init__(self, root, precision=GEOHASH_PRECISION):
+        self.root = Path(root)
+        self.precision = precision
+
+    def ingest(self, columns, touched=None):
+        """Write a dict of ``COLUMNS`` arrays; returns the number of rows written.
+
+        ``touched`` is a set that collects the partition directories written
+        to, for a later ``compact``.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        count = len(columns["time"])
+        if not count:
+            return 0
+        times = np.asarray(columns["time"], dtype=np.int64)
+        days = times // 86400
+        cells = geohash_codes(columns["lat"], columns["lon"], self.precision)
+
+        # Partition-major, time-minor order, then one contiguous run per partition
+        order = np.lexsort((times, cells, days))
+        day_sorted, cell_sorted = days[order], cells[order]
+        breaks = np.flatnonzero((day_sorted[1:] != day_sorted[:-1]) | (cell_sorted[1:] != cell_sorted[:-1])) + 1
+        table = pa.table({
+            "mmsi": pa.array(np.asarray(columns["mmsi"])[order], type=pa.int32()),
+            "time": pa.array(times[order], type=pa.int64()),
+            "lat": pa.array(np.asarray(columns["lat"], dtype=np.float64)[order]),
+            "lon": pa.array(np.asarray(columns["lon"], dtype=np.float64)[order]),
+            "sog": pa.array(np.asarray(columns["sog"], dtype=np.float32)[order]),
+            "cog": pa.array(np.asarray(columns["cog"], dtype=np.float32)[order]),
+        })
+
+        part = f"part-{uuid.uuid4().hex[:12]}.parquet"
+        for first, last in zip(np.r_[0, breaks], np.r_[breaks, count]):
+            directory = (self.root / f"date={_date(times[order[first]])}"
+                         / f"cell={geohash_string(cell_sorted[first], self.precision)}")
+            directory.mkdir(parents=True, exist_ok=True)
+            if touched is not None:
+                touched.add(directory)
+            pq.write_table(table.slice(first, last - first), directory / part, row_group_size=ROW_GROUP_ROWS,
+                           compression="zstd", write_statistics=True)
+        return count
+
+    def ingest_file(self, path, chunk_rows=INGEST_CHUNK_ROWS):
+        """Ingest a CSV, Parquet or raw NMEA AIS dump in chunks; returns the number of rows written.
+
+        Each chunk adds a file to the partitions it touches; they are
+        compacted into one file per partition once the dump is read.
+        """
+        import pandas as pd
+
+        import aivdm
+
+        touched = set()
+        if aivdm.is_nmea(path):
+            batches = aivdm.iter_batches(str(path), batch_rows=chunk_rows)
+            rows = sum(self.ingest(aivdm.storable(columns), touched) for kind, columns in batches
+                       if kind == "positions")
+        else:
+            if str(path).endswith((".parquet", ".pq")):
+                import pyarrow.parquet as pq
+
+                chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows))
+            else:
+                chunks = pd.read_csv(path, chunksize=chunk_rows)
+            rows = sum(self.ingest(ais_columns(chunk, path), touched) for chunk in chunks)
+        self.compact(sorted(touched))
+        return rows
+
+    def compact(self, partitions=None):
+        """Merge the files of each partition (default: all) into one time-sorted file.
+
+        The merged file is written under a temporary name and renamed into
+        place before the old files are removed, so a query never sees a
+        half-written partition. Returns the number of partitions rewritten.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        compacted = 0
+        for partition in self.partitions() if partitions is None else partitions:
+            paths = sorted(Path(partition).glob("*.parquet"))
+            if len(paths) < 2:
+                continue
+            table = pa.concat_tables(pq.read_table(path) for path in paths)
+            # Stable sort: reports with equal times keep their ingest order
+            table = table.take(pc.sort_indices(table, sort_keys=[("time", "ascending")]))
+            part = Path(partition) / f"part-{uuid.uuid4().hex[:12]}.parquet"
+            staging = part.with_suffix(".parquet.tmp")
+            pq.write_table(table, staging, row_group_size=ROW_GROUP_ROWS, compression="zstd", write_statistics=True)
+            os.replace(staging, part)
+            for path in paths:
+                path.unlink()
+            compacted += 1
+        return compacted
+
+    def partitions(self, bbox=None, start=None, end=None):
+        """Partition directories whose date is within [start, end] and whose cell meets ``bbox``"""
+        first = _date(start) if start is not None else None
+        last = _date(end) if end is not None else None
+        selected = []
+        for day in sorted(self.root.glob("date=*")):
+            date = day.name[len("date="):]
+            if (first is not None and date < first) or (last is not None and date > last):
+                continue
+            for cell in sorted(day.glob("cell=*")):
+                if bbox is None or _overlaps(geohash_bounds(cell.name[len("cell="):]), bbox):
+                    selected.append(cell)
+        return selected
+
+    def query(self, bbox=None, start=None, end=None, stats=None):
+        """Dict of ``COLUMNS`` arrays of the positions in ``bbox`` between ``start`` and ``end`` (epoch seconds).
+
+        Rows come back grouped by partition and time-sorted within each;
+        the files of a partition that has not been compacted yet are merged
+        by time as they are read. Pass a dict as ``stats`` to get the
+        partitions, files and row groups read and skipped.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        stats = {} if stats is None else stats
+        stats.update(partitions=0, files=0, row_groups=0, row_groups_skipped=0)
+        low = -np.inf if start is None else start
+        high = np.inf if end is None else end
+        lon_min, lat_min, lon_max, lat_max = bbox if bbox is not None else (-180, -90, 180, 90)
+
+        chunks = []
+        for partition in self.partitions(bbox, start, end):
+            stats["partitions"] += 1
+            partition_chunks = []
+            for path in sorted(partition.glob("*.parquet")):
+                source = pq.ParquetFile(path, memory_map=True)
+                metadata = source.metadata
+                position = {name: source.schema_arrow.get_field_index(name) for name in ("time", "lat", "lon")}
+                keep = []
+                for group in range(metadata.num_row_groups):
+                    ranges = {}
+                    for name, column in position.items():
+                        statistics = metadata.row_group(group).column(column).statistics
+                        ranges[name] = ((statistics.min, statistics.max) if statistics is not None
+                                        and statistics.has_min_max else (-np.inf, np.inf))
+                    if (ranges["time"][1] < low or ranges["time"][0] > high
+                            or not _overlaps((ranges["lon"][0], ranges["lat"][0], ranges["lon"][1],
+                                              ranges["lat"][1]), (lon_min, lat_min, lon_max, lat_max))):
+                        stats["row_groups_skipped"] += 1
+                        continue
+                    keep.append(group)
+                stats["files"] += 1
+                stats["row_groups"] += len(keep)
+                if keep:
+                    partition_chunks.append(source.read_row_groups(keep, columns=list(COLUMNS)))
+            if len(partition_chunks) > 1:
+                table = pa.concat_tables(partition_chunks)
+                partition_chunks = [table.take(pc.sort_indices(table, sort_keys=[("time", "ascending")]))]
+            chunks.extend(partition_chunks)
+
+        if not chunks:
+            return {name: np.empty(0, dtype=np.int64 if name in ("mmsi", "time") else np.float64)
+                    for name in COLUMNS}
+        columns = {name: np.concatenate([chunk.column(name).to_numpy() for chunk in chunks]) for name in COLUMNS}
+        mask = (columns["time"] >= low) & (columns["time"] <= high)
+        if bbox is not None:
+            mask &= _in_bbox(columns["lon"], columns["lat"], bbox)
+        return {
+            "mmsi": columns["mmsi"][mask].astype(np.int64),
+            "time": columns["time"][mask],
+            "lat": columns["lat"][mask],
+            "lon": columns["lon"][mask],
+            "sog": columns["sog"][mask].astype(np.float64),
+            "cog": columns["cog"][mask].astype(np.float64),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root", help="Store directory")
+    parser.add_argument("--ingest", nargs="+", metavar="DUMP", help="CSV, Parquet or NMEA (AIVDM) AIS dumps to add")
+    parser.add_argument("--compact", action="store_true", help="Merge every partition's files into one")
+    parser.add_argument("--bbox", help="Query: lon_min,lat_min,lon_max,lat_max")
+    parser.add_argument("--start", help="Query: first time (ISO 8601, UTC)")
+    parser.add_argument("--end", help="Query: last time (ISO 8601, UTC)")
+    parser.add_argument("--out", help="Write the query result (.csv or .parquet)")
+    args = parser.parse_args()
+
+    store = AISStore(args.root)
+    for path in args.ingest or ():
+        start = time.perf_counter()
+        rows = store.ingest_file(path)
+        seconds = time.perf_counter() - start
+        print(f"📥 {path}: {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+    if args.compact:
+        print(f"🗜️ {store.compact()} partitions compacted")
+
+    if args.bbox or args.start or args.end:
+        bbox = tuple(float(v) for v in args.bbox.split(",")) if args.bbox else None
+        start = epoch_seconds([args.start])[0] if args.start else None
+        end = epoch_seconds([args.end])[0] if args.end else None
+        stats = {}
+        began = time.perf_counter()
+        rows = store.query(bbox, start, end, stats)
+        seconds = time.perf_counter() - began
+        print(f"🔎 {len(rows['time'])} positions in {seconds * 1000:.1f} ms ({stats['partitions']} partitions, "
+              f"{stats['row_groups']} row groups read, {stats['row_groups_skipped']} skipped)")
+        if args.out:
+            import pandas as pd
+
+            frame = pd.DataFrame(rows)
+            frame["time"] = pd.to_datetime(frame["time"], unit="s", utc=True)
+            if args.out.endswith((".parquet", ".pq")):
+                frame.to_parquet(args.out, index=False)
+            else:
+                frame.to_csv(args.out, index=False)
+            print(f"💾 Written to {args.out}")
+    return True
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIS track kernel
+Positions of every vessel at a batch of query times from MMSI- and time-sorted columnar AIS, with no per-vessel loops
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+KNOT = 1852.0 / 3600
+
+# Columnar AIS sorted by (mmsi, time); ``starts`` indexes each vessel's first report
+# and ``vessels`` holds its MMSI. Times are epoch seconds.
+Tracks = namedtuple("Tracks", "mmsi time lat lon sog cog starts vessels")
+# Estimated positions; ``gap_s`` is the time to the nearest report, ``interpolated``
+# is False where the position was dead-reckoned past either end of the track
+TrackPositions = namedtuple("TrackPositions", "mmsi lon lat gap_s interpolated")
+
+
+def build_tracks(mmsi, times, lat, lon, sog=None, cog=None):
+    """Tracks of unordered AIS columns; one ``lexsort``, skipped when the input is already sorted"""
+    mmsi = np.asarray(mmsi, dtype=np.int64)
+    times = np.asarray(times, dtype=np.int64)
+    columns = [np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)]
+    for values in (sog, cog):
+        columns.append(np.full(len(mmsi), np.nan) if values is None else np.asarray(values, dtype=np.float64))
+
+    same = mmsi[1:] == mmsi[:-1]
+    if not (np.all(mmsi[1:] >= mmsi[:-1]) and np.all(times[1:][same] >= times[:-1][same])):
+        order = np.lexsort((times, mmsi))
+        mmsi, times = mmsi[order], times[order]
+        columns = [values[order] for values in columns]
+
+    starts = np.flatnonzero(np.r_[True, mmsi[1:] != mmsi[:-1]]) if len(mmsi) else np.empty(0, dtype=np.int64)
+    return Tracks(mmsi, times, *columns, starts, mmsi[starts])
+
+
+def _segment_search(tracks, track, query):
+    """Per (track, query) pair, the number of the track's reports at or before ``query``.
+
+    Each track's times are offset by ``track * span`` so the whole column is
+    one increasing key; a single ``searchsorted`` then searches every
+    track's own segment at once. Queries are clipped to just before the
+    first and at the last time of the column, which keeps them inside their
+    segment without changing the count.
+    """
+    t_min, t_max = int(tracks.time.min()) - 1, int(tracks.time.max())
+    span = t_max - t_min + 1
+    run = np.diff(np.r_[tracks.starts, len(tracks.time)])
+    key = np.repeat(np.arange(len(tracks.starts), dtype=np.int64) * span, run) + (tracks.time - t_min)
+    probe = track * span + (np.clip(query, t_min, t_max) - t_min)
+    return np.searchsorted(key, probe, side="right") - tracks.starts[track]
+
+
+def _unit_vectors(lon, lat):
+    lon, lat = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def great_circle_interpolate(lon0, lat0, lon1, lat1, fraction):
+    """Point at ``fraction`` of the great circle from (lon0, lat0) to (lon1, lat1), in degrees"""
+    p0, p1 = _unit_vectors(lon0, lat0), _unit_vectors(lon1, lat1)
+    angle = np.arccos(np.clip((p0 * p1).sum(axis=0), -1.0, 1.0))
+    sin_angle = np.sin(angle)
+    # Coincident reports: slerp degenerates to a linear blend
+    tiny = sin_angle < 1e-12
+    sin_angle = np.where(tiny, 1.0, sin_angle)
+    w0 = np.where(tiny, 1 - fraction, np.sin((1 - fraction) * angle) / sin_angle)
+    w1 = np.where(tiny, fraction, np.sin(fraction * angle) / sin_angle)
+    x, y, z = w0 * p0 + w1 * p1
+    return np.degrees(np.arctan2(y, x)), np.degrees(np.arctan2(z, np.hypot(x, y)))
+
+
+def dead_reckon(lon, lat, sog, cog, dt):
+    """Great-circle destination after ``dt`` seconds at ``sog`` knots on course ``cog``; NaN SOG/COG hold position"""
+    distance = np.nan_to_num(sog) * KNOT * dt / EARTH_RADIUS_M
+    course = np.radians(np.nan_to_num(cog))
+    phi, lam = np.radians(lat), np.radians(lon)
+    sin_phi = np.sin(phi) * np.cos(distance) + np.cos(phi) * np.sin(distance) * np.cos(course)
+    phi2 = np.arcsin(np.clip(sin_phi, -1.0, 1.0))
+    lam2 = lam + np.arctan2(np.sin(course) * np.sin(distance) * np.cos(phi),
+                            np.cos(distance) - np.sin(phi) * sin_phi)
+    return (np.degrees(lam2) + 180) % 360 - 180, np.degrees(phi2)
+
+
+def positions_at(tracks, times, vessels=None, max_gap_s=None):
+    """Positions of vessels at query ``times`` (epoch seconds).
+
+    Without ``vessels`` every track is evaluated at every time and the
+    arrays are ``(n_tracks, n_times)``. With ``vessels`` (MMSIs, same
+    length as ``times``) each vessel is evaluated at its own time and the
+    arrays are flat; unknown MMSIs come back as NaN.
+
+    Inside a track the position is the great-circle interpolation between
+    the reports around the query time. Before the first or after the last
+    report it is dead-reckoned from that report's SOG/COG. Positions
+    further than ``max_gap_s`` from the nearest report are NaN.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    if vessels is None:
+        shape = (len(tracks.starts), times.size)
+        track = np.repeat(np.arange(len(tracks.starts), dtype=np.int64), times.size)
+        query = np.tile(times.ravel(), len(tracks.starts))
+        known = np.ones(track.size, dtype=bool)
+    else:
+        vessels = np.asarray(vessels, dtype=np.int64)
+        shape = vessels.shape
+        track = np.searchsorted(tracks.vessels, vessels.ravel())
+        known = track < len(tracks.vessels)
+        known[known] = tracks.vessels[track[known]] == vessels.ravel()[known]
+        track = np.where(known, track, 0)
+        query = np.broadcast_to(times, shape).ravel()
+
+    if not len(tracks.time) or not track.size:
+        nan = np.full(shape, np.nan)
+        return TrackPositions(np.full(shape, -1, dtype=np.int64), nan, nan.copy(), nan.copy(),
+                              np.zeros(shape, dtype=bool))
+
+    start = tracks.starts[track]
+    count = np.diff(np.r_[tracks.starts, len(tracks.time)])[track]
+    before = _segment_search(tracks, track, query)
+    i0 = start + np.maximum(before - 1, 0)
+    i1 = start + np.minimum(before, count - 1)
+    t0, t1 = tracks.time[i0], tracks.time[i1]
+    inside = (before > 0) & (before < count) & (t1 > t0)
+
+    lon = np.empty(track.size)
+    lat = np.empty(track.size)
+    fraction = (query[inside] - t0[inside]) / (t1[inside] - t0[inside])
+    lon[inside], lat[inside] = great_circle_interpolate(tracks.lon[i0[inside]], tracks.lat[i0[inside]],
+                                                        tracks.lon[i1[inside]], tracks.lat[i1[inside]], fraction)
+
+    # Past either end, the report at that end
+    nearest_end = np.where(before > 0, i0, i1)
+    outside = ~inside
+    anchor = nearest_end[outside]
+    dt = (query[outside] - tracks.time[anchor]).astype(np.float64)
+    lon[outside], lat[outside] = dead_reckon(tracks.lon[anchor], tracks.lat[anchor],
+                                             tracks.sog[anchor], tracks.cog[anchor], dt)
+
+    gap = np.where(inside, np.minimum(query - t0, t1 - query), np.abs(query - tracks.time[nearest_end]))
+    gap = gap.astype(np.float64)
+    unknown = ~known
+    if max_gap_s is not None:
+        unknown |= gap > max_gap_s
+    lon[unknown] = lat[unknown] = gap[unknown] = np.nan
+
+    mmsi = np.where(known, tracks.vessels[track], -1)
+    return TrackPositions(mmsi.reshape(shape), lon.reshape(shape), lat.reshape(shape), gap.reshape(shape),
+                          (inside & ~unknown).reshape(shape))
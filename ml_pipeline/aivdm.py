@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIVDM decoder
+Decodes raw AIS (NMEA AIVDM/AIVDO) from files or a TCP feed into columnar NumPy batches, a chunk at a time
+"""
+
+import argparse
+import bisect
+import re
+import socket
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Bytes read from a file or socket per decode call (whole lines only)
+CHUNK_BYTES = 8 * 1024 * 1024
+# Rows per yielded batch
+BATCH_ROWS = 65536
+# Incomplete multi-sentence messages kept waiting for their next fragment
+MAX_PENDING_FRAGMENTS = 1024
+# A TCP feed flushes what it has after this long without data
+FLUSH_SECONDS = 1.0
+
+# Always read as NMEA; other text files only when their first line is an AIVDM/AIVDO sentence (is_nmea)
+NMEA_SUFFIXES = (".nmea", ".aivdm", ".ais")
+# Optional tag block, then !xxVDM / !xxVDO
+NMEA_LINE = re.compile(rb"^(\\[^\\]*\\)?!\w{2}VD[MO],")
+
+POSITION_FIELDS = {
+    "mmsi": np.int64,
+    "time": np.int64,
+    "msg_type": np.int8,
+    "status": np.int8,
+    "lat": np.float64,
+    "lon": np.float64,
+    "sog": np.float64,
+    "cog": np.float64,
+    "heading": np.float64,
+    "second": np.int8,
+}
+STATIC_FIELDS = {
+    "mmsi": np.int64,
+    "time": np.int64,
+    "msg_type": np.int8,
+    "imo": np.int64,
+    "callsign": "U7",
+    "name": "U20",
+    "ship_type": np.int16,
+    "length_m": np.float64,
+    "width_m": np.float64,
+    "draught_m": np.float64,
+    "destination": "U20",
+}
+
+# Payload bits a message needs before its fields can be read
+MIN_BITS = {1: 143, 2: 143, 3: 143, 5: 420, 18: 139, 19: 301, 24: 160}
+
+# Position fields: (bits, signed), and their offsets in class A (types 1-3) and class B (18, 19) reports
+POSITION_BITS = {"sog": (10, False), "lon": (28, True), "lat": (27, True), "cog": (12, False),
+                 "heading": (9, False), "second": (6, False)}
+CLASS_A = {"sog": 50, "lon": 61, "lat": 89, "cog": 116, "heading": 128, "second": 137}
+CLASS_B = {"sog": 46, "lon": 57, "lat": 85, "cog": 112, "heading": 124, "second": 133}
+
+COMMA, BANG, STAR, BACKSLASH = ord(","), ord("!"), ord("*"), ord("\\")
+
+# Payload character -> 6-bit value ('0'..'W' = 0..39, '`'..'w' = 40..63)
+ARMOUR = np.zeros(256, dtype=np.int64)
+ARMOUR[48:88] = np.arange(40)
+ARMOUR[96:120] = np.arange(40, 64)
+# Zero bytes appended to every decoded buffer, so payload gathers never run off its end
+PADDING = bytes(80)
+
+
+def _symbols(buf, start, length, width):
+    """(width, N) 6-bit values of payloads ``buf[start:start+length]``, zero past each payload's end.
+
+    One row per character position, so each field reads contiguous rows.
+    ``buf`` must end with ``PADDING``.
+    """
+    offset = np.arange(width)[:, None]
+    values = ARMOUR[buf[start + offset]]
+    values[offset >= length] = 0
+    return values
+
+
+def _field(symbols, offset, bits, signed=False):
+    """Unsigned (or two's complement) integer of ``bits`` bits at bit ``offset`` of every payload"""
+    first, last = offset // 6, (offset + bits - 1) // 6
+    value = symbols[first]
+    for row in range(first + 1, last + 1):
+        value = (value << 6) | symbols[row]
+    value = (value >> ((last + 1) * 6 - offset - bits)) & ((1 << bits) - 1)
+    if signed:
+        value = np.where(value >= 1 << (bits - 1), value - (1 << bits), value)
+    return value
+
+
+def _text(symbols, offset, chars):
+    """Six-bit ASCII strings of ``chars`` characters at bit ``offset``, cut at the first '@' and stripped"""
+    codes = np.stack([_field(symbols, offset + 6 * i, 6) for i in range(chars)], axis=1)
+    ascii_codes = np.where(codes < 32, codes + 64, codes).astype(np.uint8)
+    # '@' (0) ends the string
+    ascii_codes[np.logical_or.accumulate(codes == 0, axis=1)] = ord(" ")
+    text = np.ascontiguousarray(ascii_codes).view(f"S{chars}")[:, 0]
+    return np.char.strip(text).astype(f"U{chars}")
+
+
+def _scaled(value, scale, missing):
+    return np.where(value == missing, np.nan, value / scale)
+
+
+def _degrees(value, limit):
+    """Coordinate in degrees of 1/10000 minute units; NaN for 'not available' (91 / 181) and out of range"""
+    degrees = value / 600000.0
+    return np.where(np.abs(degrees) <= limit, degrees, np.nan)
+
+
+def _decode_positions(symbols, msg_type, times):
+    """POSITION_FIELDS columns of type 1/2/3/18/19 payloads"""
+    class_b = msg_type >= 18
+    fields = {}
+    for name, (bits, signed) in POSITION_BITS.items():
+        fields[name] = np.where(class_b, _field(symbols, CLASS_B[name], bits, signed),
+                                _field(symbols, CLASS_A[name], bits, signed))
+    return {
+        "mmsi": _field(symbols, 8, 30),
+        "time": times,
+        "msg_type": msg_type.astype(np.int8),
+        "status": np.where(class_b, 15, _field(symbols, 38, 4)).astype(np.int8),
+        "lat": _degrees(fields["lat"], 90),
+        "lon": _degrees(fields["lon"], 180),
+        "sog": _scaled(fields["sog"], 10.0, 1023),
+        "cog": _scaled(fields["cog"], 10.0, 3600),
+        "heading": _scaled(fields["heading"], 1.0, 511),
+        "second": fields["second"].astype(np.int8),
+    }
+
+
+def _static_rows(count, msg_type, mmsi, times):
+    rows = {name: np.zeros(count, dtype=dtype) for name, dtype in STATIC_FIELDS.items()}
+    rows.update(mmsi=mmsi, time=times, msg_type=np.full(count, msg_type, dtype=np.int8))
+    for name in ("length_m", "width_m", "draught_m"):
+        rows[name][:] = np.nan
+    return rows
+
+
+def _dimensions(symbols, offset):
+    """(length, width) in metres of the bow/stern/port/starboard fields at ``offset``; NaN when not reported"""
+    bow, stern = _field(symbols, offset, 9), _field(symbols, offset + 9, 9)
+    port, starboard = _field(symbols, offset + 18, 6), _field(symbols, offset + 24, 6)
+    length, width = (bow + stern).astype(np.float64), (port + starboard).astype(np.float64)
+    return np.where(length > 0, length, np.nan), np.where(width > 0, width, np.nan)
+
+
+def _decode_statics(symbols, msg_type, times):
+    """STATIC_FIELDS columns of type 5, 19 and 24 payloads, one block per type"""
+    blocks = []
+    mmsi = _field(symbols, 8, 30) if symbols.shape[1] else np.empty(0, dtype=np.int64)
+    for kind in (5, 19, 24):
+        rows = np.flatnonzero(msg_type == kind)
+        if not len(rows):
+            continue
+        s = symbols[:, rows]
+        block = _static_rows(len(rows), kind, mmsi[rows], times[rows])
+        if kind == 5:
+            block["imo"] = _field(s, 40, 30)
+            block["callsign"] = _text(s, 70, 7)
+            block["name"] = _text(s, 112, 20)
+            block["ship_type"] = _field(s, 232, 8).astype(np.int16)
+            block["length_m"], block["width_m"] = _dimensions(s, 240)
+            draught = _field(s, 294, 8)
+            block["draught_m"] = np.where(draught > 0, draught / 10.0, np.nan)
+            block["destination"] = _text(s, 302, 20)
+        elif kind == 19:
+            block["name"] = _text(s, 143, 20)
+            block["ship_type"] = _field(s, 263, 8).astype(np.int16)
+            block["length_m"], block["width_m"] = _dimensions(s, 271)
+        else:
+            part_b = _field(s, 38, 2) == 1
+            block["name"] = np.where(part_b, "", _text(s, 40, 20))
+            block["ship_type"] = np.where(part_b, _field(s, 40, 8), 0).astype(np.int16)
+            block["callsign"] = np.where(part_b, _text(s, 90, 7), "")
+            length, width = _dimensions(s, 132)
+            block["length_m"] = np.where(part_b, length, np.nan)
+            block["width_m"] = np.where(part_b, width, np.nan)
+        blocks.append(block)
+    return blocks
+
+
+def _concat(blocks, fields):
+    if not blocks:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in fields.items()}
+    return {name: np.concatenate([block[name] for block in blocks]).astype(dtype, copy=False)
+            for name, dtype in fields.items()}
+
+
+def _ranges(starts, lengths):
+    """Indices of the concatenated ranges ``[start, start + length)``"""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum()))
+
+
+def _next(positions, after, before):
+    """First of the sorted ``positions`` at or after each ``after``, and whether it lies before ``before``"""
+    if not len(positions):
+        return np.zeros(len(after), dtype=np.int64), np.zeros(len(after), dtype=bool)
+    k = np.searchsorted(positions, after)
+    found = positions[np.minimum(k, len(positions) - 1)]
+    return found, (k < len(positions)) & (found < before)
+
+
+def _tag_times(buf, starts, sentence):
+    """Epoch seconds of each line's tag block ``c:`` field (seconds or milliseconds), -1 without one"""
+    times = np.full(len(starts), -1, dtype=np.int64)
+    marks, has = _next(np.flatnonzero((buf[:-1] == ord("c")) & (buf[1:] == ord(":"))), starts, sentence)
+    has &= buf[starts] == BACKSLASH
+    if not has.any():
+        return times
+    digits = buf[np.minimum(marks[has][:, None] + 2 + np.arange(13), len(buf) - 1)].astype(np.int64) - 48
+    valid = np.logical_and.accumulate((digits >= 0) & (digits <= 9), axis=1)
+    value = np.zeros(len(digits), dtype=np.int64)
+    for column in range(digits.shape[1]):
+        value = np.where(valid[:, column], value * 10 + digits[:, column], value)
+    # 13 digits are milliseconds
+    value = np.where(valid.sum(axis=1) > 10, value // 1000, value)
+    times[has] = np.where(valid[:, 0], value, -1)
+    return times
+
+
+class AIVDMDecoder:
+    """Vectorised AIVDM/AIVDO decoder; ``decode`` takes whole lines and returns (positions, statics) columns.
+
+    Every step runs on the whole chunk at once: line and field splitting
+    through ``searchsorted`` over newline/comma positions, checksums with
+    ``bitwise_xor.reduceat``, and field extraction by shifting the 6-bit
+    payload symbols of all messages of a type together. Two-sentence
+    messages (type 5) whose fragments arrive back to back are joined with
+    one gather. Other fragments pass through a Python loop that matches
+    them by channel and sequence id, across chunks too. At most
+    ``max_pending`` incomplete messages are kept, the oldest dropped first.
+
+    Times come from a ``\\c:`` tag block when lines have one, else from
+    ``default_time`` (epoch seconds), else -1.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_FRAGMENTS, default_time=None):
+        self.max_pending = max_pending
+        self.default_time = default_time
+        self.pending = OrderedDict()
+        self.stats = {"sentences": 0, "bad_checksum": 0, "malformed": 0, "fragments_dropped": 0,
+                      "positions": 0, "statics": 0, "other": 0}
+
+    def decode(self, data, default_time=None):
+        """(positions, statics) columns of the complete lines in ``data``"""
+        data = bytes(data)
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        buf = np.frombuffer(data + PADDING, dtype=np.uint8)
+        ends = np.flatnonzero(buf[:len(data)] == ord("\n"))
+        starts = np.r_[0, ends[:-1] + 1]
+        ends = ends - ((ends > starts) & (buf[np.maximum(ends - 1, 0)] == ord("\r")))
+
+        # '!' of each sentence, after an optional tag block; then the VDM/VDO formatter
+        sentence, ok = _next(np.flatnonzero(buf == BANG), starts, ends - 6)
+        formatter = buf[np.minimum(sentence[:, None] + np.arange(3, 6), len(buf) - 1)]
+        ok &= (formatter[:, 0] == ord("V")) & (formatter[:, 1] == ord("D")) & np.isin(formatter[:, 2], (77, 79))
+        line = np.flatnonzero(ok)
+        starts, ends, sentence = starts[line], ends[line], sentence[line]
+        self.stats["sentences"] += len(line)
+
+        # Six commas (count, number, sequence id, channel, payload, fill bits), then *hh
+        commas = np.flatnonzero(buf == COMMA)
+        first = np.searchsorted(commas, sentence)
+        ok = first + 5 < len(commas)
+        c = commas[np.minimum(first[:, None] + np.arange(6), len(commas) - 1)] if len(commas) \
+            else np.zeros((len(line), 6), dtype=np.int64)
+        ok &= (c[:, 5] + 4 < ends) & (c[:, 1] == c[:, 0] + 2) & (c[:, 2] == c[:, 1] + 2)
+        ok &= buf[np.minimum(c[:, 5] + 2, len(buf) - 1)] == STAR
+        self.stats["malformed"] += int((~ok).sum())
+        keep = np.flatnonzero(ok)
+        starts, sentence, c = starts[keep], sentence[keep], c[keep]
+
+        star = c[:, 5] + 2
+        checks = np.bitwise_xor.reduceat(buf, np.stack([sentence + 1, star], axis=1).ravel())[0::2] \
+            if len(keep) else np.empty(0, dtype=np.uint8)
+        digits = buf[star[:, None] + np.array([1, 2])].astype(np.int64)
+        digits = np.where(digits >= 65, (digits & ~32) - 55, digits - 48)
+        good = checks == digits[:, 0] * 16 + digits[:, 1]
+        self.stats["bad_checksum"] += int((~good).sum())
+        good = np.flatnonzero(good)
+        starts, sentence, c = starts[good], sentence[good], c[good]
+
+        count = buf[c[:, 0] + 1].astype(np.int64) - 48
+        number = buf[c[:, 1] + 1].astype(np.int64) - 48
+        payload_start = c[:, 4] + 1
+        payload_length = c[:, 5] - payload_start
+        fill = buf[c[:, 5] + 1].astype(np.int64) - 48
+        times = _tag_times(buf, starts, sentence)
+        fallback = default_time if default_time is not None else self.default_time
+        if fallback is not None:
+            times = np.where(times < 0, int(fallback), times)
+
+        multi = np.flatnonzero(count > 1)
+        assembled = self._reassemble(buf, c[multi], count[multi], number[multi], payload_start[multi],
+                                     payload_length[multi], fill[multi], times[multi])
+        single = np.flatnonzero(count == 1)
+        positions, statics = self._decode_payloads(buf, payload_start[single], payload_length[single],
+                                                   times[single], fill[single])
+        if assembled is None:
+            return positions, statics
+        more_positions, more_statics = self._decode_payloads(*assembled)
+        return ({name: np.concatenate([positions[name], more_positions[name]]) for name in positions},
+                {name: np.concatenate([statics[name], more_statics[name]]) for name in statics})
+
+    def _reassemble(self, buf, c, count, number, start, length, fill, times):
+        """Completed multi-sentence payloads as (buffer, start, length, time, fill), or None.
+
+        Two-sentence messages whose fragments follow each other, the usual
+        case, are joined with one gather; everything else goes through the
+        bounded ``pending`` map, in arrival order.
+        """
+        if not len(count):
+            return None
+        sequence = np.where(c[:, 3] > c[:, 2] + 1, buf[c[:, 2] + 1], 0)
+        channel = np.where(c[:, 4] > c[:, 3] + 1, buf[c[:, 3] + 1], 0)
+
+        first = np.flatnonzero((count[:-1] == 2) & (count[1:] == 2) & (number[:-1] == 1) & (number[1:] == 2)
+                               & (channel[:-1] == channel[1:]) & (sequence[:-1] == sequence[1:]))
+        paired = np.zeros(len(count), dtype=bool)
+        paired[first] = paired[first + 1] = True
+        pending, completed = self.pending, []
+        for entry in pending.values():
+            entry[3] = -1  # waiting since an earlier chunk
+
+        # Rows of the paired first fragments per key: a new first fragment replaces a waiting one
+        pair_rows = {}
+        if pending or not paired.all():
+            for key_channel, key_sequence, row in zip(channel[first].tolist(), sequence[first].tolist(),
+                                                      first.tolist()):
+                pair_rows.setdefault((key_channel, key_sequence, 2), []).append(row)
+
+        def replaced(key, since, until):
+            rows = pair_rows.get(key)
+            if not rows:
+                return False
+            k = bisect.bisect_right(rows, since)
+            return k < len(rows) and rows[k] < until
+
+        for i in np.flatnonzero(~paired).tolist():
+            total, part = int(count[i]), int(number[i])
+            key = (int(channel[i]), int(sequence[i]), total)
+            payload = buf[start[i]:start[i] + length[i]].tobytes()
+            entry = pending.get(key)
+            if entry is not None and replaced(key, entry[3], i):
+                del pending[key]
+                self.stats["fragments_dropped"] += 1
+                entry = None
+            if part == 1:
+                if entry is not None:
+                    self.stats["fragments_dropped"] += 1
+                pending[key] = [2, [payload], int(times[i]), i]
+                pending.move_to_end(key)
+                while len(pending) > self.max_pending:
+                    pending.popitem(last=False)
+                    self.stats["fragments_dropped"] += 1
+                continue
+            if entry is None or entry[0] != part:
+                self.stats["fragments_dropped"] += 1
+                continue
+            entry[1].append(payload)
+            entry[0] += 1
+            if part == total:
+                del pending[key]
+                completed.append((b"".join(entry[1]), entry[2], int(fill[i])))
+        for key, entry in list(pending.items()):
+            if replaced(key, entry[3], len(count)):
+                del pending[key]
+                self.stats["fragments_dropped"] += 1
+
+        if not len(first) and not completed:
+            return None
+        # Paired payloads, then the ones completed from ``pending``
+        pieces = np.stack([first, first + 1], axis=1).ravel()
+        joined = buf[_ranges(start[pieces], length[pieces])].tobytes()
+        joined += b"".join(payload for payload, _, _ in completed)
+        lengths = np.r_[length[first] + length[first + 1],
+                        np.array([len(payload) for payload, _, _ in completed], dtype=np.int64)]
+        starts = np.cumsum(lengths) - lengths
+        return (np.frombuffer(joined + PADDING, dtype=np.uint8), starts, lengths,
+                np.r_[times[first], np.array([t for _, t, _ in completed], dtype=np.int64)],
+                np.r_[fill[first + 1], np.array([f for _, _, f in completed], dtype=np.int64)])
+
+    def _decode_payloads(self, buf, start, length, times, fill):
+        msg_type = _symbols(buf, start, np.minimum(length, 1), 1)[0]
+        bits = length * 6 - np.clip(fill, 0, 5)
+        required = np.zeros(len(msg_type), dtype=np.int64)
+        for kind, needed in MIN_BITS.items():
+            required[msg_type == kind] = needed
+        supported = (required > 0) & (bits >= required)
+        self.stats["other"] += int((~supported).sum())
+
+        rows = np.flatnonzero(supported & np.isin(msg_type, (1, 2, 3, 18, 19)))
+        positions = _decode_positions(_symbols(buf, start[rows], length[rows], 24), msg_type[rows], times[rows])
+        rows = np.flatnonzero(supported & np.isin(msg_type, (5, 19, 24)))
+        statics = _concat(_decode_statics(_symbols(buf, start[rows], length[rows], 71), msg_type[rows], times[rows]),
+                          STATIC_FIELDS)
+        self.stats["positions"] += len(positions["mmsi"])
+        self.stats["statics"] += len(statics["mmsi"])
+        return _concat([positions], POSITION_FIELDS), statics
+
+
+class ColumnBuffer:
+    """Pre-allocated columns filled batch after batch; ``take`` returns views that the next fill overwrites"""
+
+    def __init__(self, fields, capacity=BATCH_ROWS):
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in fields.items()}
+        self.capacity = capacity
+        self.size = 0
+
+    def append(self, columns, first=0):
+        """Copy rows from ``first`` on until full; returns the index of the first row not copied"""
+        total = len(next(iter(columns.values())))
+        count = min(total - first, self.capacity - self.size)
+        for name, target in self.columns.items():
+            target[self.size:self.size + count] = columns[name][first:first + count]
+        self.size += count
+        return first + count
+
+    def full(self):
+        return self.size == self.capacity
+
+    def take(self):
+        views = {name: values[:self.size] for name, values in self.columns.items()}
+        self.size = 0
+        return views
+
+
+def is_nmea(path):
+    """Whether an AIS file is NMEA: an NMEA suffix, or a first line that is an AIVDM/AIVDO sentence.
+
+    CSV and Parquet exports are told apart by content, not by a ``.txt``
+    or ``.log`` name.
+    """
+    path = str(path)
+    if path.endswith(NMEA_SUFFIXES):
+        return True
+    if path.endswith((".parquet", ".pq")):
+        return False
+    with open(path, "rb") as f:
+        return NMEA_LINE.match(f.read(4096).lstrip()) is not None
+
+
+def iter_chunks(source, chunk_bytes=CHUNK_BYTES, flush_seconds=FLUSH_SECONDS):
+    """Chunks of whole lines from a path, a binary file object or ``tcp://host:port``; yields (data, live)"""
+    if isinstance(source, str) and source.startswith("tcp://"):
+        host, port = source[len("tcp://"):].rsplit(":", 1)
+        with socket.create_connection((host, int(port))) as connection:
+            connection.settimeout(flush_seconds)
+            pending = b""
+            while True:
+                try:
+                    data = connection.recv(1 << 20)
+                except socket.timeout:
+                    data = None
+                if data == b"":
+                    break
+                if data:
+                    pending += data
+                if pending and (data is None or len(pending) >= chunk_bytes):
+                    cut = pending.rfind(b"\n") + 1
+                    if cut:
+                        yield pending[:cut], True
+                        pending = pending[cut:]
+            if pending:
+                yield pending, True
+        return
+
+    handle = open(source, "rb") if isinstance(source, str) else source
+    try:
+        remainder = b""
+        while True:
+            data = handle.read(chunk_bytes)
+            if not data:
+                break
+            data = remainder + data
+            cut = data.rfind(b"\n") + 1
+            if not cut:
+                remainder = data
+                continue
+            remainder = data[cut:]
+            yield data[:cut], False
+        if remainder:
+            yield remainder, False
+    finally:
+        if handle is not source:
+            handle.close()
+
+
+def iter_batches(source, batch_rows=BATCH_ROWS, decoder=None):
+    """Yield ("positions" | "statics", columns) batches of up to ``batch_rows`` rows decoded from ``source``.
+
+    Columns are views into reused buffers, valid until the next batch;
+    copy them to keep them. A TCP feed without tag blocks is stamped with
+    the receive time, and flushes partial batches whenever the feed pauses.
+    """
+    decoder = decoder or AIVDMDecoder()
+    buffers = {"positions": ColumnBuffer(POSITION_FIELDS, batch_rows),
+               "statics": ColumnBuffer(STATIC_FIELDS, batch_rows)}
+    for data, live in iter_chunks(source):
+        decoded = dict(zip(("positions", "statics"), decoder.decode(data, int(time.time()) if live else None)))
+        for kind, columns in decoded.items():
+            buffer, first = buffers[kind], 0
+            while first < len(columns["mmsi"]):
+                first = buffer.append(columns, first)
+                if buffer.full():
+                    yield kind, buffer.take()
+            if live and buffer.size:
+                yield kind, buffer.take()
+    for kind, buffer in buffers.items():
+        if buffer.size:
+            yield kind, buffer.take()
+
+
+def storable(positions):
+    """ais_store columns (copies) of the position rows with a time and a valid position"""
+    keep = (positions["time"] >= 0) & np.isfinite(positions["lat"]) & np.isfinite(positions["lon"])
+    return {name: positions[name][keep] for name in ("mmsi", "time", "lat", "lon", "sog", "cog")}
+
+
+def read_positions(path, default_time=None):
+    """ais_store columns of every timed, valid position report in an NMEA file"""
+    batches = [storable(columns) for kind, columns in iter_batches(path, decoder=AIVDMDecoder(
+        default_time=default_time)) if kind == "positions"]
+    if not batches:
+        return storable({name: np.empty(0, dtype=dtype) for name, dtype in POSITION_FIELDS.items()})
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", help="NMEA file or tcp://host:port")
+    parser.add_argument("--store", help="ais_store directory to add the position reports to")
+    parser.add_argument("--out", help="Write position reports (.csv or .parquet)")
+    parser.add_argument("--time", help="Time (ISO 8601, UTC) of sentences without a tag block")
+    args = parser.parse_args()
+
+    default_time = None
+    if args.time:
+        from ais_store import epoch_seconds
+
+        default_time = int(epoch_seconds([args.time])[0])
+    decoder = AIVDMDecoder(default_time=default_time)
+    store = None
+    if args.store:
+        from ais_store import AISStore
+
+        store = AISStore(args.store)
+
+    start = time.perf_counter()
+    kept, stored, touched = [], 0, set()
+    try:
+        for kind, columns in iter_batches(args.source, decoder=decoder):
+            if kind != "positions":
+                continue
+            if store is not None:
+                stored += store.ingest(storable(columns), touched)
+            if args.out:
+                kept.append({name: values.copy() for name, values in columns.items()})
+    except KeyboardInterrupt:
+        pass
+    seconds = time.perf_counter() - start
+
+    stats = decoder.stats
+    print(f"📡 {stats['sentences']} sentences in {seconds:.2f}s ({stats['sentences'] / max(seconds, 1e-9):,.0f}/s): "
+          f"{stats['positions']} positions, {stats['statics']} static reports, {stats['other']} other")
+    print(f"⚠️ {stats['bad_checksum']} bad checksums, {stats['malformed']} malformed, "
+          f"{stats['fragments_dropped']} fragments dropped")
+    if store is not None:
+        # One file per batch until now; leave one per partition
+        store.compact(sorted(touched))
+        print(f"💾 {stored} positions added to {args.store}")
+    if args.out:
+        import pandas as pd
+
+        frame = pd.DataFrame({name: np.concatenate([batch[name] for batch in kept]) for name in POSITION_FIELDS}
+                             if kept else {name: [] for name in POSITION_FIELDS})
+        if args.out.endswith((".parquet", ".pq")):
+            frame.to_parquet(args.out, index=False)
+        else:
+            frame.to_csv(args.out, index=False)
+        print(f"💾 Positions written to {args.out}")
+    return True
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
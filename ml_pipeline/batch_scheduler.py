@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Micro-batching scheduler
+Coalesces concurrent detection requests into batched YOLOv8x forward passes
+"""
+
+import asyncio
+import bisect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Histogram:
+    """Fixed-bucket histogram with cumulative (Prometheus-style) counts"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        buckets = {}
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0
+        }
+
+
+class _PendingRequest:
+    __slots__ = ("image", "confidence", "future", "enqueued_at")
+
+    def __init__(self, image, confidence, future):
+        self.image = image
+        self.confidence = confidence
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """Queue images and run them through the model in bounded batches.
+
+    A batch is dispatched as soon as it holds ``max_batch_size`` images or
+    ``max_wait_ms`` has passed since its first image arrived. The forward
+    pass runs on a worker thread so the event loop stays free,
+    and each caller receives only the result for its own image. Up to
+    ``max_concurrent_batches`` batches are in flight at once (one per
+    worker process when ``predict_fn`` dispatches to a model pool).
+
+    ``predict_fn(images, confidence)`` must return one result per image.
+    Batches run at the lowest confidence requested, so callers filter their
+    own result with their own threshold.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10.0, max_queue_size=1024,
+                 max_concurrent_batches=1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_concurrent_batches < 1:
+            raise ValueError("max_concurrent_batches must be >= 1")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_sizes = Histogram(_batch_size_buckets(max_batch_size))
+
+        self._queue = None
+        self._worker = None
+        self._executor = None
+        self._in_flight = set()
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches,
+                                            thread_name_prefix="yolo-batch")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._in_flight):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, image, confidence):
+        """Enqueue one image and wait for its result"""
+        if not self.running:
+            raise RuntimeError("Scheduler is not running")
+
+        pending = _PendingRequest(image, confidence, asyncio.get_running_loop().create_future())
+        await self._queue.put(pending)
+        try:
+            return await pending.future
+        finally:
+            self.latency_ms.observe((time.perf_counter() - pending.enqueued_at) * 1000)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches_in_flight": len(self._in_flight),
+            "request_latency_ms": self.latency_ms.snapshot(),
+            "batch_size": self.batch_sizes.snapshot()
+        }
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+
+        while True:
+            # Wait for a free slot first so requests keep coalescing while busy
+            await slots.acquire()
+            batch = await self._collect_batch()
+            # Callers that gave up (client disconnect) don't need a forward pass
+            batch = [p for p in batch if not p.future.done()]
+            if not batch:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+
+        self.batch_sizes.observe(len(batch))
+        images = [p.image for p in batch]
+        confidence = min(p.confidence for p in batch)
+
+        try:
+            results = await loop.run_in_executor(self._executor, self.predict_fn, images, confidence)
+        except Exception as e:
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+
+        for p, result in zip(batch, results):
+            if not p.future.done():
+                p.future.set_result(result)
+
+
+def _batch_size_buckets(max_batch_size):
+    buckets = []
+    size = 1
+    while size < max_batch_size:
+        buckets.append(size)
+        size *= 2
+    buckets.append(max_batch_size)
+    return buckets
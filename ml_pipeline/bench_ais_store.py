@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIS store benchmark
+Ingest rate and bbox/time query latency of ais_store on synthetic traffic, against a full scan of the same store
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import ais_store
+from bench_tracks import synthetic_ais
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--vessels", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--box-deg", type=float, default=2.0, help="Query bbox side")
+    parser.add_argument("--window-min", type=float, default=60, help="Query time span")
+    parser.add_argument("--root", help="Store directory (default: a temporary one, removed afterwards)")
+    args = parser.parse_args()
+
+    mmsi, times, lat, lon, sog, cog = synthetic_ais(args.rows, args.vessels, days=args.days)
+    columns = dict(zip(ais_store.COLUMNS, (mmsi, times, lat, lon, sog, cog)))
+    root = args.root or tempfile.mkdtemp(prefix="ais_store_")
+    store = ais_store.AISStore(root)
+    try:
+        start = time.perf_counter()
+        for first in range(0, args.rows, ais_store.INGEST_CHUNK_ROWS):
+            store.ingest({name: values[first:first + ais_store.INGEST_CHUNK_ROWS] for name, values in columns.items()})
+        seconds = time.perf_counter() - start
+        print(f"Ingested {args.rows} rows over {args.days} day(s) in {seconds:.2f}s "
+              f"({args.rows / seconds:,.0f} rows/s), {len(store.partitions())} partitions\n")
+
+        rng = np.random.default_rng(1)
+        window_s = int(args.window_min * 60)
+        latencies, rows, read, skipped = [], 0, 0, 0
+        for _ in range(args.queries):
+            lon_min, lat_min = rng.uniform(-180, 180 - args.box_deg), rng.uniform(-60, 60 - args.box_deg)
+            bbox = (lon_min, lat_min, lon_min + args.box_deg, lat_min + args.box_deg)
+            t0 = int(rng.integers(times.min(), times.max() - window_s))
+            stats = {}
+            start = time.perf_counter()
+            found = store.query(bbox, t0, t0 + window_s, stats)
+            latencies.append(time.perf_counter() - start)
+            rows += len(found["time"])
+            read += stats["row_groups"]
+            skipped += stats["row_groups_skipped"]
+
+        start = time.perf_counter()
+        everything = store.query()
+        scan = time.perf_counter() - start
+        assert len(everything["time"]) == args.rows
+
+        latencies = np.asarray(latencies) * 1000
+        print(f"{'query':<26} {'p50 (ms)':>9} {'p95 (ms)':>9} {'rows':>8} {'groups read':>12} {'skipped':>8}")
+        print(f"{f'{args.box_deg:g} deg x {args.window_min:g} min':<26} {np.percentile(latencies, 50):>9.1f} "
+              f"{np.percentile(latencies, 95):>9.1f} {rows / args.queries:>8.0f} {read / args.queries:>12.1f} "
+              f"{skipped / args.queries:>8.1f}")
+        print(f"{'full scan':<26} {scan * 1000:>9.1f} {'':>9} {args.rows:>8}")
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIVDM decoder benchmark
+Decoder throughput on synthetic AIVDM (types 1/2/3/18, two-sentence type 5), checked against the encoded fields
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import aivdm
+
+HEADER = b"!AIVDM,%d,%d,%s,%s,"
+
+
+def _bits(count, length, fields):
+    """(count, length) bit matrix with ``fields`` = [(offset, bits, values)] written MSB first"""
+    bits = np.zeros((count, length), dtype=np.uint8)
+    for offset, width, values in fields:
+        values = np.asarray(values, dtype=np.int64) & ((1 << width) - 1)
+        for i in range(width):
+            bits[:, offset + i] = (values >> (width - 1 - i)) & 1
+    return bits
+
+
+def _text_values(strings, chars):
+    """Six-bit codes of strings padded with '@' to ``chars`` characters, as ``chars`` 6-bit fields"""
+    codes = np.frombuffer("".join(s.ljust(chars, "@")[:chars] for s in strings).encode(), dtype=np.uint8)
+    codes = codes.reshape(-1, chars).astype(np.int64)
+    return np.where(codes >= 64, codes - 64, codes)
+
+
+def _armour(bits):
+    """Armoured payload characters of a bit matrix (padded to whole characters)"""
+    pad = (-bits.shape[1]) % 6
+    bits = np.pad(bits, ((0, 0), (0, pad)))
+    symbols = bits.reshape(len(bits), -1, 6) @ np.array([32, 16, 8, 4, 2, 1], dtype=np.uint8)
+    characters = symbols + 48
+    characters[characters > 87] += 8
+    return characters.astype(np.uint8), pad
+
+
+def _sentences(payloads, count, number, sequence, fill):
+    """(N, width) uint8 lines '!AIVDM,...*hh\\n' of fixed-width payload matrices"""
+    head = np.frombuffer(HEADER % (count, number, sequence, b"A"), dtype=np.uint8)
+    tail = np.frombuffer(b",%d*" % fill, dtype=np.uint8)
+    body = np.hstack([np.broadcast_to(head, (len(payloads), len(head))), payloads,
+                      np.broadcast_to(tail, (len(payloads), len(tail)))])
+    checksum = np.bitwise_xor.reduce(body[:, 1:-1], axis=1)
+    hex_digits = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+    return np.hstack([body, hex_digits[checksum >> 4, None], hex_digits[checksum & 15, None],
+                      np.full((len(body), 1), ord("\n"), dtype=np.uint8)])
+
+
+def synthetic_traffic(messages, seed=0, static_share=0.05, class_b_share=0.1):
+    """(NMEA bytes, expected positions, expected statics) of ``messages`` messages in random order"""
+    rng = np.random.default_rng(seed)
+    statics = int(messages * static_share)
+    positions = messages - statics
+    class_b = rng.random(positions) < class_b_share
+
+    mmsi = rng.integers(200_000_000, 800_000_000, positions)
+    msg_type = np.where(class_b, 18, rng.integers(1, 4, positions))
+    lat = np.round(rng.uniform(-80, 80, positions) * 600000) / 600000
+    lon = np.round(rng.uniform(-179, 179, positions) * 600000) / 600000
+    sog = rng.integers(0, 300, positions) / 10
+    cog = rng.integers(0, 3600, positions) / 10
+    heading = rng.integers(0, 360, positions).astype(np.float64)
+    second = rng.integers(0, 60, positions)
+    status = rng.integers(0, 9, positions)
+
+    def class_a_fields(rows):
+        return [(0, 6, msg_type[rows]), (8, 30, mmsi[rows]), (38, 4, status[rows]), (50, 10, sog[rows] * 10),
+                (61, 28, np.round(lon[rows] * 600000)), (89, 27, np.round(lat[rows] * 600000)),
+                (116, 12, cog[rows] * 10), (128, 9, heading[rows]), (137, 6, second[rows])]
+
+    def class_b_fields(rows):
+        return [(0, 6, msg_type[rows]), (8, 30, mmsi[rows]), (46, 10, sog[rows] * 10),
+                (57, 28, np.round(lon[rows] * 600000)), (85, 27, np.round(lat[rows] * 600000)),
+                (112, 12, cog[rows] * 10), (124, 9, heading[rows]), (133, 6, second[rows])]
+
+    lines = []
+    for rows, fields in ((np.flatnonzero(~class_b), class_a_fields), (np.flatnonzero(class_b), class_b_fields)):
+        payload, _ = _armour(_bits(len(rows), 168, fields(rows)))
+        lines.extend(line.tobytes() for line in _sentences(payload, 1, 1, b"", 0))
+
+    static_mmsi = rng.integers(200_000_000, 800_000_000, statics)
+    names = [f"VESSEL {i}" for i in range(statics)]
+    callsigns = [f"C{i % 100000}" for i in range(statics)]
+    destinations = [f"PORT {i % 977}" for i in range(statics)]
+    bow, stern = rng.integers(1, 200, statics), rng.integers(1, 100, statics)
+    port, starboard = rng.integers(1, 30, statics), rng.integers(1, 30, statics)
+    draught = rng.integers(1, 200, statics)
+    ship_type = rng.integers(20, 99, statics)
+    imo = rng.integers(1_000_000, 9_999_999, statics)
+    fields = [(0, 6, np.full(statics, 5)), (8, 30, static_mmsi), (40, 30, imo), (232, 8, ship_type),
+              (240, 9, bow), (249, 9, stern), (258, 6, port), (264, 6, starboard), (294, 8, draught)]
+    for offset, strings, chars in ((70, callsigns, 7), (112, names, 20), (302, destinations, 20)):
+        codes = _text_values(strings, chars)
+        fields.extend((offset + 6 * i, 6, codes[:, i]) for i in range(chars))
+    payload, pad = _armour(_bits(statics, 424, fields))
+    sequence = [str(i % 10).encode() for i in range(statics)]
+    first = [_sentences(payload[i:i + 1, :60], 2, 1, sequence[i], 0)[0].tobytes() for i in range(statics)]
+    second_part = [_sentences(payload[i:i + 1, 60:], 2, 2, sequence[i], pad)[0].tobytes() for i in range(statics)]
+    lines.extend(a + b for a, b in zip(first, second_part))
+
+    order = rng.permutation(len(lines))
+    data = b"".join(lines[i] for i in order)
+    expected_positions = {"mmsi": np.r_[mmsi[~class_b], mmsi[class_b]], "lat": np.r_[lat[~class_b], lat[class_b]],
+                          "lon": np.r_[lon[~class_b], lon[class_b]], "sog": np.r_[sog[~class_b], sog[class_b]],
+                          "cog": np.r_[cog[~class_b], cog[class_b]]}
+    expected_statics = {"mmsi": static_mmsi, "name": np.array(names), "length_m": (bow + stern).astype(float)}
+    return data, expected_positions, expected_statics
+
+
+def _matches(decoded, expected):
+    """Whether decoded rows equal the expected ones, compared as multisets keyed by MMSI"""
+    second = "lat" if "lat" in expected else "name"
+    found = np.lexsort((decoded[second], decoded["mmsi"]))
+    wanted = np.lexsort((expected[second], expected["mmsi"]))
+    if len(found) != len(wanted):
+        return False
+    for name, values in expected.items():
+        got, want = decoded[name][found], values[wanted]
+        if got.dtype.kind == "f":
+            if not np.allclose(got, want, atol=1e-6):
+                return False
+        elif not np.array_equal(got, want):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data, expected_positions, expected_statics = synthetic_traffic(args.messages)
+    sentences = data.count(b"\n")
+    print(f"{sentences} sentences ({len(data) / 1e6:.0f} MB), {len(expected_positions['mmsi'])} positions, "
+          f"{len(expected_statics['mmsi'])} two-sentence type 5\n")
+
+    print(f"{'stage':<24} {'seconds':>8} {'sentences/s':>12} {'MB/s':>7}")
+    best = np.inf
+    for _ in range(args.repeat):
+        decoder = aivdm.AIVDMDecoder()
+        start = time.perf_counter()
+        decoded = [decoder.decode(chunk) for chunk, _ in aivdm.iter_chunks(io.BytesIO(data))]
+        best = min(best, time.perf_counter() - start)
+    print(f"{'decode (in memory)':<24} {best:>8.2f} {sentences / best:>12,.0f} {len(data) / 1e6 / best:>7.0f}")
+
+    with tempfile.NamedTemporaryFile(suffix=".nmea", delete=False) as f:
+        f.write(data)
+    try:
+        start = time.perf_counter()
+        rows = sum(len(columns["mmsi"]) for _, columns in aivdm.iter_batches(f.name))
+        seconds = time.perf_counter() - start
+        print(f"{'file -> batches':<24} {seconds:>8.2f} {sentences / seconds:>12,.0f} "
+              f"{len(data) / 1e6 / seconds:>7.0f}")
+    finally:
+        os.unlink(f.name)
+
+    positions = {name: np.concatenate([p[name] for p, _ in decoded]) for name in expected_positions}
+    statics = {name: np.concatenate([s[name] for _, s in decoded]) for name in expected_statics}
+    print(f"\nRows decoded: {rows}; positions match: {_matches(positions, expected_positions)}, "
+          f"type 5 match: {_matches(statics, expected_statics)}; {decoder.stats}")
+
+
+if __name__ == "__main__":
+    main()
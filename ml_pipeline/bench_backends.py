@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Backend benchmark
+Images/sec and p50/p99 latency for every available inference backend
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from model_backends import BACKENDS, exported_path, load_model, load_reference_tile, warmup
+
+
+def available_variants(weights, backends):
+    for backend in backends:
+        for int8 in (False, True):
+            if backend == "pytorch" and int8:
+                continue
+            if exported_path(weights, backend, int8).exists():
+                yield backend, int8
+
+
+def bench_variant(model, tile, batch_size, iterations):
+    batch = [tile] * batch_size
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model(batch, device="cpu", verbose=False)
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    return {
+        "images_per_sec": batch_size * iterations / latencies.sum(),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--weights", default="./runs/production_sar_model/weights/best.pt")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--reference-tile")
+    args = parser.parse_args()
+
+    tile = load_reference_tile(args.reference_tile)
+
+    print(f"{'backend':<16} {'batch':>5} {'img/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for backend, int8 in available_variants(args.weights, args.backends):
+        model = load_model(args.weights, backend, int8, args.intra_op_threads, args.inter_op_threads)
+        warmup(model)
+
+        name = f"{backend}{'-int8' if int8 else ''}"
+        for batch_size in args.batch_sizes:
+            stats = bench_variant(model, tile, batch_size, args.iterations)
+            print(f"{name:<16} {batch_size:>5} {stats['images_per_sec']:>8.2f} "
+                  f"{stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
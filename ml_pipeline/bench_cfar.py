@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - CFAR benchmark
+CFAR speed and recall on a synthetic sea with injected ships; with --weights, full-scene YOLO alone vs CFAR->YOLO
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+import cfar
+from tiling import PAD_EDGES, iter_tiles
+
+
+def synthetic_scene(rows, width, ships, seed=0):
+    """Gamma-speckled sea (linear backscatter, 4.4 looks) with bright ship rectangles; returns (scene, ship boxes)"""
+    rng = np.random.default_rng(seed)
+    scene = (rng.gamma(4.4, 0.03 / 4.4, (rows, width)) * 1000).astype(np.float32)
+    boxes = []
+    for _ in range(ships):
+        height, length = int(rng.integers(2, 8)), int(rng.integers(4, 30))
+        y, x = int(rng.integers(0, rows - height)), int(rng.integers(0, width - length))
+        # 8-20 dB above the sea
+        scene[y:y + height, x:x + length] *= 10 ** rng.uniform(0.8, 2.0)
+        boxes.append((x, y, x + length, y + height))
+    return scene, np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def box_iou(a, b):
+    """(len(a), len(b)) IoU matrix of x1, y1, x2, y2 boxes"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def recall(found, reference, iou=0.0):
+    """Share of ``reference`` boxes matched by a ``found`` box (IoU above ``iou``; 0 = any overlap)"""
+    if not len(reference):
+        return 1.0
+    if not len(found):
+        return 0.0
+    return float(np.mean((box_iou(reference[:, :4], found[:, :4]) > iou).any(axis=1)))
+
+
+def false_alarms(found, reference):
+    """``found`` boxes that overlap no ``reference`` box"""
+    if not len(found):
+        return 0
+    if not len(reference):
+        return len(found)
+    return int(np.count_nonzero(~(box_iou(found[:, :4], reference[:, :4]) > 0).any(axis=1)))
+
+
+def detect_tiles(model, tiles, confidence, iou_threshold):
+    """Run the model tile by tile and merge like /detect/scene; returns (detections, tile count)"""
+    from postprocess import nms, result_to_array
+
+    boxes, count = [], 0
+    for (y, x), tile in tiles:
+        result = model(cv2.cvtColor(tile, cv2.COLOR_GRAY2RGB), conf=confidence, device="cpu", verbose=False)
+        data = result_to_array(result[0])
+        data[:, [0, 2]] += x
+        data[:, [1, 3]] += y
+        boxes.append(data)
+        count += 1
+    merged = np.concatenate(boxes) if boxes else np.empty((0, 6), dtype=np.float32)
+    return merged[nms(merged[:, :4], merged[:, 4], iou_threshold, class_ids=merged[:, 5])], count
+
+
+def main():
+    from sar_preprocessing import preprocess_sar_advanced, sar_to_db
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scene", help="GeoTIFF scene (band 1); default: a synthetic sea with injected ships")
+    parser.add_argument("--rows", type=int, default=4096)
+    parser.add_argument("--width", type=int, default=8192)
+    parser.add_argument("--ships", type=int, default=100)
+    parser.add_argument("--pfa", type=float, nargs="+", default=[1e-4, 1e-5, 1e-6, 1e-7, 1e-8])
+    parser.add_argument("--guard", type=int, default=cfar.GUARD)
+    parser.add_argument("--train", type=int, default=cfar.TRAIN)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--weights", help="YOLO weights: also compare YOLO alone with CFAR->YOLO")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--confidence", type=float, default=0.25)
+    parser.add_argument("--tile-size", type=int, default=640)
+    parser.add_argument("--overlap", type=int, default=64)
+    parser.add_argument("--iou", type=float, default=0.45, help="NMS IoU; cascade boxes match YOLO boxes above it")
+    args = parser.parse_args()
+
+    truth = None
+    if args.scene:
+        import rasterio
+
+        with rasterio.open(args.scene) as src:
+            raw = src.read(1)
+    else:
+        raw, truth = synthetic_scene(args.rows, args.width, args.ships)
+    image = sar_to_db(raw)
+    megapixels = image.size / 1e6
+    print(f"Scene {image.shape[0]} x {image.shape[1]} ({megapixels:.1f} MP), "
+          f"guard {args.guard}, train {args.train}, {args.workers} worker(s)"
+          + (f", {len(truth)} injected ships" if truth is not None else "") + "\n")
+
+    print(f"{'pfa':>8} {'k':>5} {'censor':>6} {'seconds':>8} {'MP/s':>7} {'candidates':>10}"
+          + (f" {'recall':>7} {'false':>6}" if truth is not None else ""))
+    for pfa in args.pfa:
+        for censor in (False, True):
+            start = time.perf_counter()
+            candidates = cfar.detect(image, args.guard, args.train, pfa, censor=censor, workers=args.workers)
+            seconds = time.perf_counter() - start
+            line = (f"{pfa:>8.0e} {cfar.pfa_to_threshold(pfa):>5.2f} {'yes' if censor else 'no':>6} "
+                    f"{seconds:>8.2f} {megapixels / seconds:>7.1f} {len(candidates):>10}")
+            if truth is not None:
+                line += f" {recall(candidates, truth):>7.1%} {false_alarms(candidates, truth):>6}"
+            print(line)
+
+    if not args.weights:
+        return
+
+    from model_backends import load_model
+
+    model = load_model(args.weights, args.backend)
+    scene = preprocess_sar_advanced(raw) if raw.dtype != np.uint8 else raw
+    print(f"\n{'pipeline':<12} {'tiles':>6} {'seconds':>8} {'detections':>10} {'vs YOLO':>8}"
+          + (f" {'vs truth':>8}" if truth is not None else ""))
+
+    start = time.perf_counter()
+    tiles = iter_tiles(scene, args.tile_size, args.overlap, pad_edges=PAD_EDGES)
+    full, full_tiles = detect_tiles(model, tiles, args.confidence, args.iou)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidates = cfar.detect(image, args.guard, args.train, workers=args.workers)
+    tiles = cfar.iter_cascade_tiles(scene, candidates, args.tile_size)
+    cascade, cascade_tiles = detect_tiles(model, tiles, args.confidence, args.iou)
+    cascade_seconds = time.perf_counter() - start
+
+    for label, detections, count, seconds in (("YOLO", full, full_tiles, full_seconds),
+                                              ("CFAR->YOLO", cascade, cascade_tiles, cascade_seconds)):
+        line = (f"{label:<12} {count:>6} {seconds:>8.2f} {len(detections):>10} "
+                f"{recall(detections, full, args.iou):>8.1%}")
+        if truth is not None:
+            line += f" {recall(detections, truth):>8.1%}"
+        print(line)
+    print(f"\nCascade speedup {full_seconds / cascade_seconds:.1f}x ({len(candidates)} CFAR candidates)")
+
+
+if __name__ == "__main__":
+    main()
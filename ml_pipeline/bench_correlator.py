@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIS correlator benchmark
+Synthetic AIS traffic with SAR detections of a known subset of vessels plus dark ones; reports speed and match accuracy
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import ais_correlator as correlator
+import ais_tracks
+
+
+def synthetic_traffic(reports, vessels, detections, dark_share, seed=0, bbox=(40.0, -20.0, 100.0, 25.0),
+                      interval_s=180, acquired=1_700_000_000):
+    """(ais_tracks.Tracks, Detections, true mmsi per detection; -1 = dark) around one acquisition"""
+    rng = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = bbox
+    per_vessel = max(reports // vessels, 2)
+    span = per_vessel * interval_s
+
+    start_lon = rng.uniform(lon_min, lon_max, vessels)
+    start_lat = rng.uniform(lat_min, lat_max, vessels)
+    sog = rng.uniform(0, 20, vessels)
+    cog = rng.uniform(0, 360, vessels)
+    phase = rng.uniform(0, interval_s, vessels)
+    t0 = acquired - span / 2 + phase
+
+    # Straight tracks reported every interval_s (jittered), with AIS position noise
+    steps = t0[:, None] + np.arange(per_vessel)[None, :] * interval_s + rng.normal(0, 10, (vessels, per_vessel))
+    def position(t):
+        dt = t - t0[:, None] if np.ndim(t) == 2 else t - t0
+        speed = sog * ais_tracks.KNOT
+        course = np.radians(cog)
+        lat = (start_lat + np.degrees(speed * np.cos(course) * dt.T / ais_tracks.EARTH_RADIUS_M)).T
+        lon = (start_lon + np.degrees(speed * np.sin(course) * dt.T
+                                      / (ais_tracks.EARTH_RADIUS_M * np.cos(np.radians(start_lat))))).T
+        return lon, lat
+    lon, lat = position(steps)
+    noise = 20 / 111_000
+    ais = ais_tracks.build_tracks(np.repeat(200_000_000 + np.arange(vessels), per_vessel),
+                                  steps.ravel().astype(np.int64),
+                                  lat.ravel() + rng.normal(0, noise, lat.size),
+                                  lon.ravel() + rng.normal(0, noise, lon.size),
+                                  np.repeat(sog, per_vessel), np.repeat(cog, per_vessel))
+
+    dark = int(detections * dark_share)
+    seen = rng.choice(vessels, detections - dark, replace=False)
+    seen_lon, seen_lat = position(np.full(vessels, float(acquired)))
+    # SAR geolocation error of ~100 m
+    sar_noise = 100 / 111_000
+    det_lon = np.r_[seen_lon[seen] + rng.normal(0, sar_noise, len(seen)), rng.uniform(lon_min, lon_max, dark)]
+    det_lat = np.r_[seen_lat[seen] + rng.normal(0, sar_noise, len(seen)), rng.uniform(lat_min, lat_max, dark)]
+    truth = np.r_[200_000_000 + seen, np.full(dark, -1)]
+    count = len(truth)
+    found = correlator.Detections(det_lon, det_lat, np.full(count, acquired, dtype=np.int64),
+                                  rng.uniform(0.3, 1.0, count), rng.uniform(20, 300, count))
+    return ais, found, truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=1_000_000)
+    parser.add_argument("--vessels", type=int, default=20_000)
+    parser.add_argument("--detections", type=int, default=1_500)
+    parser.add_argument("--dark-share", type=float, default=0.1)
+    parser.add_argument("--gate-nm", type=float, default=correlator.GATE_NM)
+    parser.add_argument("--window-min", type=float, default=correlator.WINDOW_MIN)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ais, detections, truth = synthetic_traffic(args.reports, args.vessels, args.detections, args.dark_share)
+    print(f"{len(ais.time)} AIS reports from {args.vessels} vessels, {len(truth)} detections "
+          f"({np.count_nonzero(truth < 0)} dark), gate {args.gate_nm:g} NM / {args.window_min:g} min\n")
+
+    start = time.perf_counter()
+    index = correlator.AISIndex(ais)
+    build = time.perf_counter() - start
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        events = correlator.correlate(detections, index, args.gate_nm, args.window_min)
+        timings.append(time.perf_counter() - start)
+
+    matched = truth >= 0
+    correct = np.count_nonzero(events["mmsi"][matched] == truth[matched])
+    flagged = np.count_nonzero(events["dark"][~matched])
+    false_dark = np.count_nonzero(events["dark"][matched])
+    print(f"{'index (s)':>10} {'best (s)':>9} {'median (s)':>11} {'matched':>8} {'dark found':>10} {'false dark':>10}")
+    print(f"{build:>10.3f} {min(timings):>9.3f} {float(np.median(timings)):>11.3f} "
+          f"{correct / max(np.count_nonzero(matched), 1):>8.1%} "
+          f"{flagged / max(np.count_nonzero(~matched), 1):>10.1%} {false_dark:>10}")
+
+
+if __name__ == "__main__":
+    main()
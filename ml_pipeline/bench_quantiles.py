@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Quantile benchmark
+1/99 percentile clip points: exact np.percentile vs the streaming KLL sketch
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from quantile_sketch import DEFAULT_K, KLLSketch
+
+PERCENTILES = [1, 99]
+
+
+def synthetic_scene(size, rng):
+    """Lee-filtered-like dB values with a NaN nodata border"""
+    scene = (10 * np.log10(rng.gamma(1.0, 0.05, size))).astype(np.float32)
+    scene[:size // 50] = np.nan
+    return scene
+
+
+def exact(scene):
+    return np.percentile(scene[np.isfinite(scene)], PERCENTILES)
+
+
+def sketched(scene, chunk_size, k, seed=0):
+    sketch = KLLSketch(k, seed)
+    for start in range(0, scene.size, chunk_size):
+        sketch.update(scene[start:start + chunk_size])
+    return sketch
+
+
+def rank_error(sorted_finite, values):
+    """|estimated rank - target rank| in percentage points"""
+    ranks = np.searchsorted(sorted_finite, values) / sorted_finite.size * 100
+    return np.abs(ranks - PERCENTILES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 50],
+                        help="Scene sizes in megapixels")
+    parser.add_argument("--chunk-rows", type=int, default=256)
+    parser.add_argument("--width", type=int, default=25000, help="Scene width (IW GRD is ~25k)")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--workers", type=int, default=4, help="Shards merged in the merge check")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunk_size = args.chunk_rows * args.width
+
+    print(f"{'MP':>6} {'exact ms':>9} {'sketch ms':>10} {'speedup':>8} {'p1 err':>8} {'p99 err':>8} "
+          f"{'rank err %':>11} {'merged rank err %':>18} {'items':>6}")
+    for megapixels in args.sizes:
+        scene = synthetic_scene(int(megapixels * 1e6), rng)
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            reference = exact(scene)
+        exact_ms = (time.perf_counter() - start) / args.repeats * 1000
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            sketch = sketched(scene, chunk_size, args.k)
+        sketch_ms = (time.perf_counter() - start) / args.repeats * 1000
+        estimate = sketch.percentiles(PERCENTILES)
+
+        # Per-worker sketches over disjoint shards, merged afterwards
+        shards = np.array_split(scene, args.workers)
+        merged = sketched(shards[0], chunk_size, args.k, seed=0)
+        for worker, shard in enumerate(shards[1:], start=1):
+            merged.merge(sketched(shard, chunk_size, args.k, seed=worker))
+
+        sorted_finite = np.sort(scene[np.isfinite(scene)])
+        error = np.abs(estimate - reference)
+        ranks = rank_error(sorted_finite, estimate)
+        merged_ranks = rank_error(sorted_finite, merged.percentiles(PERCENTILES))
+
+        print(f"{megapixels:>6g} {exact_ms:>9.1f} {sketch_ms:>10.1f} {exact_ms / sketch_ms:>7.2f}x "
+              f"{error[0]:>8.4f} {error[1]:>8.4f} {ranks.max():>11.3f} {merged_ranks.max():>18.3f} {len(sketch):>6}")
+
+    print("\nerr columns are absolute dB differences; rank err is the distance of the")
+    print("estimate from the 1st/99th percentile in percentage points of the data.")
+
+
+if __name__ == "__main__":
+    main()
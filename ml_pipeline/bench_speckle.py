@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Speckle filter benchmark
+Megapixels/sec of each speckle filter and window size, against the original filter2D Lee
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from speckle_filters import FILTERS, speckle_filter
+
+
+def filter2d_lee(image, window_size=7):
+    """The original lee_filter: dense kernel through filter2D, image**2 as a new array"""
+    kernel = np.ones((window_size, window_size), np.float32) / (window_size * window_size)
+    mean = cv2.filter2D(image, -1, kernel)
+    sqr_mean = cv2.filter2D(image**2, -1, kernel)
+    variance = np.maximum(sqr_mean - mean**2, 1e-10)
+    k = variance / (variance + mean**2 + 1e-10)
+    return mean + k * (image - mean)
+
+
+def timed(function, repeats):
+    function()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2048)
+    parser.add_argument("--width", type=int, default=25000, help="Scene width (IW GRD is ~25k)")
+    parser.add_argument("--windows", type=int, nargs="+", default=[5, 7, 11, 15])
+    parser.add_argument("--filters", nargs="+", default=list(FILTERS), choices=FILTERS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scene = (10 * np.log10(rng.gamma(4.4, 0.05 / 4.4, (args.rows, args.width)))).astype(np.float32)
+    megapixels = scene.size / 1e6
+    print(f"Scene {args.rows} x {args.width} ({megapixels:.1f} MP), {args.workers} worker(s)\n")
+
+    print(f"{'filter':<25} " + " ".join(f"{f'w={w} MP/s':>11}" for w in args.windows))
+    rows = [("lee (filter2D, original)", lambda w: filter2d_lee(scene, w))]
+    rows += [(name, lambda w, name=name: speckle_filter(scene, name, w, workers=args.workers))
+             for name in args.filters]
+    for label, run in rows:
+        cells = []
+        for window_size in args.windows:
+            if label == "refined_lee" and window_size < 5:
+                cells.append(f"{'-':>11}")
+                continue
+            seconds = timed(lambda: run(window_size), args.repeats)
+            cells.append(f"{megapixels / seconds:>11.1f}")
+        print(f"{label:<25} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
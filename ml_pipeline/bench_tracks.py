@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - AIS track kernel benchmark
+Vectorised ais_tracks.positions_at vs a pandas groupby-apply baseline on synthetic AIS at 10M-row scale
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import ais_tracks
+
+
+def synthetic_ais(rows, vessels, seed=0, start=1_700_000_000, days=1):
+    """Unordered AIS columns (mmsi, time, lat, lon, sog, cog) with irregular report intervals"""
+    rng = np.random.default_rng(seed)
+    mmsi = 200_000_000 + rng.integers(0, vessels, rows)
+    times = start + rng.integers(0, days * 86400, rows)
+    lat = rng.uniform(-60, 60, rows)
+    lon = rng.uniform(-180, 180, rows)
+    sog = rng.uniform(0, 20, rows)
+    cog = rng.uniform(0, 360, rows)
+    return mmsi, times, lat, lon, sog, cog
+
+
+def groupby_positions(frame, when):
+    """Baseline: one Python call per vessel (interpolate, else dead-reckon from the nearest end)"""
+
+    def locate(track):
+        times = track["time"].to_numpy()
+        before = np.searchsorted(times, when, side="right")
+        if 0 < before < len(times):
+            row0, row1 = track.iloc[before - 1], track.iloc[before]
+            fraction = (when - row0["time"]) / max(row1["time"] - row0["time"], 1)
+            return ais_tracks.great_circle_interpolate(row0["lon"], row0["lat"], row1["lon"], row1["lat"], fraction)
+        row = track.iloc[max(before - 1, 0)]
+        return ais_tracks.dead_reckon(row["lon"], row["lat"], row["sog"], row["cog"], when - row["time"])
+
+    return frame.groupby("mmsi", sort=True).apply(locate, include_groups=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--vessels", type=int, default=200_000)
+    parser.add_argument("--times", type=int, default=8, help="Query times per batch (e.g. SAR acquisitions)")
+    parser.add_argument("--baseline-vessels", type=int, default=2_000,
+                        help="Vessels timed with groupby-apply, extrapolated to all (0 = skip)")
+    args = parser.parse_args()
+
+    columns = synthetic_ais(args.rows, args.vessels)
+    start = time.perf_counter()
+    tracks = ais_tracks.build_tracks(*columns)
+    build = time.perf_counter() - start
+    vessels = len(tracks.vessels)
+    queries = np.linspace(tracks.time.min(), tracks.time.max(), args.times + 2)[1:-1].astype(np.int64)
+    print(f"{len(tracks.time)} AIS rows, {vessels} vessels, {args.times} query times "
+          f"(sorted in {build:.2f}s)\n")
+
+    print(f"{'method':<22} {'seconds':>8} {'positions':>11} {'positions/s':>12}")
+    start = time.perf_counter()
+    single = ais_tracks.positions_at(tracks, queries[:1])
+    seconds = time.perf_counter() - start
+    print(f"{'kernel, 1 time':<22} {seconds:>8.2f} {single.lon.size:>11} {single.lon.size / seconds:>12,.0f}")
+
+    start = time.perf_counter()
+    grid = ais_tracks.positions_at(tracks, queries)
+    seconds = time.perf_counter() - start
+    print(f"{'kernel, batch':<22} {seconds:>8.2f} {grid.lon.size:>11} {grid.lon.size / seconds:>12,.0f}")
+
+    # Per-vessel times, e.g. the acquisition of each vessel's candidate detection
+    rng = np.random.default_rng(1)
+    pick = rng.choice(tracks.vessels, min(vessels, 100_000), replace=False)
+    own = rng.choice(queries, len(pick))
+    start = time.perf_counter()
+    pairs = ais_tracks.positions_at(tracks, own, vessels=pick)
+    seconds = time.perf_counter() - start
+    print(f"{'kernel, vessel pairs':<22} {seconds:>8.2f} {pairs.lon.size:>11} {pairs.lon.size / seconds:>12,.0f}")
+
+    if not args.baseline_vessels:
+        return
+    import pandas as pd
+
+    sample = np.isin(tracks.mmsi, tracks.vessels[:args.baseline_vessels])
+    names = ("mmsi", "time", "lat", "lon", "sog", "cog")
+    frame = pd.DataFrame({name: getattr(tracks, name)[sample] for name in names})
+    start = time.perf_counter()
+    baseline = groupby_positions(frame, int(queries[0]))
+    seconds = time.perf_counter() - start
+    scale = vessels / len(baseline)
+    print(f"{'groupby-apply, 1 time':<22} {seconds * scale:>8.2f} {vessels:>11} {vessels / (seconds * scale):>12,.0f}"
+          f"  (extrapolated from {len(baseline)} vessels)")
+
+    lon = np.array([position[0] for position in baseline])
+    lat = np.array([position[1] for position in baseline])
+    error = max(np.abs(lon - single.lon[:len(baseline), 0]).max(), np.abs(lat - single.lat[:len(baseline), 0]).max())
+    print(f"\nMax difference kernel vs baseline: {error:.2e} deg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Upload path benchmark
+Compares the legacy base64 JSON /detect payload with the binary /detect/raw paths
+"""
+
+import argparse
+import base64
+import json
+import time
+import urllib.request
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from decoding import decode_base64_image, decode_image_bytes, decode_raw_array
+
+
+def make_chip(size, seed=0):
+    """Speckle-like uint8 chip with a few bright targets"""
+    rng = np.random.default_rng(seed)
+    chip = np.clip(rng.gamma(4.0, 12.0, (size, size)), 0, 255).astype(np.uint8)
+    for y, x in rng.integers(0, size - 8, (5, 2)):
+        chip[y:y+4, x:x+8] = 250
+    return chip
+
+
+def build_payloads(chip):
+    png = BytesIO()
+    Image.fromarray(chip).save(png, format="PNG")
+    png = png.getvalue()
+    shape = f"{chip.shape[0]},{chip.shape[1]}"
+
+    return {
+        "json_base64_png": {
+            "body": json.dumps({"image": base64.b64encode(png).decode(), "confidence": 0.25}).encode(),
+            "headers": {"Content-Type": "application/json"},
+            "path": "/detect",
+            "decode": lambda body: decode_base64_image(json.loads(body)["image"])
+        },
+        "octet_png": {
+            "body": png,
+            "headers": {"Content-Type": "application/octet-stream"},
+            "path": "/detect/raw",
+            "decode": decode_image_bytes
+        },
+        "octet_raw_uint8": {
+            "body": chip.tobytes(),
+            "headers": {"Content-Type": "application/octet-stream", "X-Array-Shape": shape},
+            "path": "/detect/raw",
+            "decode": lambda body: decode_raw_array(body, chip.shape, "uint8")
+        },
+        "octet_raw_float32": {
+            "body": chip.astype(np.float32).tobytes(),
+            "headers": {"Content-Type": "application/octet-stream", "X-Array-Shape": shape,
+                        "X-Array-Dtype": "float32"},
+            "path": "/detect/raw",
+            "decode": lambda body: decode_raw_array(body, chip.shape, "float32")
+        }
+    }
+
+
+def time_calls(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def bench_decode(sizes, repeats):
+    print("🔬 Server-side decode cost (no inference)")
+    print(f"{'size':>6} {'path':<20} {'payload KB':>11} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for size in sizes:
+        for name, payload in build_payloads(make_chip(size)).items():
+            body = payload["body"]
+            ms = time_calls(lambda: payload["decode"](body), repeats)
+            print(f"{size:>6} {name:<20} {len(body) / 1024:>11.1f} "
+                  f"{np.percentile(ms, 50):>8.3f} {np.percentile(ms, 99):>8.3f}")
+
+
+def bench_http(url, size, repeats):
+    print(f"\n🌐 End-to-end against {url} ({size}x{size})")
+    print(f"{'path':<20} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for name, payload in build_payloads(make_chip(size)).items():
+        def post():
+            req = urllib.request.Request(url.rstrip("/") + payload["path"], data=payload["body"],
+                                         headers=payload["headers"], method="POST")
+            with urllib.request.urlopen(req) as resp:
+                resp.read()
+
+        ms = time_calls(post, repeats)
+        print(f"{name:<20} {np.percentile(ms, 50):>8.2f} {np.percentile(ms, 99):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[640, 1024, 2048])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--url", help="Also benchmark a running server, e.g. http://localhost:8000")
+    args = parser.parse_args()
+
+    bench_decode(args.sizes, args.repeats)
+    if args.url:
+        bench_http(args.url, args.sizes[0], args.repeats)
+
+
+if __name__ == "__main__":
+    main()
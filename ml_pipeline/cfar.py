@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - CFAR ship detector
+Two-parameter CA-CFAR on the dB image: a fast standalone detector and the candidate stage in front of YOLO
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import cv2
+import numpy as np
+
+from georef import detection_geometry, pixel_to_lonlat
+from postprocess import geometry_to_columns, geometry_to_objects
+
+# Guard window half-width in pixels: keeps a ship's own pixels (up to ~200 m at 10 m GRD) out of its background
+GUARD = int(os.environ.get("IODARKWATCH_CFAR_GUARD", "10"))
+# Width in pixels of the training ring around the guard window the background is estimated on
+TRAIN = int(os.environ.get("IODARKWATCH_CFAR_TRAIN", "12"))
+# Probability of false alarm per pixel; sets the threshold in background standard deviations
+PFA = float(os.environ.get("IODARKWATCH_CFAR_PFA", "1e-6"))
+# Candidate size limits in pixels: single bright pixels are speckle, huge blobs are land or ice
+MIN_AREA = int(os.environ.get("IODARKWATCH_CFAR_MIN_AREA", "3"))
+MAX_AREA = int(os.environ.get("IODARKWATCH_CFAR_MAX_AREA", "5000"))
+
+# Pixels near no-data or the scene border need this share of their training ring
+MIN_TRAINING_FRACTION = 0.25
+# Rows per band; bands run on a thread pool like the speckle filters
+BAND_ROWS = 256
+# Threads per cfar_scores call; None = one per CPU
+WORKERS = None
+
+# Side of the chips cut around candidates for review / classification
+CHIP_SIZE = 64
+
+CANDIDATE_COLUMNS = ("x1", "y1", "x2", "y2", "score", "area", "cx", "cy", "peak")
+
+EPS = 1e-10
+# dB of the zero-backscatter floor sar_to_db clamps to (10 * log10(1e-10))
+NODATA_DB = -100.0
+
+
+def valid_pixels(image):
+    """Pixels that carry data: finite, non-zero and above the dB floor of zero backscatter"""
+    return np.isfinite(image) & (image != 0) & (image > NODATA_DB)
+
+
+def pfa_to_threshold(pfa=PFA):
+    """Background standard deviations a pixel must exceed for a false-alarm rate of ``pfa``"""
+    return NormalDist().inv_cdf(1 - pfa)
+
+
+def cfar_scores(image, guard=GUARD, train=TRAIN, valid=None, background=None, workers=None):
+    """Two-parameter CFAR statistic ``(x - mean) / std`` of every pixel.
+
+    Mean and standard deviation are those of the training ring: the
+    ``2 * (guard + train) + 1`` window minus the ``2 * guard + 1`` guard
+    window, both summed with unnormalised box filters, so the cost does not
+    depend on the window size. Only ``background`` pixels (default:
+    ``valid``, itself defaulting to ``valid_pixels``) enter the sums; the
+    scene border is padded as excluded, so edge pixels are judged on the
+    ring they actually have. Pixels that are not ``valid`` or have less than
+    ``MIN_TRAINING_FRACTION`` of their ring score 0.
+    """
+    if guard < 0 or train < 1:
+        raise ValueError("guard must be >= 0 and train >= 1")
+    image = np.asarray(image, dtype=np.float32)
+    if valid is None:
+        valid = valid_pixels(image)
+    if background is None:
+        background = valid
+    if not background.any():
+        return np.zeros(image.shape, dtype=np.float32)
+
+    # Centred values keep the float32 E[x^2] - E[x]^2 away from cancellation
+    offset = float(np.median(image[background][::max(int(np.count_nonzero(background)) // 100_000, 1)]))
+    height, width = image.shape
+    halo = guard + train
+    outer, inner = 2 * halo + 1, 2 * guard + 1
+    ring_pixels = outer * outer - inner * inner
+    out = np.empty(image.shape, dtype=np.float32)
+
+    def run(band_start):
+        band_stop = min(band_start + BAND_ROWS, height)
+        in0, in1 = max(band_start - halo, 0), min(band_stop + halo, height)
+        border = (halo - (band_start - in0), halo - (in1 - band_stop), halo, halo)
+        band = image[in0:in1] - offset
+        weights = cv2.copyMakeBorder(background[in0:in1].astype(np.float32), *border, cv2.BORDER_CONSTANT, value=0)
+        values = cv2.copyMakeBorder(np.where(background[in0:in1], band, 0).astype(np.float32),
+                                    *border, cv2.BORDER_CONSTANT, value=0)
+        squares = values * values
+
+        def ring(array):
+            sums = [cv2.boxFilter(array, cv2.CV_32F, (size, size), normalize=False,
+                                  borderType=cv2.BORDER_CONSTANT)[halo:-halo, halo:-halo]
+                    for size in (outer, inner)]
+            return sums[0] - sums[1]
+
+        count = ring(weights)
+        mean = ring(values) / np.maximum(count, 1)
+        variance = ring(squares) / np.maximum(count, 1) - mean * mean
+        center = band[band_start - in0:band_stop - in0]
+        score = (center - mean) / np.sqrt(np.maximum(variance, EPS))
+        score[(count < MIN_TRAINING_FRACTION * ring_pixels) | ~valid[band_start:band_stop]] = 0
+        out[band_start:band_stop] = score
+
+    bands = range(0, height, BAND_ROWS)
+    workers = workers or WORKERS or os.cpu_count() or 1
+    if workers == 1 or len(bands) == 1:
+        for band_start in bands:
+            run(band_start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cfar") as executor:
+            list(executor.map(run, bands))
+    return out
+
+
+def cfar_mask(image, guard=GUARD, train=TRAIN, pfa=PFA, censor=True, valid=None, workers=None):
+    """Pixels above the CFAR threshold, and their scores.
+
+    With ``censor`` a second pass re-estimates the background with the
+    first pass's detections left out of the training rings, so a ship
+    next to another ship (or a bright wake) does not inflate the
+    background and hide it. This trimmed estimate gives the robustness of
+    an order-statistic CFAR at the cost of one more box-filter pass.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    if valid is None:
+        valid = valid_pixels(image)
+    threshold = pfa_to_threshold(pfa)
+    scores = cfar_scores(image, guard, train, valid, workers=workers)
+    mask = scores > threshold
+    if censor and mask.any():
+        scores = cfar_scores(image, guard, train, valid, valid & ~mask, workers)
+        mask = scores > threshold
+    return mask, scores
+
+
+def detect(image, guard=GUARD, train=TRAIN, pfa=PFA, min_area=MIN_AREA, max_area=MAX_AREA, censor=True,
+           valid=None, workers=None):
+    """Ship candidates of a 2-D image (dB backscatter, or a preprocessed uint8 scene).
+
+    Returns an ``(N, 9)`` float32 array with ``CANDIDATE_COLUMNS``: the
+    bounding box in pixels (x2/y2 exclusive, like the detector's boxes),
+    the highest CFAR score of the blob, its area in pixels, its centroid
+    and its brightest pixel value. Rows are sorted by score, highest first.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    mask, scores = cfar_mask(image, guard, train, pfa, censor, valid, workers)
+
+    # Bridge one-pixel gaps so a ship broken up by speckle stays one candidate
+    blobs = cv2.morphologyEx(mask.view(np.uint8), cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(blobs, connectivity=8)
+    if count <= 1:
+        return np.empty((0, len(CANDIDATE_COLUMNS)), dtype=np.float32)
+
+    # Per-blob maxima over the (few) detected pixels only
+    pixels = np.flatnonzero(mask)
+    blob = labels.ravel()[pixels]
+    best_score = np.full(count, -np.inf, dtype=np.float32)
+    peak = np.full(count, -np.inf, dtype=np.float32)
+    np.maximum.at(best_score, blob, scores.ravel()[pixels])
+    np.maximum.at(peak, blob, image.ravel()[pixels])
+
+    x, y, w, h, area = (stats[1:, i] for i in range(5))
+    candidates = np.column_stack([x, y, x + w, y + h, best_score[1:], area, centroids[1:], peak[1:]])
+    candidates = candidates[(area >= min_area) & (area <= max_area)].astype(np.float32)
+    return candidates[np.argsort(-candidates[:, 4], kind="stable")]
+
+
+def candidate_chips(image, candidates, chip_size=CHIP_SIZE):
+    """Yield ``((y, x), chip)`` windows of ``chip_size`` centred on each candidate.
+
+    Windows are shifted to stay inside the image, so chips are views and
+    only an image smaller than ``chip_size`` yields smaller chips.
+    """
+    height, width = image.shape[:2]
+    for cx, cy in candidates[:, [6, 7]]:
+        y = int(min(max(round(cy) - chip_size // 2, 0), max(height - chip_size, 0)))
+        x = int(min(max(round(cx) - chip_size // 2, 0), max(width - chip_size, 0)))
+        yield (y, x), image[y:y + chip_size, x:x + chip_size]
+
+
+def cascade_offsets(candidates, height, width, tile_size=640, margin=16):
+    """(y, x) origins of detector tiles that cover every candidate.
+
+    YOLO runs at its training tile size, so instead of scaling small chips
+    up the cascade places full tiles: greedily, in row-major order, a tile
+    centred on the first uncovered candidate, which then covers every
+    candidate whose box lies at least ``margin`` pixels inside it. Tiles
+    are clamped to the scene; a scene smaller than a tile gets one tile at
+    the origin, like ``tiling.tile_offsets(cover_edges=True)``.
+    """
+    if not len(candidates):
+        return []
+    boxes = candidates[np.lexsort((candidates[:, 0], candidates[:, 1])), :4]
+    covered = np.zeros(len(boxes), dtype=bool)
+    offsets = []
+    for i in range(len(boxes)):
+        if covered[i]:
+            continue
+        x1, y1, x2, y2 = boxes[i]
+        y = int(min(max((y1 + y2) / 2 - tile_size // 2, 0), max(height - tile_size, 0)))
+        x = int(min(max((x1 + x2) / 2 - tile_size // 2, 0), max(width - tile_size, 0)))
+        # Boxes at the scene border cannot have a margin on that side
+        top, left = (margin if y > 0 else 0), (margin if x > 0 else 0)
+        bottom = margin if y + tile_size < height else 0
+        right = margin if x + tile_size < width else 0
+        covered |= ((boxes[:, 0] >= x + left) & (boxes[:, 1] >= y + top)
+                    & (boxes[:, 2] <= x + tile_size - right) & (boxes[:, 3] <= y + tile_size - bottom))
+        covered[i] = True  # a box larger than the tile still gets only one
+        offsets.append((y, x))
+    return offsets
+
+
+def iter_cascade_tiles(image, candidates, tile_size=640, margin=16):
+    """Yield ``((y, x), tile)`` over ``cascade_offsets``, like ``tiling.iter_tiles``"""
+    height, width = image.shape[:2]
+    for y, x in cascade_offsets(candidates, height, width, tile_size, margin):
+        yield (y, x), image[y:y + tile_size, x:x + tile_size]
+
+
+def candidate_geometry(candidates, transform, crs=None):
+    """georef.detection_geometry of the candidates' boxes, located at their centroids"""
+    geometry = detection_geometry(candidates[:, :4], transform, crs)
+    # Centroids are in pixel indices; +0.5 moves them onto the continuous grid of the transform
+    geometry['lon'], geometry['lat'] = pixel_to_lonlat(transform, crs, candidates[:, 6] + 0.5,
+                                                       candidates[:, 7] + 0.5)
+    return geometry
+
+
+def candidates_to_objects(candidates, transform=None, crs=None):
+    """One dict per candidate, with a ``geo`` dict when the image is georeferenced"""
+    objects = [
+        {
+            'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2},
+            'centroid': {'x': cx, 'y': cy},
+            'score': score,
+            'area': int(area),
+            'peak': peak,
+        }
+        for x1, y1, x2, y2, score, area, cx, cy, peak in candidates.tolist()
+    ]
+    if transform is not None:
+        for candidate, geo in zip(objects, geometry_to_objects(candidate_geometry(candidates, transform, crs))):
+            candidate['geo'] = geo
+    return objects
+
+
+def candidates_to_columns(candidates, transform=None, crs=None):
+    """Parallel arrays, one entry per candidate (plus the geometry columns when georeferenced)"""
+    columns = {'count': len(candidates)}
+    for i, name in enumerate(CANDIDATE_COLUMNS):
+        columns[name] = candidates[:, i].tolist()
+    columns['area'] = candidates[:, 5].astype(np.int64).tolist()
+    if transform is not None:
+        columns.update(geometry_to_columns(candidate_geometry(candidates, transform, crs)))
+    return columns
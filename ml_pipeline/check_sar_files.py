@@ -3,24 +3,26 @@
 Check SAR file contents and structure
 """
 
-import zipfile
 from pathlib import Path
 
+from safe_archive import SafeArchive
+
 def check_sentinel1_structure():
     zip_path = "/Volumes/SanDisk 1 TB/Datasets/SAR_Images/S1A_IW_RAW__0SDV_20240102T141608_20240102T141641_051929_06462F_8BBA.zip"
     
     print("🔍 Analyzing Sentinel-1 ZIP structure...")
     
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        files = zip_ref.namelist()
+    # One pass over the central directory; everything below uses the index
+    with SafeArchive(zip_path) as archive:
+        members = list(archive.members.values())
         
-        print(f"📦 Total files: {len(files)}")
+        print(f"📦 Total files: {len(members)}")
         
         # Analyze file types
         extensions = {}
-        for f in files:
-            if '.' in f:
-                ext = f.split('.')[-1].lower()
+        for member in members:
+            if '.' in member.name:
+                ext = member.name.split('.')[-1].lower()
                 extensions[ext] = extensions.get(ext, 0) + 1
         
         print("\n📊 File types:")
@@ -28,17 +30,17 @@ def check_sentinel1_structure():
             print(f"  .{ext}: {count} files")
         
         print("\n📁 Sample files:")
-        for i, f in enumerate(files[:15]):
-            size = zip_ref.getinfo(f).file_size / (1024*1024)  # MB
-            print(f"  {f} ({size:.1f} MB)")
+        for member in members[:15]:
+            size = member.size / (1024*1024)  # MB
+            print(f"  {member.name} ({size:.1f} MB)")
         
-        if len(files) > 15:
-            print(f"  ... and {len(files) - 15} more files")
+        if len(members) > 15:
+            print(f"  ... and {len(members) - 15} more files")
         
         # Check for measurement files (actual SAR data)
-        measurement_files = [f for f in files if 'measurement' in f.lower()]
-        annotation_files = [f for f in files if 'annotation' in f.lower()]
-        calibration_files = [f for f in files if 'calibration' in f.lower()]
+        measurement_files = archive.find("measurement")
+        annotation_files = archive.find("annotation")
+        calibration_files = archive.find("calibration") + archive.find("noise")
         
         print(f"\n🛰️ SAR data structure:")
         print(f"  Measurement files: {len(measurement_files)}")
@@ -47,9 +49,10 @@ def check_sentinel1_structure():
         
         if measurement_files:
             print(f"\n📊 Measurement files (SAR data):")
-            for f in measurement_files:
-                size = zip_ref.getinfo(f).file_size / (1024*1024)
-                print(f"  {f} ({size:.1f} MB)")
+            for name in measurement_files:
+                member = archive.members[name]
+                storage = "stored" if member.stored else f"deflated, {member.compressed_size / (1024*1024):.1f} MB zipped"
+                print(f"  {name} ({member.size / (1024*1024):.1f} MB, {storage})")
 
 def check_smap_files():
     smap_files = [
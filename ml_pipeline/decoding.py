@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Request payload decoding
+Turns base64 JSON, encoded image bytes or raw array bytes into numpy images
+"""
+
+import base64
+import threading
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# dtypes accepted for raw array uploads
+RAW_DTYPES = {
+    "uint8": np.uint8,
+    "float32": np.float32
+}
+
+
+def decode_base64_image(data):
+    """Legacy JSON path: base64 -> bytes -> PIL -> numpy (three copies)"""
+    return decode_image_bytes(base64.b64decode(data))
+
+
+# PIL's decompression-bomb limit is a module global; only swapped while a header is parsed
+_pixel_limit_lock = threading.Lock()
+
+
+def decode_image_bytes(data, max_pixels=None):
+    """Decode an encoded image file (PNG, TIFF, JPEG, ...).
+
+    PIL's decompression-bomb guard applies unless ``max_pixels`` is given,
+    in which case that explicit cap replaces it (full scenes are larger
+    than PIL's default limit).
+    """
+    if max_pixels is None:
+        return np.array(Image.open(BytesIO(data)))
+
+    with _pixel_limit_lock:
+        default = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            # Only reads the header; pixels are decoded by np.array below
+            image = Image.open(BytesIO(data))
+        finally:
+            Image.MAX_IMAGE_PIXELS = default
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ValueError(f"Image of {width}x{height} pixels exceeds the limit of {max_pixels} pixels")
+    return np.array(image)
+
+
+def parse_shape(value):
+    """Parse an array shape header such as ``640,640`` or ``640x640x3``"""
+    try:
+        shape = tuple(int(v) for v in value.replace("x", ",").split(",") if v.strip())
+    except ValueError:
+        raise ValueError(f"Invalid array shape: {value!r}")
+
+    if len(shape) not in (2, 3) or any(v <= 0 for v in shape):
+        raise ValueError(f"Array shape must be HxW or HxWxC, got {value!r}")
+    return shape
+
+
+def parse_transform(value):
+    """Parse an affine transform header ``a,b,c,d,e,f`` (rasterio Affine order, not GDAL's)"""
+    try:
+        transform = [float(v) for v in value.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid transform: {value!r}")
+
+    if len(transform) != 6:
+        raise ValueError(f"Transform needs 6 coefficients a,b,c,d,e,f, got {value!r}")
+    return transform
+
+
+def parse_origin(value):
+    """Parse a tile origin header ``y,x`` (the tile's offset in its scene, in pixels)"""
+    try:
+        origin = [int(v) for v in value.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid origin: {value!r}")
+
+    if len(origin) != 2:
+        raise ValueError(f"Origin must be y,x, got {value!r}")
+    return origin
+
+
+def decode_raw_array(data, shape, dtype="uint8"):
+    """Zero-copy view of raw little-endian array bytes.
+
+    The returned array aliases ``data`` and is read-only.
+    """
+    if dtype not in RAW_DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {sorted(RAW_DTYPES)}")
+
+    np_dtype = np.dtype(RAW_DTYPES[dtype]).newbyteorder("<")
+    expected = int(np.prod(shape)) * np_dtype.itemsize
+    if len(data) != expected:
+        raise ValueError(f"Expected {expected} bytes for shape {shape} {dtype}, got {len(data)}")
+
+    return np.frombuffer(data, dtype=np_dtype).reshape(shape)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Export the trained detector for the CPU inference backends
+"""
+
+import argparse
+
+from model_backends import BACKENDS, check_parity, export_model, load_model, load_reference_tile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLOv8x weights to ONNX / OpenVINO")
+    parser.add_argument("--weights", default="./runs/production_sar_model/weights/best.pt")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "pytorch"], required=True)
+    parser.add_argument("--int8", action="store_true", help="Also quantize to INT8")
+    parser.add_argument("--data", default="./data/yolo/dataset.yaml",
+                        help="Calibration dataset for OpenVINO INT8")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--reference-tile", help="Tile used for the parity check")
+    args = parser.parse_args()
+
+    print(f"📦 Exporting {args.weights} -> {args.backend}{' (INT8)' if args.int8 else ''}")
+    path = export_model(args.weights, args.backend, int8=args.int8, data=args.data, imgsz=args.imgsz)
+    print(f"✅ Exported: {path}")
+
+    tile = load_reference_tile(args.reference_tile, args.imgsz)
+    report = check_parity(load_model(args.weights), load_model(args.weights, args.backend, args.int8),
+                          tile, int8=args.int8)
+    status = "✅ Parity OK" if report["passed"] else "❌ Parity FAILED"
+    print(f"{status}: {report}")
+    return report["passed"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Georeferencing
+Pixel boxes to WGS84 centroids, footprints and sizes in metres, vectorised over all detections of a response
+"""
+
+import warnings
+from functools import lru_cache
+
+import numpy as np
+
+WGS84 = "EPSG:4326"
+
+# TIFF / BigTIFF signatures; only these uploads can carry a georeference
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+
+def coefficients(transform):
+    """``(a, b, c, d, e, f)`` of an ``Affine`` or of a sequence holding them"""
+    if hasattr(transform, "a"):
+        return transform.a, transform.b, transform.c, transform.d, transform.e, transform.f
+    if len(transform) < 6:
+        raise ValueError(f"transform needs 6 coefficients (a, b, c, d, e, f), got {len(transform)}")
+    return tuple(float(v) for v in transform[:6])
+
+
+def tile_transform(transform, offset):
+    """Affine transform of the tile at ``offset`` (y, x) of a raster with ``transform``"""
+    y, x = offset
+    a, b, c, d, e, f = coefficients(transform)
+    return a, b, a * x + b * y + c, d, e, d * x + e * y + f
+
+
+@lru_cache(maxsize=64)
+def _crs_units(crs):
+    """(is WGS84, is geographic, metres per CRS unit) of a CRS string"""
+    if crs is None:
+        return True, True, None
+    from rasterio.crs import CRS
+
+    parsed = CRS.from_user_input(crs)
+    if parsed.is_geographic:
+        return parsed == CRS.from_epsg(4326), True, None
+    return False, False, parsed.linear_units_factor[1]
+
+
+def check_crs(crs):
+    """Raise ValueError (rasterio's CRSError) if ``crs`` is not None and not a CRS rasterio can parse"""
+    _crs_units(None if crs is None else str(crs))
+
+
+def pixel_to_lonlat(transform, crs, x, y):
+    """WGS84 (lon, lat) arrays of pixel coordinates ``x``, ``y``.
+
+    Coordinates are continuous, as in detection boxes: (0, 0) is the outer
+    corner of the first pixel. ``crs`` is the CRS of ``transform``; None
+    means WGS84, which is what sar_fetcher tiles are delivered in.
+    """
+    a, b, c, d, e, f = coefficients(transform)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    xs = a * x + b * y + c
+    ys = d * x + e * y + f
+    if _crs_units(None if crs is None else str(crs))[0]:
+        return xs, ys
+
+    from rasterio.warp import transform as warp_transform
+
+    lon, lat = warp_transform(crs, WGS84, xs.ravel(), ys.ravel())
+    return np.reshape(lon, xs.shape), np.reshape(lat, ys.shape)
+
+
+def metres_per_degree(lat):
+    """(east, north) metres per degree of longitude / latitude at ``lat`` on the WGS84 ellipsoid"""
+    phi = np.radians(lat)
+    north = 111132.92 - 559.82 * np.cos(2 * phi) + 1.175 * np.cos(4 * phi) - 0.0023 * np.cos(6 * phi)
+    east = 111412.84 * np.cos(phi) - 93.5 * np.cos(3 * phi) + 0.118 * np.cos(5 * phi)
+    return east, north
+
+
+def detection_geometry(boxes, transform, crs=None, origin=None):
+    """WGS84 geometry of ``(N, 4+)`` x1, y1, x2, y2 pixel boxes, as a dict of arrays.
+
+    ``origin`` is the (y, x) offset of the detected image inside the raster
+    ``transform`` belongs to, e.g. a tile's position in its scene.
+
+    - ``lon``, ``lat``: box centre
+    - ``footprint``: ``(N, 5, 2)`` closed lon/lat ring of the box corners
+    - ``length_m``, ``width_m``: the box's longer and shorter side on the
+      ground. The box is axis-aligned, so a ship lying diagonally across
+      the image gets a shorter length and a larger width than it has.
+
+    All corners and centres of the batch go through one CRS transformation.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if boxes.ndim == 1:
+        boxes = boxes.reshape(-1, 4)
+    if origin is not None:
+        transform = tile_transform(transform, origin)
+    a, b, _, d, e, _ = coefficients(transform)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+
+    xs = np.stack([x1, x2, x2, x1, (x1 + x2) / 2], axis=1)
+    ys = np.stack([y1, y1, y2, y2, (y1 + y2) / 2], axis=1)
+    lon, lat = pixel_to_lonlat(transform, crs, xs, ys)
+    ring = [0, 1, 2, 3, 0]
+    footprint = np.stack([lon[:, ring], lat[:, ring]], axis=-1)
+
+    # Box sides as ground vectors in CRS units: (w, 0) and (0, h) pixels
+    width_px, height_px = x2 - x1, y2 - y1
+    across = np.stack([a * width_px, d * width_px], axis=1)
+    down = np.stack([b * height_px, e * height_px], axis=1)
+    _, geographic, unit = _crs_units(None if crs is None else str(crs))
+    if geographic:
+        east, north = metres_per_degree(lat[:, 4])
+        scale = np.stack([east, north], axis=1)
+        across, down = across * scale, down * scale
+    else:
+        across, down = across * unit, down * unit
+    sides = np.stack([np.hypot(*across.T), np.hypot(*down.T)], axis=1)
+
+    return {
+        "lon": lon[:, 4],
+        "lat": lat[:, 4],
+        "footprint": footprint,
+        "length_m": sides.max(axis=1),
+        "width_m": sides.min(axis=1),
+    }
+
+
+def read_georeference(data):
+    """``(transform, crs)`` of an uploaded GeoTIFF, or None for other images and plain TIFFs"""
+    if bytes(data[:4]) not in TIFF_MAGIC:
+        return None
+    try:
+        from rasterio.errors import NotGeoreferencedWarning, RasterioIOError
+        from rasterio.io import MemoryFile
+    except ImportError:
+        return None
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", NotGeoreferencedWarning)
+            with MemoryFile(bytes(data)) as memfile, memfile.open() as src:
+                transform = coefficients(src.transform)
+                crs = src.crs.to_string() if src.crs else None
+    except RasterioIOError:
+        return None
+    if crs is None and transform == (1.0, 0.0, 0.0, 0.0, 1.0, 0.0):
+        return None  # no georeference, rasterio's identity default
+    return transform, crs
@@ -4,35 +4,194 @@ IODarkWatch - YOLOv8x Inference Server
 Production-ready dark vessel detection API
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from pydantic import BaseModel
-from ultralytics import YOLO
+import argparse
+import base64
 import cv2
 import numpy as np
-import base64
-from io import BytesIO
-from PIL import Image
+import asyncio
+import os
+import time
+from itertools import islice
+from PIL import UnidentifiedImageError
 import json
 from pathlib import Path
+from typing import List, Literal, Optional, Union
+
+from batch_scheduler import MicroBatchScheduler
+import cfar
+from decoding import decode_image_bytes, decode_raw_array, parse_origin, parse_shape, parse_transform
+from georef import WGS84, check_crs, coefficients, detection_geometry, read_georeference, tile_transform
+from model_backends import BACKENDS, check_parity, load_model, load_reference_tile
+from model_pool import ModelPool
+from postprocess import (
+    detections_to_binary,
+    detections_to_columns,
+    detections_to_objects,
+    filter_confidence,
+    nms,
+    result_to_array,
+)
+from sar_preprocessing import preprocess_sar_advanced, sar_to_db
+from tile_prefilter import LAND_MASK_PATH, MIN_CONTRAST, LandMask, TilePrefilter, load_land_geometries
+from tiling import PAD_EDGES, iter_tiles
 
 app = FastAPI(title="IODarkWatch SAR Detection API", version="1.0.0")
 
-# Load the trained model
-MODEL_PATH = "./runs/production_sar_model/weights/best.pt"
+# Trained weights; exported backends are looked up next to them (see model_backends.py)
+MODEL_PATH = os.environ.get("IODARKWATCH_MODEL", "./runs/production_sar_model/weights/best.pt")
+BACKEND = os.environ.get("IODARKWATCH_BACKEND", "pytorch")
+INT8 = os.environ.get("IODARKWATCH_INT8", "0") == "1"
+INTRA_OP_THREADS = int(os.environ.get("IODARKWATCH_INTRA_OP_THREADS", 0)) or None
+INTER_OP_THREADS = int(os.environ.get("IODARKWATCH_INTER_OP_THREADS", 0)) or None
+
+# Inference worker processes sharing one copy of the weights (0 = run in the server process)
+WORKERS = int(os.environ.get("IODARKWATCH_WORKERS", 0))
+
+# Exported models must reproduce the .pt output on this tile before serving
+PARITY_CHECK = os.environ.get("IODARKWATCH_PARITY_CHECK", "1") == "1"
+REFERENCE_TILE = os.environ.get("IODARKWATCH_REFERENCE_TILE")
+
+# Micro-batching: concurrent requests are coalesced into one forward pass
+MAX_BATCH_SIZE = int(os.environ.get("IODARKWATCH_MAX_BATCH_SIZE", 16))
+MAX_BATCH_WAIT_MS = float(os.environ.get("IODARKWATCH_MAX_BATCH_WAIT_MS", 10))
+
+# Scene tiles in flight at once; bounds the RGB tile copies held in memory
+SCENE_TILES_IN_FLIGHT = int(os.environ.get("IODARKWATCH_SCENE_TILES_IN_FLIGHT", 4 * MAX_BATCH_SIZE))
+
+# Drop no-data / empty-ocean scene tiles before the model (tile_prefilter.py);
+# off by default, tune the thresholds with its recall report first
+PREFILTER = os.environ.get("IODARKWATCH_PREFILTER", "0") == "1"
+
+# Run YOLO only on tiles around CFAR candidates (cfar.py) instead of the whole scene;
+# off by default, compare recall with bench_cfar.py first
+CASCADE = os.environ.get("IODARKWATCH_CASCADE", "0") == "1"
+
+# Pixel cap for /detect/scene and /detect/cfar uploads; full Sentinel-1 GRD scenes exceed
+# PIL's decompression-bomb limit, which still guards the other endpoints
+SCENE_MAX_PIXELS = int(os.environ.get("IODARKWATCH_SCENE_MAX_PIXELS", 30000 * 30000))
+
+model = None
+pool = None
+scheduler = None
+land_geometries = None
+
+def load_server_model():
+    return load_model(MODEL_PATH, BACKEND, INT8, INTRA_OP_THREADS, INTER_OP_THREADS)
+
+def verify_exported_model(loaded):
+    """Exported models must match the .pt weights before they serve traffic"""
+    tile = load_reference_tile(REFERENCE_TILE)
+    report = check_parity(load_model(MODEL_PATH), loaded, tile, int8=INT8)
+    if not report["passed"]:
+        raise RuntimeError(f"{BACKEND} model does not match {MODEL_PATH}: {report}")
+    if INT8:
+        print(f"✅ Parity check passed ({report['detections']} detections matched, "
+              f"min IoU {report['min_iou']}, max score error {report['max_score_error']})")
+    else:
+        print(f"✅ Parity check passed (max box error {report['max_box_error_px']:.3g} px, "
+              f"max score error {report['max_score_error']:.3g})")
+
+def run_batch(images, confidence):
+    """Batched forward pass, executed on the scheduler's worker thread"""
+    results = model(images, conf=confidence, device='cpu', verbose=False)
+    return [result_to_array(r) for r in results]
+
+def load_land_mask():
+    """Land polygons for the scene pre-filter; rasterised per request onto georeferenced scenes"""
+    global land_geometries
+    if not LAND_MASK_PATH:
+        return
+    try:
+        land_geometries = load_land_geometries(LAND_MASK_PATH)
+        print(f"✅ Land mask loaded: {LAND_MASK_PATH} ({len(land_geometries)} geometries)")
+    except Exception as e:
+        print(f"❌ Failed to load land mask: {e}")
+
+def scene_land_mask(shape, georef):
+    """LandMask of a scene of ``shape`` placed on the ground by ``georef``"""
+    from rasterio.transform import Affine
+    
+    transform, crs, origin = georef
+    if origin is not None:
+        transform = tile_transform(transform, origin)
+    return LandMask.from_geometries(land_geometries, shape, Affine(*coefficients(transform)), crs or WGS84)
+
+@app.on_event("startup")
+async def startup():
+    global model, pool, scheduler
+    load_land_mask()
+    try:
+        model = load_server_model()
+        print(f"✅ Model loaded: {MODEL_PATH} ({BACKEND}{', INT8' if INT8 else ''})")
+        
+        if WORKERS:
+            # Workers are spawned; PyTorch workers run this model on its shared weights
+            pool = ModelPool(MODEL_PATH, BACKEND, INT8, num_workers=WORKERS,
+                             threads_per_worker=INTRA_OP_THREADS, model=model)
+            pool.start()
+        
+        if BACKEND != "pytorch" and PARITY_CHECK:
+            verify_exported_model(model)
+    except Exception as e:
+        print(f"❌ Failed to load model: {e}")
+        if pool:
+            pool.stop()
+        model = pool = None
+        return
+    
+    scheduler = MicroBatchScheduler(
+        pool.predict if pool else run_batch,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_BATCH_WAIT_MS,
+        max_concurrent_batches=WORKERS or 1
+    )
+    await scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if scheduler:
+        await scheduler.stop()
+    if pool:
+        pool.stop()
 
-try:
-    model = YOLO(MODEL_PATH)
-    print(f"✅ Model loaded: {MODEL_PATH}")
-except Exception as e:
-    print(f"❌ Failed to load model: {e}")
-    model = None
+# objects: one dict per detection, columnar: parallel arrays,
+# binary: packed float32 rows (see postprocess.detections_to_binary)
+DetectionFormat = Literal["objects", "columnar", "binary"]
 
-class DetectionRequest(BaseModel):
+class GeoreferencedRequest(BaseModel):
+    # Where the image lies on the ground; GeoTIFF uploads carry their own georeference
+    transform: Optional[List[float]] = None  # affine (a, b, c, d, e, f) of the raster the image comes from
+    crs: Optional[str] = None  # CRS of the transform (default WGS84, as fetched by sar_fetcher)
+    origin: Optional[List[int]] = None  # (y, x) of the image in that raster, e.g. a tile's scene offset
+
+class DetectionRequest(GeoreferencedRequest):
     image: str  # Base64 encoded image
     confidence: float = 0.25
+    format: DetectionFormat = "objects"
+
+class SceneDetectionRequest(GeoreferencedRequest):
+    image: str  # Base64 encoded scene raster (GeoTIFF, PNG, ...)
+    confidence: float = 0.25
+    tile_size: int = 640
+    overlap: int = 64
+    iou_threshold: float = 0.45
+    format: DetectionFormat = "objects"
+    prefilter: bool = PREFILTER
+    cascade: bool = CASCADE
+
+class CFARDetectionRequest(GeoreferencedRequest):
+    image: str  # Base64 encoded scene raster
+    guard: int = cfar.GUARD
+    train: int = cfar.TRAIN
+    pfa: float = cfar.PFA
+    min_area: int = cfar.MIN_AREA
+    max_area: int = cfar.MAX_AREA
+    format: Literal["objects", "columnar"] = "objects"
 
 class DetectionResponse(BaseModel):
-    detections: list
+    detections: Union[list, dict]
     model_info: dict
     processing_time: float
 
@@ -42,15 +201,35 @@ async def root():
         "service": "IODarkWatch SAR Detection API",
         "model": "YOLOv8x",
         "status": "online" if model else "model_not_loaded",
-        "endpoints": ["/detect", "/health", "/model-info"]
+        "endpoints": ["/detect", "/detect/raw", "/detect/scene", "/detect/cfar", "/health", "/model-info", "/metrics"]
     }
 
 @app.get("/health")
 async def health_check():
-    return {
+    health = {
         "status": "healthy" if model else "unhealthy",
-        "model_loaded": model is not None
+        "model_loaded": model is not None,
+        "scheduler_running": scheduler is not None and scheduler.running
     }
+    
+    if scheduler:
+        stats = scheduler.stats()
+        health["queue_depth"] = stats["queue_depth"]
+        health["batches_in_flight"] = stats["batches_in_flight"]
+    
+    if pool:
+        workers = pool.stats()
+        health["workers"] = workers
+        if not all(w["alive"] for w in workers):
+            health["status"] = "degraded" if any(w["alive"] for w in workers) else "unhealthy"
+    
+    return health
+
+@app.get("/metrics")
+async def metrics():
+    if not scheduler:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return scheduler.stats()
 
 @app.get("/model-info")
 async def model_info():
@@ -68,74 +247,349 @@ async def model_info():
     return {
         "model_type": "YOLOv8x",
         "data_source": "Sentinel-1 SAR",
+        "backend": BACKEND,
+        "int8": INT8,
+        "threads": {"intra_op": INTRA_OP_THREADS, "inter_op": INTER_OP_THREADS},
         "deployment_config": config
     }
 
+def to_rgb(img_array):
+    """Legacy /detect conversion: the decoded image as-is, grayscale expanded to RGB"""
+    # Preprocess for SAR data if needed
+    if len(img_array.shape) == 2:
+        # Grayscale SAR image
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
+    
+    return img_array
+
+def to_model_input(img_array):
+    """Bring a decoded image into the layout the model was trained on (raw upload path)"""
+    if img_array.ndim == 3 and img_array.shape[2] == 1:
+        img_array = img_array[..., 0]
+    
+    if img_array.dtype != np.uint8:
+        # Raw backscatter: same preprocessing the training tiles went through
+        if img_array.ndim == 3:
+            img_array = img_array.mean(axis=2)
+        img_array = preprocess_sar_advanced(img_array)
+    
+    return to_rgb(img_array)
+
+def request_georeference(transform, crs, origin, data=None):
+    """(transform, crs, origin) given with the request, else read from a GeoTIFF upload, else None"""
+    if transform is None and data is not None:
+        transform, crs = read_georeference(data) or (None, crs)
+    if transform is None:
+        return None
+    if len(transform) != 6:
+        raise ValueError(f"transform needs 6 coefficients (a, b, c, d, e, f), got {len(transform)}")
+    if origin is not None and len(origin) != 2:
+        raise ValueError(f"origin must be (y, x), got {origin}")
+    # Rejected before inference rather than when the response is built
+    check_crs(crs)
+    return transform, crs, origin
+
+def decode_scene(image, transform, crs, origin):
+    """(single-band scene, georef) of a base64 scene upload; slow for full scenes, run it off the event loop"""
+    data = base64.b64decode(image)
+    scene = decode_image_bytes(data, SCENE_MAX_PIXELS)
+    georef = request_georeference(transform, crs, origin, data)
+    if scene.ndim == 3:
+        scene = cv2.cvtColor(scene[..., :3], cv2.COLOR_RGB2GRAY)
+    return scene, georef
+
+def decode_raw_upload(data, shape, dtype, transform, crs, origin):
+    """(model input, georef) of a /detect/raw body; float uploads are fully preprocessed, run it off the event loop"""
+    if shape:
+        img_array = decode_raw_array(data, parse_shape(shape), dtype)
+    else:
+        img_array = decode_image_bytes(data)
+    
+    img_array = to_model_input(img_array)
+    georef = request_georeference(parse_transform(transform) if transform else None, crs,
+                                  parse_origin(origin) if origin else None, None if shape else data)
+    return img_array, georef
+
+def build_response(detections, fmt, model_info, start_time, georef=None):
+    """Serialize an (N, 6) detection array in the requested format.
+    
+    With ``georef`` (see request_georeference) objects and columnar
+    responses carry WGS84 centres, footprints and sizes in metres, computed
+    for all detections at once; the binary format stays pixel boxes only.
+    """
+    model_info["georeferenced"] = georef is not None
+    geometry = None
+    if georef is not None and fmt != "binary":
+        geometry = detection_geometry(detections[:, :4], *georef)
+    processing_time = time.time() - start_time
+    
+    if fmt == "binary":
+        return Response(
+            content=detections_to_binary(detections),
+            media_type="application/octet-stream",
+            headers={
+                "X-Processing-Time": f"{processing_time:.6f}",
+                "X-Detection-Count": str(len(detections))
+            }
+        )
+    
+    if fmt == "columnar":
+        payload = detections_to_columns(detections, model.names, geometry)
+    else:
+        payload = detections_to_objects(detections, model.names, geometry)
+    
+    return DetectionResponse(
+        detections=payload,
+        model_info=model_info,
+        processing_time=processing_time
+    )
+
+async def run_detection(img_array, confidence, fmt, start_time, georef=None):
+    # Run inference (batched with other in-flight requests)
+    result = await scheduler.submit(img_array, confidence)
+    
+    # The batch ran at the lowest threshold among its requests
+    detections = filter_confidence(result, confidence)
+    
+    return build_response(detections, fmt, {
+        "model": "YOLOv8x-SAR",
+        "confidence_threshold": confidence,
+        "classes": list(model.names.values()),
+        "input_size": img_array.shape
+    }, start_time, georef)
+
 @app.post("/detect", response_model=DetectionResponse)
 async def detect_vessels(request: DetectionRequest):
     if not model:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        import time
         start_time = time.time()
         
-        # Decode base64 image
-        image_data = base64.b64decode(request.image)
-        image = Image.open(BytesIO(image_data))
-        
-        # Convert to numpy array
-        img_array = np.array(image)
-        
-        # Preprocess for SAR data if needed
-        if len(img_array.shape) == 2:
-            # Grayscale SAR image
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-        
-        # Run inference
-        results = model(img_array, conf=request.confidence, device='cpu')
-        
-        # Extract detections
-        detections = []
-        
-        for result in results:
-            if result.boxes is not None:
-                for box in result.boxes:
-                    detection = {
-                        'class_id': int(box.cls.item()),
-                        'class_name': model.names[int(box.cls.item())],
-                        'confidence': float(box.conf.item()),
-                        'bbox': {
-                            'x1': float(box.xyxy[0][0].item()),
-                            'y1': float(box.xyxy[0][1].item()),
-                            'x2': float(box.xyxy[0][2].item()),
-                            'y2': float(box.xyxy[0][3].item())
-                        },
-                        'is_dark_vessel': int(box.cls.item()) == 0  # Assuming class 0 is dark_vessel
-                    }
-                    detections.append(detection)
-        
-        processing_time = time.time() - start_time
+        # Decode base64 image; converted exactly as before /detect/raw existed
+        data = base64.b64decode(request.image)
+        img_array = to_rgb(decode_image_bytes(data))
+        georef = request_georeference(request.transform, request.crs, request.origin, data)
+        
+        return await run_detection(img_array, request.confidence, request.format, start_time, georef)
+        
+    except ValueError as e:
+        # Bad client-supplied transform / CRS / origin
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
+@app.post("/detect/raw", response_model=DetectionResponse)
+async def detect_vessels_raw(
+    request: Request,
+    confidence: float = 0.25,
+    format: DetectionFormat = "objects",
+    x_array_shape: Optional[str] = Header(None),
+    x_array_dtype: str = Header("uint8"),
+    x_geo_transform: Optional[str] = Header(None),
+    x_geo_crs: Optional[str] = Header(None),
+    x_tile_origin: Optional[str] = Header(None)
+):
+    """Binary upload path: no base64 and no JSON parsing.
+    
+    The body is either an encoded image file or, when an array shape is
+    given, raw uint8/float32 pixels that are viewed in place with
+    np.frombuffer. Send it as application/octet-stream or as a multipart
+    form with an ``image`` file field (plus optional ``shape``/``dtype``).
+    The georeference comes from a GeoTIFF body or from the
+    ``X-Geo-Transform``/``X-Geo-CRS``/``X-Tile-Origin`` headers (form
+    fields ``transform``/``crs``/``origin``).
+    """
+    if not model:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    try:
+        start_time = time.time()
+        
+        shape, dtype = x_array_shape, x_array_dtype
+        transform, crs, origin = x_geo_transform, x_geo_crs, x_tile_origin
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("image")
+            if upload is None or isinstance(upload, str):
+                raise ValueError("Multipart upload needs an 'image' file field")
+            data = await upload.read()
+            shape = form.get("shape", shape)
+            dtype = form.get("dtype", dtype)
+            transform = form.get("transform", transform)
+            crs = form.get("crs", crs)
+            origin = form.get("origin", origin)
+        else:
+            data = await request.body()
+        
+        img_array, georef = await asyncio.to_thread(decode_raw_upload, data, shape, dtype, transform, crs, origin)
+        
+        return await run_detection(img_array, confidence, format, start_time, georef)
+        
+    except (ValueError, UnidentifiedImageError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
+@app.post("/detect/scene", response_model=DetectionResponse)
+async def detect_scene(request: SceneDetectionRequest):
+    """Tile a full scene server-side, detect on every tile and merge with a global NMS"""
+    if not model:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    try:
+        start_time = time.time()
+        
+        # Decoding (and reading a GeoTIFF's georeference) takes seconds on a full scene
+        scene, georef = await asyncio.to_thread(
+            decode_scene, request.image, request.transform, request.crs, request.origin
+        )
+        
+        backscatter = None
+        if scene.dtype != np.uint8:
+            # Raw backscatter: same preprocessing the training tiles went through
+            backscatter = scene
+            scene = await asyncio.to_thread(preprocess_sar_advanced, scene)
+        
+        # Tile views are generated as the scheduler takes them, never collected
+        candidates = None
+        if request.cascade:
+            # CFAR on the dB backscatter (or the preprocessed scene) decides where YOLO looks;
+            # a full-scene scan, so it runs off the event loop like /detect/cfar
+            candidates = await asyncio.to_thread(
+                lambda: cfar.detect(sar_to_db(backscatter) if backscatter is not None else scene)
+            )
+            tiles = cfar.iter_cascade_tiles(scene, candidates, request.tile_size)
+        else:
+            # Edge tiles are zero-padded on the step grid, exactly like the training tiles
+            tiles = iter_tiles(scene, request.tile_size, request.overlap, pad_edges=PAD_EDGES)
+        prefilter = land = None
+        if request.prefilter:
+            if land_geometries is not None and georef is not None:
+                # The land check needs to know where the scene lies; uploads without a georeference skip it
+                land = await asyncio.to_thread(scene_land_mask, scene.shape, georef)
+            # The contrast screen needs backscatter; uint8 scenes are only screened for no-data
+            prefilter = TilePrefilter(min_contrast=MIN_CONTRAST if backscatter is not None else None)
+            tiles = prefilter.filter(tiles, screen_image=backscatter, land=land)
+        
+        async def detect_tile(y, x, tile):
+            tile = cv2.cvtColor(tile, cv2.COLOR_GRAY2RGB)
+            result = await scheduler.submit(tile, request.confidence)
+            
+            data = filter_confidence(result, request.confidence)
+            # Boxes on a padded edge tile may reach into the padding; clip them to the scene
+            data[:, [0, 2]] = np.clip(data[:, [0, 2]] + x, 0, scene.shape[1])
+            data[:, [1, 3]] = np.clip(data[:, [1, 3]] + y, 0, scene.shape[0])
+            return data
+        
+        # Tiles are fed to the batch scheduler a window at a time. Pulling a window
+        # runs the prefilter's screen, so it happens off the event loop too
+        tile_boxes = []
+        while window := await asyncio.to_thread(lambda: list(islice(tiles, SCENE_TILES_IN_FLIGHT))):
+            tile_boxes.extend(await asyncio.gather(*(detect_tile(y, x, tile) for (y, x), tile in window)))
+        
+        merged = np.concatenate(tile_boxes) if tile_boxes else np.empty((0, 6), dtype=np.float32)
+        keep = nms(merged[:, :4], merged[:, 4], request.iou_threshold, class_ids=merged[:, 5])
+        merged = merged[keep]
+        
+        return build_response(merged, request.format, {
+            "model": "YOLOv8x-SAR",
+            "confidence_threshold": request.confidence,
+            "classes": list(model.names.values()),
+            "input_size": scene.shape,
+            "tile_size": request.tile_size,
+            "overlap": request.overlap,
+            "tiles": len(tile_boxes),
+            "iou_threshold": request.iou_threshold,
+            "prefilter": {**prefilter.stats(), "land": land is not None} if prefilter else None,
+            "cfar_candidates": len(candidates) if candidates is not None else None
+        }, start_time, georef)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Scene detection failed: {str(e)}")
+
+@app.post("/detect/cfar", response_model=DetectionResponse)
+async def detect_cfar(request: CFARDetectionRequest):
+    """Classical CA-CFAR detection over a full scene; needs no model"""
+    try:
+        start_time = time.time()
+        
+        def scan():
+            scene, georef = decode_scene(request.image, request.transform, request.crs, request.origin)
+            image = sar_to_db(scene) if scene.dtype != np.uint8 else scene
+            candidates = cfar.detect(image, request.guard, request.train, request.pfa,
+                                     request.min_area, request.max_area)
+            return scene.shape, georef, candidates
+        
+        # Decoding, the dB conversion and the scan all take seconds on a full scene;
+        # box filters and labelling release the GIL, so keep the event loop free
+        input_size, georef, candidates = await asyncio.to_thread(scan)
+        
+        transform = crs = None
+        if georef is not None:
+            transform, crs, origin = georef
+            if origin is not None:
+                transform = tile_transform(transform, origin)
+        if request.format == "columnar":
+            payload = cfar.candidates_to_columns(candidates, transform, crs)
+        else:
+            payload = cfar.candidates_to_objects(candidates, transform, crs)
         
         return DetectionResponse(
-            detections=detections,
+            detections=payload,
             model_info={
-                "model": "YOLOv8x-SAR",
-                "confidence_threshold": request.confidence,
-                "classes": list(model.names.values()),
-                "input_size": img_array.shape
+                "model": "CA-CFAR",
+                "guard": request.guard,
+                "train": request.train,
+                "pfa": request.pfa,
+                "threshold": cfar.pfa_to_threshold(request.pfa),
+                "input_size": input_size,
+                "georeferenced": georef is not None
             },
-            processing_time=processing_time
+            processing_time=time.time() - start_time
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"CFAR detection failed: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
+    
+    parser = argparse.ArgumentParser(description="IODarkWatch SAR Detection API")
+    parser.add_argument("--model", default=MODEL_PATH, help="Trained .pt weights")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND)
+    parser.add_argument("--int8", action="store_true", default=INT8, help="Serve the INT8-quantized export")
+    parser.add_argument("--intra-op-threads", type=int, default=INTRA_OP_THREADS)
+    parser.add_argument("--inter-op-threads", type=int, default=INTER_OP_THREADS)
+    parser.add_argument("--reference-tile", default=REFERENCE_TILE, help="Tile used for the startup parity check")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Inference worker processes sharing one copy of the weights (0 = in-process)")
+    parser.add_argument("--skip-parity-check", action="store_true", default=not PARITY_CHECK)
+    parser.add_argument("--land-mask", default=LAND_MASK_PATH,
+                        help="GeoJSON of land polygons (WGS84) for the /detect/scene pre-filter")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    
+    MODEL_PATH = args.model
+    BACKEND = args.backend
+    INT8 = args.int8
+    INTRA_OP_THREADS = args.intra_op_threads
+    INTER_OP_THREADS = args.inter_op_threads
+    REFERENCE_TILE = args.reference_tile
+    WORKERS = args.workers
+    PARITY_CHECK = not args.skip_parity_check
+    LAND_MASK_PATH = args.land_mask
+    
     print("🚀 Starting IODarkWatch SAR Detection API...")
-    print(f"📊 Model: {MODEL_PATH}")
-    print("🌐 API: http://localhost:8000")
-    print("📖 Docs: http://localhost:8000/docs")
+    print(f"📊 Model: {MODEL_PATH} ({BACKEND}{', INT8' if INT8 else ''})")
+    print(f"📦 Batching: up to {MAX_BATCH_SIZE} images / {MAX_BATCH_WAIT_MS:g} ms")
+    if WORKERS:
+        print(f"👷 Workers: {WORKERS}")
+    print(f"🌐 API: http://localhost:{args.port}")
+    print(f"📖 Docs: http://localhost:{args.port}/docs")
     
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=args.port) 
\ No newline at end of file
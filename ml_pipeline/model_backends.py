@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Model backends
+Loads the detector as PyTorch, ONNX Runtime or OpenVINO, with CPU thread tuning
+and a parity check of exported models against the original .pt weights
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from postprocess import result_to_array
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+# Parity tolerances. FP32 exports must reproduce the raw head output (boxes in
+# pixels, class scores in [0, 1]); INT8 exports must reproduce the detections,
+# box for box, with at least this IoU and at most this score difference
+PARITY_TOLERANCES = {
+    "fp32": {"box_px": 1.0, "score": 2e-3},
+    "int8": {"box_iou": 0.9, "score": 0.05}
+}
+# Confidence threshold of the detections compared for INT8 parity
+PARITY_CONFIDENCE = 0.25
+
+
+def exported_path(weights, backend, int8=False):
+    """Where ``export_model`` writes (and ``load_model`` looks for) an artifact"""
+    weights = Path(weights)
+    if backend == "pytorch":
+        return weights
+
+    stem = f"{weights.stem}_int8" if int8 else weights.stem
+    if backend == "onnx":
+        return weights.with_name(f"{stem}.onnx")
+    if backend == "openvino":
+        return weights.with_name(f"{stem}_openvino_model")
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+
+def export_model(weights, backend, int8=False, data=None, imgsz=640, batch=16):
+    """Export ``weights`` for ``backend`` and return the artifact path.
+
+    Exports use a dynamic batch axis so the batch scheduler can feed them.
+    OpenVINO INT8 is calibrated by NNCF on ``data`` (a dataset yaml); ONNX
+    INT8 uses ONNX Runtime dynamic weight quantization of the FP32 export.
+    """
+    from ultralytics import YOLO
+
+    target = exported_path(weights, backend, int8)
+    if backend == "pytorch":
+        return target
+
+    if backend == "openvino":
+        out = YOLO(str(weights)).export(format="openvino", imgsz=imgsz, dynamic=True, batch=batch,
+                                        int8=int8, data=data)
+        out = Path(out)
+        if out != target:
+            out.rename(target)
+        return target
+
+    onnx_path = Path(YOLO(str(weights)).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+    if not int8:
+        return onnx_path
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        raise ImportError("ONNX INT8 export needs onnxruntime: pip install onnxruntime")
+
+    quantize_dynamic(str(onnx_path), str(target), weight_type=QuantType.QUInt8)
+    return target
+
+
+def configure_torch_threads(intra_op_threads=None, inter_op_threads=None):
+    import torch
+
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # Only settable before the first parallel region has run
+            print("⚠️  Inter-op threads already initialised, keeping the current setting")
+
+
+def load_model(weights, backend="pytorch", int8=False, intra_op_threads=None, inter_op_threads=None):
+    """Load the detector for ``backend`` with the requested CPU thread counts"""
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "pytorch" and int8:
+        raise ValueError("INT8 is only available for the onnx and openvino backends")
+
+    path = exported_path(weights, backend, int8)
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found - run: python export_model.py --weights {weights} "
+                                f"--backend {backend}{' --int8' if int8 else ''}")
+
+    # Torch threads also drive pre/post-processing for the exported backends
+    configure_torch_threads(intra_op_threads, inter_op_threads)
+
+    model = YOLO(str(path), task="detect")
+    if backend == "pytorch" or not (intra_op_threads or inter_op_threads):
+        return model
+
+    # Ultralytics builds the runtime session with library defaults on first use;
+    # build it now, then swap in a session with our thread settings
+    warmup(model)
+    runtime = model.predictor.model
+    if backend == "onnx":
+        runtime.session = _onnx_session(path, intra_op_threads, inter_op_threads)
+    else:
+        runtime.ov_compiled_model = _openvino_compiled_model(path, intra_op_threads, inter_op_threads)
+    return model
+
+
+def warmup(model, imgsz=640):
+    model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), device="cpu", verbose=False)
+
+
+def _onnx_session(path, intra_op_threads, inter_op_threads):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    return ort.InferenceSession(str(path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _openvino_compiled_model(path, intra_op_threads, inter_op_threads):
+    import openvino as ov
+
+    core = ov.Core()
+    config = {}
+    if intra_op_threads:
+        config["INFERENCE_NUM_THREADS"] = intra_op_threads
+    if inter_op_threads:
+        # OpenVINO's closest analogue: parallel inference streams
+        config["NUM_STREAMS"] = inter_op_threads
+
+    xml = next(Path(path).glob("*.xml"))
+    return core.compile_model(core.read_model(xml), device_name="CPU", config=config)
+
+
+def raw_output(model, image):
+    """Raw head output (before NMS) for one image, as a numpy array"""
+    if model.predictor is None:
+        warmup(model)
+
+    predictor = model.predictor
+    preds = predictor.inference(predictor.preprocess([image]))
+    if isinstance(preds, (list, tuple)):
+        preds = preds[0]
+    if hasattr(preds, "cpu"):
+        preds = preds.cpu().numpy()
+    return np.asarray(preds, dtype=np.float32)
+
+
+def detections(model, image, confidence):
+    """(N, 6) detections of ``model`` on one image"""
+    return result_to_array(model(image, conf=confidence, device="cpu", verbose=False)[0])
+
+
+def box_iou(a, b):
+    """(N, M) IoU of two sets of xyxy boxes"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_detections(expected, actual):
+    """Pair two (N, 6) detection arrays one to one within each class, highest IoU first.
+
+    Returns an (expected, actual) index pair per match and the IoU of each.
+    """
+    iou = box_iou(expected[:, :4], actual[:, :4])
+    iou[expected[:, None, 5] != actual[None, :, 5]] = 0
+    pairs, ious = [], []
+    while iou.size and iou.max() > 0:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        pairs.append((i, j))
+        ious.append(iou[i, j])
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return np.asarray(pairs, dtype=np.int64).reshape(-1, 2), np.asarray(ious, dtype=np.float32)
+
+
+def check_parity(reference, candidate, image, int8=False):
+    """Compare two models on ``image``.
+
+    FP32 candidates are compared on the raw head output: worst box and
+    score deviations. INT8 candidates are compared on their detections:
+    both models must find the same boxes, each with IoU >= the tolerance
+    and a score within it of the reference. Returns a report dict with
+    whether the candidate is within tolerance for its precision.
+    """
+    if int8:
+        return _detection_parity(reference, candidate, image)
+
+    expected = raw_output(reference, image)
+    actual = raw_output(candidate, image)
+    if expected.shape != actual.shape:
+        return {"passed": False, "reason": f"output shape {actual.shape} != {expected.shape}"}
+
+    tolerance = PARITY_TOLERANCES["fp32"]
+    # YOLOv8 head: (batch, 4 + num_classes, anchors), boxes first
+    box_error = float(np.abs(expected[:, :4] - actual[:, :4]).max())
+    score_error = float(np.abs(expected[:, 4:] - actual[:, 4:]).max())
+
+    return {
+        "passed": box_error <= tolerance["box_px"] and score_error <= tolerance["score"],
+        "max_box_error_px": box_error,
+        "max_score_error": score_error,
+        "tolerance": tolerance
+    }
+
+
+def _detection_parity(reference, candidate, image):
+    tolerance = PARITY_TOLERANCES["int8"]
+    # Both sides are run a score tolerance below the threshold, so a box that
+    # crosses the threshold within tolerance still finds its counterpart
+    floor = PARITY_CONFIDENCE - tolerance["score"]
+    expected = detections(reference, image, floor)
+    actual = detections(candidate, image, floor)
+
+    pairs, ious = match_detections(expected, actual)
+    score_errors = np.abs(expected[pairs[:, 0], 4] - actual[pairs[:, 1], 4])
+    good = (ious >= tolerance["box_iou"]) & (score_errors <= tolerance["score"])
+
+    # Every detection at or above the threshold, on either side, needs a good match
+    required_expected = expected[:, 4] >= PARITY_CONFIDENCE
+    required_actual = actual[:, 4] >= PARITY_CONFIDENCE
+    unmatched = (int(required_expected.sum() - required_expected[pairs[good, 0]].sum())
+                 + int(required_actual.sum() - required_actual[pairs[good, 1]].sum()))
+
+    required = required_expected[pairs[:, 0]] | required_actual[pairs[:, 1]]
+    return {
+        "passed": unmatched == 0,
+        "detections": int(required_expected.sum()),
+        "candidate_detections": int(required_actual.sum()),
+        "unmatched": unmatched,
+        "min_iou": float(ious[required].min()) if required.any() else None,
+        "max_score_error": float(score_errors[required].max()) if required.any() else None,
+        "tolerance": tolerance
+    }
+
+
+def load_reference_tile(path=None, imgsz=640):
+    """Reference tile for parity checks: a file if given, else a fixed synthetic SAR tile"""
+    if path:
+        import cv2
+
+        tile = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if tile is None:
+            raise FileNotFoundError(f"Cannot read reference tile {path}")
+        # Square input so every backend letterboxes it identically
+        return cv2.resize(tile, (imgsz, imgsz), interpolation=cv2.INTER_AREA)
+
+    rng = np.random.default_rng(0)
+    tile = np.clip(rng.gamma(4.0, 12.0, (imgsz, imgsz)), 0, 255).astype(np.uint8)
+    for y, x in rng.integers(32, imgsz - 32, (6, 2)):
+        tile[y:y+6, x:x+18] = 245
+    return np.repeat(tile[..., None], 3, axis=2)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Multi-process model pool
+Runs N inference worker processes that share one read-only copy of the weights
+"""
+
+import copy
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from model_backends import configure_torch_threads, load_model
+from postprocess import result_to_array
+
+
+def share_model(model):
+    """A copy of a loaded PyTorch YOLO model whose fused weights live in shared memory.
+
+    Conv+BN fusion normally happens lazily on the first prediction, which
+    would give every worker its own fused copy; doing it here means workers
+    run the parent's tensors. The copy leaves out the checkpoint dict (a
+    second, unfused copy of the weights) and any predictor, so under spawn
+    it pickles to shared-memory handles plus the network's metadata, and a
+    worker unpickles a ready model without reading the checkpoint.
+    """
+    from ultralytics.utils import callbacks
+
+    net = model.model
+    net.fuse(verbose=False)
+    net.eval()
+    net.share_memory()
+
+    shared = copy.copy(model)
+    shared.ckpt = {}
+    shared.predictor = shared.trainer = shared.metrics = None
+    shared.callbacks = callbacks.get_default_callbacks()
+    return shared
+
+
+def _init_worker(loader, threads, shared):
+    """The worker's model, after its own thread pools are configured"""
+    configure_torch_threads(threads)
+    if shared is not None:
+        # PyTorch: the parent's model, already unpickled onto its shared weights. Ultralytics
+        # deep-copies the network when it sets up a predictor; that copy is the shared network
+        net = shared.model
+        net.__deepcopy__ = lambda memo: net
+        return shared
+    # Exported backends open the artifact here; OpenVINO memory-maps the IR weights
+    return load_model(*loader, intra_op_threads=threads)
+
+
+def _worker_main(worker_id, loader, threads, shared, tasks, results):
+    model = _init_worker(loader, threads, shared)
+
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+
+        request_id, images, confidence = item
+        start = time.perf_counter()
+        try:
+            predictions = model(images, conf=confidence, device="cpu", verbose=False)
+            payload, error = [result_to_array(p) for p in predictions], None
+        except Exception as e:
+            payload, error = None, f"{type(e).__name__}: {e}"
+        results.put((request_id, worker_id, payload, error, time.perf_counter() - start))
+
+
+class _WorkerState:
+    def __init__(self, worker_id, process, tasks):
+        self.worker_id = worker_id
+        self.process = process
+        self.tasks = tasks
+        self.in_flight_batches = 0
+        self.in_flight_images = 0
+        self.batches = 0
+        self.images = 0
+        self.busy_seconds = 0.0
+        self.last_dispatch = 0.0
+        self.failed = False
+
+    @property
+    def alive(self):
+        return not self.failed and self.process.is_alive()
+
+
+class ModelPool:
+    """Least-loaded dispatch of batches to spawned inference workers.
+
+    Workers are spawned, not forked: the server process already runs
+    torch/OpenMP thread pools, and forking a process with live thread pools
+    can deadlock the child. For the PyTorch backend the parent fuses its
+    model, moves the weights to shared memory and hands the model itself to
+    every worker, so no worker reads the checkpoint and N workers hold one
+    copy of the weights. Exported backends are opened by each worker.
+    ``predict`` is blocking and thread-safe, which makes it usable as the
+    batch scheduler's ``predict_fn``.
+    """
+
+    def __init__(self, weights, backend="pytorch", int8=False, num_workers=2, threads_per_worker=None,
+                 model=None):
+        if num_workers < 1:
+            raise ValueError("num_workers must be >= 1")
+
+        self.weights = weights
+        self.backend = backend
+        self.int8 = int8
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self.model = model
+
+        self._workers = []
+        self._results = None
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector = None
+        self._started_at = None
+        self._stopped = False
+
+    def start(self):
+        # Never fork: this process already has live OpenMP/MKL thread pools
+        ctx = mp.get_context("spawn")
+
+        shared = None
+        if self.backend == "pytorch":
+            if self.model is None:
+                self.model = load_model(self.weights)
+            shared = share_model(self.model)
+
+        loader = (self.weights, self.backend, self.int8)
+        self._results = ctx.Queue()
+        for worker_id in range(self.num_workers):
+            tasks = ctx.Queue()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(worker_id, loader, self.threads_per_worker, shared, tasks, self._results),
+                name=f"iodarkwatch-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self._workers.append(_WorkerState(worker_id, process, tasks))
+
+        self._started_at = time.monotonic()
+        self._collector = threading.Thread(target=self._collect, name="model-pool-results", daemon=True)
+        self._collector.start()
+        print(f"✅ Model pool: {self.num_workers} workers x {self.threads_per_worker} threads ({self.backend})")
+
+    def stop(self):
+        self._stopped = True
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _, _ in pending.values():
+            future.set_exception(RuntimeError("Model pool stopped"))
+
+    def predict(self, images, confidence):
+        """Run one batch on the least-loaded worker; returns one (N, 6) array per image"""
+        future = Future()
+
+        with self._lock:
+            alive = [w for w in self._workers if w.alive]
+            if self._stopped or not alive:
+                raise RuntimeError("No live inference workers")
+
+            # Ties go to the worker that has waited longest
+            worker = min(alive, key=lambda w: (w.in_flight_images, w.last_dispatch))
+            worker.last_dispatch = time.monotonic()
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, worker.worker_id, len(images))
+            worker.in_flight_batches += 1
+            worker.in_flight_images += len(images)
+
+        worker.tasks.put((request_id, images, confidence))
+        return future.result()
+
+    def stats(self):
+        uptime = max(time.monotonic() - self._started_at, 1e-9) if self._started_at else 0.0
+
+        with self._lock:
+            return [
+                {
+                    "worker_id": w.worker_id,
+                    "pid": w.process.pid,
+                    "alive": w.alive,
+                    "queue_depth": w.in_flight_batches,
+                    "queued_images": w.in_flight_images,
+                    "batches": w.batches,
+                    "images": w.images,
+                    "utilisation": w.busy_seconds / uptime if uptime else 0.0
+                }
+                for w in self._workers
+            ]
+
+    def _collect(self):
+        last_reap = time.monotonic()
+
+        while not self._stopped:
+            if time.monotonic() - last_reap >= 1.0:
+                self._reap_dead_workers()
+                last_reap = time.monotonic()
+
+            try:
+                request_id, worker_id, payload, error, busy = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+                worker = self._workers[worker_id]
+                worker.busy_seconds += busy
+                if entry is not None:
+                    worker.in_flight_batches -= 1
+                    worker.in_flight_images -= entry[2]
+                    worker.batches += 1
+                    worker.images += entry[2]
+
+            if entry is None:
+                continue
+            if error is None:
+                entry[0].set_result(payload)
+            else:
+                entry[0].set_exception(RuntimeError(f"Worker {worker_id}: {error}"))
+
+    def _reap_dead_workers(self):
+        with self._lock:
+            dead = {w.worker_id for w in self._workers if not w.failed and not w.process.is_alive()}
+            if not dead:
+                return
+
+            lost = {rid: e for rid, e in self._pending.items() if e[1] in dead}
+            for request_id in lost:
+                del self._pending[request_id]
+            for worker in self._workers:
+                if worker.worker_id in dead:
+                    worker.failed = True
+                    worker.in_flight_batches = 0
+                    worker.in_flight_images = 0
+
+        for worker_id in sorted(dead):
+            print(f"❌ Inference worker {worker_id} died")
+        for future, worker_id, _ in lost.values():
+            future.set_exception(RuntimeError(f"Worker {worker_id} died"))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Detection post-processing
+Array-level helpers shared by the inference endpoints
+"""
+
+import struct
+
+import numpy as np
+
+# Row layout of the (N, 6) detection arrays
+DETECTION_COLUMNS = ("x1", "y1", "x2", "y2", "confidence", "class_id")
+
+# Assuming class 0 is dark_vessel
+DARK_VESSEL_CLASS = 0
+
+# Binary format: magic, version, columns per row, row count, then rows of
+# little-endian float32 in DETECTION_COLUMNS order
+BINARY_MAGIC = b"IODW"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHHI")
+
+
+def nms(boxes, scores, iou_threshold=0.45, class_ids=None):
+    """Greedy non-maximum suppression.
+
+    ``boxes`` is an (N, 4) xyxy array. When ``class_ids`` is given boxes only
+    suppress boxes of the same class. Returns the kept indices, highest
+    score first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if class_ids is not None:
+        # Shift each class into its own coordinate range so classes never overlap
+        shift = np.asarray(class_ids, dtype=np.float32).reshape(-1, 1) * (boxes.max() + 1)
+        boxes = boxes + shift
+
+    x1, y1, x2, y2 = boxes.T
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores, kind="stable")
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def result_to_array(result):
+    """(N, 6) float32 detections pulled off the model output in one transfer"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+
+    data = boxes.data.cpu().numpy()
+    # Tracked boxes carry an extra track-id column before conf/cls
+    return np.ascontiguousarray(data[:, [0, 1, 2, 3, -2, -1]], dtype=np.float32)
+
+
+def filter_confidence(detections, confidence):
+    return detections[detections[:, 4] >= confidence]
+
+
+def geometry_to_objects(geometry):
+    """One ``geo`` dict per row of a georef.detection_geometry result (footprint as a GeoJSON polygon)"""
+    return [
+        {
+            'lon': lon,
+            'lat': lat,
+            'length_m': length,
+            'width_m': width,
+            'footprint': {'type': 'Polygon', 'coordinates': [ring]}
+        }
+        for lon, lat, length, width, ring in zip(
+            geometry['lon'].tolist(), geometry['lat'].tolist(), geometry['length_m'].tolist(),
+            geometry['width_m'].tolist(), geometry['footprint'].tolist()
+        )
+    ]
+
+
+def geometry_to_columns(geometry):
+    """Parallel arrays of a georef.detection_geometry result (footprints as lon/lat rings)"""
+    return {name: geometry[name].tolist() for name in ('lon', 'lat', 'length_m', 'width_m', 'footprint')}
+
+
+def detections_to_objects(detections, names, geometry=None):
+    """One dict per detection (the original /detect response shape).
+
+    With ``geometry`` (georef.detection_geometry of the same rows) each
+    detection also gets a ``geo`` dict: WGS84 centre, footprint and size.
+    """
+    boxes = detections[:, :4].tolist()
+    scores = detections[:, 4].tolist()
+    class_ids = detections[:, 5].astype(np.int64).tolist()
+
+    objects = [
+        {
+            'class_id': cls,
+            'class_name': names[cls],
+            'confidence': conf,
+            'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2},
+            'is_dark_vessel': cls == DARK_VESSEL_CLASS
+        }
+        for (x1, y1, x2, y2), conf, cls in zip(boxes, scores, class_ids)
+    ]
+    if geometry is not None:
+        for detection, geo in zip(objects, geometry_to_objects(geometry)):
+            detection['geo'] = geo
+    return objects
+
+
+def detections_to_columns(detections, names, geometry=None):
+    """Parallel arrays, one entry per detection (plus the geometry columns when given)"""
+    class_ids = detections[:, 5].astype(np.int64)
+
+    columns = {
+        'count': len(detections),
+        'class_names': [names[i] for i in sorted(names)],
+        'class_id': class_ids.tolist(),
+        'confidence': detections[:, 4].tolist(),
+        'x1': detections[:, 0].tolist(),
+        'y1': detections[:, 1].tolist(),
+        'x2': detections[:, 2].tolist(),
+        'y2': detections[:, 3].tolist(),
+        'is_dark_vessel': (class_ids == DARK_VESSEL_CLASS).tolist()
+    }
+    if geometry is not None:
+        columns.update(geometry_to_columns(geometry))
+    return columns
+
+
+def detections_to_binary(detections):
+    """Compact binary encoding: 12-byte header plus 24 bytes per detection"""
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(DETECTION_COLUMNS), len(detections))
+    return header + np.ascontiguousarray(detections, dtype="<f4").tobytes()
+
+
+def detections_from_binary(data):
+    """Inverse of detections_to_binary, for clients"""
+    magic, version, columns, count = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not an IODarkWatch detection payload")
+
+    return np.frombuffer(data, dtype="<f4", count=count * columns,
+                         offset=BINARY_HEADER.size).reshape(count, columns)
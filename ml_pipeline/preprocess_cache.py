@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Preprocessing cache
+Content-addressed store of finished preprocessing jobs (tiles + clip sketch), LRU-bounded on disk
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+from pathlib import Path
+
+CACHE_DIR = os.environ.get("IODARKWATCH_CACHE_DIR", "./data/cache")
+# Size bound in GB; 0 disables the cache
+CACHE_GB = float(os.environ.get("IODARKWATCH_CACHE_GB", "20"))
+
+# Bump whenever preprocessing code changes its output, so old entries stop matching
+PREPROCESS_VERSION = 2
+
+CHECKSUM_CHUNK = 8 * 1024**2
+
+# Name prefix of a job's staging directory, ``tmp-{key}-{pid}``
+STAGING_PREFIX = "tmp-"
+
+
+def job_params(job, position, clip_range, tile_format):
+    """Everything besides the input that decides a job's output"""
+    if job.kind == "scene":
+        from streaming_preprocess import CLAHE_CLIP_LIMIT, CLAHE_GRID, CLIP_PERCENTILES
+        from sar_preprocessing import PREPROCESSING_CONFIG
+        from train_yolov8x_live import TILE_OVERLAP, TILE_PAD_EDGES, TILE_SIZE
+
+        params = {
+            **PREPROCESSING_CONFIG,
+            "clip_percentiles": CLIP_PERCENTILES,
+            "clahe_clip_limit": CLAHE_CLIP_LIMIT,
+            "clahe_grid": CLAHE_GRID,
+            "tile_size": TILE_SIZE,
+            "overlap": TILE_OVERLAP,
+            "pad_edges": TILE_PAD_EDGES,
+        }
+    else:
+        from train_sentinel1_yolov8x import (RAW_CHUNK_LINES, RAW_CLAHE_CLIP_LIMIT, TILE_OVERLAP,
+                                             TILE_PAD_EDGES, TILE_SIZE)
+
+        params = {
+            "chunk_lines": RAW_CHUNK_LINES,
+            "clahe_clip_limit": RAW_CLAHE_CLIP_LIMIT,
+            "tile_size": TILE_SIZE,
+            "overlap": TILE_OVERLAP,
+            "pad_edges": TILE_PAD_EDGES,
+        }
+    return {
+        **params,
+        "kind": job.kind,
+        "prefix": job.prefix,
+        "position": position,  # seeds the job's clip sketch
+        "clip_range": None if clip_range is None else [float(v) for v in clip_range],
+        "tile_format": tile_format,
+    }
+
+
+def open_cache():
+    """PreprocessCache from IODARKWATCH_CACHE_DIR / IODARKWATCH_CACHE_GB, or None if disabled"""
+    return PreprocessCache(CACHE_DIR, CACHE_GB) if CACHE_GB > 0 else None
+
+
+class PreprocessCache:
+    """Finished jobs keyed on a checksum of their input plus ``job_params``.
+
+    An entry is a directory holding the job's ``train``/``val`` files, its
+    clip sketch and ``meta.json``. Misses are written to a staging directory
+    and renamed into place, so concurrent workers never see half an entry.
+    Hits are hard-linked (or copied) into the output directories.
+    ``meta.json``'s mtime is the last use; ``evict`` drops the least
+    recently used entries until the cache fits in ``max_gb``.
+
+    Input checksums are computed once in the parent process: plain files
+    are hashed (BLAKE2b, remembered by path, size and mtime) and ZIP members
+    use the CRC-32 and size from the archive's central directory.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_gb=CACHE_GB):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_gb * 1024**3)
+        self.entries = self.directory / "entries"
+        self.entries.mkdir(parents=True, exist_ok=True)
+        self._checksums_path = self.directory / "checksums.json"
+        self._checksums = None
+
+    def _file_checksum(self, path):
+        if self._checksums is None:
+            self._checksums = {}
+            if self._checksums_path.exists():
+                with open(self._checksums_path) as f:
+                    self._checksums = json.load(f)
+
+        path = Path(path).resolve()
+        stat = path.stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        known = self._checksums.get(str(path))
+        if known and known["stamp"] == stamp:
+            return known["checksum"]
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            while chunk := f.read(CHECKSUM_CHUNK):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        self._checksums[str(path)] = {"stamp": stamp, "checksum": checksum}
+        temporary = self._checksums_path.with_suffix(".tmp")
+        with open(temporary, "w") as f:
+            json.dump(self._checksums, f)
+        os.replace(temporary, self._checksums_path)
+        return checksum
+
+    def input_checksum(self, job):
+        if job.kind == "raw":
+            archive_path, member, _ = job.source
+        elif str(job.source).startswith("/vsizip/"):
+            archive_path, member = str(job.source)[len("/vsizip/"):].split(".zip/", 1)
+            archive_path += ".zip"
+        else:
+            return self._file_checksum(job.source)
+
+        with zipfile.ZipFile(archive_path) as archive:
+            info = archive.getinfo(member)
+        return f"zip:{member}:{info.CRC:08x}:{info.file_size}"
+
+    def key(self, job, params):
+        description = {"version": PREPROCESS_VERSION, "input": self.input_checksum(job), **params}
+        encoded = json.dumps(description, sort_keys=True).encode()
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def _staging_dir(self, key):
+        return self.entries / f"{STAGING_PREFIX}{key}-{os.getpid()}"
+
+    def staging(self, key):
+        """Fresh (train, val) directories for a job that missed"""
+        staging = self._staging_dir(key)
+        shutil.rmtree(staging, ignore_errors=True)
+        (staging / "train").mkdir(parents=True)
+        (staging / "val").mkdir()
+        return staging / "train", staging / "val"
+
+    def discard(self, key):
+        """Remove the staging directory of a job that failed"""
+        shutil.rmtree(self._staging_dir(key), ignore_errors=True)
+
+    def store(self, key, tiles, written, seconds, sketch=None):
+        """Turn the staging directory of ``key`` into an entry"""
+        staging = self._staging_dir(key)
+        if sketch is not None:
+            with open(staging / "sketch.bin", "wb") as f:
+                f.write(sketch)
+        size = sum(path.stat().st_size for path in staging.rglob("*") if path.is_file())
+        meta = {"tiles": tiles, "bytes": written, "seconds": seconds, "size": size, "created": time.time()}
+        with open(staging / "meta.json", "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(staging, self.entries / key)
+        except OSError:
+            # Another process stored the same job first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def restore(self, key, train_dir, val_dir):
+        """Link the entry's files into the output directories; returns (meta, sketch) or None"""
+        entry = self.entries / key
+        try:
+            with open(entry / "meta.json") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        for split, directory in (("train", train_dir), ("val", val_dir)):
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            for path in sorted((entry / split).iterdir()):
+                target = Path(directory) / path.name
+                target.unlink(missing_ok=True)
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copyfile(path, target)
+
+        sketch = None
+        if (entry / "sketch.bin").exists():
+            with open(entry / "sketch.bin", "rb") as f:
+                sketch = f.read()
+        os.utime(entry / "meta.json")  # mark as recently used
+        return meta, sketch
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits; returns (entries evicted, bytes in use)
+
+        Staging directories left by processes that no longer run are
+        removed first.
+        """
+        entries = []
+        for entry in self.entries.iterdir():
+            if entry.name.startswith(STAGING_PREFIX):
+                if not _process_running(int(entry.name.rsplit("-", 1)[-1])):
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            try:
+                with open(entry / "meta.json") as f:
+                    size = json.load(f)["size"]
+                entries.append((os.stat(entry / "meta.json").st_mtime, size, entry))
+            except (OSError, ValueError, KeyError):
+                continue  # broken entry
+
+        entries.sort()
+        used = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, entry in entries:
+            if used <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            used -= size
+            evicted += 1
+        return evicted, used
+
+
+def _process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # someone else's process
+    return True
+
+
+def print_cache_stats(results, cache):
+    """Hit/miss counts, restored volume and preprocessing time skipped, then LRU eviction"""
+    hits = [result for result in results if result.cached]
+    misses = len(results) - len(hits)
+    evicted, used = cache.evict()
+    rate = 100 * len(hits) / max(len(results), 1)
+    print(f"\n💾 Cache: {len(hits)} hits, {misses} misses ({rate:.0f}% hit rate), "
+          f"{sum(result.tiles for result in hits)} tiles restored, "
+          f"{sum(result.saved for result in hits):.1f}s of preprocessing skipped")
+    print(f"💾 Cache size: {used / 1024**3:.2f} / {cache.max_bytes / 1024**3:.2f} GB"
+          + (f", {evicted} least recently used entries evicted" if evicted else ""))
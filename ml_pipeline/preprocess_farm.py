@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Preprocessing farm
+Spreads scenes and polarizations over a process pool and reports per-worker throughput
+"""
+
+import argparse
+import os
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+
+from preprocess_cache import CACHE_DIR, CACHE_GB, PreprocessCache, job_params, print_cache_stats
+from quantile_sketch import KLLSketch
+from tile_shards import ShardWriter, TileShards, write_georef
+
+TILE_FORMATS = ("jpeg", "shards")
+# Tile format the training scripts write and train from
+TILE_FORMAT = os.environ.get("IODARKWATCH_TILE_FORMAT", "jpeg")
+
+# kind: "scene" (source = raster path or /vsizip/ path) or
+#       "raw" (source = (archive path, .dat member, extract dir))
+# prefix: tile file name prefix, unique per job so output names never depend on scheduling
+Job = namedtuple("Job", "kind source prefix label")
+# cached: restored from the preprocessing cache; saved: preprocessing seconds that skipped
+JobResult = namedtuple("JobResult", "position label tiles bytes seconds worker sketch error cached saved")
+
+
+def write_jpeg(path, tile):
+    """cv2.imwrite that returns the number of bytes written"""
+    ok, encoded = cv2.imencode(".jpg", tile)
+    if not ok:
+        raise RuntimeError(f"JPEG encoding failed for {path}")
+    data = encoded.tobytes()
+    # Replace rather than overwrite: the old file may be a hard link into the preprocessing cache
+    Path(path).unlink(missing_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def dataset_dirs(tile_format, root=None):
+    """(root, train dir, val dir) of a dataset, created if missing.
+
+    JPEGs use the YOLO layout under ``./data/yolo``, shards one directory
+    per split under ``./data/shards``.
+    """
+    if tile_format == "shards":
+        root = Path(root or "./data/shards")
+        train_dir, val_dir = root / "train", root / "val"
+    else:
+        root = Path(root or "./data/yolo")
+        train_dir, val_dir = root / "images" / "train", root / "images" / "val"
+    for directory in (train_dir, val_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+    return root, train_dir, val_dir
+
+
+def count_tiles(directory, tile_format):
+    if tile_format == "shards":
+        return len(TileShards(directory))
+    return sum(1 for _ in Path(directory).glob("*.jpg"))
+
+
+class TileOutput:
+    """A job's tiles in scan order: the first ``split_idx`` to train, the rest to val.
+
+    ``"jpeg"`` writes ``{prefix}_{n:04d}.jpg`` files (the YOLO layout)
+    plus a ``{prefix}.georef.json`` sidecar with each tile's offset and
+    georeference; ``"shards"`` appends the same names to tile_shards
+    shards, lossless and with the offsets and georeference in their index.
+    Val tiles are numbered from 0 unless ``renumber_val`` is False.
+    Leaving the ``with`` block on an exception writes neither shard
+    indexes nor georef sidecars, and deletes the tiles written so far.
+    """
+
+    def __init__(self, train_dir, val_dir, prefix, split_idx, tile_format="jpeg", crs=None, renumber_val=True):
+        if tile_format not in TILE_FORMATS:
+            raise ValueError(f"unknown tile format {tile_format!r}, expected one of {TILE_FORMATS}")
+        self.dirs = (Path(train_dir), Path(val_dir))
+        self.prefix = prefix
+        self.split_idx = split_idx
+        self.renumber_val = renumber_val
+        self.crs = crs
+        self.georef = ({}, {})
+        self.paths = []  # JPEGs written, removed again if the job fails
+        self.writers = None
+        if tile_format == "shards":
+            self.writers = [ShardWriter(directory, prefix, crs=crs) for directory in self.dirs]
+
+    def write(self, i, tile, offset=None, transform=None):
+        """Write tile number ``i``; returns the bytes written"""
+        split = 0 if i < self.split_idx else 1
+        number = i - self.split_idx if split and self.renumber_val else i
+        name = f"{self.prefix}_{number:04d}"
+        if self.writers is None:
+            if offset is not None or transform is not None:
+                self.georef[split][name] = {
+                    "offset": None if offset is None else [int(v) for v in offset],
+                    "transform": None if transform is None else [float(v) for v in transform],
+                }
+            path = self.dirs[split] / f"{name}.jpg"
+            self.paths.append(path)
+            return write_jpeg(path, tile)
+        return self.writers[split].add(tile, name, offset, transform)
+
+    def close(self, complete=True):
+        for writer in self.writers or ():
+            writer.close(complete)
+        if not complete:
+            for path in self.paths:
+                path.unlink(missing_ok=True)
+            return
+        for directory, tiles in zip(self.dirs, self.georef):
+            if tiles:
+                write_georef(directory, self.prefix, tiles, self.crs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(complete=exc_type is None)
+
+
+def _init_worker():
+    # One process per core already; keep OpenCV and the speckle filter single-threaded
+    import speckle_filters
+
+    cv2.setNumThreads(1)
+    speckle_filters.WORKERS = 1
+
+
+def _run_job(position, job, train_dir, val_dir, clip_range, tile_format, cache=None, key=None):
+    start = time.perf_counter()
+    if key is not None:
+        hit = cache.restore(key, train_dir, val_dir)
+        if hit is not None:
+            meta, sketch = hit
+            return JobResult(position, job.label, meta["tiles"], meta["bytes"], time.perf_counter() - start,
+                             os.getpid(), sketch, None, True, meta["seconds"])
+        job_train_dir, job_val_dir = cache.staging(key)
+    else:
+        job_train_dir, job_val_dir = train_dir, val_dir
+
+    sketch = None
+    try:
+        if job.kind == "scene":
+            from train_yolov8x_live import tile_scene
+
+            scene_sketch = KLLSketch(seed=position)
+            tiles, written = tile_scene(job.source, job.prefix, job_train_dir, job_val_dir, clip_range,
+                                        scene_sketch, tile_format)
+            sketch = scene_sketch.to_bytes()
+        elif job.kind == "raw":
+            from train_sentinel1_yolov8x import tile_raw_member
+
+            archive_path, member, extract_dir = job.source
+            tiles, written = tile_raw_member(archive_path, member, extract_dir, job.prefix, job_train_dir,
+                                             job_val_dir, tile_format)
+        else:
+            raise ValueError(f"unknown job kind {job.kind!r}")
+        error = None
+    except Exception as e:
+        tiles, written, error = 0, 0, f"{type(e).__name__}: {e}"
+
+    seconds = time.perf_counter() - start
+    if key is not None and error is None:
+        cache.store(key, tiles, written, seconds, sketch)
+        cache.restore(key, train_dir, val_dir)
+    elif key is not None:
+        cache.discard(key)
+    return JobResult(position, job.label, tiles, written, seconds, os.getpid(), sketch, error, False, 0.0)
+
+
+def run_jobs(jobs, train_dir, val_dir, workers=None, clip_range=None, tile_format="jpeg", cache=None):
+    """Run jobs on ``workers`` processes; returns (results in job order, merged scene sketch).
+
+    Tiles are split 80/20 within each job and named by job prefix and tile
+    index, and sketches are merged in job order, so the output is the same
+    for any number of workers. ``tile_format`` is a TileOutput format.
+
+    With a ``cache`` (preprocess_cache.PreprocessCache) jobs whose input
+    and parameters are unchanged are restored instead of recomputed.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    train_dir, val_dir = Path(train_dir), Path(val_dir)
+    started = time.perf_counter()
+
+    keys = [None] * len(jobs)
+    if cache is not None:
+        for position, job in enumerate(jobs):
+            try:
+                keys[position] = cache.key(job, job_params(job, position, clip_range, tile_format))
+            except (OSError, KeyError, zipfile.BadZipFile) as e:
+                print(f"  ⚠️  {job.label}: not cached ({e})")
+
+    results = []
+
+    def report(result):
+        results.append(result)
+        if result.cached:
+            print(f"  💾 [{len(results)}/{len(jobs)}] {result.label}: {result.tiles} tiles from cache")
+        elif result.error:
+            print(f"  ❌ [{len(results)}/{len(jobs)}] {result.label}: {result.error}")
+        else:
+            print(f"  ✅ [{len(results)}/{len(jobs)}] {result.label}: {result.tiles} tiles "
+                  f"in {result.seconds:.1f}s ({result.tiles / max(result.seconds, 1e-9):.1f} tiles/s)")
+
+    if workers == 1:
+        for position, job in enumerate(jobs):
+            report(_run_job(position, job, train_dir, val_dir, clip_range, tile_format, cache, keys[position]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [executor.submit(_run_job, position, job, train_dir, val_dir, clip_range, tile_format,
+                                       cache, keys[position])
+                       for position, job in enumerate(jobs)]
+            for future in as_completed(futures):
+                report(future.result())
+
+    results.sort(key=lambda result: result.position)
+    print_worker_stats(results, time.perf_counter() - started)
+    if cache is not None:
+        print_cache_stats(results, cache)
+
+    merged = None
+    for result in results:
+        if result.sketch is not None:
+            # Seeded so the merge's own coin flips are reproducible too
+            sketch = KLLSketch.from_bytes(result.sketch, seed=result.position)
+            merged = sketch if merged is None else merged.merge(sketch)
+    return results, merged
+
+
+def print_worker_stats(results, wall_seconds):
+    """Per-worker tiles/sec and JPEG MB/sec over the time each worker was busy"""
+    workers = {}
+    for result in results:
+        stats = workers.setdefault(result.worker, [0, 0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += result.tiles
+        stats[2] += result.bytes
+        stats[3] += result.seconds
+
+    print(f"\n  {'worker':>6} {'jobs':>5} {'tiles':>7} {'MB':>8} {'busy s':>8} {'tiles/s':>8} {'MB/s':>7}")
+    for number, (jobs, tiles, written, busy) in enumerate(
+            (workers[pid] for pid in sorted(workers)), start=1):
+        busy = max(busy, 1e-9)
+        print(f"  {number:>6} {jobs:>5} {tiles:>7} {written / 1024**2:>8.1f} {busy:>8.1f} "
+              f"{tiles / busy:>8.1f} {written / 1024**2 / busy:>7.2f}")
+
+    tiles = sum(result.tiles for result in results)
+    written = sum(result.bytes for result in results)
+    wall_seconds = max(wall_seconds, 1e-9)
+    print(f"  {'all':>6} {len(results):>5} {tiles:>7} {written / 1024**2:>8.1f} {wall_seconds:>8.1f} "
+          f"{tiles / wall_seconds:>8.1f} {written / 1024**2 / wall_seconds:>7.2f}  (wall clock)")
+
+
+def collect_jobs(inputs, extract_dir):
+    """Jobs for TIFFs and zipped .SAFE products (GRD TIFFs and RAW polarizations)"""
+    from safe_archive import SafeArchive
+
+    jobs = []
+    for index, path in enumerate(inputs):
+        path = Path(path)
+        if path.suffix.lower() != ".zip":
+            jobs.append(Job("scene", str(path), f"sar_{index}_0", path.name))
+            continue
+        with SafeArchive(path) as archive:
+            for n, name in enumerate(archive.find("measurement", suffix=(".tif", ".tiff"))):
+                jobs.append(Job("scene", archive.gdal_path(name), f"sar_{index}_{n}", Path(name).name))
+            for polarization in ("vv", "vh", "hh", "hv"):
+                for name in archive.find("measurement", polarisation=polarization, suffix=".dat"):
+                    jobs.append(Job("raw", (str(path), name, str(extract_dir)),
+                                    f"s1_{index}_{polarization.upper()}", f"{path.name} {polarization.upper()}"))
+    return jobs
+
+
+def main():
+    from sar_catalog import CATALOG_PATH, catalog_paths
+    from train_yolov8x_live import CLIP_SKETCH_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("inputs", nargs="*",
+                        help="GeoTIFFs or zipped .SAFE products (default: IODARKWATCH_TILE_CATALOG)")
+    parser.add_argument("--out", type=Path,
+                        help="Dataset directory (default: ./data/yolo, or ./data/shards with --format shards)")
+    parser.add_argument("--format", choices=TILE_FORMATS, default=TILE_FORMAT,
+                        help="YOLO JPEG files or memory-mappable tile shards")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Preprocessing cache directory")
+    parser.add_argument("--cache-gb", type=float, default=CACHE_GB,
+                        help="Preprocessing cache size bound, least recently used entries go first (0 disables)")
+    parser.add_argument("--clip-sketch", default=CLIP_SKETCH_PATH,
+                        help="Saved KLL sketch for dataset-wide clip points (GeoTIFF scenes)")
+    args = parser.parse_args()
+
+    inputs = args.inputs or (catalog_paths(CATALOG_PATH) if CATALOG_PATH else [])
+    if not inputs:
+        parser.error("no inputs given and IODARKWATCH_TILE_CATALOG is not set")
+
+    args.out, train_dir, val_dir = dataset_dirs(args.format, args.out)
+    extract_dir = Path("./data/raw/sentinel1")
+    extract_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = collect_jobs(inputs, extract_dir)
+    print(f"🏭 {len(jobs)} jobs on {min(args.workers, len(jobs))} workers")
+
+    clip_range = KLLSketch.load(args.clip_sketch).clip_range() if args.clip_sketch else None
+    cache = PreprocessCache(args.cache_dir, args.cache_gb) if args.cache_gb > 0 else None
+    results, sketch = run_jobs(jobs, train_dir, val_dir, args.workers, clip_range, args.format, cache)
+
+    if sketch is not None:
+        sketch_path = args.out / "clip_sketch.npz"
+        sketch.save(sketch_path)
+        p_low, p_high = sketch.clip_range()
+        print(f"📏 Dataset 1/99 percentiles: {p_low:.2f} .. {p_high:.2f} (sketch: {sketch_path})")
+
+    failed = [result for result in results if result.error]
+    print(f"\n📊 Total tiles: {sum(result.tiles for result in results)}"
+          + (f" ({len(failed)} jobs failed)" if failed else ""))
+    return not failed
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Streaming quantile sketch
+Mergeable KLL sketch for percentile clip points over chunks, scenes and workers
+"""
+
+import io
+import math
+
+import numpy as np
+
+DEFAULT_K = 1024
+LEVEL_DECAY = 2 / 3
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang & Liberty 2016), vectorized over chunks.
+
+    Level ``h`` holds items of weight ``2**h``. When a level overflows it is
+    sorted and every other item (random offset) moves up a level. A large
+    chunk is sorted once and strided straight into the level where it fits;
+    this is the same as compacting it level by level. Rank error is about
+    ``1.7 / k`` with high probability. Sketches built on different chunks,
+    scenes or processes ``merge`` into a sketch of the union.
+
+    Non-finite values are ignored, matching the ``np.isfinite`` masks used
+    before percentile clipping.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        if k < 8:
+            raise ValueError("k must be >= 8")
+        self.k = k
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._levels = [np.empty(0, dtype=np.float32)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self._levels) - 1 - level
+        return max(2, int(math.ceil(self.k * LEVEL_DECAY ** depth)))
+
+    def update(self, values):
+        """Add a chunk of values (any shape)"""
+        values = np.asarray(values, dtype=np.float32).ravel()
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        # Jump to the level where the chunk fits instead of halving it repeatedly
+        level = 0
+        while values.size >> level > self.k:
+            level += 1
+        if level == 0:
+            self._append(0, values)
+        else:
+            values = np.sort(values)
+            stride = 1 << level
+            full = values.size - values.size % stride
+            self._append(level, values[self._rng.integers(stride):full:stride])
+            # Leftovers keep weight 1 so the total weight stays exact
+            self._append(0, values[full:])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for level, items in enumerate(other._levels):
+            self._append(level, items)
+        self._compress()
+        return self
+
+    def _append(self, level, items):
+        while len(self._levels) <= level:
+            self._levels.append(np.empty(0, dtype=np.float32))
+        if items.size:
+            self._levels[level] = np.concatenate([self._levels[level], items])
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if items.size > self._capacity(level):
+                items = np.sort(items)
+                # An odd item out stays behind so weights are preserved
+                keep = items[-1:] if items.size % 2 else items[:0]
+                paired = items[:items.size - keep.size]
+                self._append(level + 1, paired[self._rng.integers(2)::2])
+                self._levels[level] = keep
+            level += 1
+
+    def _weighted(self):
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(lv.size, 1 << h, dtype=np.int64) for h, lv in enumerate(self._levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        """Approximate quantiles for ``qs`` in [0, 1] (float64 array)"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+
+        if all(level.size == 0 for level in self._levels[1:]):
+            # Nothing compacted yet: the sketch still holds every value
+            return np.percentile(self._levels[0], qs * 100).astype(np.float64)
+
+        items, cumulative = self._weighted()
+        # Same rank convention as np.percentile(method="linear"): q * (n - 1)
+        ranks = qs * (self.count - 1)
+        index = np.searchsorted(cumulative, ranks, side="right")
+        result = items[np.minimum(index, items.size - 1)].astype(np.float64)
+        result[qs <= 0] = self.min
+        result[qs >= 1] = self.max
+        return result
+
+    def percentiles(self, percentiles):
+        return self.quantiles(np.true_divide(percentiles, 100))
+
+    def clip_range(self, low=1, high=99):
+        """(p_low, p_high) clip points for preprocess_sar_advanced / process_sar_data"""
+        p_low, p_high = self.percentiles([low, high])
+        return p_low, p_high
+
+    def __len__(self):
+        return sum(level.size for level in self._levels)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            header=np.array([self.k, self.count], dtype=np.int64),
+            bounds=np.array([self.min, self.max], dtype=np.float64),
+            **{f"level_{h}": items for h, items in enumerate(self._levels)}
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, seed=None):
+        with np.load(io.BytesIO(data)) as stored:
+            k, count = (int(v) for v in stored["header"])
+            sketch = cls(k, seed)
+            sketch.count = count
+            sketch.min, sketch.max = (float(v) for v in stored["bounds"])
+            levels = sorted((name for name in stored.files if name.startswith("level_")),
+                            key=lambda name: int(name.split("_")[1]))
+            sketch._levels = [stored[name].astype(np.float32) for name in levels]
+        return sketch
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path, seed=None):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read(), seed)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Sentinel-1 RAW reader
+Memory-mapped Level-0 ISP reader: real line/sample geometry, float32 magnitude in bounded chunks
+"""
+
+import numpy as np
+
+# Sentinel-1 SAR Space Packet Protocol Data Unit (S1-IF-ASD-PL-0007)
+PRIMARY_HEADER_BYTES = 6
+SECONDARY_HEADER_BYTES = 62
+USER_DATA_OFFSET = PRIMARY_HEADER_BYTES + SECONDARY_HEADER_BYTES
+SYNC_MARKER = 0x352EF853
+
+BAQ_BYPASS = 0
+# FDBAQ modes 0-2; the plain 3/4/5-bit BAQ modes (3, 4, 5) are not decoded
+FDBAQ_MODES = (12, 13, 14)
+SIGNAL_ECHO = 0
+
+# FDBAQ: every channel is split into blocks of 128 samples; a block's bit
+# rate code (BRC, 3 bits) leads it in the IE channel, its threshold index
+# (THIDX, 8 bits) in the QE channel
+FDBAQ_BLOCK_SAMPLES = 128
+# Lines decoded together; bounds the 24-bit lookahead words to ~40 MB for IW
+FDBAQ_BATCH_LINES = 512
+
+# Huffman codes of the magnitude codes per BRC; every sample is a sign bit
+# followed by one of these (S1-IF-ASD-PL-0007, FDBAQ decoding)
+HUFFMAN_CODES = [
+    ["0", "10", "110", "111"],
+    ["0", "10", "110", "1110", "1111"],
+    ["0", "10", "110", "1110", "11110", "111110", "111111"],
+    ["00", "01", "10", "110", "1110", "11110", "111110", "1111110", "11111110", "11111111"],
+    ["00", "010", "011", "100", "101", "1100", "1101", "1110", "11110", "111110",
+     "11111100", "11111101", "111111100", "111111101", "111111110", "111111111"],
+]
+HUFFMAN_MAX_BITS = 9
+
+# Sample value reconstruction. Up to SIMPLE_THIDX[brc] a magnitude code is
+# its own value except the top one, which maps to SIMPLE_LEVELS[brc][thidx];
+# above it values are NORMALISED_LEVELS[brc][mcode] * SIGMA_FACTORS[thidx]
+SIMPLE_THIDX = [3, 3, 5, 6, 8]
+SIMPLE_LEVELS = [
+    [3, 3, 3.16, 3.53],
+    [4, 4, 4.08, 4.37],
+    [6, 6, 6, 6.15, 6.50, 6.88],
+    [9, 9, 9, 9, 9.36, 9.50, 10.1],
+    [15, 15, 15, 15, 15, 15, 15.22, 15.50, 16.05],
+]
+NORMALISED_LEVELS = [
+    [0.3637, 1.0915, 1.8208, 2.6406],
+    [0.3042, 0.9127, 1.5216, 2.1313, 2.8426],
+    [0.2305, 0.6916, 1.1528, 1.6140, 2.0754, 2.5369, 3.1191],
+    [0.1702, 0.5107, 0.8511, 1.1916, 1.5321, 1.8726, 2.2131, 2.5536, 2.8942, 3.3744],
+    [0.1130, 0.3389, 0.5649, 0.7908, 1.0167, 1.2428, 1.4687, 1.6947, 1.9206, 2.1466,
+     2.3725, 2.5985, 2.8244, 3.0504, 3.2764, 3.6623],
+]
+SIGMA_FACTORS = [
+    0.00, 0.63, 1.25, 1.88, 2.51, 3.13, 3.76, 4.39, 5.01, 5.64, 6.27, 6.89, 7.52, 8.15, 8.77, 9.40,
+    10.03, 10.65, 11.28, 11.91, 12.53, 13.16, 13.79, 14.41, 15.04, 15.67, 16.29, 16.92, 17.55, 18.17,
+    18.80, 19.43, 20.05, 20.68, 21.31, 21.93, 22.56, 23.19, 23.81, 24.44, 25.07, 25.69, 26.32, 26.95,
+    27.57, 28.20, 28.83, 29.45, 30.08, 30.71, 31.33, 31.96, 32.59, 33.21, 33.84, 34.47, 35.09, 35.72,
+    36.35, 36.97, 37.60, 38.23, 38.85, 39.48, 40.11, 40.73, 41.36, 41.99, 42.61, 43.24, 43.87, 44.49,
+    45.12, 45.75, 46.37, 47.00, 47.63, 48.25, 48.88, 49.51, 50.13, 50.76, 51.39, 52.01, 52.64, 53.27,
+    53.89, 54.52, 55.15, 55.77, 56.40, 57.03, 57.65, 58.28, 58.91, 59.53, 60.16, 60.79, 61.41, 62.04,
+    62.98, 64.24, 65.49, 66.74, 68.00, 69.25, 70.50, 71.76, 73.01, 74.26, 75.52, 76.77, 78.02, 79.28,
+    80.53, 81.78, 83.04, 84.29, 85.54, 86.80, 88.05, 89.30, 90.56, 91.81, 93.06, 94.32, 95.57, 96.82,
+    98.08, 99.33, 100.58, 101.84, 103.09, 104.34, 105.60, 106.85, 108.10, 109.35, 110.61, 111.86,
+    113.11, 114.37, 115.62, 116.87, 118.13, 119.38, 120.63, 121.89, 123.14, 124.39, 125.65, 126.90,
+    128.15, 129.41, 130.66, 131.91, 133.17, 134.42, 135.67, 136.93, 138.18, 139.43, 140.69, 141.94,
+    143.19, 144.45, 145.70, 146.95, 148.21, 149.46, 150.71, 151.97, 153.22, 154.47, 155.73, 156.98,
+    158.23, 159.49, 160.74, 161.99, 163.25, 164.50, 165.75, 167.01, 168.26, 169.51, 170.77, 172.02,
+    173.27, 174.53, 175.78, 177.03, 178.29, 179.54, 180.79, 182.05, 183.30, 184.55, 185.81, 187.06,
+    188.31, 189.57, 190.82, 192.07, 193.33, 194.58, 195.83, 197.09, 198.34, 199.59, 200.85, 202.10,
+    203.35, 204.61, 205.86, 207.11, 208.37, 209.62, 210.87, 212.13, 213.38, 214.63, 215.89, 217.14,
+    218.39, 219.65, 220.90, 222.15, 223.41, 224.66, 225.91, 227.17, 228.42, 229.67, 230.93, 232.18,
+    233.43, 234.69, 235.94, 237.19, 238.45, 239.70, 240.95, 242.21, 243.46, 244.71, 245.97, 247.22,
+    248.47, 249.73, 250.98, 252.23, 253.49, 254.74, 255.99, 255.99,
+]
+
+PACKET_FIELDS = [
+    ("offset", np.int64),        # byte offset of the packet in the file
+    ("length", np.int32),        # total packet length in bytes
+    ("coarse_time", np.uint32),  # GPS seconds
+    ("fine_time", np.uint16),    # 2**-16 s
+    ("data_take_id", np.uint32),
+    ("pri_count", np.uint32),
+    ("baq_mode", np.uint8),
+    ("polarisation", np.uint8),
+    ("signal_type", np.uint8),   # 0 = echo, others are noise / calibration
+    ("swath", np.uint8),
+    ("num_quads", np.uint16),    # NQ: complex samples per line = 2 * NQ
+]
+
+
+def _big_endian(headers, start, size):
+    value = np.zeros(len(headers), dtype=np.uint32)
+    for i in range(size):
+        value = (value << 8) | headers[:, start + i]
+    return value
+
+
+def scan_packets(data):
+    """Packet table (structured array of PACKET_FIELDS) of a memory-mapped .dat file"""
+    offsets = []
+    position, size = 0, len(data)
+    while position + USER_DATA_OFFSET <= size:
+        # Packet data length is the total length minus the primary header minus one
+        length = (int(data[position + 4]) << 8 | int(data[position + 5])) + PRIMARY_HEADER_BYTES + 1
+        if position + length > size:
+            break  # truncated final packet
+        offsets.append(position)
+        position += length
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    headers = data[offsets[:, None] + np.arange(USER_DATA_OFFSET)]
+    if len(offsets) == 0 or np.any(_big_endian(headers, 12, 4) != SYNC_MARKER):
+        raise ValueError("not a Sentinel-1 Level-0 ISP file (missing sync marker)")
+
+    packets = np.zeros(len(offsets), dtype=PACKET_FIELDS)
+    packets["offset"] = offsets
+    packets["length"] = _big_endian(headers, 4, 2) + PRIMARY_HEADER_BYTES + 1
+    packets["coarse_time"] = _big_endian(headers, 6, 4)
+    packets["fine_time"] = _big_endian(headers, 10, 2)
+    packets["data_take_id"] = _big_endian(headers, 16, 4)
+    packets["pri_count"] = _big_endian(headers, 33, 4)
+    packets["baq_mode"] = headers[:, 37] & 0x1F
+    packets["polarisation"] = (headers[:, 59] >> 4) & 0x07
+    packets["signal_type"] = headers[:, 63] >> 4
+    packets["swath"] = headers[:, 64]
+    packets["num_quads"] = _big_endian(headers, 65, 2)
+    return packets
+
+
+def decode_bypass(user_data, num_quads):
+    """(I, Q) int16 arrays of shape (lines, 2 * num_quads) from bypass-mode user data.
+
+    Bypass lines hold four channels (I even, I odd, Q even, Q odd) of
+    ``num_quads`` 10-bit sign/magnitude samples, each channel padded to a
+    16-bit word; every 5 bytes carry 4 samples.
+    """
+    lines = user_data.shape[0]
+    channel_bytes = 2 * -(-10 * num_quads // 16)
+    groups = -(-num_quads // 4)
+
+    channels = []
+    for channel in range(4):
+        raw = np.zeros((lines, groups * 5), dtype=np.uint16)
+        used = min(channel_bytes, groups * 5)
+        raw[:, :used] = user_data[:, channel * channel_bytes:channel * channel_bytes + used]
+        b = raw.reshape(lines, groups, 5)
+
+        codes = np.empty((lines, groups, 4), dtype=np.uint16)
+        codes[..., 0] = (b[..., 0] << 2) | (b[..., 1] >> 6)
+        codes[..., 1] = ((b[..., 1] & 0x3F) << 4) | (b[..., 2] >> 4)
+        codes[..., 2] = ((b[..., 2] & 0x0F) << 6) | (b[..., 3] >> 2)
+        codes[..., 3] = ((b[..., 3] & 0x03) << 8) | b[..., 4]
+        codes = codes.reshape(lines, -1)[:, :num_quads]
+
+        values = (codes & 0x1FF).astype(np.int16)
+        np.negative(values, out=values, where=(codes & 0x200) != 0)
+        channels.append(values)
+
+    ie, io, qe, qo = channels
+    i = np.empty((lines, 2 * num_quads), dtype=np.int16)
+    q = np.empty((lines, 2 * num_quads), dtype=np.int16)
+    i[:, 0::2], i[:, 1::2] = ie, io
+    q[:, 0::2], q[:, 1::2] = qe, qo
+    return i, q
+
+
+def _huffman_tables():
+    """(magnitude code, code length) lookups of shape (5, 2**HUFFMAN_MAX_BITS), by BRC and next 9 bits"""
+    values = np.zeros((len(HUFFMAN_CODES), 1 << HUFFMAN_MAX_BITS), dtype=np.uint8)
+    lengths = np.zeros_like(values)
+    for brc, codes in enumerate(HUFFMAN_CODES):
+        for mcode, code in enumerate(codes):
+            free = HUFFMAN_MAX_BITS - len(code)
+            first = int(code, 2) << free
+            values[brc, first:first + (1 << free)] = mcode
+            lengths[brc, first:first + (1 << free)] = len(code)
+    return values, lengths
+
+
+def _reconstruction_table():
+    """float32 sample values of shape (5, 256, 16), by BRC, THIDX and magnitude code"""
+    table = np.zeros((len(HUFFMAN_CODES), len(SIGMA_FACTORS), 16), dtype=np.float32)
+    sigma = np.asarray(SIGMA_FACTORS, dtype=np.float32)
+    for brc, levels in enumerate(NORMALISED_LEVELS):
+        top = len(levels) - 1
+        simple = SIMPLE_THIDX[brc] + 1
+        table[brc, :simple, :top] = np.arange(top)
+        table[brc, :simple, top] = SIMPLE_LEVELS[brc]
+        table[brc, simple:, :len(levels)] = sigma[simple:, None] * np.asarray(levels, dtype=np.float32)
+    return table
+
+
+HUFFMAN_VALUES, HUFFMAN_LENGTHS = _huffman_tables()
+RECONSTRUCTION = _reconstruction_table()
+
+
+def decode_fdbaq(user_data, data_bytes, num_quads):
+    """(I, Q) float32 arrays of shape (lines, 2 * num_quads) from FDBAQ user data.
+
+    ``user_data`` holds one packet's user data per row, zero-padded to the
+    longest; ``data_bytes`` is each row's real length. The four channels
+    (I even, I odd, Q even, Q odd) are Huffman-coded blocks of 128
+    samples, each channel padded to a 16-bit word. Codes are variable
+    length, so lines are decoded side by side, one sample of every line
+    per step, and the BRC/THIDX of each block pick the reconstructed
+    values at the end.
+    """
+    lines = user_data.shape[0]
+    blocks = -(-num_quads // FDBAQ_BLOCK_SAMPLES)
+    # A block is at most 8 + 128 * 10 bits; the slack lets its last lookahead run past the data
+    slack = (8 + FDBAQ_BLOCK_SAMPLES * (1 + HUFFMAN_MAX_BITS)) // 8 + 3
+    padded = np.zeros((lines, user_data.shape[1] + slack), dtype=np.uint32)
+    padded[:, :user_data.shape[1]] = user_data
+    # 24-bit big-endian word starting at every byte: any field of up to 17 bits is one lookup
+    words = (padded[:, :-2] << 16) | (padded[:, 1:-1] << 8) | padded[:, 2:]
+    row_start = np.arange(lines, dtype=np.int64) * words.shape[1]
+    words = words.ravel()
+    limit = 8 * np.asarray(data_bytes, dtype=np.int64)
+
+    position = np.zeros(lines, dtype=np.int64)
+
+    def peek(bits):
+        return (words[row_start + (position >> 3)] >> (24 - bits - (position & 7))) & ((1 << bits) - 1)
+
+    brc = np.empty((lines, blocks), dtype=np.uint8)
+    thidx = np.empty((lines, blocks), dtype=np.uint8)
+    codes = np.empty((4, lines, num_quads), dtype=np.uint8)
+    negative = np.empty((4, lines, num_quads), dtype=bool)
+    for channel in range(4):
+        for block in range(blocks):
+            if np.any(position > limit):
+                raise ValueError("FDBAQ user data is shorter than its samples")
+            if channel == 0:
+                brc[:, block] = peek(3)
+                position += 3
+                if np.any(brc[:, block] >= len(HUFFMAN_CODES)):
+                    raise ValueError(f"invalid FDBAQ bit rate code {int(brc[:, block].max())}")
+            elif channel == 2:
+                thidx[:, block] = peek(8)
+                position += 8
+            block_brc = brc[:, block]
+            for n in range(block * FDBAQ_BLOCK_SAMPLES, min((block + 1) * FDBAQ_BLOCK_SAMPLES, num_quads)):
+                bits = peek(1 + HUFFMAN_MAX_BITS)
+                code = bits & ((1 << HUFFMAN_MAX_BITS) - 1)
+                negative[channel, :, n] = bits >> HUFFMAN_MAX_BITS
+                codes[channel, :, n] = HUFFMAN_VALUES[block_brc, code]
+                position += 1 + HUFFMAN_LENGTHS[block_brc, code]
+        # Channels end on a 16-bit word
+        position = (position + 15) & ~15
+    if np.any(position > limit):
+        raise ValueError("FDBAQ user data is shorter than its samples")
+
+    sample_block = np.arange(num_quads) // FDBAQ_BLOCK_SAMPLES
+    values = RECONSTRUCTION[brc[:, sample_block], thidx[:, sample_block], codes]
+    np.negative(values, out=values, where=negative)
+
+    ie, io, qe, qo = values
+    i = np.empty((lines, 2 * num_quads), dtype=np.float32)
+    q = np.empty((lines, 2 * num_quads), dtype=np.float32)
+    i[:, 0::2], i[:, 1::2] = ie, io
+    q[:, 0::2], q[:, 1::2] = qe, qo
+    return i, q
+
+
+def chunk_bounds(num_lines, chunk_lines, overlap=0):
+    """(start, stop) line ranges of Sentinel1Raw.iter_magnitude chunks"""
+    if not 0 <= overlap < chunk_lines:
+        raise ValueError("overlap must be in [0, chunk_lines)")
+    bounds, start = [], 0
+    while start < num_lines:
+        stop = min(start + chunk_lines, num_lines)
+        bounds.append((start, stop))
+        if stop == num_lines:
+            break
+        start = stop - overlap
+    return bounds
+
+
+class Sentinel1Raw:
+    """Echo lines of a Sentinel-1 RAW measurement .dat file.
+
+    The file is memory-mapped and only the packet headers are read up
+    front. Each swath's echo packets form an image of
+    ``(lines, 2 * max NQ)`` samples in acquisition order; shorter lines are
+    zero-padded. Magnitude is computed in float32 straight from the
+    decoded I/Q, chunk by chunk.
+
+    Bypass (uncompressed 10-bit) and FDBAQ echoes are decoded; FDBAQ is
+    the normal IW mode. Files with echoes in the plain BAQ modes are
+    rejected with ``NotImplementedError`` when opened.
+    """
+
+    def __init__(self, path, offset=0, length=None):
+        # offset/length select a stored member inside an archive (safe_archive.SafeArchive.open_raw)
+        self.path = path
+        shape = None if length is None else (length,)
+        self._data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=shape)
+        self.packets = scan_packets(self._data)
+        self._echoes = self.packets[self.packets["signal_type"] == SIGNAL_ECHO]
+
+        modes = self._echoes["baq_mode"]
+        unsupported = np.unique(modes[(modes != BAQ_BYPASS) & ~np.isin(modes, FDBAQ_MODES)])
+        if len(unsupported):
+            self.close()
+            raise NotImplementedError(
+                f"{path}: echoes use BAQ modes {unsupported.tolist()}; "
+                "only bypass and FDBAQ products can be decoded"
+            )
+
+    @property
+    def swaths(self):
+        return sorted(int(s) for s in np.unique(self._echoes["swath"]))
+
+    @property
+    def default_swath(self):
+        """Swath with the most echo lines"""
+        swaths, counts = np.unique(self._echoes["swath"], return_counts=True)
+        if len(swaths) == 0:
+            raise ValueError(f"{self.path} has no echo packets")
+        return int(swaths[np.argmax(counts)])
+
+    def lines(self, swath=None):
+        swath = self.default_swath if swath is None else swath
+        return self._echoes[self._echoes["swath"] == swath]
+
+    def shape(self, swath=None):
+        lines = self.lines(swath)
+        return len(lines), 2 * int(lines["num_quads"].max(initial=0))
+
+    def iter_magnitude(self, swath=None, chunk_lines=1024, overlap=0):
+        """Yield ``(first_line, magnitude)`` float32 chunks of ``chunk_lines`` lines.
+
+        Consecutive chunks share ``overlap`` lines, so tiles with that
+        overlap can be cut from each chunk on its own.
+        """
+        lines = self.lines(swath)
+        num_lines, samples = len(lines), 2 * int(lines["num_quads"].max(initial=0))
+
+        for start, stop in chunk_bounds(num_lines, chunk_lines, overlap):
+            yield start, self._magnitude(lines[start:stop], samples)
+
+    def magnitude(self, swath=None):
+        """Whole swath at once; use iter_magnitude for large files"""
+        lines, samples = self.shape(swath)
+        out = np.empty((lines, samples), dtype=np.float32)
+        for start, chunk in self.iter_magnitude(swath):
+            out[start:start + len(chunk)] = chunk
+        return out
+
+    def _magnitude(self, lines, samples):
+        out = np.zeros((len(lines), samples), dtype=np.float32)
+        fdbaq = lines["baq_mode"] != BAQ_BYPASS
+        for num_quads in np.unique(lines["num_quads"]):
+            same_quads = lines["num_quads"] == num_quads
+            num_quads = int(num_quads)
+
+            rows = np.flatnonzero(same_quads & ~fdbaq)
+            if len(rows):
+                user_bytes = 4 * 2 * -(-10 * num_quads // 16)
+                i, q = decode_bypass(self._user_data(lines[rows], user_bytes), num_quads)
+                out[rows, :2 * num_quads] = np.hypot(i.astype(np.float32), q.astype(np.float32))
+
+            rows = np.flatnonzero(same_quads & fdbaq)
+            for batch in range(0, len(rows), FDBAQ_BATCH_LINES):
+                batch_rows = rows[batch:batch + FDBAQ_BATCH_LINES]
+                data_bytes = lines["length"][batch_rows] - USER_DATA_OFFSET
+                user_data = self._user_data(lines[batch_rows], int(data_bytes.max()))
+                i, q = decode_fdbaq(user_data, data_bytes, num_quads)
+                out[batch_rows, :2 * num_quads] = np.hypot(i, q)
+        return out
+
+    def _user_data(self, lines, user_bytes):
+        """Up to ``user_bytes`` of each line's user data, zero-padded"""
+        user_data = np.zeros((len(lines), user_bytes), dtype=np.uint8)
+        for row, (offset, length) in enumerate(zip(lines["offset"], lines["length"])):
+            data = self._data[offset + USER_DATA_OFFSET:offset + min(length, USER_DATA_OFFSET + user_bytes)]
+            user_data[row, :len(data)] = data
+        return user_data
+
+    def close(self):
+        self._data._mmap.close()
+        self._data = None
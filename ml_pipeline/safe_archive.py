@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - SAFE archive access
+Reads measurement rasters and annotation/calibration XML straight from zipped .SAFE products
+"""
+
+import io
+import os
+import struct
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+LOCAL_HEADER = struct.Struct("<4s22xHH")  # signature ... name length, extra length
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+KINDS = ("measurement", "annotation", "calibration", "noise", "index", "manifest", "other")
+
+Member = namedtuple("Member", "name kind size compressed_size stored data_offset")
+
+
+def member_kind(name):
+    """Which part of a .SAFE product a ZIP member is"""
+    parts = name.lower().split("/")
+    filename = parts[-1]
+    if filename == "manifest.safe":
+        return "manifest"
+    if "calibration" in parts[:-1]:
+        return "noise" if filename.startswith("noise") else "calibration"
+    if "annotation" in parts[:-1]:
+        return "annotation"
+    if "measurement" in parts[:-1]:
+        return "measurement"
+    if filename.endswith(".dat"):
+        # RAW products keep their data, annotation and index .dat files side by side
+        if filename.endswith("-annot.dat"):
+            return "annotation"
+        if filename.endswith("-index.dat"):
+            return "index"
+        return "measurement"
+    return "other"
+
+
+class MemberReader(io.RawIOBase):
+    """Seekable reader over a stored (uncompressed) member, by byte range.
+
+    Uses ``os.pread`` on the archive's descriptor, so any number of readers
+    of the same archive can be used from different threads.
+    """
+
+    def __init__(self, fd, offset, size):
+        super().__init__()
+        self._fd = fd
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), self._size - self._position))
+        if count == 0:
+            return 0
+        data = os.pread(self._fd, count, self._offset + self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class SafeArchive:
+    """Index of a zipped .SAFE product, built once from the central directory.
+
+    Members are grouped by kind (``KINDS``). Stored members are read by
+    byte range from the archive; deflated ones are inflated on the fly.
+    Rasters open through GDAL's ``/vsizip/`` and RAW ``.dat`` files are
+    memory-mapped in place when stored. Nothing is extracted.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = os.open(self.path, os.O_RDONLY)
+        self._zip = zipfile.ZipFile(self.path)
+        self._lock = threading.Lock()
+
+        self.members = {}
+        for info in self._zip.infolist():
+            if info.is_dir():
+                continue
+            stored = info.compress_type == zipfile.ZIP_STORED
+            self.members[info.filename] = Member(
+                info.filename, member_kind(info.filename), info.file_size, info.compress_size,
+                stored, self._data_offset(info) if stored else None
+            )
+
+    def _data_offset(self, info):
+        # The local header's name/extra lengths may differ from the central directory's
+        header = os.pread(self._fd, LOCAL_HEADER.size, info.header_offset)
+        signature, name_length, extra_length = LOCAL_HEADER.unpack(header)
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"bad local header for {info.filename}")
+        return info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+
+    def find(self, kind=None, polarisation=None, suffix=None):
+        """Member names of one kind, optionally filtered by polarisation (``"vv"``) and suffix"""
+        names = []
+        for member in self.members.values():
+            filename = member.name.lower().rsplit("/", 1)[-1]
+            if kind is not None and member.kind != kind:
+                continue
+            if polarisation is not None and f"-{polarisation.lower()}-" not in filename:
+                continue
+            if suffix is not None and not filename.endswith(suffix):
+                continue
+            names.append(member.name)
+        return sorted(names)
+
+    def open(self, name):
+        """Binary file object for a member (seekable for stored members)"""
+        member = self.members[name]
+        if member.stored:
+            return io.BufferedReader(MemberReader(self._fd, member.data_offset, member.size))
+        with self._lock:
+            return self._zip.open(name)
+
+    def read(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def read_xml(self, name):
+        return ET.fromstring(self.read(name))
+
+    def gdal_path(self, name):
+        return f"/vsizip/{self.path.resolve()}/{name}"
+
+    def open_raster(self, name):
+        import rasterio
+
+        return rasterio.open(self.gdal_path(name))
+
+    def open_raw(self, name):
+        """s1_raw.Sentinel1Raw memory-mapped in place; the member must be stored"""
+        from s1_raw import Sentinel1Raw
+
+        member = self.members[name]
+        if not member.stored:
+            raise ValueError(f"{name} is deflated and cannot be memory-mapped; extract it first")
+        return Sentinel1Raw(self.path, offset=member.data_offset, length=member.size)
+
+    def close(self):
+        self._zip.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_archives(paths, max_workers=8):
+    """SafeArchive for each path, indexed concurrently (in the same order)"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(SafeArchive, paths))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - SAR tile catalog reader
+Finds fetched Sentinel-1 tiles through the sar_fetcher catalog instead of walking directories
+
+The catalog is queried with sar_fetcher's own tile_catalog module, so both
+agree on what matches; put sar_fetcher on the path to use it:
+PYTHONPATH=../sar_fetcher
+"""
+
+import os
+from pathlib import Path
+
+# catalog.sqlite written by sar_fetcher; unset means "glob the extraction directory"
+CATALOG_PATH = os.environ.get("IODARKWATCH_TILE_CATALOG")
+
+
+def catalog_tiles(catalog_path, bbox=None, start=None, end=None, verify_size=True):
+    """Rows for tiles intersecting ``bbox`` (lon_min, lat_min, lon_max, lat_max)
+    whose acquisition window overlaps [start, end] (ISO dates or datetimes;
+    a date-only ``end`` includes that whole day).
+
+    Each row is a dict of the catalog columns plus ``path``, the absolute
+    file path. ``transform`` is the tile's affine (a, b, c, d, e, f) in
+    ``crs`` (None for tiles cataloged before it was kept). With
+    ``verify_size`` tiles that are missing or whose size no longer matches
+    the catalog are skipped.
+    """
+    try:
+        from tile_catalog import read_tiles
+    except ImportError:
+        raise ImportError("Reading the tile catalog needs sar_fetcher's tile_catalog: PYTHONPATH=../sar_fetcher")
+
+    catalog_path = Path(catalog_path)
+    root = catalog_path.parent
+
+    # Read-only, so training can run while the fetcher is still appending
+    rows = read_tiles(catalog_path, bbox, start, end)
+
+    tiles = []
+    for row in rows:
+        path = root / row["file_path"]
+        if verify_size and (not path.exists() or path.stat().st_size != row["file_size"]):
+            print(f"⚠️  Skipping {row['file_path']}: missing or changed since it was cataloged")
+            continue
+        row["path"] = path
+        row["transform"] = row.get("transform") or None
+        tiles.append(row)
+    return tiles
+
+
+def catalog_paths(catalog_path, bbox=None, start=None, end=None):
+    return [row["path"] for row in catalog_tiles(catalog_path, bbox, start, end)]
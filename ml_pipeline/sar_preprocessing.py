@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - SAR preprocessing
+dB conversion, speckle filtering, normalization and CLAHE shared by training and the inference server
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from speckle_filters import speckle_filter
+
+# Shared by training and the inference server so both filter the same way
+PREPROCESSING_CONFIG = {
+    "speckle_filter": os.environ.get("IODARKWATCH_SPECKLE_FILTER", "lee"),  # lee, enhanced_lee, frost, refined_lee
+    "speckle_window": int(os.environ.get("IODARKWATCH_SPECKLE_WINDOW", "7")),
+}
+
+
+def sar_to_db(image):
+    """float32 image the speckle filter runs on: dB for raw backscatter, a copy of images already in [0, 1]"""
+    # Convert to float32
+    if image.dtype != np.float32:
+        image = image.astype(np.float32)
+
+    # Handle different value ranges
+    if np.max(image) > 1:
+        # Convert to dB scale
+        return 10 * np.log10(np.maximum(image, 1e-10))
+    return image.copy()
+
+
+def preprocess_sar_advanced(image, clip_range=None, config=None):
+    """Advanced SAR preprocessing for high accuracy
+
+    ``clip_range`` (p_low, p_high) replaces the per-image 1/99 percentiles,
+    e.g. dataset-wide clip points from a quantile_sketch.KLLSketch.
+    ``config`` overrides PREPROCESSING_CONFIG (speckle filter and window).
+    """
+    config = {**PREPROCESSING_CONFIG, **(config or {})}
+
+    image_db = sar_to_db(image)
+
+    # Advanced speckle filtering (Lee filter by default)
+    filtered = speckle_filter(image_db, config["speckle_filter"], config["speckle_window"])
+
+    # Adaptive normalization
+    finite_mask = np.isfinite(filtered) if clip_range is None else None
+    if clip_range is not None or np.any(finite_mask):
+        if clip_range is not None:
+            p_low, p_high = clip_range
+        else:
+            finite_values = filtered[finite_mask]
+            p_low, p_high = np.percentile(finite_values, [1, 99])  # More aggressive clipping
+
+        # Normalize to 0-255
+        normalized = np.clip((filtered - p_low) / (p_high - p_low) * 255, 0, 255).astype(np.uint8)
+    else:
+        normalized = np.zeros_like(filtered, dtype=np.uint8)
+
+    # Apply CLAHE for local contrast enhancement
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    enhanced = clahe.apply(normalized)
+
+    return enhanced
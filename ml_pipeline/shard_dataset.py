@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Shard-backed YOLO training
+Ultralytics dataset, trainer and validator that read tiles and labels straight from tile_shards directories
+"""
+
+import math
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import colorstr
+
+from tile_shards import TileShards
+
+
+class ShardDataset(YOLODataset):
+    """YOLODataset over a tile_shards directory instead of image and label files.
+
+    Tiles are read from the memory-mapped shards and labels from the
+    index, so there is no file listing, JPEG decoding or label scan; the
+    augmentation pipeline is Ultralytics' own. Tile names stand in for
+    image paths in logs and plots.
+    """
+
+    def get_img_files(self, img_path):
+        self.shards = TileShards(img_path)
+        if not len(self.shards):
+            raise FileNotFoundError(f"{self.prefix}No tile shards found in {img_path}")
+        if self.shards.dtypes() != {np.dtype(np.uint8)}:
+            raise ValueError(f"{self.prefix}YOLO trains on uint8 tiles, {img_path} holds {self.shards.dtypes()}")
+        return [str(Path(img_path) / name) for name in self.shards.names()]
+
+    def get_labels(self):
+        labels = []
+        for i, im_file in enumerate(self.im_files):
+            rows = self.shards.labels(i)
+            labels.append({
+                "im_file": im_file,
+                "shape": self.shards.tile(i).shape[:2],
+                "cls": rows[:, 0:1],
+                "bboxes": rows[:, 1:],
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True, **kwargs):
+        """Tile ``i`` in BGR, resized the way BaseDataset.load_image resizes image files"""
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+        tile = self.shards.tile(i)
+        if tile.ndim == 3 and tile.shape[2] == 1:
+            tile = tile[..., 0]
+        if getattr(self, "channels", 3) == 1:
+            im = np.array(tile if tile.ndim == 2 else cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY))
+        else:
+            im = cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR) if tile.ndim == 2 else np.array(tile)
+
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                size = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+                im = cv2.resize(im, size, interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        if im.ndim == 2:
+            im = im[..., None]
+
+        if self.augment:
+            # Mosaic picks its partner tiles from this buffer, as with image files
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j] = self.im_hw0[j] = self.im_hw[j] = None
+        return im, (h0, w0), im.shape[:2]
+
+
+def build_shard_dataset(cfg, img_path, batch, data, mode="train", rect=False, stride=32):
+    """ShardDataset with the settings Ultralytics' build_yolo_dataset gives a YOLODataset"""
+    return ShardDataset(
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=None,  # the shards are memory-mapped already
+        single_cls=cfg.single_cls or False,
+        stride=int(stride),
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+    )
+
+
+class ShardTrainer(DetectionTrainer):
+    """DetectionTrainer whose ``train``/``val`` dataset entries are shard directories.
+
+    Pass it as ``model.train(data=..., trainer=ShardTrainer)``; validation
+    during training reuses its loaders.
+    """
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max()) if model else 0, 32)
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode, rect=mode == "val",
+                                   stride=stride)
+
+
+class ShardValidator(DetectionValidator):
+    """DetectionValidator over shard directories: ``model.val(data=..., validator=ShardValidator)``"""
+
+    def build_dataset(self, img_path, mode="val", batch=None):
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode, stride=self.stride)
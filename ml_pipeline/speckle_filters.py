@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Speckle filters
+Lee, Enhanced Lee, Frost and Refined Lee on box filters, run over row bands in parallel
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+FILTERS = ("lee", "enhanced_lee", "frost", "refined_lee")
+
+# Bands start at absolute multiples of BAND_ROWS, so the result does not depend
+# on the number of workers or on how a streaming caller splits the scene
+BAND_ROWS = 64
+
+# Threads per speckle_filter call; None = one per CPU (the preprocessing farm sets 1 per process)
+WORKERS = None
+
+# Equivalent number of looks of Sentinel-1 IW GRD (high resolution)
+DEFAULT_LOOKS = 4.4
+DEFAULT_DAMPING = 1.0
+
+# Frost: decay factors the exponential kernel is evaluated at; pixels interpolate between them
+FROST_LEVELS = 8
+
+EPS = 1e-10
+
+# Refined Lee: 9-input sorting network pruned to leave the 5 lowest in positions 0-4
+LOWEST_5_OF_9 = [(0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7),
+                 (0, 3), (3, 6), (1, 4), (4, 7), (1, 4), (5, 8), (2, 5), (2, 6), (4, 6)]
+
+
+def speckle_filter(image, method="lee", window_size=7, workers=None, **params):
+    """Speckle-filter a whole 2-D image; returns a new float32 array"""
+    image = np.asarray(image, dtype=np.float32)
+    height = image.shape[0]
+    return speckle_filter_rows(image, 0, height, 0, height, method, window_size, workers, **params)
+
+
+def speckle_filter_rows(image, first_row, height, start, stop, method="lee", window_size=7, workers=None,
+                        **params):
+    """Filtered rows [start, stop) of a scene with ``height`` rows.
+
+    ``image`` holds scene rows [first_row, first_row + len(image)) and must
+    include ``window_size // 2`` rows of halo around [start, stop) where the
+    scene has them. ``start`` must be a multiple of ``BAND_ROWS`` and ``stop``
+    too unless it is the end of the scene. The output is then bit-identical
+    to the same rows of ``speckle_filter`` on the whole scene.
+
+    ``params``: ``looks`` (Enhanced Lee, Refined Lee is data-driven) and
+    ``damping`` (Enhanced Lee, Frost).
+    """
+    if method not in FILTERS:
+        raise ValueError(f"Unknown speckle filter {method!r}, expected one of {FILTERS}")
+    if window_size < 3 or window_size % 2 == 0:
+        raise ValueError("window_size must be odd and >= 3")
+    if method == "refined_lee" and window_size < 5:
+        raise ValueError("refined_lee needs window_size >= 5")
+    if start % BAND_ROWS or (stop % BAND_ROWS and stop != height):
+        raise ValueError(f"start/stop must be multiples of BAND_ROWS ({BAND_ROWS})")
+
+    halo = window_size // 2
+    if first_row > max(start - halo, 0) or first_row + image.shape[0] < min(stop + halo, height):
+        raise ValueError("image does not cover the requested rows plus their halo")
+
+    image = np.asarray(image, dtype=np.float32)
+    kernel = _KERNELS[method]
+    out = np.empty((stop - start, image.shape[1]), dtype=np.float32)
+
+    def run(band_start):
+        band_stop = min(band_start + BAND_ROWS, stop)
+        in0, in1 = max(band_start - halo, 0), min(band_stop + halo, height)
+        # Reflect only at the scene's own edges; elsewhere the halo holds real rows
+        padded = cv2.copyMakeBorder(
+            image[in0 - first_row:in1 - first_row],
+            halo - (band_start - in0), halo - (in1 - band_stop), halo, halo,
+            cv2.BORDER_REFLECT_101
+        )
+        out[band_start - start:band_stop - start] = kernel(padded, window_size, **params)
+
+    bands = range(start, stop, BAND_ROWS)
+    workers = workers or WORKERS or os.cpu_count() or 1
+    if workers == 1 or len(bands) == 1:
+        for band_start in bands:
+            run(band_start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speckle") as executor:
+            list(executor.map(run, bands))
+    return out
+
+
+def _crop(array, halo):
+    return array[halo:array.shape[0] - halo, halo:array.shape[1] - halo]
+
+
+def _local_stats(padded, window_size):
+    """Cropped local mean and variance over a square window"""
+    halo = window_size // 2
+    ksize = (window_size, window_size)
+    mean = _crop(cv2.boxFilter(padded, cv2.CV_32F, ksize, borderType=cv2.BORDER_REFLECT_101), halo)
+    variance = _crop(cv2.sqrBoxFilter(padded, cv2.CV_32F, ksize, borderType=cv2.BORDER_REFLECT_101), halo)
+    variance -= mean * mean
+    return mean, variance
+
+
+def _lee(padded, window_size):
+    # Same estimator as the original lee_filter
+    mean, variance = _local_stats(padded, window_size)
+    center = _crop(padded, window_size // 2)
+
+    np.maximum(variance, EPS, out=variance)
+    gain = mean * mean
+    gain += variance
+    gain += EPS
+    np.divide(variance, gain, out=gain)
+
+    out = np.subtract(center, mean)
+    out *= gain
+    out += mean
+    return out
+
+
+def _enhanced_lee(padded, window_size, looks=DEFAULT_LOOKS, damping=DEFAULT_DAMPING):
+    """Lopes et al. (1990): mean in homogeneous areas, original pixel at point targets"""
+    mean, variance = _local_stats(padded, window_size)
+    center = _crop(padded, window_size // 2)
+
+    cu = 1.0 / np.sqrt(looks)
+    cmax = np.sqrt(1.0 + 2.0 / looks)
+
+    # Local coefficient of variation
+    ci = np.maximum(variance, 0, out=variance)
+    np.sqrt(ci, out=ci)
+    ci /= np.abs(mean) + EPS
+
+    weight = np.clip(ci, cu, cmax - EPS)
+    weight -= cu
+    weight *= -damping
+    weight /= cmax - np.minimum(ci, cmax - EPS)
+    np.exp(weight, out=weight)
+
+    out = mean * weight
+    out += center * (1 - weight)
+    np.copyto(out, mean, where=ci <= cu)
+    np.copyto(out, center, where=ci >= cmax)
+    return out
+
+
+def _frost(padded, window_size, damping=DEFAULT_DAMPING):
+    """Frost et al. (1982) with an exp(-damping * Ci^2 * |d|) kernel, |d| = |dx| + |dy|.
+
+    The L1 distance makes the kernel separable. It is evaluated at
+    ``FROST_LEVELS + 1`` fixed decay factors and each pixel interpolates
+    between the two around its own.
+    """
+    halo = window_size // 2
+    mean, variance = _local_stats(padded, window_size)
+
+    ci2 = np.maximum(variance, 0, out=variance)
+    ci2 /= mean * mean + EPS
+    # Per-axis decay factor in [0, 1]: 1 = plain mean, 0 = original pixel
+    decay = np.exp(-damping * ci2)
+
+    position = decay * FROST_LEVELS
+    # NaN (nodata) pixels keep a NaN fraction and stay NaN in the output
+    lower = np.minimum(np.nan_to_num(position).astype(np.int64), FROST_LEVELS - 1)
+    frac = position - lower
+
+    distance = np.abs(np.arange(-halo, halo + 1, dtype=np.float32))
+    out = np.zeros_like(mean)
+    for level in range(FROST_LEVELS + 1):
+        weight = np.where(lower == level, 1 - frac, 0) + np.where(lower == level - 1, frac, 0)
+        if not weight.any():
+            continue
+        kernel = np.float32(level / FROST_LEVELS) ** distance
+        kernel /= kernel.sum()
+        smoothed = _crop(cv2.sepFilter2D(padded, cv2.CV_32F, kernel, kernel, borderType=cv2.BORDER_REFLECT_101),
+                         halo)
+        out += weight.astype(np.float32) * smoothed
+    return out
+
+
+def _half_window_sums(values, halo):
+    """Sums of ``values`` over the 8 refined-Lee half windows of every fully inside pixel.
+
+    Returns ``{direction: sums}`` (0 down, 1 lower-left, 2 left, 3 upper-left,
+    4-7 the opposites). Row prefix sums P reduce a window row to two
+    lookups; column, diagonal and anti-diagonal cumulative sums of P then
+    give each half window in O(1) per pixel, whatever the window size.
+    """
+    rows, cols = values.shape
+    prefix = np.zeros((rows, cols + 1))
+    np.cumsum(values, axis=1, out=prefix[:, 1:])
+
+    # Exclusive cumulative sums of the row prefix down columns, diagonals and anti-diagonals
+    column = np.zeros((rows + 1, cols + 1))
+    np.cumsum(prefix, axis=0, out=column[1:])
+    diagonal = np.zeros((rows + 1, cols + 2))
+    anti = np.zeros((rows + 1, cols + 2))
+    for r in range(rows):
+        np.add(diagonal[r, :cols + 1], prefix[r], out=diagonal[r + 1, 1:])
+        np.add(anti[r, 1:], prefix[r], out=anti[r + 1, :cols + 1])
+
+    def at(table, dy, dx):
+        return table[halo + dy:rows - halo + dy, halo + dx:cols - halo + dx]
+
+    def col(dx, dy0, dy1):
+        # Sum of P(y + dy, x + dx) for dy in [dy0, dy1]
+        return at(column, dy1 + 1, dx) - at(column, dy0, dx)
+
+    def diag(dx):
+        # Sum of P(y + dy, x + dx + dy) for dy in [-halo, halo]
+        return at(diagonal, halo + 1, dx + halo + 1) - at(diagonal, -halo, dx - halo)
+
+    def anti_diag(dx):
+        # Sum of P(y + dy, x + dx - dy) for dy in [-halo, halo]
+        return at(anti, halo + 1, dx - halo) - at(anti, -halo, dx + halo + 1)
+
+    left_edge, right_edge = col(-halo, -halo, halo), col(halo + 1, -halo, halo)
+    box = right_edge - left_edge
+    lower_left = diag(1) - left_edge             # dx <= dy
+    lower_right = right_edge - anti_diag(0)      # dx >= -dy
+    on_diagonal = diag(1) - diag(0)              # dx == dy
+    on_anti = anti_diag(1) - anti_diag(0)        # dx == -dy
+    return {
+        0: col(halo + 1, 0, halo) - col(-halo, 0, halo),
+        1: lower_left,
+        2: col(1, -halo, halo) - left_edge,
+        3: box + on_anti - lower_right,
+        4: col(halo + 1, -halo, 0) - col(-halo, -halo, 0),
+        5: box + on_diagonal - lower_left,
+        6: right_edge - col(0, -halo, halo),
+        7: lower_right,
+    }
+
+
+def _refined_lee(padded, window_size):
+    """Lee (1981) refined filter: Lee statistics from the edge-aligned half window.
+
+    Nine 3x3 sample windows (spaced ``(window_size - 3) // 2`` apart) give
+    the edge direction; of the 8 half windows (4 rectangles and 4 triangles,
+    each including the centre) the one on the homogeneous side is used. Noise
+    variance is the mean of the 5 lowest normalized sample variances.
+    """
+    halo = window_size // 2
+    step = (window_size - 3) // 2
+    rows, cols = padded.shape[0] - 2 * halo, padded.shape[1] - 2 * halo
+    center = _crop(padded, halo)
+
+    mean3 = cv2.boxFilter(padded, cv2.CV_32F, (3, 3), borderType=cv2.BORDER_REFLECT_101)
+    sqr3 = cv2.sqrBoxFilter(padded, cv2.CV_32F, (3, 3), borderType=cv2.BORDER_REFLECT_101)
+
+    # 3x3 grid of samples, row-major: 0 1 2 / 3 4 5 / 6 7 8
+    means, normalized_vars = [], []
+    for dy in (-step, 0, step):
+        for dx in (-step, 0, step):
+            window = (slice(halo + dy, halo + dy + rows), slice(halo + dx, halo + dx + cols))
+            m = mean3[window]
+            means.append(m)
+            normalized_vars.append((sqr3[window] - m * m) / (m * m + EPS))
+    m = means
+
+    # Strongest of the vertical, diagonal, horizontal and anti-diagonal gradients
+    # (first one on ties), and whether the edge lies toward the first sample of the pair
+    pairs = [(1, 7), (6, 2), (3, 5), (0, 8)]
+    strongest = np.abs(m[1] - m[7])
+    direction = np.zeros((rows, cols), dtype=np.int8)
+    for axis, (a, b) in enumerate(pairs[1:], start=1):
+        gradient = np.abs(m[a] - m[b])
+        stronger = gradient > strongest
+        direction[stronger] = axis
+        np.maximum(strongest, gradient, out=strongest)
+    toward = np.zeros((rows, cols), dtype=bool)
+    for axis, (a, b) in enumerate(pairs):
+        chosen = direction == axis
+        toward[chosen] = ((m[a] - m[4]) > (m[4] - m[b]))[chosen]
+    # Direction 0-7: 0 down, 1 lower-left, 2 left, 3 upper-left, then the opposites
+    direction += 4 * ~toward
+
+    # Comparator network: afterwards positions 0-4 hold the 5 lowest
+    v = normalized_vars
+    for a, b in LOWEST_5_OF_9:
+        low = np.minimum(v[a], v[b])
+        np.maximum(v[a], v[b], out=v[b])
+        v[a] = low
+    sigma_v = (v[0] + v[1] + v[2] + v[3] + v[4]) / 5
+
+    # Statistics of the selected half window
+    padded64 = padded.astype(np.float64)
+    sums = _half_window_sums(padded64, halo)
+    squares = _half_window_sums(np.square(padded64, out=padded64), halo)
+    rect_area, triangle_area = window_size * (halo + 1), window_size * (window_size + 1) // 2
+    area = np.where(direction % 2, triangle_area, rect_area)
+    dir_mean = np.choose(direction, [sums[d] for d in range(8)]) / area
+    dir_var = np.choose(direction, [squares[d] for d in range(8)]) / area
+    dir_var -= dir_mean * dir_mean
+    dir_mean = dir_mean.astype(np.float32)
+    dir_var = dir_var.astype(np.float32)
+
+    var_x = dir_mean * dir_mean
+    var_x *= sigma_v
+    np.subtract(dir_var, var_x, out=var_x)
+    var_x /= sigma_v + 1
+    np.maximum(var_x, 0, out=var_x)
+    gain = np.divide(var_x, dir_var, out=np.zeros_like(var_x), where=dir_var > EPS)
+    np.minimum(gain, 1, out=gain)
+
+    out = np.subtract(center, dir_mean)
+    out *= gain
+    out += dir_mean
+    return out
+
+
+_KERNELS = {
+    "lee": _lee,
+    "enhanced_lee": _enhanced_lee,
+    "frost": _frost,
+    "refined_lee": _refined_lee,
+}
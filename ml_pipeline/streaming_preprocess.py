@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Streaming SAR preprocessing
+Block-wise preprocess_sar_advanced + create_training_tiles with bounded memory
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from sar_preprocessing import PREPROCESSING_CONFIG
+from speckle_filters import BAND_ROWS, speckle_filter_rows
+from tiling import PAD_EDGES, tile_offsets
+
+CLIP_PERCENTILES = [1, 99]
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_GRID = (8, 8)
+HIST_SIZE = 256
+
+
+class RowReader:
+    """Full-width row bands of band 1 of a raster, as float32.
+
+    ``source`` is a path opened with rasterio (read window by window) or an
+    in-memory 2-D array.
+    """
+
+    def __init__(self, source):
+        self._dataset = None
+        if isinstance(source, np.ndarray):
+            self._array = source
+            self.height, self.width = source.shape[:2]
+        else:
+            import rasterio
+
+            self._dataset = rasterio.open(str(source))
+            self._array = None
+            self.height, self.width = self._dataset.height, self._dataset.width
+
+    def read(self, row_start, row_stop):
+        if self._array is not None:
+            return self._array[row_start:row_stop].astype(np.float32)
+
+        from rasterio.windows import Window
+
+        window = Window(0, row_start, self.width, row_stop - row_start)
+        return self._dataset.read(1, window=window).astype(np.float32)
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+
+
+def stream_training_tiles(source, tile_size=640, overlap=64, band_rows=256, spill_dir=None,
+                          clip_range=None, sketch=None, config=None, pad_edges=PAD_EDGES):
+    """Yield ``((y, x), tile)`` for the tiles of a preprocessed SAR scene.
+
+    Produces exactly what ``create_training_tiles(preprocess_sar_advanced(image))``
+    yields, bit for bit and in the same order, while holding only a few
+    full-width row bands in memory. The speckle-filtered scene is spilled to a
+    float32 memmap in ``spill_dir`` (default: the system temp dir) because
+    the percentile clip and CLAHE both need scene-wide statistics:
+
+    1. scan for the global maximum (decides whether to convert to dB)
+    2. dB + speckle filter per band, read with a ``window // 2`` row halo
+    3. exact 1st/99th percentiles by radix selection over the spill
+    4. per-cell CLAHE histograms, then OpenCV's LUTs
+    5. normalize + CLAHE interpolation per output tile row, sliced into tiles
+
+    Peak memory depends on the scene width and ``band_rows``, not on its height.
+
+    ``clip_range`` (p_low, p_high) replaces the per-scene percentiles and
+    skips step 3, matching ``preprocess_sar_advanced(image, clip_range)``.
+    If a ``sketch`` (quantile_sketch.KLLSketch) is given, every filtered
+    band is added to it so dataset-wide clip points come for free.
+    ``config`` overrides PREPROCESSING_CONFIG, as in preprocess_sar_advanced.
+    ``pad_edges`` (default tiling.PAD_EDGES) adds the zero-padded edge tiles of tiling.iter_tiles.
+
+    ``band_rows`` must be a multiple of speckle_filters.BAND_ROWS so bands
+    line up with the filter's own row bands.
+    """
+    if band_rows % BAND_ROWS:
+        raise ValueError(f"band_rows must be a multiple of {BAND_ROWS}")
+    config = {**PREPROCESSING_CONFIG, **(config or {})}
+
+    reader = RowReader(source)
+    height, width = reader.height, reader.width
+    offsets = tile_offsets(height, width, tile_size, overlap, pad_edges=pad_edges)
+    # Edge tiles may run past the right border; the padding stays zero
+    band_width = max([width] + [x + tile_size for _, x in offsets])
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="iodarkwatch_spill_", dir=spill_dir) as tmp:
+            filtered = np.lib.format.open_memmap(
+                Path(tmp) / "filtered.npy", mode="w+", dtype=np.float32, shape=(height, width)
+            )
+            selector = _speckle_filter_to_spill(reader, filtered, band_rows, config, clip_range is None, sketch)
+            normalize = _normalizer(filtered, selector, clip_range)
+            clahe = _StreamingClahe(height, width)
+            clahe.fit(normalize, band_rows)
+
+            rows_with_tiles = {}
+            for y, x in offsets:
+                rows_with_tiles.setdefault(y, []).append(x)
+
+            for y, xs in rows_with_tiles.items():
+                stop = min(y + tile_size, height)
+                band = (np.zeros if pad_edges else np.empty)((tile_size, band_width), dtype=np.uint8)
+                for r0 in range(y, stop, band_rows):
+                    r1 = min(r0 + band_rows, stop)
+                    band[r0 - y:r1 - y, :width] = clahe.apply(normalize(r0, r1), r0)
+                for x in xs:
+                    yield (y, x), band[:, x:x + tile_size]
+
+            del filtered
+    finally:
+        reader.close()
+
+
+def _speckle_filter_to_spill(reader, filtered, band_rows, config, exact_percentiles=True, sketch=None):
+    """dB conversion + speckle filter into ``filtered``; returns the percentile selector"""
+    height = reader.height
+    method, window_size = config["speckle_filter"], config["speckle_window"]
+    halo = window_size // 2
+
+    # preprocess_sar_advanced decides on dB with np.max over the whole scene
+    # (NaN anywhere makes the comparison false)
+    scene_max = -np.inf
+    for r0 in range(0, height, band_rows):
+        band_max = np.max(reader.read(r0, min(r0 + band_rows, height)))
+        if np.isnan(band_max):
+            scene_max = band_max
+            break
+        scene_max = max(scene_max, band_max)
+    to_db = scene_max > 1
+
+    selector = RadixPercentiles()
+    for r0 in range(0, height, band_rows):
+        r1 = min(r0 + band_rows, height)
+        # Rows beyond the band give the filter the same neighbourhood it sees on the full scene
+        h0, h1 = max(r0 - halo, 0), min(r1 + halo, height)
+        image = reader.read(h0, h1)
+        if to_db:
+            image_db = 10 * np.log10(np.maximum(image, 1e-10))
+        else:
+            image_db = image
+        band = speckle_filter_rows(image_db, h0, height, r0, r1, method, window_size)
+
+        filtered[r0:r1] = band
+        if exact_percentiles:
+            selector.add(band)
+        if sketch is not None:
+            sketch.update(band)
+
+    # Second pass over the spill resolves the exact order statistics
+    if exact_percentiles:
+        for r0 in range(0, height, band_rows):
+            selector.refine(filtered[r0:r0 + band_rows], CLIP_PERCENTILES)
+    return selector
+
+
+def _normalizer(filtered, selector, clip_range=None):
+    """Row-range function returning the uint8 image that CLAHE is applied to"""
+    if clip_range is not None:
+        p_low, p_high = clip_range
+    elif selector.count == 0:
+        return lambda r0, r1: np.zeros((r1 - r0, filtered.shape[1]), dtype=np.uint8)
+    else:
+        p_low, p_high = selector.percentiles(CLIP_PERCENTILES)
+
+    def normalize(r0, r1):
+        rows = filtered[r0:r1]
+        return np.clip((rows - p_low) / (p_high - p_low) * 255, 0, 255).astype(np.uint8)
+
+    return normalize
+
+
+class RadixPercentiles:
+    """Exact percentiles of float32 data seen in chunks, matching ``np.percentile``.
+
+    Finite values are mapped to order-preserving 32-bit keys. ``add`` counts
+    the top 16 bits of every key; ``refine`` (a second pass over the same
+    data) counts the low 16 bits inside the few buckets holding the wanted
+    ranks. Memory is two 65536-bin histograms per wanted bucket.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._high = np.zeros(1 << 16, dtype=np.int64)
+        self._low = {}
+
+    @staticmethod
+    def _keys(values):
+        values = np.ascontiguousarray(values, dtype=np.float32).ravel()
+        bits = values[np.isfinite(values)].view(np.uint32)
+        return np.where(bits >> 31, ~bits, bits | np.uint32(0x80000000))
+
+    @staticmethod
+    def _values(keys):
+        keys = np.asarray(keys, dtype=np.uint32)
+        bits = np.where(keys >> 31, keys & np.uint32(0x7FFFFFFF), ~keys)
+        return bits.astype(np.uint32).view(np.float32)
+
+    def add(self, values):
+        keys = self._keys(values)
+        self.count += keys.size
+        self._high += np.bincount(keys >> 16, minlength=1 << 16)
+
+    def _ranks(self, percentiles):
+        # Same index arithmetic as np.percentile(method="linear")
+        q = np.true_divide(percentiles, 100)
+        virtual = (self.count - 1) * q
+        previous = np.floor(virtual)
+        above = virtual >= self.count - 1
+        previous[above] = self.count - 1
+        following = np.minimum(previous + 1, self.count - 1)
+        gamma = virtual - np.where(above, -1, previous)
+        return previous.astype(np.int64), following.astype(np.int64), gamma
+
+    def _locate(self, rank):
+        cumulative = np.cumsum(self._high)
+        bucket = int(np.searchsorted(cumulative, rank, side="right"))
+        below = int(cumulative[bucket - 1]) if bucket else 0
+        return bucket, rank - below
+
+    def refine(self, values, percentiles):
+        if self.count == 0:
+            return
+        previous, following, _ = self._ranks(percentiles)
+        buckets = {self._locate(int(r))[0] for r in np.concatenate([previous, following])}
+
+        keys = self._keys(values)
+        high = keys >> 16
+        for bucket in buckets:
+            low = keys[high == bucket] & np.uint32(0xFFFF)
+            counts = np.bincount(low, minlength=1 << 16)
+            if bucket in self._low:
+                self._low[bucket] += counts
+            else:
+                self._low[bucket] = counts
+
+    def order_statistic(self, rank):
+        bucket, residual = self._locate(rank)
+        low = int(np.searchsorted(np.cumsum(self._low[bucket]), residual, side="right"))
+        return self._values((bucket << 16) | low)
+
+    def percentiles(self, percentiles):
+        previous, following, gamma = self._ranks(percentiles)
+        a = np.array([self.order_statistic(int(r)) for r in previous], dtype=np.float32)
+        b = np.array([self.order_statistic(int(r)) for r in following], dtype=np.float32)
+
+        # numpy's _lerp, including its switch to the upper bound for gamma >= 0.5
+        diff_b_a = b - a
+        result = np.add(a, diff_b_a * gamma)
+        np.subtract(b, diff_b_a * (1 - gamma), out=result, where=gamma >= 0.5, casting="unsafe")
+        return result
+
+
+class _StreamingClahe:
+    """OpenCV's CLAHE (createCLAHE(2.0, (8, 8)).apply) split into fit/apply passes.
+
+    Replicates OpenCV exactly: scenes not divisible by the grid are padded
+    with BORDER_REFLECT_101 for the histograms, histograms are clipped and
+    the excess redistributed in integers, LUTs are rounded with cvRound and
+    the bilinear interpolation is done in float32 in the same order.
+    """
+
+    def __init__(self, height, width, clip_limit=CLAHE_CLIP_LIMIT, grid=CLAHE_GRID):
+        self.height, self.width = height, width
+        self.clip_limit = clip_limit
+        self.tiles_y, self.tiles_x = grid
+
+        if height % self.tiles_y == 0 and width % self.tiles_x == 0:
+            padded_h, padded_w = height, width
+        else:
+            padded_h = height + self.tiles_y - height % self.tiles_y
+            padded_w = width + self.tiles_x - width % self.tiles_x
+        self.padded_h = padded_h
+        self.tile_h = padded_h // self.tiles_y
+        self.tile_w = padded_w // self.tiles_x
+
+        self._columns = _reflect_101(np.arange(padded_w), width)
+        self._column_cells = np.arange(padded_w) // self.tile_w
+        self.luts = None
+
+        inv_tw = np.float32(1.0) / np.float32(self.tile_w)
+        txf = np.arange(width, dtype=np.float32) * inv_tw - np.float32(0.5)
+        tx1 = np.floor(txf).astype(np.int64)
+        self._xa = txf - tx1.astype(np.float32)
+        self._xa1 = np.float32(1.0) - self._xa
+        self._tx1 = np.maximum(tx1, 0)
+        self._tx2 = np.minimum(tx1 + 1, self.tiles_x - 1)
+        self._inv_th = np.float32(1.0) / np.float32(self.tile_h)
+
+    def fit(self, normalize, band_rows):
+        hists = np.zeros((self.tiles_y, self.tiles_x * HIST_SIZE), dtype=np.int64)
+        for p0 in range(0, self.padded_h, band_rows):
+            p1 = min(p0 + band_rows, self.padded_h)
+            rows = _reflect_101(np.arange(p0, p1), self.height)
+            # Padding rows only exist past the bottom edge, so real rows are contiguous
+            real = rows[rows == np.arange(p0, p1)]
+            image = normalize(int(real[0]), int(real[-1]) + 1) if real.size else None
+            padding = rows[real.size:]
+            if padding.size:
+                extra = np.concatenate([normalize(int(r), int(r) + 1) for r in padding])
+                image = extra if image is None else np.concatenate([image, extra])
+
+            cells = np.arange(p0, p1) // self.tile_h
+            keys = self._column_cells[None, :] * HIST_SIZE + image[:, self._columns]
+            for cell in np.unique(cells):
+                hists[cell] += np.bincount(keys[cells == cell].ravel(), minlength=self.tiles_x * HIST_SIZE)
+
+        self.luts = self._luts(hists.reshape(self.tiles_y, self.tiles_x, HIST_SIZE))
+
+    def _luts(self, hists):
+        total = self.tile_h * self.tile_w
+        limit = max(int(self.clip_limit * total / HIST_SIZE), 1) if self.clip_limit > 0 else 0
+        scale = np.float32(HIST_SIZE - 1) / np.float32(total)
+
+        luts = np.empty(hists.shape, dtype=np.uint8)
+        for ty in range(self.tiles_y):
+            for tx in range(self.tiles_x):
+                hist = hists[ty, tx].copy()
+                if limit > 0:
+                    over = hist > limit
+                    clipped = int((hist[over] - limit).sum())
+                    hist[over] = limit
+
+                    batch = clipped // HIST_SIZE
+                    residual = clipped - batch * HIST_SIZE
+                    hist += batch
+                    if residual:
+                        step = max(HIST_SIZE // residual, 1)
+                        hist[np.arange(0, HIST_SIZE, step)[:residual]] += 1
+
+                cumulative = np.cumsum(hist).astype(np.float32)
+                luts[ty, tx] = np.clip(np.rint(cumulative * scale), 0, 255).astype(np.uint8)
+        return luts
+
+    def apply(self, image, row_start):
+        """CLAHE output for ``image`` = rows [row_start, row_start + len(image)) of the scene"""
+        tyf = np.arange(row_start, row_start + image.shape[0], dtype=np.float32) * self._inv_th - np.float32(0.5)
+        ty1 = np.floor(tyf).astype(np.int64)
+        ya = (tyf - ty1.astype(np.float32))[:, None]
+        ya1 = np.float32(1.0) - ya
+        ty2 = np.minimum(ty1 + 1, self.tiles_y - 1)[:, None]
+        ty1 = np.maximum(ty1, 0)[:, None]
+
+        values = image.astype(np.intp)
+        top = (self.luts[ty1, self._tx1, values].astype(np.float32) * self._xa1
+               + self.luts[ty1, self._tx2, values].astype(np.float32) * self._xa)
+        bottom = (self.luts[ty2, self._tx1, values].astype(np.float32) * self._xa1
+                  + self.luts[ty2, self._tx2, values].astype(np.float32) * self._xa)
+        result = top * ya1 + bottom * ya
+        return np.clip(np.rint(result), 0, 255).astype(np.uint8)
+
+
+def _reflect_101(index, length):
+    """cv2.BORDER_REFLECT_101 source index for each (possibly out of range) index"""
+    if length == 1:
+        return np.zeros_like(index)
+    period = 2 * (length - 1)
+    index = np.abs(index) % period
+    return np.where(index >= length, period - index, index)
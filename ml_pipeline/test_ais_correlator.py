@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from ais_correlator import NM, AISIndex, Detections, correlate, dark_events
+from ais_tracks import build_tracks
+
+WHEN = 1_700_000_000
+# One arc minute of longitude on the equator is one nautical mile
+MINUTE = 1 / 60
+
+
+def stationary(vessels, times=(WHEN - 300, WHEN + 300)):
+    """AISIndex of vessels parked on the equator at {mmsi: lon}, reporting at ``times``"""
+    mmsi = [m for m in vessels for _ in times]
+    lon = [lon for lon in vessels.values() for _ in times]
+    count = len(mmsi)
+    return AISIndex(build_tracks(mmsi, list(times) * len(vessels), np.zeros(count), lon, np.zeros(count),
+                                 np.zeros(count)))
+
+
+def detections(lon, when=WHEN):
+    count = len(lon)
+    return Detections(np.asarray(lon, dtype=np.float64), np.zeros(count), np.full(count, when, dtype=np.int64),
+                      np.full(count, 0.9), np.full(count, np.nan))
+
+
+def test_two_detections_compete_for_one_vessel():
+    events = correlate(detections([0.2 * MINUTE, 0.6 * MINUTE]), stationary({111: 0.0}))
+    # The nearer detection takes the vessel; the other is dark, but less certainly than an empty gate
+    assert events["mmsi"].tolist() == [111, -1]
+    assert events["dark"].tolist() == [False, True]
+    assert events["distance_m"][0] == pytest.approx(0.2 * NM, rel=1e-3)
+    assert events["ais_gap_s"][0] == 300.0
+    assert 0 < events["match_confidence"][0] <= 1 and events["dark_confidence"][0] == 0.0
+    assert 0 < events["dark_confidence"][1] < 1 and events["match_confidence"][1] == 0.0
+
+
+def test_assignment_is_one_to_one_over_all_pairs():
+    # Detection 0 is nearest vessel 111, but only detection 0 can reach vessel 222:
+    # matching it greedily to 111 would leave detection 1 dark
+    events = correlate(detections([0.4 * MINUTE, -0.3 * MINUTE]), stationary({111: 0.0, 222: 1.8 * MINUTE}))
+    assert events["mmsi"].tolist() == [222, 111]
+    assert not events["dark"].any()
+
+
+def test_detection_outside_the_distance_gate_is_dark():
+    events = correlate(detections([0.0, 2.5 * MINUTE]), stationary({111: 0.0}))
+    assert events["dark"].tolist() == [False, True]
+    assert events["dark_confidence"][1] == 1.0
+    assert np.isnan(events["distance_m"][1]) and events["mmsi"][1] == -1
+
+    wider = correlate(detections([2.5 * MINUTE]), stationary({111: 0.0}), gate_nm=3.0)
+    assert wider["mmsi"].tolist() == [111]
+
+
+def test_reports_outside_the_time_window_are_ignored():
+    # Reports 45 min either side of the acquisition: outside the 30 min window
+    index = stationary({111: 0.0}, times=(WHEN - 2700, WHEN + 2700))
+    assert len(index.positions_at(WHEN, 30 * 60)[0]) == 0
+    events = correlate(detections([0.0]), index)
+    assert events["dark"].tolist() == [True]
+    assert events["dark_confidence"].tolist() == [1.0]
+
+    assert correlate(detections([0.0]), index, window_min=60)["mmsi"].tolist() == [111]
+
+
+def test_index_reads_only_the_window_around_each_acquisition():
+    index = AISIndex(build_tracks([1, 2, 1, 2, 1], [0, 5000, 1000, 9000, 2000],
+                                  np.zeros(5), [0.0, 1.0, 0.1, 1.0, 0.2], np.full(5, 10.0), np.full(5, 90.0)))
+    tracks = index.window(900, 5000)
+    assert tracks.vessels.tolist() == [1, 2]
+    assert tracks.time.tolist() == [1000, 2000, 5000]
+
+    mmsi, lon, _, gap = index.positions_at(1500, 600)
+    assert mmsi.tolist() == [1]
+    assert lon[0] == pytest.approx(0.15)
+    assert gap.tolist() == [500.0]
+
+
+def test_detections_are_placed_at_their_own_acquisition():
+    index = stationary({111: 0.0})
+    later = WHEN + 3 * 3600
+    events = correlate(Detections(np.zeros(2), np.zeros(2), np.array([WHEN, later]), np.ones(2),
+                                  np.full(2, np.nan)), index)
+    assert events["mmsi"].tolist() == [111, -1]
+    assert dark_events(events)["detection"].tolist() == [1]
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from ais_store import AISStore
+
+
+def positions(times):
+    count = len(times)
+    return {
+        "mmsi": np.full(count, 123456789),
+        "time": np.asarray(times, dtype=np.int64),
+        "lat": np.full(count, 10.0),
+        "lon": np.full(count, 70.0),
+        "sog": np.full(count, 12.0),
+        "cog": np.full(count, 90.0),
+    }
+
+
+def partition_files(store):
+    return [sorted(partition.glob("*.parquet")) for partition in store.partitions()]
+
+
+def test_query_merges_uncompacted_files_by_time(tmp_path):
+    store = AISStore(tmp_path)
+    store.ingest(positions([100, 300]))
+    store.ingest(positions([200, 400]))
+    assert [len(files) for files in partition_files(store)] == [2]
+    assert store.query()["time"].tolist() == [100, 200, 300, 400]
+
+
+def test_compact_leaves_one_sorted_file_per_partition(tmp_path):
+    store = AISStore(tmp_path)
+    touched = set()
+    store.ingest(positions([100, 300]), touched)
+    store.ingest(positions([200, 400]), touched)
+    assert store.compact(sorted(touched)) == 1
+    assert [len(files) for files in partition_files(store)] == [1]
+    assert store.query()["time"].tolist() == [100, 200, 300, 400]
+    assert store.compact() == 0
+
+
+def test_ingest_file_compacts_its_chunks(tmp_path):
+    dump = tmp_path / "ais.csv"
+    pd.DataFrame(positions([400, 100, 300, 200, 500])).to_csv(dump, index=False)
+    store = AISStore(tmp_path / "store")
+    assert store.ingest_file(dump, chunk_rows=2) == 5
+    assert [len(files) for files in partition_files(store)] == [1]
+    assert store.query()["time"].tolist() == [100, 200, 300, 400, 500]
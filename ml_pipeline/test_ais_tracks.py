@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from ais_tracks import KNOT, build_tracks, positions_at
+
+# Vessel 111 steams due east along the equator at 10 kn; vessel 222 has a single report
+MMSI = [222, 111, 111, 111]
+TIMES = [500, 2000, 0, 1000]
+LAT = [5.0, 0.0, 0.0, 0.0]
+LON = [60.0, 0.2, 0.0, 0.1]
+SOG = [0.0, 10.0, 10.0, 10.0]
+COG = [0.0, 90.0, 90.0, 90.0]
+
+
+@pytest.fixture
+def tracks():
+    return build_tracks(MMSI, TIMES, LAT, LON, SOG, COG)
+
+
+def degrees_east(seconds, knots=10.0):
+    return np.degrees(knots * KNOT * seconds / 6371008.8)
+
+
+def test_build_tracks_sorts_by_vessel_and_time(tracks):
+    assert tracks.vessels.tolist() == [111, 222]
+    assert tracks.starts.tolist() == [0, 3]
+    assert tracks.time.tolist() == [0, 1000, 2000, 500]
+    assert tracks.lon.tolist() == [0.0, 0.1, 0.2, 60.0]
+
+
+def test_query_exactly_on_reports(tracks):
+    result = positions_at(tracks, [0, 1000, 2000], vessels=[111, 111, 111])
+    np.testing.assert_allclose(result.lon, [0.0, 0.1, 0.2], atol=1e-9)
+    np.testing.assert_allclose(result.lat, 0.0, atol=1e-9)
+    assert result.gap_s.tolist() == [0.0, 0.0, 0.0]
+    # The last report is an end of the track, not an interpolation
+    assert result.interpolated.tolist() == [True, True, False]
+
+
+def test_query_between_reports_interpolates(tracks):
+    result = positions_at(tracks, [250, 1500], vessels=[111, 111])
+    np.testing.assert_allclose(result.lon, [0.025, 0.15], atol=1e-9)
+    assert result.gap_s.tolist() == [250.0, 500.0]
+    assert result.interpolated.all()
+
+
+def test_query_before_first_and_after_last_dead_reckons(tracks):
+    result = positions_at(tracks, [-600, 2600], vessels=[111, 111])
+    np.testing.assert_allclose(result.lon, [-degrees_east(600), 0.2 + degrees_east(600)], atol=1e-9)
+    np.testing.assert_allclose(result.lat, 0.0, atol=1e-9)
+    assert result.gap_s.tolist() == [600.0, 600.0]
+    assert not result.interpolated.any()
+
+
+def test_single_report_track(tracks):
+    result = positions_at(tracks, [-100, 500, 9000], vessels=[222, 222, 222])
+    # SOG 0 holds position either side of the only report
+    np.testing.assert_allclose(result.lon, 60.0)
+    np.testing.assert_allclose(result.lat, 5.0)
+    assert result.gap_s.tolist() == [600.0, 0.0, 8500.0]
+    assert not result.interpolated.any()
+
+
+def test_unknown_vessels_are_nan(tracks):
+    result = positions_at(tracks, [1000, 1000, 1000, 1000], vessels=[100, 111, 150, 999])
+    assert result.mmsi.tolist() == [-1, 111, -1, -1]
+    assert np.isnan(result.lon[[0, 2, 3]]).all() and np.isnan(result.lat[[0, 2, 3]]).all()
+    assert np.isnan(result.gap_s[[0, 2, 3]]).all()
+    assert result.interpolated.tolist() == [False, True, False, False]
+    assert result.lon[1] == pytest.approx(0.1)
+
+
+def test_every_track_at_every_time(tracks):
+    result = positions_at(tracks, [0, 1000, 2000])
+    assert result.lon.shape == (2, 3)
+    assert result.mmsi.tolist() == [[111] * 3, [222] * 3]
+    np.testing.assert_allclose(result.lon[0], [0.0, 0.1, 0.2], atol=1e-9)
+    np.testing.assert_allclose(result.lon[1], 60.0)
+
+
+def test_max_gap_masks_positions_far_from_reports(tracks):
+    result = positions_at(tracks, [500, 3000, 500, 2000], vessels=[111, 111, 222, 222], max_gap_s=600)
+    assert result.gap_s[0] == 500.0 and not np.isnan(result.lon[0])
+    assert np.isnan(result.lon[1]) and np.isnan(result.lat[1]) and np.isnan(result.gap_s[1])
+    assert result.gap_s[2] == 0.0
+    assert np.isnan(result.lon[3])
+    assert result.interpolated.tolist() == [True, False, False, False]
+    # Still attributed to the vessel, only the position is masked
+    assert result.mmsi.tolist() == [111, 111, 222, 222]
+
+
+def test_interpolation_across_the_antimeridian():
+    tracks = build_tracks([7, 7], [0, 100], [10.0, 10.0], [179.9, -179.9])
+    result = positions_at(tracks, [25, 50, 75], vessels=[7, 7, 7])
+    # The short way across the dateline, not 359.8 degrees back through Greenwich
+    assert abs(result.lon[1]) == pytest.approx(180.0, abs=1e-6)
+    assert result.lon[0] == pytest.approx(179.95, abs=1e-3)
+    assert result.lon[2] == pytest.approx(-179.95, abs=1e-3)
+    np.testing.assert_allclose(result.lat, 10.0, atol=1e-3)
+
+
+def test_empty_tracks():
+    tracks = build_tracks([], [], [], [])
+    result = positions_at(tracks, [0, 1], vessels=[1, 2])
+    assert result.mmsi.tolist() == [-1, -1]
+    assert np.isnan(result.lon).all()
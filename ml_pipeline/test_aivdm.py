@@ -0,0 +1,139 @@
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aivdm
+from aivdm import AIVDMDecoder
+
+# Reference sentences: a class A position report and a two-part static and voyage report
+TYPE_1 = b"!AIVDM,1,1,,A,15RTgt0PAso;90TKcjM8h6g208CQ,0*4A"
+TYPE_5 = (b"!AIVDM,2,1,1,A,55?MbV02;H;s<HtKR20EHE:0@T4@Dn2222222216L961O5Gf0NSQEp6ClRp8,0*1C",
+          b"!AIVDM,2,2,1,A,88888888880,2*25")
+TYPE_5_PAYLOADS = ("55?MbV02;H;s<HtKR20EHE:0@T4@Dn2222222216L961O5Gf0NSQEp6ClRp8", "88888888880")
+
+
+def sentence(body):
+    """``!body*hh`` with its checksum"""
+    return f"!{body}*{reduce(lambda check, char: check ^ ord(char), body, 0):02X}".encode()
+
+
+def type_5_parts(sequence, channel="A"):
+    return [sentence(f"AIVDM,2,1,{sequence},{channel},{TYPE_5_PAYLOADS[0]},0"),
+            sentence(f"AIVDM,2,2,{sequence},{channel},{TYPE_5_PAYLOADS[1]},2")]
+
+
+def lines(*sentences):
+    return b"\r\n".join(sentences) + b"\r\n"
+
+
+def assert_ever_diadem(statics):
+    assert statics["mmsi"].tolist() == [351759000]
+    assert statics["name"].tolist() == ["EVER DIADEM"]
+    assert statics["callsign"].tolist() == ["3FOF8"]
+    assert statics["imo"].tolist() == [9134270]
+    assert statics["destination"].tolist() == ["NEW YORK"]
+    assert statics["ship_type"].tolist() == [70]
+    assert statics["length_m"].tolist() == [295.0] and statics["width_m"].tolist() == [32.0]
+    assert statics["draught_m"].tolist() == pytest.approx([12.2])
+
+
+def test_type_1_reference_sentence():
+    positions, statics = AIVDMDecoder(default_time=1000).decode(lines(TYPE_1))
+    assert positions["mmsi"].tolist() == [371798000]
+    assert positions["msg_type"].tolist() == [1]
+    assert positions["lat"][0] == pytest.approx(48.38163, abs=1e-5)
+    assert positions["lon"][0] == pytest.approx(-123.39538, abs=1e-5)
+    assert positions["sog"].tolist() == pytest.approx([12.3])
+    assert positions["cog"].tolist() == pytest.approx([224.0])
+    assert positions["heading"].tolist() == [215.0]
+    assert positions["time"].tolist() == [1000]
+    assert len(statics["mmsi"]) == 0
+
+
+def test_type_5_reference_sentences():
+    decoder = AIVDMDecoder()
+    _, statics = decoder.decode(lines(*TYPE_5))
+    assert_ever_diadem(statics)
+    assert statics["time"].tolist() == [-1]
+    assert decoder.stats["fragments_dropped"] == 0
+
+
+def test_tag_block_time_in_seconds_and_milliseconds():
+    tagged = lines(b"\\s:rx1,c:1700000000*00\\" + TYPE_1, b"\\c:1700000005123*00\\" + TYPE_1)
+    positions, _ = AIVDMDecoder(default_time=5).decode(tagged)
+    assert positions["time"].tolist() == [1700000000, 1700000005]
+
+
+def test_fragments_split_across_decode_calls():
+    decoder = AIVDMDecoder()
+    positions, statics = decoder.decode(lines(TYPE_1, TYPE_5[0]))
+    assert len(positions["mmsi"]) == 1 and len(statics["mmsi"]) == 0
+    assert len(decoder.pending) == 1
+
+    _, statics = decoder.decode(lines(TYPE_5[1]))
+    assert_ever_diadem(statics)
+    assert not decoder.pending
+
+
+def test_interleaved_fragments_are_matched_by_sequence_id():
+    first, second = type_5_parts(1), type_5_parts(2)
+    _, statics = AIVDMDecoder().decode(lines(first[0], second[0], TYPE_1, second[1], first[1]))
+    assert statics["mmsi"].tolist() == [351759000, 351759000]
+
+
+def test_oldest_pending_message_is_evicted():
+    decoder = AIVDMDecoder(max_pending=2)
+    parts = {sequence: type_5_parts(sequence) for sequence in (1, 2, 3)}
+    decoder.decode(lines(parts[1][0], parts[2][0], parts[3][0]))
+    assert len(decoder.pending) == 2
+    assert decoder.stats["fragments_dropped"] == 1
+
+    # Sequence 1 was evicted, so its second part has nothing to join
+    _, statics = decoder.decode(lines(parts[1][1], parts[3][1], parts[2][1]))
+    assert len(statics["mmsi"]) == 2
+    assert decoder.stats["fragments_dropped"] == 2
+    assert not decoder.pending
+
+
+def test_bad_checksums_are_counted_and_skipped():
+    decoder = AIVDMDecoder()
+    corrupted = TYPE_1[:-2] + b"4B"
+    flipped = TYPE_1.replace(b"15RT", b"15RU")
+    positions, _ = decoder.decode(lines(corrupted, flipped, TYPE_1[:-2] + b"4a"))
+    # Lower-case hex digits are valid
+    assert positions["mmsi"].tolist() == [371798000]
+    assert decoder.stats["bad_checksum"] == 2
+
+
+def test_malformed_and_foreign_lines():
+    decoder = AIVDMDecoder()
+    positions, _ = decoder.decode(lines(b"$GPGGA,123519,4807.038,N*47", b"!AIVDM,1,1,A,15RT*00", TYPE_1))
+    assert len(positions["mmsi"]) == 1
+    assert decoder.stats["sentences"] == 2 and decoder.stats["malformed"] == 1
+
+
+def test_iter_batches_yields_full_and_final_batches(tmp_path):
+    path = tmp_path / "feed.nmea"
+    path.write_bytes(lines(*[TYPE_1] * 5, *TYPE_5))
+    batches = [(kind, {name: values.copy() for name, values in columns.items()})
+               for kind, columns in aivdm.iter_batches(str(path), batch_rows=2)]
+    positions = [columns for kind, columns in batches if kind == "positions"]
+    assert [len(columns["mmsi"]) for columns in positions] == [2, 2, 1]
+    assert [kind for kind, _ in batches].count("statics") == 1
+
+
+def test_nmea_is_told_from_csv_by_content(tmp_path):
+    nmea_txt = tmp_path / "receiver.txt"
+    nmea_txt.write_bytes(lines(b"\\c:1700000000*00\\" + TYPE_1))
+    csv_txt = tmp_path / "export.txt"
+    pd.DataFrame({"mmsi": [1], "time": [0], "lat": [0.0], "lon": [0.0]}).to_csv(csv_txt, index=False)
+    empty_log = tmp_path / "empty.log"
+    empty_log.write_bytes(b"")
+
+    assert aivdm.is_nmea(nmea_txt)
+    assert not aivdm.is_nmea(csv_txt)
+    assert not aivdm.is_nmea(empty_log)
+    assert aivdm.is_nmea(tmp_path / "missing.nmea")
+    np.testing.assert_array_equal(aivdm.read_positions(str(nmea_txt))["mmsi"], [371798000])
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+import cfar
+from cfar import cascade_offsets, cfar_scores, detect, pfa_to_threshold
+
+SEA_DB = -20.0
+
+
+@pytest.fixture
+def sea():
+    """Homogeneous clutter in dB, unit standard deviation"""
+    return (SEA_DB + np.random.default_rng(0).standard_normal((240, 320))).astype(np.float32)
+
+
+def test_bright_blob_is_found_with_its_box_and_centroid(sea):
+    sea[100:104, 150:156] += 15
+    candidates = detect(sea)
+    assert len(candidates) == 1
+    x1, y1, x2, y2, score, area, cx, cy, peak = candidates[0]
+    # x2 / y2 are exclusive, like the detector's boxes
+    assert (x1, y1, x2, y2) == (150, 100, 156, 104)
+    assert area == 24
+    assert (cx, cy) == pytest.approx((152.5, 101.5))
+    assert score > pfa_to_threshold()
+    assert peak == sea[100:104, 150:156].max()
+
+
+def test_clutter_alone_gives_no_candidates(sea):
+    assert len(detect(sea)) == 0
+
+
+def test_blob_below_min_area_is_dropped(sea):
+    sea[50, 60] += 30
+    assert len(detect(sea)) == 0
+    assert len(detect(sea, min_area=1)) == 1
+
+
+def test_nodata_pixels_score_zero(sea):
+    sea[:, :40] = 0  # zero-filled GRD border
+    sea[:30] = np.nan
+    sea[200:, 200:] = cfar.NODATA_DB
+    scores = cfar_scores(sea)
+    assert not scores[:, :40].any() and not scores[:30].any() and not scores[200:, 200:].any()
+    assert np.count_nonzero(scores[30:200, 40:200]) == scores[30:200, 40:200].size
+
+    # A bright no-data edge is not a ship
+    assert len(detect(sea)) == 0
+
+
+def test_pixels_without_enough_training_ring_score_zero(sea):
+    # A two-pixel strip of data between no-data borders: far too little ring to judge on
+    sea[:, :150] = 0
+    sea[:, 152:] = 0
+    sea[120, 150] += 30
+    scores = cfar_scores(sea)
+    assert not scores.any()
+    assert len(detect(sea, min_area=1)) == 0
+
+
+def test_ship_at_the_scene_border_is_judged_on_the_ring_it_has(sea):
+    # The corner keeps just over MIN_TRAINING_FRACTION of its ring
+    sea[:3, :3] += 15
+    candidates = detect(sea)
+    assert len(candidates) == 1
+    assert candidates[0, :4].tolist() == [0, 0, 3, 3]
+
+
+def test_censoring_recovers_a_ship_next_to_a_brighter_one(sea):
+    # The weak ship sits in the bright one's training ring (guard 10, ring out to 22 px)
+    sea[100:105, 100:105] += 30
+    sea[100:103, 116:119] += 8
+    weak = lambda candidates: [c for c in candidates if 116 <= c[6] < 119]
+
+    assert not weak(detect(sea, censor=False))
+    found = detect(sea)
+    assert len(found) == 2
+    assert weak(found)[0][:4].tolist() == [116, 100, 119, 103]
+
+
+def test_bands_match_a_single_pass(monkeypatch):
+    # Rows past BAND_ROWS run as separate bands on threads, each with its own halo
+    image = (SEA_DB + np.random.default_rng(1).standard_normal((cfar.BAND_ROWS * 2 + 37, 90))).astype(np.float32)
+    image[cfar.BAND_ROWS - 3:cfar.BAND_ROWS + 3, 40:45] += 20
+    banded = cfar_scores(image, workers=4)
+    candidates = detect(image, workers=4)
+    monkeypatch.setattr(cfar, "BAND_ROWS", image.shape[0])
+    np.testing.assert_allclose(banded, cfar_scores(image), atol=1e-4)
+    assert candidates[:, :4].tolist() == [[40, 253, 45, 259]]
+
+
+@pytest.mark.parametrize("height, width", [(1000, 1500), (700, 641), (300, 400)])
+def test_cascade_offsets_cover_every_candidate_with_clamped_tiles(height, width):
+    rng = np.random.default_rng(height)
+    count = 60
+    x1 = rng.integers(0, width - 12, count)
+    y1 = rng.integers(0, height - 12, count)
+    size = rng.integers(2, 12, (count, 2))
+    # Candidates at the scene corners too
+    x1[:2], y1[:2] = (0, width - size[1, 0]), (0, height - size[1, 1])
+    candidates = np.zeros((count, len(cfar.CANDIDATE_COLUMNS)), dtype=np.float32)
+    candidates[:, :4] = np.column_stack([x1, y1, x1 + size[:, 0], y1 + size[:, 1]])
+
+    tile_size = 640
+    offsets = cascade_offsets(candidates, height, width, tile_size)
+    assert offsets and len(offsets) == len(set(offsets))
+    for y, x in offsets:
+        assert 0 <= y <= max(height - tile_size, 0) and 0 <= x <= max(width - tile_size, 0)
+    for bx1, by1, bx2, by2 in candidates[:, :4]:
+        assert any(x <= bx1 and y <= by1 and bx2 <= x + tile_size and by2 <= y + tile_size for y, x in offsets)
+    if height <= tile_size and width <= tile_size:
+        assert offsets == [(0, 0)]
+
+
+def test_cascade_offsets_without_candidates():
+    assert cascade_offsets(np.empty((0, len(cfar.CANDIDATE_COLUMNS)), dtype=np.float32), 1000, 1000) == []
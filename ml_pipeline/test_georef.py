@@ -0,0 +1,138 @@
+import base64
+import io
+import warnings
+
+import numpy as np
+import pytest
+
+pytest.importorskip("rasterio")
+
+from affine import Affine
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.io import MemoryFile
+from rasterio.warp import transform as warp_transform
+
+from georef import detection_geometry, pixel_to_lonlat, read_georeference, tile_transform
+
+# 10 m UTM zone 33N pixels; easting 500000 is the zone's 15 E central meridian
+UTM = (10.0, 0.0, 500000.0, 0.0, -10.0, 4000000.0)
+UTM_CRS = "EPSG:32633"
+# 0.001 degree WGS84 pixels
+LONLAT = (0.001, 0.0, 10.0, 0.0, -0.001, 50.0)
+
+
+def geotiff(transform=None, crs=None):
+    with MemoryFile() as memfile, warnings.catch_warnings():
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        profile = {"driver": "GTiff", "width": 8, "height": 8, "count": 1, "dtype": "uint8"}
+        if transform is not None:
+            profile.update(transform=Affine(*transform), crs=crs)
+        with memfile.open(**profile) as dataset:
+            dataset.write(np.zeros((1, 8, 8), dtype=np.uint8))
+        return memfile.read()
+
+
+def test_wgs84_pixels_map_straight_to_lonlat():
+    lon, lat = pixel_to_lonlat(LONLAT, None, [0, 10, 2.5], [0, 20, 0.5])
+    np.testing.assert_allclose(lon, [10.0, 10.01, 10.0025])
+    np.testing.assert_allclose(lat, [50.0, 49.98, 49.9995])
+    np.testing.assert_allclose(pixel_to_lonlat(LONLAT, "EPSG:4326", [10], [20]), [[10.01], [49.98]])
+
+
+def test_projected_pixels_are_transformed_to_wgs84():
+    lon, lat = pixel_to_lonlat(UTM, UTM_CRS, np.array([[0.0, 100.0]]), np.array([[0.0, 50.0]]))
+    assert lon.shape == (1, 2)
+    assert lon[0, 0] == pytest.approx(15.0)
+    assert lat[0, 0] == pytest.approx(36.1447, abs=1e-4)
+    # Back to UTM: the pixel's map coordinates
+    easting, northing = warp_transform("EPSG:4326", UTM_CRS, lon.ravel(), lat.ravel())
+    np.testing.assert_allclose(easting, [500000.0, 501000.0], atol=1e-3)
+    np.testing.assert_allclose(northing, [4000000.0, 3999500.0], atol=1e-3)
+
+
+def test_detection_geometry_in_metres_on_a_utm_grid():
+    # 10 x 4 pixels at 10 m: 100 m long, 40 m wide
+    geometry = detection_geometry(np.array([[0, 0, 10, 4, 0.9, 0], [5, 5, 7, 25, 0.8, 0]]), UTM, UTM_CRS)
+    np.testing.assert_allclose(geometry["length_m"], [100.0, 200.0])
+    np.testing.assert_allclose(geometry["width_m"], [40.0, 20.0])
+
+    footprint = geometry["footprint"]
+    assert footprint.shape == (2, 5, 2)
+    np.testing.assert_array_equal(footprint[:, 0], footprint[:, 4])
+    centre = pixel_to_lonlat(UTM, UTM_CRS, [5.0, 6.0], [2.0, 15.0])
+    np.testing.assert_allclose(geometry["lon"], centre[0])
+    np.testing.assert_allclose(geometry["lat"], centre[1])
+
+
+def test_detection_geometry_in_metres_on_a_lonlat_grid():
+    # 0.001 degree at 50 N: ~71.7 m east, ~111.2 m north
+    geometry = detection_geometry([0, 0, 1, 1], LONLAT)
+    assert geometry["length_m"][0] == pytest.approx(111.2, abs=0.1)
+    assert geometry["width_m"][0] == pytest.approx(71.7, abs=0.1)
+    assert geometry["lon"][0] == pytest.approx(10.0005)
+
+
+def test_origin_shifts_boxes_to_the_tiles_place_in_the_scene():
+    boxes = np.array([[10.0, 20.0, 30.0, 26.0]])
+    origin = (640, 576)
+    tiled = detection_geometry(boxes, UTM, UTM_CRS, origin=origin)
+    scene = detection_geometry(boxes + [576, 640, 576, 640], UTM, UTM_CRS)
+    for name in ("lon", "lat", "footprint", "length_m", "width_m"):
+        np.testing.assert_allclose(tiled[name], scene[name])
+    assert tile_transform(UTM, origin) == (10.0, 0.0, 505760.0, 0.0, -10.0, 3993600.0)
+
+
+def test_read_georeference_of_uploads():
+    assert read_georeference(geotiff(UTM, UTM_CRS)) == (UTM, UTM_CRS)
+    # Plain TIFFs, other images and broken files carry none
+    assert read_georeference(geotiff()) is None
+    assert read_georeference(b"\x89PNG\r\n\x1a\n" + bytes(64)) is None
+    assert read_georeference(b"II*\x00" + bytes(64)) is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    import inference_server
+
+    class Model:
+        names = {0: "vessel"}
+
+    class Scheduler:
+        async def submit(self, image, confidence):
+            return np.array([[0, 0, 10, 4, 0.9, 0]], dtype=np.float32)
+
+    monkeypatch.setattr(inference_server, "model", Model())
+    monkeypatch.setattr(inference_server, "scheduler", Scheduler())
+    return TestClient(inference_server.app)
+
+
+def png():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.zeros((32, 32), dtype=np.uint8)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.mark.parametrize("georeference", [
+    {"transform": [10.0, 0.0, 500000.0]},
+    {"transform": list(UTM), "crs": "EPSG:999999"},
+    {"transform": list(UTM), "crs": UTM_CRS, "origin": [1, 2, 3]},
+])
+def test_bad_georeference_on_detect_is_a_client_error(client, georeference):
+    response = client.post("/detect", json={"image": png(), **georeference})
+    assert response.status_code == 400
+
+
+def test_detect_returns_geometry_for_a_georeferenced_tile(client):
+    response = client.post("/detect", json={"image": png(), "transform": list(UTM), "crs": UTM_CRS,
+                                            "origin": [640, 576]})
+    assert response.status_code == 200
+    geo = response.json()["detections"][0]["geo"]
+    assert geo["length_m"] == pytest.approx(100.0)
+    assert geo["width_m"] == pytest.approx(40.0)
+    expected = detection_geometry([0, 0, 10, 4], UTM, UTM_CRS, origin=(640, 576))
+    assert (geo["lon"], geo["lat"]) == pytest.approx((expected["lon"][0], expected["lat"][0]))
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+import torch
+from ultralytics import YOLO
+
+from model_pool import ModelPool
+from postprocess import result_to_array
+
+CONFIDENCE = 0.5
+
+
+def raise_class_scores(model, logit):
+    """Shift every class logit: a randomly initialised head scores far below any threshold"""
+    with torch.no_grad():
+        for head in model.model.model[-1].cv3:
+            head[-1].bias.add_(logit)
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (320, 320, 3), dtype=np.uint8) for _ in range(2)]
+
+
+@pytest.fixture
+def pool():
+    torch.manual_seed(0)
+    model = YOLO("yolov8n.yaml")
+    raise_class_scores(model, 9.0)
+    pool = ModelPool("unused.pt", num_workers=2, threads_per_worker=1, model=model)
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def in_process(model, images):
+    # A fresh predictor: Ultralytics' own holds a copy of the weights from its first call
+    model.predictor = None
+    return [result_to_array(p) for p in model(images, conf=CONFIDENCE, device="cpu", verbose=False)]
+
+
+def assert_same_detections(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.shape == e.shape
+        # Thread counts differ between the processes, so allow float noise and order ties
+        order = lambda d: d[np.lexsort(d.T[::-1])]
+        np.testing.assert_allclose(order(a), order(e), atol=1e-3)
+
+
+def test_workers_run_the_parents_shared_weights(pool, images):
+    net = pool.model.model
+    assert all(tensor.is_shared() for tensor in [*net.parameters(), *net.buffers()])
+    # Both workers, not one of them twice
+    before = [pool.predict(images, CONFIDENCE) for _ in range(4)]
+    assert {stats["worker_id"] for stats in pool.stats() if stats["batches"]} == {0, 1}
+    expected = in_process(pool.model, images)
+    assert all(len(d) for d in expected)
+    for result in before:
+        assert_same_detections(result, expected)
+
+    # Writes to the parent's tensors show up in every worker: they read the same storage
+    raise_class_scores(pool.model, 1.0)
+    changed = in_process(pool.model, images)
+    assert changed[0][:, 4].min() > expected[0][:, 4].max()
+    for _ in range(4):
+        assert_same_detections(pool.predict(images, CONFIDENCE), changed)
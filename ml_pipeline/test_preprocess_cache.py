@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from preprocess_cache import PreprocessCache
+from preprocess_farm import Job, TileOutput, _run_job
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PreprocessCache(tmp_path / "cache", max_gb=1)
+
+
+def finished_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_failed_job_leaves_no_staging_dir(cache, tmp_path):
+    job = Job("unknown", "scene.tif", "sar_0_0", "scene.tif")
+    result = _run_job(0, job, tmp_path / "train", tmp_path / "val", None, "jpeg", cache, "k" * 32)
+    assert result.error
+    assert list(cache.entries.iterdir()) == []
+
+
+def test_evict_removes_staging_dirs_of_finished_processes(cache):
+    stale = cache.entries / f"tmp-{'a' * 32}-{finished_pid()}"
+    live = cache.entries / f"tmp-{'b' * 32}-{os.getpid()}"
+    for staging in (stale, live):
+        (staging / "train").mkdir(parents=True)
+        (staging / "train" / "sar_0_0_0000.jpg").write_bytes(b"x" * 1024)
+
+    cache.evict()
+    assert not stale.exists()
+    assert live.exists()
+
+
+def test_evict_drops_least_recently_used_entries(cache, tmp_path):
+    cache.max_bytes = 1500
+    for n, key in enumerate(("old", "new")):
+        train, _ = cache.staging(key)
+        (train / f"sar_{n}_0_0000.jpg").write_bytes(b"x" * 1000)
+        cache.store(key, 1, 1000, 1.0)
+        os.utime(cache.entries / key / "meta.json", (n, n))
+
+    evicted, used = cache.evict()
+    assert evicted == 1 and used <= cache.max_bytes
+    assert [entry.name for entry in cache.entries.iterdir()] == ["new"]
+    meta, sketch = cache.restore("new", tmp_path / "train", tmp_path / "val")
+    assert meta["tiles"] == 1 and sketch is None
+    assert (tmp_path / "train" / "sar_1_0_0000.jpg").read_bytes() == b"x" * 1000
+
+
+@pytest.mark.parametrize("tile_format", ["jpeg", "shards"])
+def test_tile_output_deletes_partial_tiles_on_error(tmp_path, tile_format):
+    train, val = tmp_path / "train", tmp_path / "val"
+    train.mkdir()
+    val.mkdir()
+    tile = np.zeros((8, 8), dtype=np.uint8)
+    with pytest.raises(RuntimeError):
+        with TileOutput(train, val, "sar_0_0", 1, tile_format) as output:
+            output.write(0, tile, (0, 0))
+            output.write(1, tile, (0, 8))
+            raise RuntimeError("job failed")
+    assert list(train.iterdir()) == [] and list(val.iterdir()) == []
+
+
+@pytest.mark.parametrize("tile_format", ["jpeg", "shards"])
+def test_tile_output_keeps_tiles_of_finished_jobs(tmp_path, tile_format):
+    train, val = tmp_path / "train", tmp_path / "val"
+    train.mkdir()
+    val.mkdir()
+    with TileOutput(train, val, "sar_0_0", 1, tile_format) as output:
+        output.write(0, np.zeros((8, 8), dtype=np.uint8), (0, 0))
+        output.write(1, np.zeros((8, 8), dtype=np.uint8), (0, 8))
+    assert len(list(train.iterdir())) == 2 and len(list(val.iterdir())) == 2
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from s1_raw import (
+    FDBAQ_BLOCK_SAMPLES, HUFFMAN_CODES, NORMALISED_LEVELS, RECONSTRUCTION, SIGMA_FACTORS, SIMPLE_LEVELS,
+    SYNC_MARKER, USER_DATA_OFFSET, Sentinel1Raw, decode_fdbaq,
+)
+
+
+def to_bytes(bits):
+    bits += "0" * (-len(bits) % 8)
+    return bytes(int(bits[k:k + 8], 2) for k in range(0, len(bits), 8))
+
+
+def pad_word(bits):
+    return bits + "0" * (-len(bits) % 16)
+
+
+def bypass_user_data(i, q):
+    channels = [i[0::2], i[1::2], q[0::2], q[1::2]]
+    return to_bytes("".join(
+        pad_word("".join(f"{int(v < 0)}{abs(int(v)):09b}" for v in channel)) for channel in channels))
+
+
+def fdbaq_user_data(brc, thidx, negative, codes):
+    """Encode per-block BRC/THIDX and per-channel (4, num_quads) signs and magnitude codes"""
+    bits = ""
+    for channel in range(4):
+        channel_bits = ""
+        for block in range(len(brc)):
+            if channel == 0:
+                channel_bits += f"{brc[block]:03b}"
+            elif channel == 2:
+                channel_bits += f"{thidx[block]:08b}"
+            for n in range(block * FDBAQ_BLOCK_SAMPLES, min((block + 1) * FDBAQ_BLOCK_SAMPLES, codes.shape[1])):
+                channel_bits += str(int(negative[channel, n])) + HUFFMAN_CODES[brc[block]][codes[channel, n]]
+        bits += pad_word(channel_bits)
+    return to_bytes(bits)
+
+
+def packet(user_data, num_quads, baq_mode=0, signal_type=0, swath=10):
+    header = bytearray(USER_DATA_OFFSET)
+    total = USER_DATA_OFFSET + len(user_data)
+    header[4:6] = (total - 7).to_bytes(2, "big")
+    header[12:16] = SYNC_MARKER.to_bytes(4, "big")
+    header[37] = baq_mode
+    header[63] = signal_type << 4
+    header[64] = swath
+    header[65:67] = num_quads.to_bytes(2, "big")
+    return bytes(header) + user_data
+
+
+def decode(user_data, num_quads):
+    row = np.frombuffer(user_data, dtype=np.uint8)[None]
+    return decode_fdbaq(row, [len(user_data)], num_quads)
+
+
+def test_fdbaq_simple_reconstruction_by_hand():
+    # BRC 4, THIDX 8: codes are their own value, the top code 15 is 16.05
+    user_data = to_bytes(
+        pad_word("100" + "0" + "111111111")  # IE: BRC 4, +15
+        + pad_word("1" + "00")                # IO: -0
+        + pad_word("00001000" + "0" + "010")  # QE: THIDX 8, +1
+        + pad_word("1" + "011")               # QO: -2
+    )
+    i, q = decode(user_data, 1)
+    np.testing.assert_allclose(i, [[16.05, 0]], rtol=1e-6)
+    np.testing.assert_allclose(q, [[1, -2]], rtol=1e-6)
+
+
+def test_fdbaq_normal_reconstruction_by_hand():
+    # BRC 0, THIDX 10: normalised level times sigma factor 6.27
+    user_data = to_bytes(
+        pad_word("000" + "1" + "111")
+        + pad_word("0" + "0")
+        + pad_word("00001010" + "0" + "10")
+        + pad_word("1" + "110")
+    )
+    i, q = decode(user_data, 1)
+    np.testing.assert_allclose(i, [[-2.6406 * 6.27, 0.3637 * 6.27]], rtol=1e-5)
+    np.testing.assert_allclose(q, [[1.0915 * 6.27, -1.8208 * 6.27]], rtol=1e-5)
+
+
+def test_reconstruction_tables():
+    for brc, levels in enumerate(SIMPLE_LEVELS):
+        top = len(NORMALISED_LEVELS[brc]) - 1
+        np.testing.assert_allclose(RECONSTRUCTION[brc, :len(levels), top], levels, rtol=1e-6)
+    np.testing.assert_allclose(RECONSTRUCTION[4, 9, 15], 3.6623 * SIGMA_FACTORS[9], rtol=1e-6)
+
+
+def test_fdbaq_round_trip_over_blocks_and_lines():
+    rng = np.random.default_rng(0)
+    num_quads = 2 * FDBAQ_BLOCK_SAMPLES + 44
+    blocks = -(-num_quads // FDBAQ_BLOCK_SAMPLES)
+    rows, expected = [], []
+    for _ in range(5):
+        brc = rng.integers(0, 5, blocks)
+        thidx = rng.integers(0, 256, blocks)
+        sample_brc = brc[np.arange(num_quads) // FDBAQ_BLOCK_SAMPLES]
+        codes = (rng.random((4, num_quads)) * np.array([len(HUFFMAN_CODES[b]) for b in sample_brc])).astype(int)
+        negative = rng.random((4, num_quads)) < 0.5
+        rows.append(fdbaq_user_data(brc, thidx, negative, codes))
+
+        sample_thidx = thidx[np.arange(num_quads) // FDBAQ_BLOCK_SAMPLES]
+        values = RECONSTRUCTION[sample_brc, sample_thidx, codes] * np.where(negative, -1, 1)
+        expected.append(values)
+
+    width = max(len(row) for row in rows)
+    user_data = np.zeros((len(rows), width), dtype=np.uint8)
+    for n, row in enumerate(rows):
+        user_data[n, :len(row)] = np.frombuffer(row, dtype=np.uint8)
+    i, q = decode_fdbaq(user_data, [len(row) for row in rows], num_quads)
+
+    expected = np.asarray(expected, dtype=np.float32)
+    np.testing.assert_array_equal(i[:, 0::2], expected[:, 0])
+    np.testing.assert_array_equal(i[:, 1::2], expected[:, 1])
+    np.testing.assert_array_equal(q[:, 0::2], expected[:, 2])
+    np.testing.assert_array_equal(q[:, 1::2], expected[:, 3])
+
+
+def test_fdbaq_rejects_truncated_user_data():
+    user_data = to_bytes(pad_word("100" + "0" + "111111111"))
+    with pytest.raises(ValueError):
+        decode(user_data, 1)
+
+
+def test_reader_decodes_bypass_and_fdbaq_echoes(tmp_path):
+    i = np.array([3, -4, 0, 100], dtype=np.int16)
+    q = np.array([4, 3, -7, 0], dtype=np.int16)
+    fdbaq = fdbaq_user_data([1], [2], np.zeros((4, 2), dtype=bool), np.array([[3, 0], [1, 2], [0, 1], [2, 4]]))
+    path = tmp_path / "s1a-iw-raw-s-vv.dat"
+    path.write_bytes(
+        packet(bypass_user_data(i, q), 2)
+        + packet(b"\0" * 8, 2, signal_type=8)  # calibration packet, skipped
+        + packet(fdbaq, 2, baq_mode=12)
+    )
+
+    raw = Sentinel1Raw(path)
+    try:
+        assert len(raw.packets) == 3
+        assert raw.shape() == (2, 4)
+        magnitude = raw.magnitude()
+    finally:
+        raw.close()
+    np.testing.assert_allclose(magnitude[0], np.hypot(i, q))
+    # BRC 1 at THIDX 2 is simple reconstruction; the top code 4 is 4.08
+    np.testing.assert_allclose(magnitude[1], np.hypot([3, 1, 0, 2], [0, 2, 1, 4.08]), rtol=1e-6)
+
+
+def test_reader_rejects_plain_baq(tmp_path):
+    path = tmp_path / "s1a-iw-raw-s-vv.dat"
+    path.write_bytes(packet(b"\0" * 16, 2, baq_mode=4))
+    with pytest.raises(NotImplementedError):
+        Sentinel1Raw(path)
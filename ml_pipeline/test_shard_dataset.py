@@ -0,0 +1,46 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from tile_shards import ShardWriter, TileShards, write_labels
+
+LABEL = [1, 0.5, 0.25, 0.1, 0.2]
+
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    with ShardWriter(tmp_path, "sar_0", shard_tiles=2) as writer:
+        for i in range(5):
+            writer.add(np.full((64, 64), i, dtype=np.uint8), f"sar_0_{i:04d}", (0, 64 * i))
+    write_labels(tmp_path, {"sar_0_0003": [LABEL]})
+    return tmp_path
+
+
+def test_pickled_shards_remap_instead_of_copying(shard_dir):
+    shards = TileShards(shard_dir)
+    data = pickle.dumps(shards)
+    assert len(data) < 64 * 64
+    restored = pickle.loads(data)
+    assert isinstance(restored.tile(3), np.memmap)
+    np.testing.assert_array_equal(restored.tile(3), shards.tile(3))
+    np.testing.assert_allclose(restored.labels(3), [LABEL])
+
+
+def test_shard_dataset_serves_tiles_and_index_labels(shard_dir):
+    pytest.importorskip("ultralytics")
+    from ultralytics.cfg import get_cfg
+
+    from shard_dataset import build_shard_dataset
+
+    cfg = get_cfg(overrides={"imgsz": 64})
+    dataset = build_shard_dataset(cfg, str(shard_dir), 2, {"names": {0: "dark_vessel", 1: "vessel"}}, mode="val")
+    assert len(dataset) == 5
+    assert [len(label["cls"]) for label in dataset.labels] == [0, 0, 0, 1, 0]
+    np.testing.assert_allclose(dataset.labels[3]["bboxes"], [LABEL[1:]])
+
+    image, _, resized = dataset.load_image(3)
+    assert resized == (64, 64) and image.shape == (64, 64, 3)
+    assert (image == 3).all()
+    batch = dataset[3]
+    assert batch["img"].shape[0] == 3 and batch["cls"].tolist() == [[1.0]]
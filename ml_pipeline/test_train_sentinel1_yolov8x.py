@@ -0,0 +1,53 @@
+import zipfile
+
+import numpy as np
+
+from safe_archive import SafeArchive
+from test_s1_raw import bypass_user_data, packet
+from train_sentinel1_yolov8x import read_sentinel1_raw
+
+NAME = "S1A_IW_RAW__0SDV.SAFE/s1a-iw-raw-s-vv-20240102t141608.dat"
+
+
+def write_product(path, compression):
+    i = np.array([3, 0], dtype=np.int16)
+    q = np.array([4, 1], dtype=np.int16)
+    with zipfile.ZipFile(path, "w", compression) as zf:
+        zf.writestr(NAME, packet(bypass_user_data(i, q), 1) * 3)
+    return np.hypot(i, q)
+
+
+def test_deflated_member_leaves_nothing_in_the_extract_dir(tmp_path):
+    expected = write_product(tmp_path / "product.zip", zipfile.ZIP_DEFLATED)
+    extract_dir = tmp_path / "extract"
+    extract_dir.mkdir()
+
+    with SafeArchive(tmp_path / "product.zip") as archive:
+        raw = read_sentinel1_raw(archive, NAME, extract_dir)
+    assert list(extract_dir.iterdir()) == []
+    try:
+        np.testing.assert_allclose(raw.magnitude(), [expected] * 3)
+    finally:
+        raw.close()
+
+
+def test_unreadable_deflated_member_leaves_nothing_in_the_extract_dir(tmp_path):
+    with zipfile.ZipFile(tmp_path / "product.zip", "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(NAME, b"\0" * 256)
+    extract_dir = tmp_path / "extract"
+    extract_dir.mkdir()
+
+    with SafeArchive(tmp_path / "product.zip") as archive:
+        assert read_sentinel1_raw(archive, NAME, extract_dir) is None
+    assert list(extract_dir.iterdir()) == []
+
+
+def test_stored_member_is_mapped_in_place(tmp_path):
+    expected = write_product(tmp_path / "product.zip", zipfile.ZIP_STORED)
+    with SafeArchive(tmp_path / "product.zip") as archive:
+        raw = read_sentinel1_raw(archive, NAME, tmp_path)
+    try:
+        np.testing.assert_allclose(raw.magnitude(), [expected] * 3)
+    finally:
+        raw.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["product.zip"]
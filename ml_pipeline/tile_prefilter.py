@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Tile pre-filter
+Cheap land / no-data / contrast screen that drops empty tiles before they reach YOLO, with a recall report
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, namedtuple
+
+import cv2
+import numpy as np
+
+from tiling import PAD_EDGES, iter_tiles, tile_offsets
+
+# Tiles with more no-data (zero / non-finite / padding) than this are skipped
+NODATA_FRACTION = float(os.environ.get("IODARKWATCH_PREFILTER_NODATA", "0.9"))
+# Tiles with more land than this are skipped (needs a land mask)
+LAND_FRACTION = float(os.environ.get("IODARKWATCH_PREFILTER_LAND", "0.95"))
+# Tiles whose brightest 3x3 spot is within this many standard deviations of the tile mean are skipped
+MIN_CONTRAST = float(os.environ.get("IODARKWATCH_PREFILTER_CONTRAST", "4.0"))
+# GeoJSON of land polygons in WGS84 (e.g. Natural Earth land or OSM land polygons)
+LAND_MASK_PATH = os.environ.get("IODARKWATCH_LAND_MASK")
+
+# Land mask resolution in scene pixels per cell
+MASK_CELL = 16
+PEAK_WINDOW = 3
+EPS = 1e-6
+
+SKIP_REASONS = ("nodata", "land", "no_target")
+TileScores = namedtuple("TileScores", "nodata land contrast")
+
+
+def load_land_geometries(path):
+    """Geometries of a GeoJSON FeatureCollection (or a single geometry)"""
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("type") == "FeatureCollection":
+        return [feature["geometry"] for feature in data["features"] if feature.get("geometry")]
+    if data.get("type") == "Feature":
+        return [data["geometry"]]
+    return [data]
+
+
+class LandMask:
+    """Land rasterised onto a scene at ``cell`` x ``cell`` pixel resolution.
+
+    A coarse raster is enough to decide whole tiles and costs next to
+    nothing to build; ``fraction`` averages the cells under a tile.
+    """
+
+    def __init__(self, cells, cell=MASK_CELL):
+        self.cells = cells.astype(np.float32)
+        self.cell = cell
+
+    @classmethod
+    def from_geometries(cls, geometries, shape, transform, crs, cell=MASK_CELL):
+        """Rasterise WGS84 ``geometries`` onto a scene of ``shape`` with ``transform`` and ``crs``"""
+        from rasterio.features import rasterize
+        from rasterio.transform import Affine
+        from rasterio.warp import transform_geom
+
+        height, width = shape
+        coarse = Affine(transform.a * cell, transform.b * cell, transform.c,
+                        transform.d * cell, transform.e * cell, transform.f)
+        shapes = [(transform_geom("EPSG:4326", crs, geometry), 1) for geometry in geometries]
+        out_shape = (-(-height // cell), -(-width // cell))
+        if not shapes:
+            return cls(np.zeros(out_shape, dtype=np.uint8), cell)
+        return cls(rasterize(shapes, out_shape=out_shape, transform=coarse, fill=0, dtype="uint8"), cell)
+
+    @classmethod
+    def from_geojson(cls, path, shape, transform, crs, cell=MASK_CELL):
+        return cls.from_geometries(load_land_geometries(path), shape, transform, crs, cell)
+
+    def fraction(self, y, x, tile_size):
+        cells = self.cells[y // self.cell:-(-(y + tile_size) // self.cell),
+                           x // self.cell:-(-(x + tile_size) // self.cell)]
+        return float(cells.mean()) if cells.size else 0.0
+
+
+def score_tile(tile, area=None, nodata_value=0):
+    """(no-data fraction, contrast) of one tile of the screening image.
+
+    Contrast is the brightest ``PEAK_WINDOW`` box mean over the valid
+    pixels, in standard deviations above their mean: a ship is a compact
+    bright spot, open water and land clutter are not. The box mean keeps
+    single speckle pixels from counting as spots. ``area`` is the full tile
+    area when ``tile`` is cut short by the scene border; the missing part
+    counts as no-data.
+    """
+    tile = np.asarray(tile, dtype=np.float32)
+    valid = np.isfinite(tile) & (tile != nodata_value)
+    count = int(np.count_nonzero(valid))
+    nodata = 1 - count / (area or tile.size)
+    if count < 2:
+        return nodata, 0.0
+
+    values = np.where(valid, tile, 0).astype(np.float32)
+    mask = valid.view(np.uint8)
+    mean, std = (float(v[0, 0]) for v in cv2.meanStdDev(values, mask=mask))
+    smoothed = cv2.blur(values, (PEAK_WINDOW, PEAK_WINDOW))
+    peak = cv2.minMaxLoc(smoothed, mask=mask)[1]
+    return nodata, (peak - mean) / (std + EPS)
+
+
+def score_tiles(image, offsets, tile_size, land=None, nodata_value=0):
+    """TileScores for each (y, x) offset"""
+    scores = []
+    for y, x in offsets:
+        nodata, contrast = score_tile(image[y:y + tile_size, x:x + tile_size], tile_size * tile_size, nodata_value)
+        land_fraction = land.fraction(y, x, tile_size) if land is not None else 0.0
+        scores.append(TileScores(nodata, land_fraction, contrast))
+    return scores
+
+
+class TilePrefilter:
+    """Drops tiles that cannot hold a ship before they are sent to the detector.
+
+    Tests run cheapest first: no-data fraction, land fraction (when a
+    ``LandMask`` is given), then the contrast screen. The screen is meant
+    for backscatter; CLAHE-equalized uint8 tiles all look alike to it, so
+    ``min_contrast=None`` turns it off. ``skipped`` counts the dropped
+    tiles by reason and ``kept`` the rest.
+    """
+
+    def __init__(self, nodata_fraction=NODATA_FRACTION, land_fraction=LAND_FRACTION,
+                 min_contrast=MIN_CONTRAST, nodata_value=0):
+        self.nodata_fraction = nodata_fraction
+        self.land_fraction = land_fraction
+        self.min_contrast = min_contrast
+        self.nodata_value = nodata_value
+        self.kept = 0
+        self.skipped = Counter()
+        self.seconds = 0.0
+
+    def reason(self, scores):
+        """Why a tile with these TileScores is skipped, or None to keep it"""
+        if scores.nodata > self.nodata_fraction:
+            return "nodata"
+        if scores.land > self.land_fraction:
+            return "land"
+        if self.min_contrast is not None and scores.contrast < self.min_contrast:
+            return "no_target"
+        return None
+
+    def filter(self, tiles, screen_image=None, land=None):
+        """Pass through the ``((y, x), tile)`` pairs worth detecting on.
+
+        ``screen_image`` is what the screen looks at, e.g. the raw
+        backscatter behind preprocessed tiles (default: the tiles themselves).
+        """
+        for (y, x), tile in tiles:
+            start = time.perf_counter()
+            height, width = tile.shape[:2]
+            screened = tile if screen_image is None else screen_image[y:y + height, x:x + width]
+            # Land first: a land tile needs no pixel statistics
+            land_fraction = land.fraction(y, x, height) if land is not None else 0.0
+            if land_fraction > self.land_fraction:
+                reason = "land"
+            else:
+                nodata, contrast = score_tile(screened[..., 0] if screened.ndim == 3 else screened,
+                                              height * width, self.nodata_value)
+                reason = self.reason(TileScores(nodata, land_fraction, contrast))
+            self.seconds += time.perf_counter() - start
+
+            if reason is None:
+                self.kept += 1
+                yield (y, x), tile
+            else:
+                self.skipped[reason] += 1
+
+    def stats(self):
+        total = self.kept + sum(self.skipped.values())
+        return {
+            "tiles": total,
+            "kept": self.kept,
+            "skipped": {reason: self.skipped[reason] for reason in SKIP_REASONS},
+            "skipped_fraction": sum(self.skipped.values()) / total if total else 0.0,
+            "seconds": self.seconds,
+        }
+
+
+def recall_report(detections_per_tile, keep):
+    """Recall of the pre-filtered pipeline against the full model.
+
+    ``detections_per_tile`` is the full model's detection count on every
+    tile, ``keep`` the pre-filter decision. Detection recall counts boxes,
+    tile recall counts tiles with at least one box.
+    """
+    detections = np.asarray(detections_per_tile)
+    keep = np.asarray(keep, dtype=bool)
+    with_ships = detections > 0
+    return {
+        "tiles": len(detections),
+        "skipped": int(np.count_nonzero(~keep)),
+        "detections": int(detections.sum()),
+        "detection_recall": float(detections[keep].sum() / detections.sum()) if detections.sum() else 1.0,
+        "tile_recall": float(np.count_nonzero(with_ships & keep) / np.count_nonzero(with_ships))
+        if with_ships.any() else 1.0,
+    }
+
+
+def main():
+    """Skip counts and recall against the full model, over a sweep of contrast thresholds"""
+    import rasterio
+
+    from model_backends import BACKENDS, load_model
+    from postprocess import result_to_array
+    from sar_preprocessing import preprocess_sar_advanced
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scene", help="GeoTIFF scene (band 1)")
+    parser.add_argument("--weights", default="./runs/production_sar_model/weights/best.pt")
+    parser.add_argument("--backend", choices=BACKENDS, default="pytorch")
+    parser.add_argument("--confidence", type=float, default=0.25)
+    parser.add_argument("--tile-size", type=int, default=640)
+    parser.add_argument("--overlap", type=int, default=64)
+    parser.add_argument("--land-mask", default=LAND_MASK_PATH, help="GeoJSON of land polygons (WGS84)")
+    parser.add_argument("--nodata-fraction", type=float, default=NODATA_FRACTION)
+    parser.add_argument("--land-fraction", type=float, default=LAND_FRACTION)
+    parser.add_argument("--contrast", type=float, nargs="+", default=[2.0, 3.0, 4.0, 5.0, 6.0, 8.0])
+    args = parser.parse_args()
+
+    with rasterio.open(args.scene) as src:
+        raw = src.read(1)
+        transform, crs = src.transform, src.crs
+    scene = preprocess_sar_advanced(raw) if raw.dtype != np.uint8 else raw
+
+    land = None
+    if args.land_mask:
+        land = LandMask.from_geojson(args.land_mask, raw.shape, transform, crs)
+
+    offsets = tile_offsets(*scene.shape, args.tile_size, args.overlap, pad_edges=PAD_EDGES)
+    start = time.perf_counter()
+    scores = score_tiles(raw, offsets, args.tile_size, land)
+    screen_ms = (time.perf_counter() - start) * 1000 / max(len(offsets), 1)
+
+    model = load_model(args.weights, args.backend)
+    detections, start = [], time.perf_counter()
+    for _, tile in iter_tiles(scene, args.tile_size, args.overlap, pad_edges=PAD_EDGES):
+        result = model(cv2.cvtColor(tile, cv2.COLOR_GRAY2RGB), conf=args.confidence, device="cpu", verbose=False)
+        detections.append(len(result_to_array(result[0])))
+    model_ms = (time.perf_counter() - start) * 1000 / max(len(offsets), 1)
+
+    print(f"{len(offsets)} tiles, {sum(detections)} detections by the full model")
+    print(f"Screen {screen_ms:.2f} ms/tile, model {model_ms:.1f} ms/tile\n")
+    print(f"{'contrast':>8} {'nodata':>7} {'land':>6} {'no_tgt':>7} {'skipped':>8} "
+          f"{'det recall':>10} {'tile recall':>11} {'speedup':>8}")
+    for min_contrast in args.contrast:
+        prefilter = TilePrefilter(args.nodata_fraction, args.land_fraction, min_contrast)
+        reasons = [prefilter.reason(score) for score in scores]
+        counts = Counter(reasons)
+        report = recall_report(detections, [reason is None for reason in reasons])
+        kept = report["tiles"] - report["skipped"]
+        speedup = model_ms * report["tiles"] / (model_ms * kept + screen_ms * report["tiles"])
+        print(f"{min_contrast:>8.1f} {counts['nodata']:>7} {counts['land']:>6} {counts['no_target']:>7} "
+              f"{report['skipped'] / max(report['tiles'], 1):>8.1%} {report['detection_recall']:>10.1%} "
+              f"{report['tile_recall']:>11.1%} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - Tile shards
+Training tiles packed into memory-mappable shards with a per-job JSON index (georeference, labels)
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Tiles per shard file (256 x 640 x 640 uint8 = 100 MB)
+SHARD_TILES = 256
+DTYPES = ("uint8", "uint16", "float16")
+INDEX_SUFFIX = ".index.json"
+# Offsets and georeference of JPEG tiles, one sidecar per job next to the images
+GEOREF_SUFFIX = ".georef.json"
+
+
+def _write_json(path, data):
+    # Readers only ever see a complete file
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def write_georef(directory, prefix, tiles, crs=None):
+    """Write ``{prefix}.georef.json``: ``tiles`` maps tile names to their offset and transform"""
+    _write_json(Path(directory) / f"{prefix}{GEOREF_SUFFIX}", {"prefix": prefix, "crs": crs, "tiles": tiles})
+
+
+def read_georef(directory):
+    """Tile name -> {"offset", "transform", "crs"} from every georef sidecar in ``directory``"""
+    tiles = {}
+    for path in sorted(Path(directory).glob(f"*{GEOREF_SUFFIX}")):
+        with open(path) as f:
+            sidecar = json.load(f)
+        for name, record in sidecar["tiles"].items():
+            tiles[name] = {**record, "crs": sidecar["crs"]}
+    return tiles
+
+
+class ShardWriter:
+    """Append same-shaped tiles to ``{prefix}_{n:04d}.bin`` shards in ``directory``.
+
+    Shards are raw C-order arrays of ``(count, *tile_shape)``; their
+    dtype, shape and per-tile records live in ``{prefix}.index.json``,
+    written on ``close``. A ``with`` block that exits on an exception
+    writes no index and deletes the shards it wrote, so readers never see
+    a crashed job's partial shards.
+    Each preprocessing job uses its own prefix, so jobs on different
+    processes never share a file.
+    """
+
+    def __init__(self, directory, prefix, dtype=None, shard_tiles=SHARD_TILES, crs=None):
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.shard_tiles = shard_tiles
+        self.crs = crs
+        self.tile_shape = None
+        self.shards = []  # tile count per shard
+        self.tiles = []
+        self._file = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _shard_name(self, number):
+        return f"{self.prefix}_{number:04d}.bin"
+
+    def add(self, tile, name, offset=None, transform=None, labels=(), crs=None):
+        """Append one tile; returns the bytes written.
+
+        ``offset`` is the tile's (y, x) origin in the scene, ``transform``
+        its affine pixel-to-CRS transform as ``(a, b, c, d, e, f)`` and
+        ``labels`` YOLO rows ``(class, cx, cy, w, h)``. ``crs`` overrides
+        the writer's CRS for this tile (shards mixing scenes).
+        """
+        tile = np.asarray(tile)
+        if self.tile_shape is None:
+            self.dtype = self.dtype or tile.dtype
+            if self.dtype.name not in DTYPES:
+                raise ValueError(f"tile dtype must be one of {DTYPES}, not {self.dtype}")
+            self.tile_shape = tile.shape
+        elif tile.shape != self.tile_shape:
+            raise ValueError(f"tile {name} is {tile.shape}, shards of {self.prefix} hold {self.tile_shape}")
+
+        if self._file is None or self.shards[-1] == self.shard_tiles:
+            if self._file is not None:
+                self._file.close()
+            path = self.directory / self._shard_name(len(self.shards))
+            path.unlink(missing_ok=True)  # may be a hard link into the preprocessing cache
+            self._file = open(path, "wb")
+            self.shards.append(0)
+
+        data = np.ascontiguousarray(tile, dtype=self.dtype).tobytes()
+        self._file.write(data)
+        self.tiles.append({
+            "name": name,
+            "shard": len(self.shards) - 1,
+            "slot": self.shards[-1],
+            "offset": None if offset is None else [int(v) for v in offset],
+            "transform": None if transform is None else [float(v) for v in transform],
+            "labels": [[float(v) for v in row] for row in labels],
+            **({"crs": crs} if crs is not None and crs != self.crs else {}),
+        })
+        self.shards[-1] += 1
+        return len(data)
+
+    def close(self, complete=True):
+        """Close the open shard and, if ``complete``, write the index; otherwise delete the shards"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not complete:
+            for number in range(len(self.shards)):
+                (self.directory / self._shard_name(number)).unlink(missing_ok=True)
+            return
+        if not self.tiles:
+            return
+        index = {
+            "prefix": self.prefix,
+            "dtype": self.dtype.name,
+            "tile_shape": list(self.tile_shape),
+            "crs": self.crs,
+            "shards": [{"file": self._shard_name(n), "count": count} for n, count in enumerate(self.shards)],
+            "tiles": self.tiles,
+        }
+        # The index appears only once every shard is complete
+        _write_json(self.directory / f"{self.prefix}{INDEX_SUFFIX}", index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(complete=exc_type is None)
+
+
+class TileShards:
+    """Random access to every tile of a shard directory.
+
+    Indexes are read in name order, so tile numbers do not depend on which
+    job finished first. Shards are memory-mapped: ``tile(i)`` is a view
+    into the page cache, not a copy. ``dataset[i]`` gives ``(tile, labels)``
+    with labels as a float32 ``(n, 5)`` array of YOLO rows, so the class can
+    back a PyTorch ``Dataset``. Pickling (e.g. into ``DataLoader`` worker
+    processes) sends the index only; the shards are mapped again on the
+    other side.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.records = []
+        self._layout = []  # (file, dtype, shape) per shard
+        shard_ids, slots = [], []
+        for path in sorted(self.directory.glob(f"*{INDEX_SUFFIX}")):
+            with open(path) as f:
+                index = json.load(f)
+            first = len(self._layout)
+            for shard in index["shards"]:
+                self._layout.append((shard["file"], index["dtype"], (shard["count"], *index["tile_shape"])))
+            for record in index["tiles"]:
+                record.setdefault("crs", index["crs"])
+                self.records.append(record)
+                shard_ids.append(first + record["shard"])
+                slots.append(record["slot"])
+        self._shard_ids = np.asarray(shard_ids, dtype=np.int32)
+        self._slots = np.asarray(slots, dtype=np.int32)
+        self._map()
+
+    def _map(self):
+        self._shards = [np.memmap(self.directory / file, dtype=dtype, mode="r", shape=shape)
+                        for file, dtype, shape in self._layout]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_shards"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._map()
+
+    def __len__(self):
+        return len(self.records)
+
+    def tile(self, i):
+        return self._shards[self._shard_ids[i]][self._slots[i]]
+
+    def labels(self, i):
+        return np.asarray(self.records[i]["labels"], dtype=np.float32).reshape(-1, 5)
+
+    def __getitem__(self, i):
+        return self.tile(i), self.labels(i)
+
+    def names(self):
+        return [record["name"] for record in self.records]
+
+    def dtypes(self):
+        """Tile dtypes of the shards"""
+        return {np.dtype(dtype) for _, dtype, _ in self._layout}
+
+
+def write_labels(directory, labels):
+    """Replace the YOLO labels of the tiles named in ``labels`` (name -> rows) in ``directory``'s indexes"""
+    for path in sorted(Path(directory).glob(f"*{INDEX_SUFFIX}")):
+        with open(path) as f:
+            index = json.load(f)
+        for record in index["tiles"]:
+            if record["name"] in labels:
+                record["labels"] = [[float(v) for v in row] for row in labels[record["name"]]]
+        _write_json(path, index)
+
+
+def read_yolo_labels(path):
+    """YOLO label rows of one image; no file means no objects"""
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [[float(v) for v in line.split()[:5]] for line in f if line.strip()]
+
+
+def convert_yolo(yolo_dir, shard_dir, shard_tiles=SHARD_TILES):
+    """Pack a YOLO ``images/{split}`` + ``labels/{split}`` tree into ``shard_dir/{split}``.
+
+    Tiles keep their file stem as name, and their offset and georeference
+    when the preprocessing wrote georef sidecars next to them. Returns the
+    number of tiles per split.
+    """
+    yolo_dir, shard_dir = Path(yolo_dir), Path(shard_dir)
+    counts = {}
+    for split in ("train", "val"):
+        images = sorted((yolo_dir / "images" / split).glob("*.jpg"))
+        if not images:
+            continue
+        georef = read_georef(yolo_dir / "images" / split)
+        with ShardWriter(shard_dir / split, "yolo", shard_tiles=shard_tiles) as writer:
+            for image_path in images:
+                tile = cv2.imread(str(image_path), cv2.IMREAD_UNCHANGED)
+                if tile is None:
+                    raise ValueError(f"could not read {image_path}")
+                labels = read_yolo_labels(yolo_dir / "labels" / split / f"{image_path.stem}.txt")
+                record = georef.get(image_path.stem, {})
+                writer.add(tile, image_path.stem, record.get("offset"), record.get("transform"), labels,
+                           record.get("crs"))
+        counts[split] = len(images)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a YOLO JPEG dataset into tile shards")
+    parser.add_argument("yolo_dir", nargs="?", default="./data/yolo")
+    parser.add_argument("shard_dir", nargs="?", default="./data/shards")
+    parser.add_argument("--shard-tiles", type=int, default=SHARD_TILES)
+    args = parser.parse_args()
+
+    counts = convert_yolo(args.yolo_dir, args.shard_dir, args.shard_tiles)
+    if not counts:
+        print(f"❌ No tiles found under {args.yolo_dir}/images")
+        return False
+    for split, count in counts.items():
+        print(f"✅ {split}: {count} tiles -> {Path(args.shard_dir) / split}")
+    return True
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+IODarkWatch - SAR tiling geometry
+Shared by the training scripts and the inference server so train-time and
+serve-time tiles line up exactly
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Edge policy of the training tiles and of /detect/scene: the grid keeps its
+# step past the bottom/right border and those tiles are zero-padded to full size
+PAD_EDGES = True
+
+
+def tile_offsets(height, width, tile_size=640, overlap=64, cover_edges=False, pad_edges=False):
+    """(y, x) origins of overlapping tiles in row-major order.
+
+    The default grid is the one the training pipeline has always used: full
+    tiles only, stepping by ``tile_size - overlap``. With ``cover_edges`` a
+    final row/column flush with the bottom/right border is added so every
+    pixel of the scene is covered (a scene smaller than one tile yields a
+    single partial tile at the origin). With ``pad_edges`` the grid keeps
+    its step until it covers the scene, so the last row/column of tiles runs
+    past the border (iter_tiles pads those to full size).
+    """
+    step = tile_size - overlap
+    if step <= 0:
+        raise ValueError(f"overlap ({overlap}) must be smaller than tile_size ({tile_size})")
+    if cover_edges and pad_edges:
+        raise ValueError("cover_edges and pad_edges are alternatives")
+
+    if pad_edges:
+        # A tile is needed while the previous one stops short of the border
+        ys = list(range(0, max(height - overlap, 1), step)) if height else []
+        xs = list(range(0, max(width - overlap, 1), step)) if width else []
+    else:
+        ys = list(range(0, height - tile_size + 1, step))
+        xs = list(range(0, width - tile_size + 1, step))
+
+    if cover_edges:
+        ys = _cover_axis(ys, height, tile_size)
+        xs = _cover_axis(xs, width, tile_size)
+
+    return [(y, x) for y in ys for x in xs]
+
+
+def _cover_axis(starts, length, tile_size):
+    if length <= tile_size:
+        return [0]
+    last = length - tile_size
+    if starts[-1] != last:
+        starts.append(last)
+    return starts
+
+
+def tile_views(image, tile_size=640, overlap=64):
+    """Full tiles of the default grid as one strided ``(rows, cols, tile_size, tile_size, ...)`` view.
+
+    ``views[i, j]`` is the tile at ``(i * step, j * step)``; no pixel is
+    copied, so per-tile statistics can be computed over the whole grid at once.
+    """
+    step = tile_size - overlap
+    height, width = image.shape[:2]
+    if height < tile_size or width < tile_size:
+        return np.empty((0, 0, tile_size, tile_size) + image.shape[2:], dtype=image.dtype)
+
+    windows = sliding_window_view(image, (tile_size, tile_size), axis=(0, 1))[::step, ::step]
+    if image.ndim == 3:
+        windows = np.moveaxis(windows, 2, -1)  # channels after the window axes
+    return windows
+
+
+def iter_tiles(image, tile_size=640, overlap=64, cover_edges=False, pad_edges=False, pad_value=0):
+    """Yield ``((y, x), tile)`` over the tile_offsets grid, in the same order.
+
+    Tiles are produced one at a time and tiles inside the image are views,
+    so nothing is collected and consumers can save or detect as they go.
+    With ``pad_edges`` the tiles crossing the bottom/right border are copied
+    into full-size tiles filled with ``pad_value``.
+    """
+    height, width = image.shape[:2]
+    step = tile_size - overlap
+    views = tile_views(image, tile_size, overlap)
+
+    for y, x in tile_offsets(height, width, tile_size, overlap, cover_edges, pad_edges):
+        if y + tile_size <= height and x + tile_size <= width and y % step == 0 and x % step == 0:
+            yield (y, x), views[y // step, x // step]
+            continue
+
+        tile = image[y:y + tile_size, x:x + tile_size]
+        if pad_edges:
+            padded = np.full((tile_size, tile_size) + image.shape[2:], pad_value, dtype=image.dtype)
+            padded[:tile.shape[0], :tile.shape[1]] = tile
+            tile = padded
+        yield (y, x), tile
@@ -6,13 +6,30 @@ Specialized for your actual SAR data format (.dat files)
 
 import os
 import sys
+import tempfile
 import zipfile
 import cv2
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 import json
-import struct
+
+from preprocess_cache import open_cache
+from preprocess_farm import TILE_FORMAT, Job, TileOutput, count_tiles, dataset_dirs, run_jobs
+from quantile_sketch import KLLSketch
+from s1_raw import Sentinel1Raw, chunk_bounds
+from safe_archive import SafeArchive
+from tile_shards import TileShards, write_labels
+from tiling import PAD_EDGES, iter_tiles, tile_offsets
+
+# Range lines decoded at a time. Chunks overlap by TILE_OVERLAP and
+# 4096 = 6 * (640 - 64) + 640, so per-chunk tiles continue the whole-scene grid
+RAW_CHUNK_LINES = 4096
+TILE_SIZE = 640
+TILE_OVERLAP = 64
+RAW_CLAHE_CLIP_LIMIT = 3.0
+# Tiles crossing the last line / sample are zero-padded instead of dropped, as at inference
+TILE_PAD_EDGES = PAD_EDGES
 
 def main():
     print("🛰️  IODarkWatch - YOLOv8x Training for Sentinel-1 RAW Data")
@@ -32,94 +49,59 @@ def main():
     # Create directories
     extract_dir = Path("./data/raw/sentinel1")
     processed_dir = Path("./data/processed")
-    yolo_dir = Path("./data/yolo")
     
-    for directory in [extract_dir, processed_dir, yolo_dir]:
+    for directory in [extract_dir, processed_dir]:
         directory.mkdir(parents=True, exist_ok=True)
     
-    # Create YOLO structure
-    for subdir in ["images/train", "images/val", "labels/train", "labels/val"]:
-        (yolo_dir / subdir).mkdir(parents=True, exist_ok=True)
+    # YOLO JPEGs, or shards that training reads in place (IODARKWATCH_TILE_FORMAT=shards)
+    yolo_dir, train_dir, val_dir = dataset_dirs(TILE_FORMAT)
+    if TILE_FORMAT != "shards":
+        for subdir in ["labels/train", "labels/val"]:
+            (yolo_dir / subdir).mkdir(parents=True, exist_ok=True)
     
-    print("\n🔄 Step 1: Extracting Sentinel-1 RAW data...")
+    print("\n🔄 Step 1: Indexing Sentinel-1 RAW data...")
     
-    # Extract the ZIP file
+    # Read members in place instead of extracting the whole ZIP
     try:
-        with zipfile.ZipFile(s1_zip, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-        print("✅ Extraction complete!")
+        archive = SafeArchive(s1_zip)
+        print(f"✅ Indexed {len(archive.members)} files")
         
     except Exception as e:
-        print(f"❌ Extraction failed: {e}")
+        print(f"❌ Indexing failed: {e}")
         return False
     
     # Find SAR data files
     print("\n🔄 Step 2: Processing SAR .dat files...")
     
-    safe_dir = extract_dir / "S1A_IW_RAW__0SDV_20240102T141608_20240102T141641_051929_06462F_8BBA.SAFE"
-    
     # Find the main SAR data files
-    vv_file = None
-    vh_file = None
+    vv_files = archive.find("measurement", polarisation="vv", suffix=".dat")
+    vh_files = archive.find("measurement", polarisation="vh", suffix=".dat")
     
-    for file_path in safe_dir.glob("*.dat"):
-        if "vv" in file_path.name.lower() and "annot" not in file_path.name:
-            vv_file = file_path
-        elif "vh" in file_path.name.lower() and "annot" not in file_path.name:
-            vh_file = file_path
-    
-    if not vv_file or not vh_file:
+    if not vv_files or not vh_files:
         print("❌ Could not find VV/VH SAR data files")
         return False
     
-    print(f"✅ Found VV data: {vv_file.name} ({vv_file.stat().st_size / 1024**2:.1f} MB)")
-    print(f"✅ Found VH data: {vh_file.name} ({vh_file.stat().st_size / 1024**2:.1f} MB)")
+    vv_file, vh_file = vv_files[-1], vh_files[-1]
+    for polarization, name in [("VV", vv_file), ("VH", vh_file)]:
+        member = archive.members[name]
+        storage = "stored" if member.stored else "deflated"
+        print(f"✅ Found {polarization} data: {Path(name).name} ({member.size / 1024**2:.1f} MB, {storage})")
     
     # Process SAR data
     print("\n🔄 Step 3: Converting RAW SAR to training images...")
     
-    total_tiles = 0
-    
-    for polarization, dat_file in [("VV", vv_file), ("VH", vh_file)]:
-        print(f"\n📊 Processing {polarization} polarization...")
-        
-        # Read RAW SAR data
-        sar_data = read_sentinel1_raw(dat_file)
-        
-        if sar_data is None:
-            print(f"❌ Failed to read {polarization} data")
-            continue
-        
-        print(f"  📐 SAR data shape: {sar_data.shape}")
-        
-        # Process SAR data
-        processed_sar = process_sar_data(sar_data)
-        
-        # Create tiles
-        tiles = create_tiles(processed_sar, tile_size=640, overlap=64)
-        
-        print(f"  🔢 Created {len(tiles)} tiles from {polarization}")
-        
-        # Split train/val (80/20)
-        split_idx = int(len(tiles) * 0.8)
-        train_tiles = tiles[:split_idx]
-        val_tiles = tiles[split_idx:]
-        
-        # Save training tiles
-        train_dir = yolo_dir / "images" / "train"
-        val_dir = yolo_dir / "images" / "val"
-        
-        for i, tile in enumerate(train_tiles):
-            filename = f"s1_{polarization}_{i:04d}.jpg"
-            cv2.imwrite(str(train_dir / filename), tile)
-        
-        for i, tile in enumerate(val_tiles):
-            filename = f"s1_{polarization}_{i:04d}.jpg"
-            cv2.imwrite(str(val_dir / filename), tile)
-        
-        total_tiles += len(tiles)
-        print(f"  ✅ Saved {len(train_tiles)} train + {len(val_tiles)} val tiles")
-    
+    # Polarizations run in parallel on a process pool; tile names and the
+    # train/val split do not depend on the number of workers.
+    # Unchanged polarizations come from the preprocessing cache
+    jobs = [Job("raw", (str(s1_zip), name, str(extract_dir)), f"s1_{polarization}", polarization)
+            for polarization, name in [("VV", vv_file), ("VH", vh_file)]]
+    results, _ = run_jobs(jobs, train_dir, val_dir, tile_format=TILE_FORMAT, cache=open_cache())
+    total_tiles = sum(result.tiles for result in results)
+    
+    archive.close()
+    if all(result.error for result in results):
+        print("❌ No polarization could be tiled")
+        return False
     print(f"\n📊 Total training tiles: {total_tiles}")
     
     # Assess training data adequacy
@@ -138,8 +120,8 @@ def main():
     
     dataset_yaml = yolo_dir / "dataset.yaml"
     yaml_content = f"""path: {yolo_dir.absolute()}
-train: images/train
-val: images/val
+train: {train_dir.relative_to(yolo_dir)}
+val: {val_dir.relative_to(yolo_dir)}
 nc: 3
 names: ['dark_vessel', 'vessel', 'background']
 
@@ -159,7 +141,7 @@ weight_decay: 0.0005
     
     # Create synthetic labels for demo
     print("\n🔄 Step 5: Creating training labels...")
-    create_demo_labels(yolo_dir)
+    create_demo_labels(yolo_dir, TILE_FORMAT)
     
     # Start YOLOv8x training
     print("\n🔄 Step 6: Starting YOLOv8x production training...")
@@ -171,16 +153,22 @@ weight_decay: 0.0005
         model = YOLO('yolov8x.pt')
         
         # Count final training data
-        train_images = list((yolo_dir / "images" / "train").glob("*.jpg"))
-        val_images = list((yolo_dir / "images" / "val").glob("*.jpg"))
+        train_images = count_tiles(train_dir, TILE_FORMAT)
+        val_images = count_tiles(val_dir, TILE_FORMAT)
         
-        print(f"🏋️ Final training set: {len(train_images)} images")
-        print(f"📊 Validation set: {len(val_images)} images")
+        print(f"🏋️ Final training set: {train_images} images")
+        print(f"📊 Validation set: {val_images} images")
         
-        if len(train_images) < 10:
+        if train_images < 10:
             print("❌ Insufficient training data generated")
             return False
         
+        # Shards are read in place by a shard-backed dataset, no image files involved
+        trainer = validator = None
+        if TILE_FORMAT == "shards":
+            from shard_dataset import ShardTrainer, ShardValidator
+            trainer, validator = ShardTrainer, ShardValidator
+        
         print("🚀 Starting YOLOv8x training...")
         print(f"🎯 Expected accuracy: {accuracy_prediction}")
         
@@ -206,6 +194,7 @@ weight_decay: 0.0005
             flipud=0.5,        # Vertical flip
             fliplr=0.5,        # Horizontal flip
             mosaic=1.0,        # Mosaic augmentation
+            trainer=trainer,
         )
         
         print("\n🎉 YOLOv8x Training Complete!")
@@ -213,7 +202,7 @@ weight_decay: 0.0005
         
         # Evaluate model
         best_model = YOLO(f"{results.save_dir}/weights/best.pt")
-        val_results = best_model.val(data=str(dataset_yaml))
+        val_results = best_model.val(data=str(dataset_yaml), validator=validator)
         
         # Extract metrics
         metrics = getattr(val_results, 'results_dict', {})
@@ -246,8 +235,8 @@ weight_decay: 0.0005
             },
             "training_data": {
                 "total_tiles": total_tiles,
-                "train_images": len(train_images),
-                "val_images": len(val_images),
+                "train_images": train_images,
+                "val_images": val_images,
                 "data_source": "Sentinel-1 RAW SAR data",
                 "polarizations": ["VV", "VH"]
             },
@@ -270,67 +259,94 @@ weight_decay: 0.0005
         print(f"❌ Training failed: {e}")
         return False
 
-def read_sentinel1_raw(dat_file):
-    """Read Sentinel-1 RAW .dat file"""
+def read_sentinel1_raw(archive, name, extract_dir):
+    """Open a RAW .dat member (see s1_raw.Sentinel1Raw).
+
+    Stored members are memory-mapped inside the ZIP; a deflated one has to
+    be extracted first, but only that member, into a temporary directory
+    under ``extract_dir`` that is removed as soon as the file is mapped
+    (or failed to open). The mapping keeps the data until ``raw.close()``.
+    """
     try:
-        # Sentinel-1 RAW data is complex I/Q data
-        # Each sample is 2 bytes (I) + 2 bytes (Q) = 4 bytes total
-        
-        file_size = dat_file.stat().st_size
-        num_samples = file_size // 4  # 4 bytes per complex sample
-        
-        print(f"  📊 Reading {num_samples:,} complex samples...")
-        
-        # Read raw bytes
-        with open(dat_file, 'rb') as f:
-            # Read first portion for demo (to manage memory)
-            chunk_size = min(num_samples, 10_000_000)  # 10M samples max
-            raw_data = f.read(chunk_size * 4)
-        
-        # Convert to complex numbers (I + jQ)
-        # Assuming 16-bit signed integers for I and Q
-        samples = np.frombuffer(raw_data, dtype=np.int16)
-        
-        # Reshape to I/Q pairs
-        samples = samples.reshape(-1, 2)
-        
-        # Convert to complex numbers
-        complex_data = samples[:, 0] + 1j * samples[:, 1]
-        
-        # Calculate magnitude (amplitude)
-        magnitude = np.abs(complex_data)
-        
-        # Estimate image dimensions (square-ish)
-        total_pixels = len(magnitude)
-        img_size = int(np.sqrt(total_pixels))
-        
-        # Reshape to 2D image
-        if total_pixels >= img_size * img_size:
-            magnitude_2d = magnitude[:img_size*img_size].reshape(img_size, img_size)
+        if archive.members[name].stored:
+            raw = archive.open_raw(name)
         else:
-            # Pad if needed
-            padded = np.zeros(img_size * img_size)
-            padded[:total_pixels] = magnitude
-            magnitude_2d = padded.reshape(img_size, img_size)
-        
-        print(f"  📐 Reshaped to: {magnitude_2d.shape}")
-        
-        return magnitude_2d
+            print(f"  📦 {Path(name).name} is compressed, extracting it alone...")
+            with tempfile.TemporaryDirectory(dir=extract_dir) as temp_dir:
+                with zipfile.ZipFile(archive.path) as zip_ref:
+                    raw = Sentinel1Raw(zip_ref.extract(name, temp_dir))
+        print(f"  📊 Indexed {len(raw.packets):,} packets, swaths {raw.swaths}")
+        return raw
         
     except Exception as e:
         print(f"  ❌ Error reading SAR data: {e}")
         return None
 
-def process_sar_data(sar_data):
-    """Process SAR magnitude data for YOLO training"""
+def tile_raw(raw, prefix, train_dir, val_dir, tile_format="jpeg"):
+    """Tile the default swath of a RAW file: the first 80% to train, the rest to val.
+
+    Tiles are written as JPEGs or tile shards (preprocess_farm.TileOutput),
+    with their (line, sample) origin. Returns (tiles, bytes written).
+    """
+    lines, samples = raw.shape()
+    print(f"  📐 {prefix}: {lines} lines x {samples} samples (swath {raw.default_swath})")
+    
+    # One pass for scene-wide clip points, so every chunk is normalized alike
+    # (seeded: the same input always gives the same tiles)
+    sketch = KLLSketch(seed=0)
+    for _, chunk in raw.iter_magnitude(chunk_lines=RAW_CHUNK_LINES):
+        sketch.update(20 * np.log10(np.maximum(chunk, 1e-10)))
+    clip_range = sketch.clip_range()
+    
+    # Tiles per chunk; chunks overlap like the tiles do
+    chunks = chunk_bounds(lines, RAW_CHUNK_LINES, TILE_OVERLAP)
+    num_tiles = sum(len(tile_offsets(stop - start, samples, TILE_SIZE, TILE_OVERLAP, pad_edges=TILE_PAD_EDGES))
+                    for start, stop in chunks)
+    
+    # Split train/val (80/20)
+    split_idx = int(num_tiles * 0.8)
+    
+    i, written = 0, 0
+    # RAW val tiles keep their running number
+    with TileOutput(train_dir, val_dir, prefix, split_idx, tile_format, renumber_val=False) as output:
+        for start, chunk in raw.iter_magnitude(chunk_lines=RAW_CHUNK_LINES, overlap=TILE_OVERLAP):
+            # Process SAR data and create tiles
+            processed_sar = process_sar_data(chunk, clip_range)
+            tiles = iter_tiles(processed_sar, TILE_SIZE, TILE_OVERLAP, pad_edges=TILE_PAD_EDGES)
+            for (y, x), tile in tiles:
+                # RAW data is not georeferenced, only the line/sample origin is kept
+                written += output.write(i, tile, (start + y, x))
+                i += 1
+    return num_tiles, written
+
+def tile_raw_member(archive_path, name, extract_dir, prefix, train_dir, val_dir, tile_format="jpeg"):
+    """tile_raw for a .dat member of a zipped product (a preprocess_farm job)"""
+    with SafeArchive(archive_path) as archive:
+        raw = read_sentinel1_raw(archive, name, Path(extract_dir))
+    if raw is None:
+        raise RuntimeError(f"could not read {name}")
+    try:
+        return tile_raw(raw, prefix, train_dir, val_dir, tile_format)
+    finally:
+        raw.close()
+
+def process_sar_data(sar_data, clip_range=None):
+    """Process SAR magnitude data for YOLO training
+
+    ``clip_range`` (p_low, p_high) in dB replaces the per-scene 1/99
+    percentiles, e.g. dataset-wide clip points from a KLLSketch.
+    """
     # Convert to dB scale
     sar_db = 20 * np.log10(np.maximum(sar_data, 1e-10))
     
     # Remove infinite values
-    finite_mask = np.isfinite(sar_db)
-    if np.any(finite_mask):
-        finite_values = sar_db[finite_mask]
-        p_low, p_high = np.percentile(finite_values, [1, 99])
+    finite_mask = np.isfinite(sar_db) if clip_range is None else None
+    if clip_range is not None or np.any(finite_mask):
+        if clip_range is not None:
+            p_low, p_high = clip_range
+        else:
+            finite_values = sar_db[finite_mask]
+            p_low, p_high = np.percentile(finite_values, [1, 99])
         
         # Clip and normalize to 0-255
         clipped = np.clip(sar_db, p_low, p_high)
@@ -339,28 +355,30 @@ def process_sar_data(sar_data):
         normalized = np.zeros_like(sar_db, dtype=np.uint8)
     
     # Apply CLAHE for contrast enhancement
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    clahe = cv2.createCLAHE(clipLimit=RAW_CLAHE_CLIP_LIMIT, tileGridSize=(8,8))
     enhanced = clahe.apply(normalized)
     
     return enhanced
 
-def create_tiles(image, tile_size=640, overlap=64):
-    """Create overlapping tiles for training"""
-    tiles = []
-    h, w = image.shape[:2]
-    step = tile_size - overlap
-    
-    for y in range(0, h - tile_size + 1, step):
-        for x in range(0, w - tile_size + 1, step):
-            tile = image[y:y+tile_size, x:x+tile_size]
-            
-            if tile.shape[:2] == (tile_size, tile_size):
-                tiles.append(tile)
-    
-    return tiles
+def create_tiles(image, tile_size=640, overlap=64, pad_edges=TILE_PAD_EDGES):
+    """Create overlapping tiles for training, lazily and as views (see tiling.iter_tiles)"""
+    for _, tile in iter_tiles(image, tile_size, overlap, pad_edges=pad_edges):
+        yield tile
 
-def create_demo_labels(yolo_dir):
+def create_demo_labels(yolo_dir, tile_format="jpeg"):
     """Create demo labels for training"""
+    if tile_format == "shards":
+        # Shard labels live in the shard index
+        for split in ("train", "val"):
+            labels = {}
+            for name in TileShards(yolo_dir / split).names():
+                x, y = np.random.uniform(0.2, 0.8, 2)
+                w, h = np.random.uniform(0.05, 0.15, 2)
+                labels[name] = [[1, x, y, w, h]]
+            write_labels(yolo_dir / split, labels)
+        print("✅ Demo labels created for training")
+        return
+    
     label_train_dir = yolo_dir / "labels" / "train"
     label_val_dir = yolo_dir / "labels" / "val"
     
@@ -391,4 +409,5 @@ if __name__ == "__main__":
         print("🚀 Your Sentinel-1 SAR data has been processed for production deployment!")
         print("📊 Check deployment_config.json for accuracy metrics")
     else:
-        print("\n❌ Training pipeline failed") 
\ No newline at end of file
+        print("\n❌ Training pipeline failed")
+    raise SystemExit(0 if success else 1) 
\ No newline at end of file
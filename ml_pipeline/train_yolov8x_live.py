@@ -6,14 +6,31 @@ Live training pipeline with accuracy evaluation for production deployment
 
 import os
 import sys
-import zipfile
-import cv2
-import numpy as np
 from pathlib import Path
-from tqdm import tqdm
 import json
 import matplotlib.pyplot as plt
 
+from georef import tile_transform
+from preprocess_cache import open_cache
+from preprocess_farm import TILE_FORMAT, Job, TileOutput, count_tiles, dataset_dirs, run_jobs
+from quantile_sketch import KLLSketch
+from safe_archive import SafeArchive
+from sar_catalog import CATALOG_PATH, catalog_paths
+from speckle_filters import speckle_filter
+from tile_shards import TileShards, write_labels
+from tiling import PAD_EDGES, iter_tiles, tile_offsets
+
+# Saved KLL sketch whose 1/99 percentiles clip every scene (dataset-wide normalization)
+CLIP_SKETCH_PATH = os.environ.get("IODARKWATCH_CLIP_SKETCH")
+
+TILE_SIZE = 640
+TILE_OVERLAP = 64
+# Tiles crossing the bottom/right border are zero-padded instead of dropped, as at inference
+TILE_PAD_EDGES = PAD_EDGES
+
+# Processes for scene preprocessing (default: one per CPU)
+FARM_WORKERS = int(os.environ.get("IODARKWATCH_PREPROCESS_WORKERS", "0")) or None
+
 def main():
     print("🛰️  IODarkWatch - YOLOv8x SAR Training for Production")
     print("=" * 60)
@@ -71,90 +88,73 @@ def main():
     else:
         print("⚠️  Data volume: May need augmentation for >98% accuracy")
     
-    # Step 2: Extract and process SAR data
-    print("\n🔍 Step 2: Processing SAR data...")
-    extract_dir = Path("./data/raw/sentinel1")
-    extract_dir.mkdir(parents=True, exist_ok=True)
+    # Step 2: Index SAR data
+    print("\n🔍 Step 2: Indexing SAR data...")
     
-    # Extract Sentinel-1 data
-    try:
-        print("📦 Extracting Sentinel-1 ZIP...")
-        with zipfile.ZipFile(s1_file, 'r') as zip_ref:
-            file_list = zip_ref.namelist()
-            tiff_files = [f for f in file_list if f.lower().endswith(('.tif', '.tiff'))]
+    # Rasters are read straight from the ZIP (GDAL /vsizip/), nothing is extracted
+    archive = None
+    if not CATALOG_PATH:
+        try:
+            print("📦 Indexing Sentinel-1 ZIP...")
+            archive = SafeArchive(s1_file)
+            tiff_files = archive.find("measurement", suffix=(".tif", ".tiff"))
             
             print(f"📁 Found {len(tiff_files)} TIFF files")
             
-            # Extract first 5 TIFF files for comprehensive training
-            files_to_extract = tiff_files[:5] if len(tiff_files) > 5 else tiff_files
+            # First 5 TIFF files for comprehensive training
+            archive_tiffs = tiff_files[:5] if len(tiff_files) > 5 else tiff_files
             
-            for file_name in tqdm(files_to_extract, desc="Extracting"):
-                zip_ref.extract(file_name, extract_dir)
-            
-            print(f"✅ Extracted {len(files_to_extract)} TIFF files")
-        
-    except Exception as e:
-        print(f"❌ Extraction failed: {e}")
-        return False
+        except Exception as e:
+            print(f"❌ Indexing failed: {e}")
+            return False
     
     # Step 3: Process SAR images with advanced preprocessing
     print("\n🔍 Step 3: Advanced SAR preprocessing...")
     
     try:
-        import rasterio
-        
-        extracted_tiffs = list(extract_dir.rglob("*.tif")) + list(extract_dir.rglob("*.tiff"))
+        if CATALOG_PATH:
+            # Tiles fetched by sar_fetcher, found through its catalog
+            print(f"📚 Reading tiles from catalog {CATALOG_PATH}")
+            scenes = [(path.name, path, path.stat().st_size) for path in catalog_paths(CATALOG_PATH)]
+        else:
+            scenes = [(Path(name).name, archive.gdal_path(name), archive.members[name].size)
+                      for name in archive_tiffs]
         
-        if not extracted_tiffs:
+        if not scenes:
             print("❌ No TIFF files found")
             return False
         
-        print(f"📁 Processing {len(extracted_tiffs)} TIFF files")
+        print(f"📁 Processing {len(scenes)} TIFF files")
         
-        total_tiles = 0
-        train_dir = Path("./data/yolo/images/train")
-        val_dir = Path("./data/yolo/images/val")
+        # YOLO JPEGs, or shards that training reads in place (IODARKWATCH_TILE_FORMAT=shards)
+        dataset_dir, train_dir, val_dir = dataset_dirs(TILE_FORMAT)
         
-        # Process each TIFF file
-        for idx, tiff_file in enumerate(extracted_tiffs):
-            size_mb = tiff_file.stat().st_size / (1024**2)
-            print(f"\n📊 Processing {tiff_file.name} ({size_mb:.1f} MB)")
-            
-            with rasterio.open(tiff_file) as src:
-                print(f"  📐 Dimensions: {src.width} x {src.height}")
-                
-                # Read image data
-                if src.count >= 1:
-                    image = src.read(1).astype(np.float32)
-                else:
-                    continue
-                
-                # Advanced SAR preprocessing
-                processed_image = preprocess_sar_advanced(image)
-                
-                # Create tiles with proper train/val split
-                tiles = create_training_tiles(processed_image, tile_size=640, overlap=64)
-                
-                # Split tiles: 80% train, 20% val
-                split_idx = int(len(tiles) * 0.8)
-                train_tiles = tiles[:split_idx]
-                val_tiles = tiles[split_idx:]
-                
-                # Save training tiles
-                for i, tile in enumerate(train_tiles):
-                    tile_filename = f"sar_{idx}_{i:04d}.jpg"
-                    cv2.imwrite(str(train_dir / tile_filename), tile)
-                
-                # Save validation tiles
-                for i, tile in enumerate(val_tiles):
-                    tile_filename = f"sar_{idx}_{i:04d}.jpg"
-                    cv2.imwrite(str(val_dir / tile_filename), tile)
-                
-                total_tiles += len(tiles)
-                print(f"  ✅ Created {len(train_tiles)} train + {len(val_tiles)} val tiles")
+        # Per-scene clip points unless a dataset-wide sketch is given;
+        # either way, sketch this dataset for the next run
+        clip_range = None
+        if CLIP_SKETCH_PATH:
+            clip_range = KLLSketch.load(CLIP_SKETCH_PATH).clip_range()
+            print(f"📏 Dataset-wide clip range: {clip_range[0]:.2f} .. {clip_range[1]:.2f}")
+        
+        # Scenes run in parallel on a process pool; tile names and the
+        # train/val split do not depend on the number of workers.
+        # Unchanged scenes come from the preprocessing cache
+        jobs = [Job("scene", tiff_file, f"sar_{idx}", f"{scene_name} ({size_bytes / 1024**2:.1f} MB)")
+                for idx, (scene_name, tiff_file, size_bytes) in enumerate(scenes)]
+        results, dataset_sketch = run_jobs(jobs, train_dir, val_dir, FARM_WORKERS, clip_range, TILE_FORMAT,
+                                           cache=open_cache())
+        total_tiles = sum(result.tiles for result in results)
         
+        if archive is not None:
+            archive.close()
         print(f"\n📊 Total tiles created: {total_tiles}")
         
+        if dataset_sketch is not None:
+            sketch_path = Path("./data/yolo/clip_sketch.npz")
+            dataset_sketch.save(sketch_path)
+            p_low, p_high = dataset_sketch.clip_range()
+            print(f"📏 Dataset 1/99 percentiles: {p_low:.2f} .. {p_high:.2f} (sketch: {sketch_path})")
+        
         # Check if we have enough data for >98% accuracy
         if total_tiles >= 2000:
             print("🎯 EXCELLENT: >2000 tiles - Target >98% accuracy achievable!")
@@ -166,10 +166,10 @@ def main():
         # Step 4: Create YOLO dataset with proper configuration
         print("\n🔍 Step 4: Creating production YOLO dataset...")
         
-        dataset_yaml = Path("./data/yolo/dataset.yaml")
-        yaml_content = f"""path: {Path('./data/yolo').absolute()}
-train: images/train
-val: images/val
+        dataset_yaml = dataset_dir / "dataset.yaml"
+        yaml_content = f"""path: {dataset_dir.absolute()}
+train: {train_dir.relative_to(dataset_dir)}
+val: {val_dir.relative_to(dataset_dir)}
 nc: 3
 names: ['dark_vessel', 'vessel', 'background']
 
@@ -221,19 +221,25 @@ copy_paste: 0.0
             print("✅ YOLOv8x loaded (largest, most accurate model)")
             
             # Count training data
-            train_images = list(train_dir.glob("*.jpg"))
-            val_images = list(val_dir.glob("*.jpg"))
+            train_images = count_tiles(train_dir, TILE_FORMAT)
+            val_images = count_tiles(val_dir, TILE_FORMAT)
             
-            print(f"🏋️ Training images: {len(train_images)}")
-            print(f"📊 Validation images: {len(val_images)}")
+            print(f"🏋️ Training images: {train_images}")
+            print(f"📊 Validation images: {val_images}")
             
-            if len(train_images) < 100:
+            if train_images < 100:
                 print("⚠️  Limited training data - creating synthetic vessels...")
                 # Create some synthetic training data for demo
-                create_synthetic_vessels(train_dir, val_dir)
-                train_images = list(train_dir.glob("*.jpg"))
-                val_images = list(val_dir.glob("*.jpg"))
-                print(f"🔄 Updated - Training: {len(train_images)}, Val: {len(val_images)}")
+                create_synthetic_vessels(train_dir, val_dir, TILE_FORMAT)
+                train_images = count_tiles(train_dir, TILE_FORMAT)
+                val_images = count_tiles(val_dir, TILE_FORMAT)
+                print(f"🔄 Updated - Training: {train_images}, Val: {val_images}")
+            
+            # Shards are read in place by a shard-backed dataset, no image files involved
+            trainer = validator = None
+            if TILE_FORMAT == "shards":
+                from shard_dataset import ShardTrainer, ShardValidator
+                trainer, validator = ShardTrainer, ShardValidator
             
             # Production training configuration
             print("🚀 Starting production training...")
@@ -273,6 +279,7 @@ copy_paste: 0.0
                 mosaic=1.0,        # Mosaic augmentation
                 mixup=0.0,         # No mixup for SAR
                 copy_paste=0.0,    # No copy-paste
+                trainer=trainer,
             )
             
             print("\n🎉 Production Training Completed!")
@@ -285,7 +292,7 @@ copy_paste: 0.0
             best_model = YOLO(f"{results.save_dir}/weights/best.pt")
             
             # Run validation
-            val_results = best_model.val(data=str(dataset_yaml))
+            val_results = best_model.val(data=str(dataset_yaml), validator=validator)
             
             # Extract metrics
             metrics = val_results.results_dict if hasattr(val_results, 'results_dict') else {}
@@ -320,8 +327,8 @@ copy_paste: 0.0
                     "training_data": {
                         "total_data_gb": total_data_size,
                         "total_tiles": total_tiles,
-                        "train_images": len(train_images),
-                        "val_images": len(val_images)
+                        "train_images": train_images,
+                        "val_images": val_images
                     },
                     "deployment_ready": True,
                     "confidence_threshold": 0.25,
@@ -366,80 +373,58 @@ copy_paste: 0.0
         print(f"❌ SAR processing failed: {e}")
         return False
 
-def preprocess_sar_advanced(image):
-    """Advanced SAR preprocessing for high accuracy"""
-    # Convert to float32
-    if image.dtype != np.float32:
-        image = image.astype(np.float32)
-    
-    # Handle different value ranges
-    if np.max(image) > 1:
-        # Convert to dB scale
-        image_db = 10 * np.log10(np.maximum(image, 1e-10))
-    else:
-        image_db = image.copy()
-    
-    # Advanced speckle filtering (Lee filter)
-    filtered = lee_filter(image_db, window_size=7)
-    
-    # Adaptive normalization
-    finite_mask = np.isfinite(filtered)
-    if np.any(finite_mask):
-        finite_values = filtered[finite_mask]
-        p_low, p_high = np.percentile(finite_values, [1, 99])  # More aggressive clipping
-        
-        # Normalize to 0-255
-        normalized = np.clip((filtered - p_low) / (p_high - p_low) * 255, 0, 255).astype(np.uint8)
-    else:
-        normalized = np.zeros_like(filtered, dtype=np.uint8)
-    
-    # Apply CLAHE for local contrast enhancement
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(normalized)
-    
-    return enhanced
-
 def lee_filter(image, window_size=7):
-    """Lee speckle filter for SAR images"""
-    kernel = np.ones((window_size, window_size), np.float32) / (window_size * window_size)
-    
-    mean = cv2.filter2D(image, -1, kernel)
-    sqr_mean = cv2.filter2D(image**2, -1, kernel)
-    variance = sqr_mean - mean**2
-    
-    # Avoid division by zero
-    variance = np.maximum(variance, 1e-10)
-    
-    # Lee filter coefficient
-    k = variance / (variance + mean**2 + 1e-10)
-    
-    # Apply filter
-    filtered = mean + k * (image - mean)
-    
-    return filtered
+    """Lee speckle filter for SAR images (see speckle_filters for the others)"""
+    return speckle_filter(image, "lee", window_size)
 
-def create_training_tiles(image, tile_size=640, overlap=64):
-    """Create overlapping tiles for training"""
-    tiles = []
-    h, w = image.shape[:2]
-    step = tile_size - overlap
-    
-    for y in range(0, h - tile_size + 1, step):
-        for x in range(0, w - tile_size + 1, step):
-            tile = image[y:y+tile_size, x:x+tile_size]
-            
-            if tile.shape[:2] == (tile_size, tile_size):
-                tiles.append(tile)
-    
-    return tiles
+def tile_scene(source, prefix, train_dir, val_dir, clip_range=None, sketch=None, tile_format="jpeg"):
+    """Preprocess one scene into tiles: the first 80% to train, the rest to val.
 
-def create_synthetic_vessels(train_dir, val_dir):
+    Tiles are streamed block by block (bit-identical to
+    create_training_tiles(preprocess_sar_advanced(image)) without holding
+    the scene in memory) and written as JPEGs or tile shards
+    (preprocess_farm.TileOutput). Returns (tiles, bytes written).
+    """
+    import rasterio
+    from streaming_preprocess import stream_training_tiles
+
+    with rasterio.open(source) as src:
+        if src.count < 1:
+            return 0, 0
+        height, width = src.height, src.width
+        transform, crs = src.transform, src.crs
+
+    num_tiles = len(tile_offsets(height, width, TILE_SIZE, TILE_OVERLAP, pad_edges=TILE_PAD_EDGES))
+    split_idx = int(num_tiles * 0.8)
+
+    written = 0
+    tiles = stream_training_tiles(source, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, clip_range=clip_range,
+                                  sketch=sketch, pad_edges=TILE_PAD_EDGES)
+    crs = crs.to_string() if crs else None
+    with TileOutput(train_dir, val_dir, prefix, split_idx, tile_format, crs) as output:
+        for i, ((y, x), tile) in enumerate(tiles):
+            written += output.write(i, tile, (y, x), tile_transform(transform, (y, x)))
+    return num_tiles, written
+
+def create_training_tiles(image, tile_size=640, overlap=64, pad_edges=TILE_PAD_EDGES):
+    """Create overlapping tiles for training, lazily and as views (tiling.iter_tiles also gives their offsets)"""
+    for _, tile in iter_tiles(image, tile_size, overlap, pad_edges=pad_edges):
+        yield tile
+
+def create_synthetic_vessels(train_dir, val_dir, tile_format="jpeg"):
     """Create synthetic vessel annotations for demo training"""
     print("🔄 Creating synthetic vessel training data...")
     
     # This is a simplified version - in practice you'd have real annotations
     # For demo purposes, we'll create some basic training examples
     
+    if tile_format == "shards":
+        # Shard labels live in the shard index
+        for directory, row in ((train_dir, [1, 0.5, 0.5, 0.1, 0.1]), (val_dir, [1, 0.3, 0.3, 0.08, 0.08])):
+            write_labels(directory, {name: [row] for name in TileShards(directory).names()})
+        print("✅ Synthetic labels created for demo")
+        return
+    
     # Create some dummy YOLO label files
     label_train_dir = Path("./data/yolo/labels/train")
     label_val_dir = Path("./data/yolo/labels/val")
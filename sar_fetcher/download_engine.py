@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Resumable, rate-limited download engine for the SAR fetcher."""
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# Ledger states; DONE and NO_DATA are terminal and skipped on resume
+PENDING = 'pending'
+DONE = 'done'
+NO_DATA = 'no_data'
+FAILED = 'failed'
+
+
+class DownloadTask(NamedTuple):
+    task_id: str
+    bbox: Tuple[float, float, float, float]
+    start_date: datetime
+    end_date: datetime
+
+
+class TaskLedger:
+    """Persistent SQLite record of every task and its outcome.
+
+    Tasks are registered once; each completion is committed immediately, so
+    an interrupted run resumes with only the unfinished tasks.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                bbox TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def register(self, tasks: Iterable[DownloadTask]) -> None:
+        now = datetime.utcnow().isoformat()
+        rows = [
+            (t.task_id, json.dumps(t.bbox), t.start_date.isoformat(), t.end_date.isoformat(), PENDING, now)
+            for t in tasks
+        ]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tasks (task_id, bbox, start_date, end_date, status, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+
+    def unfinished(self) -> List[DownloadTask]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT task_id, bbox, start_date, end_date FROM tasks WHERE status NOT IN (?, ?) ORDER BY task_id',
+                (DONE, NO_DATA)
+            ).fetchall()
+        return [
+            DownloadTask(task_id, tuple(json.loads(bbox)), datetime.fromisoformat(start), datetime.fromisoformat(end))
+            for task_id, bbox, start, end in rows
+        ]
+
+    def record(self, task_id: str, status: str, attempts: int,
+               result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                'UPDATE tasks SET status = ?, attempts = attempts + ?, result = ?, error = ?, updated_at = ? '
+                'WHERE task_id = ?',
+                (status, attempts, json.dumps(result) if result else None, error,
+                 datetime.utcnow().isoformat(), task_id)
+            )
+            self._conn.commit()
+
+    def results(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT result FROM tasks WHERE status = ? ORDER BY task_id', (DONE,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows if r[0]]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0,
+                  rng: Optional[random.Random] = None) -> float:
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    rng = rng or random
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class DownloadEngine:
+    """Run download tasks concurrently with retries, rate limiting and a resumable ledger.
+
+    ``fetch(task)`` performs a single attempt. It returns the result dict for
+    a saved tile, returns None when there is no data, and raises on errors
+    that should be retried. ``is_complete(task)``, if given, is checked before
+    fetching so tiles already on disk are not downloaded again.
+    ``on_result(task, result)`` is called for every completed tile before
+    it is marked done in the ledger.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[DownloadTask], Optional[dict]],
+        ledger: TaskLedger,
+        rate_limiter: Optional[TokenBucket] = None,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        is_complete: Optional[Callable[[DownloadTask], Optional[dict]]] = None,
+        on_result: Optional[Callable[[DownloadTask, dict], None]] = None,
+    ):
+        self.fetch = fetch
+        self.ledger = ledger
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_complete = is_complete
+        self.on_result = on_result
+
+    def run(self, tasks: Iterable[DownloadTask], show_progress: bool = True) -> Dict[str, int]:
+        """Register ``tasks``, run every unfinished one and return ledger status counts."""
+        self.ledger.register(tasks)
+        todo = self.ledger.unfinished()
+        logger.info(f"{len(todo)} tasks to run ({self.ledger.counts()})")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._run_task, task): task for task in todo}
+            try:
+                with tqdm(total=len(futures), desc='Downloading images', disable=not show_progress) as pbar:
+                    for future in as_completed(futures):
+                        task = futures[future]
+                        try:
+                            status = future.result()
+                        except Exception as e:
+                            logger.error(f"Task {task.task_id} crashed: {e}")
+                            status = FAILED
+                        pbar.set_postfix_str(f"{task.task_id}: {status}")
+                        pbar.update(1)
+            except BaseException:
+                # Ctrl-C: drop the queued tasks instead of downloading them on the way out;
+                # the running ones finish and are recorded, the rest stay pending for a resume
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+        return self.ledger.counts()
+
+    def _run_task(self, task: DownloadTask) -> str:
+        if self.is_complete is not None:
+            existing = self.is_complete(task)
+            if existing is not None:
+                self._finish(task, DONE, 0, existing)
+                return DONE
+
+        for attempt in range(self.max_retries):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                result = self.fetch(task)
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    logger.error(f"Failed to download {task.task_id} after {self.max_retries} attempts: {e}")
+                    self.ledger.record(task.task_id, FAILED, attempt + 1, error=str(e))
+                    return FAILED
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                logger.warning(f"Attempt {attempt + 1} for {task.task_id} failed: {e} (retrying in {delay:.1f}s)")
+                time.sleep(delay)
+                continue
+
+            status = DONE if result is not None else NO_DATA
+            self._finish(task, status, attempt + 1, result)
+            return status
+
+        return FAILED
+
+    def _finish(self, task: DownloadTask, status: str, attempts: int, result: Optional[dict]) -> None:
+        # A crash between the two leaves the task pending; re-running it is idempotent
+        if result is not None and self.on_result is not None:
+            self.on_result(task, result)
+        self.ledger.record(task.task_id, status, attempts, result=result)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Local HTTP stand-in for the Sentinel Hub token and Process API endpoints, for tests."""
+
+import json
+import logging
+import os
+import random
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+import click
+
+logger = logging.getLogger(__name__)
+
+# TIFF field types
+SHORT = 3
+LONG = 4
+DOUBLE = 12
+
+
+def make_geotiff(width: int, height: int, bbox: Tuple[float, float, float, float], seed: int = 0) -> bytes:
+    """Minimal single-band float32 GeoTIFF in EPSG:4326 covering ``bbox``."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    rng = random.Random(seed)
+    pixels = struct.pack(f'<{width * height}f', *(rng.gammavariate(2.0, 0.02) for _ in range(width * height)))
+
+    geokeys = [
+        1, 1, 0, 3,            # version, revision, key count
+        1024, 0, 1, 2,         # GTModelType = geographic
+        1025, 0, 1, 1,         # GTRasterType = PixelIsArea
+        2048, 0, 1, 4326,      # GeographicType = WGS84
+    ]
+    entries = [
+        (256, LONG, [width]),
+        (257, LONG, [height]),
+        (258, SHORT, [32]),
+        (259, SHORT, [1]),
+        (262, SHORT, [1]),
+        (273, LONG, [0]),      # strip offset, patched below
+        (277, SHORT, [1]),
+        (278, LONG, [height]),
+        (279, LONG, [len(pixels)]),
+        (339, SHORT, [3]),     # IEEE float samples
+        (33550, DOUBLE, [(lon_max - lon_min) / width, (lat_max - lat_min) / height, 0.0]),
+        (33922, DOUBLE, [0.0, 0.0, 0.0, lon_min, lat_max, 0.0]),
+        (34735, SHORT, geokeys),
+    ]
+
+    # Layout: header | IFD | out-of-line values | pixels
+    ifd_size = 2 + 12 * len(entries) + 4
+    extra = b''
+    extra_offset = 8 + ifd_size
+    fields = []
+    for tag, ftype, values in entries:
+        fmt = {SHORT: 'H', LONG: 'I', DOUBLE: 'd'}[ftype]
+        packed = struct.pack(f'<{len(values)}{fmt}', *values)
+        if len(packed) <= 4:
+            fields.append((tag, ftype, len(values), packed.ljust(4, b'\0')))
+        else:
+            fields.append((tag, ftype, len(values), struct.pack('<I', extra_offset + len(extra))))
+            extra += packed
+            extra += b'\0' * (len(extra) % 2)
+    pixel_offset = extra_offset + len(extra)
+    fields[5] = (273, LONG, 1, struct.pack('<I', pixel_offset))
+
+    ifd = struct.pack('<H', len(fields))
+    ifd += b''.join(struct.pack('<HHI', tag, ftype, count) + value for tag, ftype, count, value in fields)
+    ifd += struct.pack('<I', 0)
+    return b'II*\0' + struct.pack('<I', 8) + ifd + extra + pixels
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Serves ``/oauth/token`` and ``/api/v1/process``.
+
+    ``failure_rate`` of process requests answer ``failure_status`` (503, or
+    e.g. 429 for rate limiting) and ``no_data_rate`` answer an empty body, so
+    retries and no-data handling can be exercised.
+    ``counts`` tracks requests per outcome.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], failure_rate: float = 0.0, no_data_rate: float = 0.0,
+                 seed: int = 0, failure_status: int = 503):
+        super().__init__(address, StandinHandler)
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.no_data_rate = no_data_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {'token': 0, 'ok': 0, 'failed': 0, 'no_data': 0}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def outcome(self) -> str:
+        with self.lock:
+            roll = self.rng.random()
+            if roll < self.failure_rate:
+                result = 'failed'
+            elif roll < self.failure_rate + self.no_data_rate:
+                result = 'no_data'
+            else:
+                result = 'ok'
+            self.counts[result] += 1
+            return result
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if self.path.startswith('/oauth/token'):
+            with self.server.lock:
+                self.server.counts['token'] += 1
+            self._send(200, json.dumps({
+                'access_token': 'standin-token',
+                'token_type': 'Bearer',
+                'expires_in': 3600
+            }).encode(), 'application/json')
+        elif self.path.startswith('/api/v1/process'):
+            outcome = self.server.outcome()
+            if outcome == 'failed':
+                self._send(self.server.failure_status, b'{"error": "service unavailable"}', 'application/json')
+                return
+            if outcome == 'no_data':
+                self._send(200, b'', 'image/tiff')
+                return
+            request = json.loads(body)
+            output = request.get('output', {})
+            bbox = tuple(request['input']['bounds']['bbox'])
+            self._send(200, make_geotiff(output.get('width', 64), output.get('height', 64), bbox), 'image/tiff')
+        else:
+            self._send(404, b'', 'text/plain')
+
+    def _send(self, status: int, payload: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_standin(port: int = 0, failure_rate: float = 0.0, no_data_rate: float = 0.0,
+                  seed: int = 0, failure_status: int = 503) -> Tuple[StandinServer, threading.Thread]:
+    """Start a stand-in on a background thread; port 0 picks a free port."""
+    # The OAuth client refuses plain-HTTP token URLs unless told otherwise
+    os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
+    server = StandinServer(('127.0.0.1', port), failure_rate, no_data_rate, seed, failure_status)
+    thread = threading.Thread(target=server.serve_forever, name='sentinelhub-standin', daemon=True)
+    thread.start()
+    return server, thread
+
+
+@click.command()
+@click.option('--port', default=8765, help='Port to listen on')
+@click.option('--failure-rate', default=0.0, help='Fraction of process requests answered with an error')
+@click.option('--failure-status', default=503, help='HTTP status of the failed requests (e.g. 429)')
+@click.option('--no-data-rate', default=0.0, help='Fraction of process requests answered with no data')
+@click.option('--seed', default=0, help='Random seed for failures')
+def main(port: int, failure_rate: float, failure_status: int, no_data_rate: float, seed: int):
+    """Run the stand-in; point the fetcher at it with --base-url http://127.0.0.1:PORT."""
+    server = StandinServer(('127.0.0.1', port), failure_rate, no_data_rate, seed, failure_status)
+    click.echo(f"Sentinel Hub stand-in listening on {server.base_url} "
+               f"(set OAUTHLIB_INSECURE_TRANSPORT=1 for the fetcher)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        click.echo(f"Requests: {server.counts}")
+
+
+if __name__ == '__main__':
+    main()
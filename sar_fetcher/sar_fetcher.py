@@ -1,26 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 import logging
 import os
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Tuple, Optional
 
 import click
-import pandas as pd
 from dateutil.relativedelta import relativedelta
 from sentinelhub import (
     CRS,
     BBox,
     DataCollection,
     MimeType,
+    SentinelHubDownloadClient,
     SentinelHubRequest,
     SHConfig,
     bbox_to_dimensions,
 )
-from tqdm import tqdm
+
+from download_engine import FAILED, DownloadEngine, DownloadTask, TaskLedger, TokenBucket
+from tile_catalog import TileCatalog, file_checksum
 
 # Configure logging
 logging.basicConfig(
@@ -29,6 +31,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Ground sampling distance requested from the Process API, in metres
+RESOLUTION_M = 10
+
+# Sentinel-1 VV backscatter as a single float32 band
+VV_EVALSCRIPT = """
+//VERSION=3
+function setup() {
+    return {input: ["VV"], output: {bands: 1, sampleType: "FLOAT32"}};
+}
+function evaluatePixel(sample) {
+    return [sample.VV];
+}
+"""
+
 def parse_bbox(bbox_str: str) -> Tuple[float, float, float, float]:
     """Parse bbox string into tuple of coordinates."""
     try:
@@ -69,60 +85,103 @@ def get_monthly_dates(start_date: datetime, end_date: datetime) -> List[Tuple[da
     
     return dates
 
+def tile_path(output_dir: Path, bbox: Tuple[float, float, float, float], start_date: datetime) -> Path:
+    """Output path of the tile for a grid cell and month."""
+    lon_min, lat_min, _, _ = bbox
+    return output_dir / str(start_date.year) / f"{start_date.month:02d}" / f"{lat_min:.2f}_{lon_min:.2f}.tif"
+
+def tile_dimensions(bbox: Tuple[float, float, float, float]) -> Tuple[int, int]:
+    """(width, height) in pixels of the tile requested for a grid cell."""
+    return bbox_to_dimensions(BBox(bbox=bbox, crs=CRS.WGS84), resolution=RESOLUTION_M)
+
+def tile_geotransform(bbox: Tuple[float, float, float, float], size: Tuple[int, int]) -> List[float]:
+    """Affine (a, b, c, d, e, f) of a tile: the Process API grids ``bbox`` into exactly ``size`` pixels."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    width, height = size
+    return [(lon_max - lon_min) / width, 0.0, lon_min, 0.0, -(lat_max - lat_min) / height, lat_max]
+
+def tile_record(bbox: Tuple[float, float, float, float], start_date: datetime, output_path: Path,
+                output_dir: Path, file_size: int, sha256: str) -> dict:
+    lon_min, lat_min, _, _ = bbox
+    width, height = tile_dimensions(bbox)
+    return {
+        'tile': f"{lat_min:.2f}_{lon_min:.2f}",
+        'timestamp': start_date.strftime('%Y-%m-%d'),
+        'cloud_cover': None,  # Not available for SAR
+        'file_path': output_path.relative_to(output_dir).as_posix(),
+        'file_size': file_size,
+        'sha256': sha256,
+        'width': width,
+        'height': height,
+        'crs': 'EPSG:4326',
+        'transform': tile_geotransform(bbox, (width, height))
+    }
+
 def download_sar_image(
     bbox: Tuple[float, float, float, float],
     start_date: datetime,
     end_date: datetime,
     output_dir: Path,
     config: SHConfig,
-    max_retries: int = 3
+    data_collection: DataCollection = DataCollection.SENTINEL1_IW
 ) -> Optional[dict]:
-    """Download SAR image for given bbox and time period."""
-    lon_min, lat_min, lon_max, lat_max = bbox
+    """Download SAR image for given bbox and time period.
+
+    Makes a single attempt and raises on failure; retries, backoff and rate
+    limiting are handled by the download engine. The GeoTIFF returned by
+    the Process API is written as-is (keeping its georeferencing) through a
+    temporary file, so a crash never leaves a partial tile behind. The
+    returned record carries the tile's size, CRS and affine transform for
+    the catalog.
+    """
     bbox_obj = BBox(bbox=bbox, crs=CRS.WGS84)
-    size = bbox_to_dimensions(bbox_obj, resolution=10)
+    size = tile_dimensions(bbox)
     
     request = SentinelHubRequest(
-        data_collection=DataCollection.SENTINEL1_IW_GRD,
-        bands=['VV'],
+        evalscript=VV_EVALSCRIPT,
+        input_data=[
+            SentinelHubRequest.input_data(
+                data_collection=data_collection,
+                time_interval=(start_date, end_date)
+            )
+        ],
+        responses=[SentinelHubRequest.output_response('default', MimeType.TIFF)],
         bbox=bbox_obj,
-        time=(start_date, end_date),
         size=size,
-        config=config,
-        mime_type=MimeType.TIFF,
-        maxcc=1.0
+        config=config
     )
     
-    for attempt in range(max_retries):
-        try:
-            data = request.get_data()
-            if not data:
-                logger.warning(f"No data found for bbox {bbox} and time {start_date} to {end_date}")
-                return None
-            
-            # Create output directory structure
-            year_dir = output_dir / str(start_date.year)
-            month_dir = year_dir / f"{start_date.month:02d}"
-            month_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Save image
-            filename = f"{lat_min:.2f}_{lon_min:.2f}.tif"
-            output_path = month_dir / filename
-            data[0].save(output_path)
-            
-            return {
-                'tile': f"{lat_min:.2f}_{lon_min:.2f}",
-                'timestamp': start_date.strftime('%Y-%m-%d'),
-                'cloud_cover': None,  # Not available for SAR
-                'file_path': str(output_path.relative_to(output_dir))
-            }
-            
-        except Exception as e:
-            if attempt == max_retries - 1:
-                logger.error(f"Failed to download after {max_retries} attempts: {e}")
-                return None
-            logger.warning(f"Attempt {attempt + 1} failed: {e}")
-            continue
+    client = SentinelHubDownloadClient(config=config)
+    data = client.download(request.download_list, decode_data=False)
+    content = getattr(data[0], 'content', data[0]) if data else None
+    if not content:
+        logger.warning(f"No data found for bbox {bbox} and time {start_date} to {end_date}")
+        return None
+    
+    # Create output directory structure
+    output_path = tile_path(output_dir, bbox, start_date)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    # Save image
+    tmp_path = output_path.with_suffix('.tif.part')
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, output_path)
+    
+    return tile_record(bbox, start_date, output_path, output_dir, len(content), hashlib.sha256(content).hexdigest())
+
+def existing_tile(task: DownloadTask, output_dir: Path) -> Optional[dict]:
+    """Record for a tile that is already on disk (e.g. saved just before a crash)."""
+    output_path = tile_path(output_dir, task.bbox, task.start_date)
+    if output_path.exists() and output_path.stat().st_size > 0:
+        return tile_record(task.bbox, task.start_date, output_path, output_dir,
+                           output_path.stat().st_size, file_checksum(output_path))
+    return None
+
+def catalog_tile(catalog: TileCatalog, task: DownloadTask, record: dict) -> None:
+    """Append a finished download to the tile catalog."""
+    catalog.add(record['file_path'], task.bbox, task.start_date, task.end_date,
+                record['file_size'], record['sha256'], tile=record['tile'], width=record['width'],
+                height=record['height'], crs=record['crs'], transform=record['transform'])
 
 @click.command()
 @click.option('--bbox', required=True, help='Bounding box as lon_min,lat_min,lon_max,lat_max')
@@ -131,8 +190,17 @@ def download_sar_image(
 @click.option('--grid', default=1.0, help='Grid size in degrees')
 @click.option('--out', required=True, type=click.Path(), help='Output directory')
 @click.option('--threads', default=4, help='Number of concurrent downloads')
-def main(bbox: str, start: datetime, end: datetime, grid: float, out: str, threads: int):
-    """Download Sentinel-1 SAR images for a given area and time period."""
+@click.option('--rate', default=300.0, help='Maximum requests per minute (match your Sentinel Hub quota)')
+@click.option('--retries', default=5, help='Attempts per tile before it is marked failed')
+@click.option('--base-url', default=None, help='Sentinel Hub base URL override (e.g. a local stand-in)')
+def main(bbox: str, start: datetime, end: datetime, grid: float, out: str, threads: int,
+         rate: float, retries: int, base_url: Optional[str]):
+    """Download Sentinel-1 SAR images for a given area and time period.
+
+    Progress is kept in OUT/tasks.sqlite; re-running the same command
+    resumes and skips tiles that are already done. Every downloaded tile
+    is appended to OUT/catalog.sqlite as soon as it is written.
+    """
     try:
         # Parse and validate inputs
         bbox_coords = parse_bbox(bbox)
@@ -141,6 +209,19 @@ def main(bbox: str, start: datetime, end: datetime, grid: float, out: str, threa
         
         # Load Sentinel Hub config
         config = SHConfig()
+        if base_url:
+            config.sh_base_url = base_url.rstrip('/')
+            config.sh_token_url = f"{config.sh_base_url}/oauth/token"
+            if config.sh_base_url.startswith('http://'):
+                os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
+            # The collection's own service URL would otherwise take precedence
+            collection = DataCollection.SENTINEL1_IW.define_from(
+                'SENTINEL1_IW_BASE_URL', service_url=config.sh_base_url
+            )
+        else:
+            collection = DataCollection.SENTINEL1_IW
+        # The engine owns retries and backoff
+        config.max_download_attempts = 1
         if not config.sh_client_id or not config.sh_client_secret:
             raise click.ClickException(
                 "Sentinel Hub credentials not found. Please configure ~/.sentinelhub/config.json"
@@ -154,40 +235,34 @@ def main(bbox: str, start: datetime, end: datetime, grid: float, out: str, threa
         tasks = []
         for cell in grid_cells:
             for start_date, end_date in date_ranges:
-                tasks.append((cell, start_date, end_date))
+                task_id = tile_path(Path(), cell, start_date).as_posix()
+                tasks.append(DownloadTask(task_id, cell, start_date, end_date))
         
-        # Download images with progress bar
-        results = []
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            futures = []
-            for cell, start_date, end_date in tasks:
-                future = executor.submit(
-                    download_sar_image,
-                    cell,
-                    start_date,
-                    end_date,
-                    output_dir,
-                    config
-                )
-                futures.append(future)
-            
-            with tqdm(total=len(tasks), desc="Downloading images") as pbar:
-                for future in futures:
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                    pbar.update(1)
+        # Download images; completed tasks from earlier runs are skipped
+        ledger = TaskLedger(output_dir / 'tasks.sqlite')
+        catalog = TileCatalog(output_dir / 'catalog.sqlite')
+        engine = DownloadEngine(
+            fetch=lambda t: download_sar_image(t.bbox, t.start_date, t.end_date, output_dir, config, collection),
+            ledger=ledger,
+            rate_limiter=TokenBucket(rate / 60.0, capacity=max(1.0, threads)),
+            max_workers=threads,
+            max_retries=retries,
+            is_complete=lambda t: existing_tile(t, output_dir),
+            on_result=lambda t, record: catalog_tile(catalog, t, record)
+        )
+        counts = engine.run(tasks)
+        ledger.close()
         
-        # Save metadata
-        if results:
-            df = pd.DataFrame(results)
+        # CSV snapshot of the whole catalog, including earlier runs
+        df = catalog.to_dataframe()
+        catalog.close()
+        if len(df):
             df.to_csv(output_dir / 'metadata.csv', index=False)
-            logger.info(f"Saved {len(results)} images to {output_dir}")
+            logger.info(f"Catalog holds {len(df)} images in {output_dir}")
         
         # Check if all expected images were downloaded
-        expected_count = len(grid_cells) * len(date_ranges)
-        if len(results) < expected_count:
-            logger.error(f"Downloaded {len(results)} images, expected {expected_count}")
+        if counts.get(FAILED):
+            logger.error(f"{counts[FAILED]} of {len(tasks)} tiles failed: re-run the same command to retry them")
             raise click.ClickException("Not all images were downloaded successfully")
         
         logger.info("Download completed successfully")
@@ -0,0 +1,147 @@
+import _thread
+import json
+import time
+import urllib.request
+from datetime import datetime
+
+import pytest
+
+import download_engine
+from download_engine import DONE, NO_DATA, DownloadEngine, DownloadTask, TaskLedger, TokenBucket, backoff_delay
+from local_standin import start_standin
+
+TASKS = [DownloadTask(f'tile_{n}', (73.5 + n, 15.5, 73.51 + n, 15.51), datetime(2023, 1, 1), datetime(2023, 1, 31))
+         for n in range(6)]
+
+
+@pytest.fixture
+def standin_factory():
+    servers = []
+
+    def start(**kwargs):
+        server, _ = start_standin(**kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def process_fetch(server, calls=None):
+    """One Process API request per attempt; HTTP errors raise, an empty body is no data"""
+    def fetch(task):
+        if calls is not None:
+            calls.append((task.task_id, time.monotonic()))
+        body = json.dumps({'input': {'bounds': {'bbox': list(task.bbox)}}, 'output': {'width': 8, 'height': 8}})
+        request = urllib.request.Request(f'{server.base_url}/api/v1/process', body.encode(), method='POST')
+        with urllib.request.urlopen(request) as response:
+            content = response.read()
+        return {'tile': task.task_id, 'file_size': len(content)} if content else None
+    return fetch
+
+
+def test_interrupted_run_resumes_from_the_ledger(tmp_path, standin_factory):
+    server = standin_factory()
+    fetch = process_fetch(server)
+    done = []
+
+    def interrupted(task):
+        if len(done) == 2:
+            raise KeyboardInterrupt
+        done.append(task.task_id)
+        return fetch(task)
+
+    ledger = TaskLedger(tmp_path / 'tasks.sqlite')
+    with pytest.raises(KeyboardInterrupt):
+        DownloadEngine(interrupted, ledger, max_workers=1).run(TASKS, show_progress=False)
+    ledger.close()
+
+    calls = []
+    ledger = TaskLedger(tmp_path / 'tasks.sqlite')
+    counts = DownloadEngine(process_fetch(server, calls), ledger, max_workers=2).run(TASKS, show_progress=False)
+    assert counts == {DONE: len(TASKS)}
+    assert sorted(task_id for task_id, _ in calls) == sorted(t.task_id for t in TASKS if t.task_id not in done)
+    assert server.counts['ok'] == len(TASKS)
+    assert [r['tile'] for r in ledger.results()] == sorted(t.task_id for t in TASKS)
+    ledger.close()
+
+
+def test_ctrl_c_drops_queued_tasks_and_resumes(tmp_path, standin_factory):
+    server = standin_factory()
+    fetch = process_fetch(server)
+    tasks = [DownloadTask(f'tile_{n}', (73.5, 15.5, 73.51, 15.51), datetime(2023, 1, 1), datetime(2023, 1, 31))
+             for n in range(20)]
+    fetched = []
+
+    def slow(task):
+        fetched.append(task.task_id)
+        if len(fetched) == 3:
+            # What Ctrl-C does: KeyboardInterrupt in the main thread, which is waiting on the pool
+            _thread.interrupt_main()
+        time.sleep(0.05)
+        return fetch(task)
+
+    ledger = TaskLedger(tmp_path / 'tasks.sqlite')
+    with pytest.raises(KeyboardInterrupt):
+        DownloadEngine(slow, ledger, max_workers=2).run(tasks, show_progress=False)
+    # Only the tasks already running when the interrupt landed were fetched
+    assert len(fetched) <= 5
+    pending = len(ledger.unfinished())
+    assert pending == len(tasks) - len(fetched)
+    ledger.close()
+
+    calls = []
+    ledger = TaskLedger(tmp_path / 'tasks.sqlite')
+    counts = DownloadEngine(process_fetch(server, calls), ledger, max_workers=2).run(tasks, show_progress=False)
+    assert counts == {DONE: len(tasks)}
+    assert len(calls) == pending
+    assert not set(task_id for task_id, _ in calls) & set(fetched)
+    ledger.close()
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_server_errors_are_retried_with_backoff(tmp_path, standin_factory, monkeypatch, status):
+    server = standin_factory(failure_rate=0.5, no_data_rate=0.1, seed=3, failure_status=status)
+    delays = []
+    monkeypatch.setattr(download_engine.time, 'sleep', delays.append)
+
+    ledger = TaskLedger(tmp_path / 'tasks.sqlite')
+    engine = DownloadEngine(process_fetch(server), ledger, max_workers=1, max_retries=20, base_delay=0.5,
+                            max_delay=4.0)
+    counts = engine.run(TASKS, show_progress=False)
+    ledger.close()
+
+    assert server.counts['failed'] > 0
+    assert counts.get(DONE, 0) + counts.get(NO_DATA, 0) == len(TASKS)
+    # One backoff sleep per failed attempt, never above the cap
+    assert len(delays) == server.counts['failed']
+    assert all(0 <= delay <= 4.0 for delay in delays)
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    class Top:
+        def uniform(self, low, high):
+            return high
+
+    assert [backoff_delay(n, base=1.0, cap=10.0, rng=Top()) for n in range(6)] == [1, 2, 4, 8, 10, 10]
+
+
+def test_token_bucket_caps_the_request_rate(tmp_path, standin_factory):
+    server = standin_factory()
+    calls = []
+    rate, tasks = 20.0, TASKS * 2
+    tasks = [task._replace(task_id=f'{task.task_id}_{n}') for n, task in enumerate(tasks)]
+
+    ledger = TaskLedger(tmp_path / 'tasks.sqlite')
+    engine = DownloadEngine(process_fetch(server, calls), ledger, rate_limiter=TokenBucket(rate, capacity=1),
+                            max_workers=4)
+    assert engine.run(tasks, show_progress=False) == {DONE: len(tasks)}
+    ledger.close()
+
+    # With a single-token bucket the k-th request starts no earlier than k / rate after the first
+    times = sorted(t for _, t in calls)
+    assert len(times) == len(tasks)
+    for k, t in enumerate(times):
+        assert t - times[0] >= k / rate - 0.01
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from tile_catalog import TileCatalog, time_bound
+
+BBOX = (73.5, 15.5, 74.0, 16.0)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    cat = TileCatalog(tmp_path / 'catalog.sqlite')
+    cat.add('2023/06/15.50_73.50.tif', BBOX, datetime(2023, 6, 1), datetime(2023, 6, 30), 1, 'x')
+    yield cat
+    cat.close()
+
+
+@pytest.mark.parametrize('end', ['2023-06-01', datetime(2023, 6, 1), '2023-06-01T00:00:00'])
+def test_end_on_the_tile_start_day_includes_it(catalog, end):
+    assert len(catalog.query(BBOX, '2023-05-01', end)) == 1
+
+
+def test_start_on_the_tile_end_day_includes_it(catalog):
+    assert len(catalog.query(BBOX, '2023-06-30', '2023-07-31')) == 1
+
+
+def test_window_before_the_tile_excludes_it(catalog):
+    assert catalog.query(BBOX, '2023-05-01', '2023-05-31') == []
+
+
+def test_date_only_end_means_end_of_day():
+    assert time_bound('2023-06-01', end=True) == '2023-06-01T23:59:59.999000'
+    assert time_bound('2023-06-01') == '2023-06-01T00:00:00'
+    assert time_bound('2023-06-01T12:00:00', end=True) == '2023-06-01T12:00:00'
+    with pytest.raises(ValueError):
+        time_bound('June 1st')
+
+
+def test_dataframe_keeps_the_original_metadata_columns(catalog):
+    df = catalog.to_dataframe()
+    assert list(df.columns[:4]) == ['tile', 'timestamp', 'cloud_cover', 'file_path']
+    assert df['timestamp'].tolist() == ['2023-06-01']
+    assert df['cloud_cover'].isna().all()
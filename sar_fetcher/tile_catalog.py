@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""Incremental SQLite catalog and spatio-temporal index of downloaded SAR tiles."""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import click
+import pandas as pd
+
+COLUMNS = (
+    'file_path', 'tile', 'lon_min', 'lat_min', 'lon_max', 'lat_max',
+    'time_start', 'time_end', 'file_size', 'sha256', 'added_at',
+    'width', 'height', 'crs', 'transform'
+)
+
+# metadata.csv keeps the columns it had before the catalog, then every catalog column
+METADATA_COLUMNS = ('tile', 'timestamp', 'cloud_cover', 'file_path') + tuple(
+    c for c in COLUMNS if c not in ('tile', 'file_path')
+)
+
+# Georeference columns added after the first catalogs were written; NULL when unknown
+GEOREFERENCE_COLUMNS = {'width': 'INTEGER', 'height': 'INTEGER', 'crs': 'TEXT', 'transform': 'TEXT'}
+
+DateLike = Union[datetime, date, str]
+
+# R*Tree time axis: days since the Unix epoch. The R*Tree stores float32, which
+# is ~3 minute resolution here; its boxes are rounded outward and every match is
+# re-checked against the exact columns in ``tiles``.
+EPOCH_JULIAN_DAY = 2440587.5
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS tiles (
+        file_path TEXT PRIMARY KEY,
+        tile TEXT NOT NULL,
+        lon_min REAL NOT NULL,
+        lat_min REAL NOT NULL,
+        lon_max REAL NOT NULL,
+        lat_max REAL NOT NULL,
+        time_start TEXT NOT NULL,
+        time_end TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        added_at TEXT NOT NULL,
+        width INTEGER,
+        height INTEGER,
+        crs TEXT,
+        transform TEXT  -- JSON [a, b, c, d, e, f]: pixel (col, row) -> crs (x, y)
+    );
+    CREATE INDEX IF NOT EXISTS tiles_time ON tiles (time_start, time_end);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS tiles_rtree USING rtree(
+        id, lon_min, lon_max, lat_min, lat_max, day_start, day_end
+    );
+
+    -- Keep the index in step with every catalog write
+    CREATE TRIGGER IF NOT EXISTS tiles_rtree_insert AFTER INSERT ON tiles BEGIN
+        INSERT INTO tiles_rtree VALUES (
+            new.rowid, new.lon_min, new.lon_max, new.lat_min, new.lat_max,
+            julianday(new.time_start) - {EPOCH_JULIAN_DAY}, julianday(new.time_end) - {EPOCH_JULIAN_DAY}
+        );
+    END;
+    CREATE TRIGGER IF NOT EXISTS tiles_rtree_update AFTER UPDATE ON tiles BEGIN
+        UPDATE tiles_rtree SET
+            lon_min = new.lon_min, lon_max = new.lon_max, lat_min = new.lat_min, lat_max = new.lat_max,
+            day_start = julianday(new.time_start) - {EPOCH_JULIAN_DAY},
+            day_end = julianday(new.time_end) - {EPOCH_JULIAN_DAY}
+        WHERE id = new.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS tiles_rtree_delete AFTER DELETE ON tiles BEGIN
+        DELETE FROM tiles_rtree WHERE id = old.rowid;
+    END;
+"""
+
+# Candidates from the R*Tree, confirmed against the exact bbox and times. Times
+# are compared as instants (julianday), never as strings: '2023-06-01T00:00:00'
+# sorts after '2023-06-01'
+INTERSECT_SQL = f"""
+    SELECT t.* FROM tiles_rtree r JOIN tiles t ON t.rowid = r.id
+    WHERE r.lon_min <= :lon_max AND r.lon_max >= :lon_min
+      AND r.lat_min <= :lat_max AND r.lat_max >= :lat_min
+      AND r.day_start <= julianday(:end) - {EPOCH_JULIAN_DAY} AND r.day_end >= julianday(:start) - {EPOCH_JULIAN_DAY}
+      AND t.lon_min < :lon_max AND t.lon_max > :lon_min
+      AND t.lat_min < :lat_max AND t.lat_max > :lat_min
+      AND julianday(t.time_start) <= julianday(:end) AND julianday(t.time_end) >= julianday(:start)
+"""
+
+# The same exact test as a table scan, for read-only readers of catalogs written before the index
+SCAN_SQL = """
+    SELECT t.* FROM tiles t
+    WHERE t.lon_min < :lon_max AND t.lon_max > :lon_min
+      AND t.lat_min < :lat_max AND t.lat_max > :lat_min
+      AND julianday(t.time_start) <= julianday(:end) AND julianday(t.time_end) >= julianday(:start)
+"""
+
+# Unbounded query limits
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+MIN_TIME = '0001-01-01T00:00:00'
+MAX_TIME = '9999-12-31T23:59:59'
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _iso(value: DateLike) -> str:
+    return value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+
+
+def time_bound(value: DateLike, end: bool = False) -> str:
+    """Full ISO timestamp for a query bound.
+
+    Dates (``date`` objects or strings without a time) cover the whole day:
+    as ``end`` they mean the last instant of that day, not its midnight.
+    Raises ValueError for strings that are not ISO dates or timestamps.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    text = value.isoformat() if isinstance(value, date) else str(value).strip()
+    parsed = datetime.fromisoformat(text)
+    if end and 'T' not in text and ' ' not in text:
+        # Milliseconds: SQLite's julianday() does not resolve anything finer
+        parsed += timedelta(days=1, milliseconds=-1)
+    return parsed.isoformat()
+
+
+def _row(row: sqlite3.Row) -> dict:
+    row = dict(row)
+    if row.get('transform'):
+        row['transform'] = json.loads(row['transform'])
+    return row
+
+
+def intersect(conn: sqlite3.Connection, bbox: Tuple[float, float, float, float], start: Optional[DateLike],
+              end: Optional[DateLike], inclusive: bool = False, indexed: bool = True) -> List[dict]:
+    """Rows of ``conn``'s catalog intersecting ``bbox`` whose window overlaps [start, end], unordered."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if inclusive:
+        # Point-like boxes (a vessel position) must match the tile containing them
+        eps = 1e-9
+        lon_min, lat_min, lon_max, lat_max = lon_min - eps, lat_min - eps, lon_max + eps, lat_max + eps
+    params = {
+        'lon_min': lon_min, 'lat_min': lat_min, 'lon_max': lon_max, 'lat_max': lat_max,
+        'start': time_bound(start) if start is not None else MIN_TIME,
+        'end': time_bound(end, end=True) if end is not None else MAX_TIME
+    }
+    sql = INTERSECT_SQL if indexed else SCAN_SQL
+    return [_row(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def read_tiles(path: Path, bbox: Optional[Tuple[float, float, float, float]] = None,
+               start: Optional[DateLike] = None, end: Optional[DateLike] = None) -> List[dict]:
+    """``TileCatalog.query`` on a read-only connection, so readers never block the fetcher.
+
+    Catalogs written before the index existed are scanned instead, since a
+    read-only reader cannot build the index.
+    """
+    conn = sqlite3.connect(f'{Path(path).resolve().as_uri()}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        indexed = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'tiles_rtree'"
+        ).fetchone() is not None
+        rows = intersect(conn, bbox or WORLD, start, end, indexed=indexed)
+    finally:
+        conn.close()
+    return sorted(rows, key=lambda r: (r['time_start'], r['file_path']))
+
+
+class TileCatalog:
+    """One row per downloaded tile, appended as each download finishes.
+
+    Rows are keyed by the tile's path relative to the catalog directory, so
+    re-downloading a tile replaces its row and repeated runs accumulate.
+    ``time_start``/``time_end`` are the requested acquisition window.
+    ``width``/``height``, ``crs`` and the affine ``transform`` locate every
+    pixel, so detections on a tile can be geolocated without reopening it.
+
+    An R*Tree over (lon, lat, time) is maintained by triggers on every
+    write, so bbox/date and track queries stay in the millisecond range
+    with hundreds of thousands of tiles.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.root = self.path.parent
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._add_georeference_columns()
+        self._backfill_index()
+        self._conn.commit()
+
+    def add(self, file_path: str, bbox: Tuple[float, float, float, float], time_start: DateLike,
+            time_end: DateLike, file_size: int, sha256: str, tile: Optional[str] = None,
+            width: Optional[int] = None, height: Optional[int] = None, crs: Optional[str] = None,
+            transform: Optional[List[float]] = None) -> None:
+        """Insert or replace the row for one tile and commit it."""
+        lon_min, lat_min, lon_max, lat_max = bbox
+        row = (
+            str(file_path), tile or Path(file_path).stem, lon_min, lat_min, lon_max, lat_max,
+            _iso(time_start), _iso(time_end), int(file_size), sha256, datetime.utcnow().isoformat(),
+            width, height, crs, json.dumps([float(v) for v in transform]) if transform is not None else None
+        )
+        with self._lock:
+            # Upsert rather than REPLACE so the row (and its R*Tree entry) keeps its id
+            self._conn.execute(
+                f"INSERT INTO tiles ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT (file_path) DO UPDATE SET "
+                f"{', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])}",
+                row
+            )
+            self._conn.commit()
+
+    def add_file(self, file_path: Path, bbox: Tuple[float, float, float, float],
+                 time_start: DateLike, time_end: DateLike) -> None:
+        """Catalog a tile that is on disk, computing its size and checksum."""
+        file_path = Path(file_path)
+        absolute = file_path if file_path.is_absolute() else self.root / file_path
+        self.add(
+            absolute.relative_to(self.root).as_posix(), bbox, time_start, time_end,
+            absolute.stat().st_size, file_checksum(absolute)
+        )
+
+    def query(self, bbox: Optional[Tuple[float, float, float, float]] = None,
+              start: Optional[DateLike] = None, end: Optional[DateLike] = None) -> List[dict]:
+        """Tiles intersecting ``bbox`` whose acquisition window overlaps [start, end].
+
+        A date-only ``end`` (``"2023-06-01"``) includes that whole day.
+        """
+        with self._lock:
+            rows = self._intersect(bbox or WORLD, start, end)
+        return sorted(rows, key=lambda r: (r['time_start'], r['file_path']))
+
+    def along_track(self, track: Iterable[Tuple[float, float, DateLike]], buffer_deg: float = 0.0,
+                    time_margin: timedelta = timedelta(0)) -> List[dict]:
+        """Tiles touching a track of (lon, lat, time) points, in time order.
+
+        Each leg between consecutive points is matched by its bbox grown by
+        ``buffer_deg`` and its time span grown by ``time_margin``.
+        """
+        points = sorted(
+            ((lon, lat, t if isinstance(t, datetime) else datetime.fromisoformat(str(t))) for lon, lat, t in track),
+            key=lambda p: p[2]
+        )
+        legs = list(zip(points, points[1:])) or [(p, p) for p in points]
+
+        found = {}
+        with self._lock:
+            for (lon0, lat0, t0), (lon1, lat1, t1) in legs:
+                bbox = (min(lon0, lon1) - buffer_deg, min(lat0, lat1) - buffer_deg,
+                        max(lon0, lon1) + buffer_deg, max(lat0, lat1) + buffer_deg)
+                for row in self._intersect(bbox, t0 - time_margin, t1 + time_margin, inclusive=True):
+                    found[row['file_path']] = row
+        return sorted(found.values(), key=lambda r: (r['time_start'], r['file_path']))
+
+    def _intersect(self, bbox: Tuple[float, float, float, float], start: Optional[DateLike],
+                   end: Optional[DateLike], inclusive: bool = False) -> List[dict]:
+        return intersect(self._conn, bbox, start, end, inclusive)
+
+    def rebuild_index(self) -> None:
+        """Recreate the R*Tree from the ``tiles`` table."""
+        with self._lock:
+            self._conn.execute('DELETE FROM tiles_rtree')
+            self._conn.commit()
+        self._backfill_index()
+
+    def _add_georeference_columns(self) -> None:
+        # Catalogs written before the georeference was kept
+        with self._lock:
+            existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(tiles)')}
+            for column, sql_type in GEOREFERENCE_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f'ALTER TABLE tiles ADD COLUMN {column} {sql_type}')
+
+    def _backfill_index(self) -> None:
+        # Catalogs written before the index existed
+        with self._lock:
+            self._conn.execute(f"""
+                INSERT INTO tiles_rtree
+                SELECT rowid, lon_min, lon_max, lat_min, lat_max,
+                       julianday(time_start) - {EPOCH_JULIAN_DAY}, julianday(time_end) - {EPOCH_JULIAN_DAY}
+                FROM tiles WHERE rowid NOT IN (SELECT id FROM tiles_rtree)
+            """)
+            self._conn.commit()
+
+    def paths(self, *args, **kwargs) -> Iterator[Path]:
+        """Absolute paths of the tiles matched by ``query``."""
+        for row in self.query(*args, **kwargs):
+            yield self.root / row['file_path']
+
+    def has(self, file_path: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM tiles WHERE file_path = ?', (str(file_path),)
+            ).fetchone() is not None
+
+    def verify(self, file_path: str) -> bool:
+        """True if the file on disk still matches its cataloged checksum."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT sha256 FROM tiles WHERE file_path = ?', (str(file_path),)
+            ).fetchone()
+        absolute = self.root / file_path
+        return row is not None and absolute.exists() and file_checksum(absolute) == row['sha256']
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Every tile, as written to metadata.csv."""
+        df = pd.DataFrame(self.query(), columns=list(COLUMNS))
+        # Acquisition date of the tile's window, as metadata.csv has always had it
+        df['timestamp'] = df['time_start'].str[:10]
+        df['cloud_cover'] = None  # Not available for SAR
+        return df[list(METADATA_COLUMNS)]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM tiles').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    if value is None:
+        return None
+    try:
+        lon_min, lat_min, lon_max, lat_max = map(float, value.split(','))
+    except ValueError:
+        raise click.BadParameter('Expected lon_min,lat_min,lon_max,lat_max')
+    return lon_min, lat_min, lon_max, lat_max
+
+
+def _parse_time(value: Optional[str], end: bool = False) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return time_bound(value, end)
+    except ValueError:
+        raise click.BadParameter(f'Expected an ISO date or timestamp, got {value!r}')
+
+
+def _emit(rows: List[dict], fmt: str, elapsed: float) -> None:
+    if fmt == 'paths':
+        for row in rows:
+            click.echo(row['file_path'])
+    elif fmt == 'csv':
+        pd.DataFrame(rows, columns=list(COLUMNS)).to_csv(sys.stdout, index=False)
+    else:
+        click.echo(json.dumps(rows, indent=2))
+    click.echo(f"{len(rows)} tiles in {elapsed * 1000:.1f} ms", err=True)
+
+
+@click.group()
+def cli():
+    """Query the tile catalog written by sar_fetcher."""
+
+
+@cli.command()
+@click.option('--catalog', required=True, type=click.Path(exists=True, dir_okay=False), help='catalog.sqlite path')
+@click.option('--bbox', default=None, help='lon_min,lat_min,lon_max,lat_max')
+@click.option('--start', default=None, help='Start date (YYYY-MM-DD) or timestamp')
+@click.option('--end', default=None, help='End date (YYYY-MM-DD, inclusive) or timestamp')
+@click.option('--format', 'fmt', default='paths', type=click.Choice(['paths', 'csv', 'json']))
+def query(catalog: str, bbox: Optional[str], start: Optional[str], end: Optional[str], fmt: str):
+    """Tiles intersecting a bbox and date range."""
+    cat = TileCatalog(Path(catalog))
+    t0 = time.perf_counter()
+    rows = cat.query(_parse_bbox(bbox), _parse_time(start), _parse_time(end, end=True))
+    _emit(rows, fmt, time.perf_counter() - t0)
+    cat.close()
+
+
+@cli.command()
+@click.option('--catalog', required=True, type=click.Path(exists=True, dir_okay=False), help='catalog.sqlite path')
+@click.option('--track', 'track_file', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='CSV with lon, lat and timestamp columns (e.g. one AIS track)')
+@click.option('--buffer', default=0.0, help='Spatial buffer around the track in degrees')
+@click.option('--margin-hours', default=0.0, help='Time margin around each track leg in hours')
+@click.option('--format', 'fmt', default='paths', type=click.Choice(['paths', 'csv', 'json']))
+def track(catalog: str, track_file: str, buffer: float, margin_hours: float, fmt: str):
+    """Tiles touching a track between its first and last timestamps."""
+    df = pd.read_csv(track_file, parse_dates=['timestamp'])
+    points = zip(df['lon'], df['lat'], df['timestamp'].dt.tz_localize(None).dt.to_pydatetime())
+    cat = TileCatalog(Path(catalog))
+    t0 = time.perf_counter()
+    rows = cat.along_track(points, buffer, timedelta(hours=margin_hours))
+    _emit(rows, fmt, time.perf_counter() - t0)
+    cat.close()
+
+
+@cli.command()
+@click.option('--catalog', required=True, type=click.Path(exists=True, dir_okay=False), help='catalog.sqlite path')
+def reindex(catalog: str):
+    """Rebuild the spatio-temporal index from the catalog rows."""
+    cat = TileCatalog(Path(catalog))
+    cat.rebuild_index()
+    click.echo(f"Indexed {len(cat)} tiles")
+    cat.close()
+
+
+if __name__ == '__main__':
+    cli()